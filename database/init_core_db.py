@@ -68,6 +68,29 @@ def table_creation(conn):
         """)
         print("Table 'news' created or already exists with unique constraint.")
 
+        # Create a table for near-duplicate news clusters if it does not exist
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS core.news_clusters (
+            event_id        UUID PRIMARY KEY,
+            cluster_id      UUID NOT NULL,                -- event_id of the cluster's canonical article
+            is_canonical    BOOLEAN NOT NULL,
+            tic             VARCHAR(10) NOT NULL,
+            url             TEXT NOT NULL,
+            published_at    TIMESTAMP NOT NULL,
+            similarity      REAL,                         -- estimated Jaccard similarity to the matched article
+            minhash         BIGINT[] NOT NULL,            -- MinHash signature of the normalized title + content
+            raw_json_sha256 CHAR(64) NOT NULL,
+            updated_at      TIMESTAMPTZ DEFAULT now(),
+
+            FOREIGN KEY (event_id)
+                REFERENCES core.news (event_id)
+                ON DELETE CASCADE
+        );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS news_clusters_tic_published_idx ON core.news_clusters (tic, published_at);")
+        cursor.execute("CREATE INDEX IF NOT EXISTS news_clusters_cluster_idx ON core.news_clusters (cluster_id);")
+        print("Table 'news_clusters' created or already exists.")
+
 
 
         # Create a table for earnings calendar data if it does not exist
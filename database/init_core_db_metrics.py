@@ -1,5 +1,6 @@
 from psycopg import connect
 from utils import connect_to_db
+from partitioning import PARTITIONED, DAILY_TABLES, partition_by, create_partitions
 
 # Connect to PostgreSQL
 def table_creation(conn):
@@ -459,10 +460,10 @@ def table_creation(conn):
 
 
        # Create a table for valuation metrics if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.valuation_metrics (
             -- Identity & period alignment
-            inference_id       UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            inference_id       UUID         NOT NULL DEFAULT gen_random_uuid(),
             tic                               VARCHAR(10)  NOT NULL,
             date                              DATE         NOT NULL,
                        
@@ -496,17 +497,18 @@ def table_creation(conn):
             total_shareholder_yield_ttm NUMERIC(20, 8), -- (Dividends + Buybacks) / Market Cap (TTM)
 
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (inference_id, date),
             UNIQUE (tic, date)
-        );
+        ) {partition_by()};
         """)
         print("Table 'valuation_metrics' created or already exists with composite primary key.")
 
 
        # Create a table for profitability metrics if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.profitability_metrics (
             -- Identity & period alignment
-            inference_id       UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            inference_id       UUID         NOT NULL DEFAULT gen_random_uuid(),
             tic                               VARCHAR(10)  NOT NULL,
             date                              DATE         NOT NULL,
 
@@ -526,17 +528,18 @@ def table_creation(conn):
             fcf_margin           NUMERIC(20, 8),  -- Free Cash Flow / Revenue
                    
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (inference_id, date),
             UNIQUE (tic, date)
-        );
+        ) {partition_by()};
         """)
         print("Table 'profitability_metrics' created or already exists with composite primary key.")
 
 
        # Create a table for growth metrics if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.growth_metrics (
             -- Identity & period alignment
-            inference_id       UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            inference_id       UUID         NOT NULL DEFAULT gen_random_uuid(),
             tic                               VARCHAR(10)  NOT NULL,
             date                              DATE         NOT NULL,
 
@@ -568,18 +571,19 @@ def table_creation(conn):
 
                    
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (inference_id, date),
             UNIQUE (tic, date)
-        );
+        ) {partition_by()};
         """)
         print("Table 'growth_metrics' created or already exists with composite primary key.")
 
 
 
        # Create a table for efficiency metrics if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.efficiency_metrics (
             -- Identity & period alignment
-            inference_id       UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            inference_id       UUID         NOT NULL DEFAULT gen_random_uuid(),
             tic                               VARCHAR(10)  NOT NULL,
             date                              DATE         NOT NULL,
                 
@@ -603,18 +607,19 @@ def table_creation(conn):
 
                    
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (inference_id, date),
             UNIQUE (tic, date)
-        );
+        ) {partition_by()};
         """)
         print("Table 'efficiency_metrics' created or already exists with composite primary key.")
 
 
 
        # Create a table for financial health metrics if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.financial_health_metrics (
             -- Identity & period alignment
-            inference_id       UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            inference_id       UUID         NOT NULL DEFAULT gen_random_uuid(),
             tic                               VARCHAR(10)  NOT NULL,
             date                              DATE         NOT NULL,
 
@@ -640,11 +645,21 @@ def table_creation(conn):
             cash_runway_months      NUMERIC(20, 2),   -- Cash & Equivalents / Monthly Operating Cash Burn
                    
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (inference_id, date),
             UNIQUE (tic, date)
-        );
+        ) {partition_by()};
         """)
         print("Table 'financial_health_metrics' created or already exists with composite primary key.")
 
+        # Date indexes so the percentile job can rank one date cohort at a time
+        for metrics_table in ['valuation_metrics', 'profitability_metrics', 'growth_metrics',
+                              'efficiency_metrics', 'financial_health_metrics']:
+            cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_core_{metrics_table}_date
+              ON core.{metrics_table} (date);
+            """)
+            print(f"Index 'idx_core_{metrics_table}_date' created or already exists.")
+
 
        # Create a table for capital allocation metrics if it does not exist
         # cursor.execute("""
@@ -672,7 +687,7 @@ def table_creation(conn):
 
 
        # Create a table for valuation percentiles if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.valuation_percentiles (
             -- Identity & period alignment
             inference_id                      UUID         NOT NULL,
@@ -709,18 +724,18 @@ def table_creation(conn):
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
             
             UNIQUE (tic, date),
-            UNIQUE (inference_id),
-            FOREIGN KEY (inference_id)
-                REFERENCES core.valuation_metrics (inference_id)
+            UNIQUE (inference_id, date),
+            FOREIGN KEY (inference_id, date)
+                REFERENCES core.valuation_metrics (inference_id, date)
                 ON DELETE CASCADE
-        );
+        ) {partition_by()};
         """)
         print("Table 'valuation_percentiles' created or already exists with composite primary key.")
 
 
 
        # Create a table for profitability percentiles if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.profitability_percentiles (
             -- Identity & period alignment
             inference_id       UUID NOT NULL,
@@ -745,17 +760,17 @@ def table_creation(conn):
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
 
             UNIQUE (tic, date),
-            UNIQUE (inference_id),
-            FOREIGN KEY (inference_id)
-                REFERENCES core.profitability_metrics (inference_id)
+            UNIQUE (inference_id, date),
+            FOREIGN KEY (inference_id, date)
+                REFERENCES core.profitability_metrics (inference_id, date)
                 ON DELETE CASCADE
-        );
+        ) {partition_by()};
         """)
         print("Table 'profitability_percentiles' created or already exists with composite primary key.")
 
 
        # Create a table for growth percentiles if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.growth_percentiles (
             -- Identity & period alignment
             inference_id       UUID NOT NULL,
@@ -793,18 +808,18 @@ def table_creation(conn):
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
 
             UNIQUE (tic, date),
-            UNIQUE (inference_id),
-            FOREIGN KEY (inference_id)
-                REFERENCES core.growth_metrics (inference_id)
+            UNIQUE (inference_id, date),
+            FOREIGN KEY (inference_id, date)
+                REFERENCES core.growth_metrics (inference_id, date)
                 ON DELETE CASCADE
-        );
+        ) {partition_by()};
         """)
         print("Table 'growth_percentiles' created or already exists with composite primary key.")
 
 
 
        # Create a table for efficiency percentiles if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.efficiency_percentiles (
             -- Identity & period alignment
             inference_id       UUID NOT NULL,
@@ -832,19 +847,18 @@ def table_creation(conn):
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
 
             UNIQUE (tic, date),
-            UNIQUE (inference_id),
-            FOREIGN KEY (inference_id)
-                REFERENCES core.efficiency_metrics (inference_id)
+            UNIQUE (inference_id, date),
+            FOREIGN KEY (inference_id, date)
+                REFERENCES core.efficiency_metrics (inference_id, date)
                 ON DELETE CASCADE
-                       
-        );
+        ) {partition_by()};
         """)
         print("Table 'efficiency_percentiles' created or already exists with composite primary key.")
 
 
 
        # Create a table for financial health percentiles if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.financial_health_percentiles (
             -- Identity & period alignment
             inference_id       UUID NOT NULL,
@@ -874,11 +888,11 @@ def table_creation(conn):
                    
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
             UNIQUE (tic, date),
-            UNIQUE (inference_id),
-            FOREIGN KEY (inference_id)
-                REFERENCES core.financial_health_metrics (inference_id)
+            UNIQUE (inference_id, date),
+            FOREIGN KEY (inference_id, date)
+                REFERENCES core.financial_health_metrics (inference_id, date)
                 ON DELETE CASCADE
-        );
+        ) {partition_by()};
         """)
         print("Table 'financial_health_percentiles' created or already exists with composite primary key.")
 
@@ -913,7 +927,7 @@ def table_creation(conn):
 
 
        # Create a table for stock scores if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS core.stock_scores (
             -- Identity & period alignment
             tic                               VARCHAR(10)  NOT NULL,
@@ -927,11 +941,174 @@ def table_creation(conn):
             total_score              NUMERIC(6, 3),  -- 0-100
             updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
             UNIQUE (tic, date)
-        );
+        ) {partition_by()};
         """)
         print("Table 'stock_scores' created or already exists with composite primary key.")
 
 
+       # Create a table for the shared TTM fundamentals feature store if it does not exist
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS core.fundamentals_ttm (
+            -- Identity & period alignment
+            tic                                   VARCHAR(10)  NOT NULL,
+            calendar_year                         SMALLINT     NOT NULL,
+            calendar_quarter                      SMALLINT     NOT NULL,
+
+            -- earnings_date of each source row (NULL when the source lacks the quarter)
+            income_date                           DATE,
+            balance_sheet_date                    DATE,
+            cash_flow_date                        DATE,
+            earnings_date                         DATE,
+
+            -- Income statement (TTM sums and 1/3/5-year lags)
+            shares_outstanding                    DOUBLE PRECISION,
+            ebitda_ttm                            DOUBLE PRECISION,
+            ebitda_ttm_prev                       DOUBLE PRECISION,
+            ebitda_ttm_3y_ago                     DOUBLE PRECISION,
+            ebitda_ttm_5y_ago                     DOUBLE PRECISION,
+            eps_gaap_ttm                          DOUBLE PRECISION,
+            eps_gaap_ttm_prev                     DOUBLE PRECISION,
+            eps_gaap_ttm_3y_ago                   DOUBLE PRECISION,
+            eps_gaap_ttm_5y_ago                   DOUBLE PRECISION,
+            revenue_gaap_ttm                      DOUBLE PRECISION,
+            revenue_gaap_ttm_prev                 DOUBLE PRECISION,
+            revenue_gaap_ttm_3y_ago               DOUBLE PRECISION,
+            revenue_gaap_ttm_5y_ago               DOUBLE PRECISION,
+            operating_income_ttm                  DOUBLE PRECISION,
+            operating_income_ttm_prev             DOUBLE PRECISION,
+            ebit_ttm                              DOUBLE PRECISION,
+            interest_expense_ttm                  DOUBLE PRECISION,
+            operating_expenses_ttm                DOUBLE PRECISION,
+            cost_of_revenue_ttm                   DOUBLE PRECISION,
+
+            -- Balance sheet (latest quarter and year-over-year averages)
+            total_debt                            DOUBLE PRECISION,
+            total_equity                          DOUBLE PRECISION,
+            cash_and_short_term_investments       DOUBLE PRECISION,
+            inventory                             DOUBLE PRECISION,
+            total_assets_avg                      DOUBLE PRECISION,
+            total_debt_avg                        DOUBLE PRECISION,
+            total_equity_avg                      DOUBLE PRECISION,
+            cash_and_short_term_investments_avg   DOUBLE PRECISION,
+            net_ppe_avg                           DOUBLE PRECISION,
+            accounts_receivable_avg               DOUBLE PRECISION,
+            accounts_payable_avg                  DOUBLE PRECISION,
+            inventory_avg                         DOUBLE PRECISION,
+            retained_earnings_avg                 DOUBLE PRECISION,
+            total_current_assets_avg              DOUBLE PRECISION,
+            total_current_liabilities_avg         DOUBLE PRECISION,
+            total_liabilities_avg                 DOUBLE PRECISION,
+            net_debt_avg                          DOUBLE PRECISION,
+
+            -- Cash flow (TTM)
+            fcf_ttm                               DOUBLE PRECISION,
+            fcf_ttm_prev                          DOUBLE PRECISION,
+            fcf_ttm_3y_ago                        DOUBLE PRECISION,
+            fcf_ttm_5y_ago                        DOUBLE PRECISION,
+            ocf_ttm                               DOUBLE PRECISION,
+            dividends_paid_ttm                    DOUBLE PRECISION,
+            share_repurchased_ttm                 DOUBLE PRECISION,
+
+            -- Reported and forward EPS / revenue (core.earnings)
+            eps_ttm                               DOUBLE PRECISION,
+            eps_ttm_prev                          DOUBLE PRECISION,
+            eps_ttm_3y_ago                        DOUBLE PRECISION,
+            eps_ttm_5y_ago                        DOUBLE PRECISION,
+            eps_forward                           DOUBLE PRECISION,
+            eps_forward_growth_rate               DOUBLE PRECISION,
+            revenue_ttm                           DOUBLE PRECISION,
+            revenue_ttm_prev                      DOUBLE PRECISION,
+            revenue_ttm_3y_ago                    DOUBLE PRECISION,
+            revenue_ttm_5y_ago                    DOUBLE PRECISION,
+            revenue_forward                       DOUBLE PRECISION,
+            revenue_forward_growth_rate           DOUBLE PRECISION,
+
+            updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (tic, calendar_year, calendar_quarter)
+        );
+        """)
+        print("Table 'fundamentals_ttm' created or already exists with composite primary key.")
+
+
+       # Create a table for the shared daily price features if it does not exist
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS core.price_features (
+            -- Identity
+            tic                                   VARCHAR(10)  NOT NULL,
+            date                                  DATE         NOT NULL,
+
+            -- Close, daily returns and drawdown from the running peak
+            close                                 DOUBLE PRECISION NOT NULL,
+            return_1d                             DOUBLE PRECISION,
+            log_return_1d                         DOUBLE PRECISION,
+            peak_close                            DOUBLE PRECISION NOT NULL,   -- highest close to date
+            drawdown                              DOUBLE PRECISION NOT NULL,   -- close / peak_close - 1
+
+            -- Trailing 1 month: (date - 1 month, date]
+            price_start_1m                        DOUBLE PRECISION,
+            price_high_1m                         DOUBLE PRECISION,
+            price_low_1m                          DOUBLE PRECISION,
+            price_p25_1m                          DOUBLE PRECISION,
+            price_median_1m                       DOUBLE PRECISION,
+            price_p75_1m                          DOUBLE PRECISION,
+            price_mean_1m                         DOUBLE PRECISION,
+            price_stddev_1m                       DOUBLE PRECISION,
+            volatility_1m                         DOUBLE PRECISION,
+
+            -- Trailing 3 months: (date - 3 months, date]
+            price_start_3m                        DOUBLE PRECISION,
+            price_high_3m                         DOUBLE PRECISION,
+            price_low_3m                          DOUBLE PRECISION,
+            price_p25_3m                          DOUBLE PRECISION,
+            price_median_3m                       DOUBLE PRECISION,
+            price_p75_3m                          DOUBLE PRECISION,
+            price_mean_3m                         DOUBLE PRECISION,
+            price_stddev_3m                       DOUBLE PRECISION,
+            volatility_3m                         DOUBLE PRECISION,
+
+            -- Trailing 12 months: (date - 12 months, date]
+            price_start_12m                       DOUBLE PRECISION,
+            price_high_12m                        DOUBLE PRECISION,
+            price_low_12m                         DOUBLE PRECISION,
+            price_p25_12m                         DOUBLE PRECISION,
+            price_median_12m                      DOUBLE PRECISION,
+            price_p75_12m                         DOUBLE PRECISION,
+            price_mean_12m                        DOUBLE PRECISION,
+            price_stddev_12m                      DOUBLE PRECISION,
+            volatility_12m                        DOUBLE PRECISION,
+
+            -- Flags
+            is_price_jump                         BOOLEAN      NOT NULL,   -- |return_1d| > 10%
+            is_split_candidate                    BOOLEAN      NOT NULL,   -- jump close to a split ratio
+
+            updated_at                            TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (tic, date)
+        ) {partition_by()};
+        """)
+        print("Table 'price_features' created or already exists with composite primary key.")
+
+
+       # Create a table for per-ticker watermarks of the incremental metric jobs if it does not exist
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS core.metric_watermarks (
+            job                     TEXT         NOT NULL,   -- target table, e.g. core.valuation_metrics
+            tic                     VARCHAR(10)  NOT NULL,
+            last_date               DATE         NOT NULL,   -- latest date written for the ticker
+            source_fingerprint      CHAR(32)     NOT NULL,   -- md5 over the upstream quarterly rows
+            updated_at              TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (job, tic)
+        );
+        """)
+        print("Table 'metric_watermarks' created or already exists with composite primary key.")
+
+        # Yearly partitions and date indexes of the daily tables (DB_PARTITIONING=1)
+        if PARTITIONED:
+            for table in DAILY_TABLES:
+                if table.startswith('core.'):
+                    created = create_partitions(cursor, table)
+                    print(f"Partitions for '{table}' created or already exist ({created} new).")
+
+
 
 
         conn.commit()
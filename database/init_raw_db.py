@@ -1,5 +1,6 @@
 from psycopg import connect
 from utils import connect_to_db
+from partitioning import PARTITIONED, partition_by, create_partitions
 
 # Connect to PostgreSQL
 def table_creation(conn):
@@ -43,7 +44,7 @@ def table_creation(conn):
 
 
         # Create a table for stock OHLCV daily data if it does not exist
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS raw.stock_ohlcv_daily (
             date          DATE NOT NULL,
             tic           VARCHAR(10) NOT NULL,
@@ -55,9 +56,12 @@ def table_creation(conn):
             source        VARCHAR(255),
             updated_at   TIMESTAMPTZ DEFAULT now(),
             PRIMARY KEY (date, tic)
-        );
+        ) {partition_by()};
         """)
         print("Table 'stock_ohlcv_daily' created or already exists.")
+        if PARTITIONED:
+            created = create_partitions(cursor, 'raw.stock_ohlcv_daily')
+            print(f"Partitions for 'stock_ohlcv_daily' created or already exist ({created} new).")
 
 
         # Create a table for historical earnings data if it does not exist
@@ -35,7 +35,40 @@ def table_creation(conn):
         """)
         print("Table 'analyst_grade_mapping' created or already exists.")
 
-       
+        # Create a table for cached retrieval query embeddings if it does not exist
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ref.query_embedding_cache (
+            embedding_model TEXT NOT NULL,
+            query_sha256    CHAR(64) NOT NULL,   -- sha256 of query_text
+            query_text      TEXT NOT NULL,
+            -- Embedding vector
+            embedding       VECTOR(1536) NOT NULL,
+
+            updated_at      TIMESTAMPTZ DEFAULT now(),
+            PRIMARY KEY (embedding_model, query_sha256)
+        );
+        """)
+        print("Table 'query_embedding_cache' created or already exists.")
+
+        # Create a table for cached LLM responses if it does not exist
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ref.llm_response_cache (
+            prompt_sha256   CHAR(64) PRIMARY KEY,   -- hash of provider, model, temperature and messages
+            provider        TEXT NOT NULL,
+            model           TEXT NOT NULL,
+            response        JSONB NOT NULL,         -- content, usage_metadata, response_metadata
+
+            created_at      TIMESTAMPTZ DEFAULT now(),
+            last_hit_at     TIMESTAMPTZ DEFAULT now()
+        );
+        """)
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS llm_response_cache_last_hit_idx
+        ON ref.llm_response_cache (last_hit_at);
+        """)
+        print("Table 'llm_response_cache' created or already exists.")
+
+
 
         conn.commit()
         
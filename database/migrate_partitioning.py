@@ -0,0 +1,84 @@
+from utils import connect_to_db
+from partitioning import DAILY_TABLES, is_partitioned, create_partitions
+
+# One-off migration of the daily (tic, date) tables to yearly range partitions.
+# Each plain table is renamed to <table>_unpartitioned, recreated partitioned
+# with the keys in partitioning.DAILY_TABLES (metrics tables before their
+# percentiles, so the new foreign keys resolve), refilled with its rows and
+# dropped. Secondary indexes are recreated under their old names. Everything
+# runs in one transaction: on any error the original tables are left untouched.
+# Stop the ETL before running it; the copy holds locks on every table.
+
+
+def read_secondary_indexes(cursor, table: str) -> list:
+    """CREATE INDEX statements of `table` that do not back a constraint."""
+    cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid)
+        FROM pg_index AS i
+        WHERE i.indrelid = to_regclass(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint AS c WHERE c.conindid = i.indexrelid);
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def migrate_table(cursor, table: str) -> int:
+    """Swap one plain table for a partitioned copy; returns the rows moved."""
+    name = table.split('.')[1]
+    old = f"{table}_unpartitioned"
+    indexes = read_secondary_indexes(cursor, table)
+
+    # Index names are unique per schema: free them for the new table
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {name}_unpartitioned;")
+    cursor.execute("""
+        SELECT indexrelid::regclass::text
+        FROM pg_index
+        WHERE indrelid = to_regclass(%s);
+    """, (old,))
+    for (index,) in cursor.fetchall():
+        cursor.execute(f"ALTER INDEX {index} RENAME TO {index.split('.')[-1]}_unpartitioned;")
+
+    keys = ",\n            ".join(DAILY_TABLES[table])
+    cursor.execute(f"""
+        CREATE TABLE {table} (
+            LIKE {old} INCLUDING DEFAULTS,
+            {keys}
+        ) PARTITION BY RANGE (date);
+    """)
+    create_partitions(cursor, table)
+    for index in indexes:
+        cursor.execute(index)
+
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {old};")
+    return cursor.rowcount
+
+
+def main():
+    conn = connect_to_db()
+    if conn is None:
+        return
+    try:
+        migrated = []
+        with conn.cursor() as cursor:
+            for table in DAILY_TABLES:
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+                if not cursor.fetchone()[0] or is_partitioned(cursor, table):
+                    print(f"Skipping '{table}': missing or already partitioned.")
+                    continue
+                total_records = migrate_table(cursor, table)
+                migrated.append(table)
+                print(f"Moved {total_records} rows into partitioned '{table}'.")
+
+            # Percentiles first: their foreign keys point at the old metrics tables
+            for table in reversed(migrated):
+                cursor.execute(f"DROP TABLE {table}_unpartitioned;")
+        conn.commit()
+        print(f"Migrated {len(migrated)} tables to yearly partitions.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+from datetime import date
+from utils import connect_to_db
+
+# Yearly range partitioning for the daily (tic, date) tables.
+# With DB_PARTITIONING=1 the init scripts create these tables PARTITION BY
+# RANGE (date): one partition per calendar year from PARTITION_FIRST_YEAR to
+# PARTITION_YEARS_AHEAD years past the current one, plus a default partition
+# for older history. Every partition gets a BRIN index on date and a btree on
+# (tic, date) (from the primary or UNIQUE key where the table has one), so a
+# range or latest-date read only opens the partitions it needs and an
+# incremental upsert only writes to the current year.
+# Postgres does not create partitions on its own: main() here runs before the
+# nightly pipeline (etl/main.sh) to add the coming years ahead of time.
+
+PARTITIONED = os.getenv("DB_PARTITIONING", "0") == "1"
+PARTITION_FIRST_YEAR = int(os.getenv("DB_PARTITION_FIRST_YEAR", "2000"))
+PARTITION_YEARS_AHEAD = 1
+
+METRIC_DOMAINS = ['valuation', 'profitability', 'growth', 'efficiency', 'financial_health']
+
+# Table -> keys it is created with. Unique keys of a partitioned table must
+# contain the partition column, so metrics rows are keyed by (inference_id, date)
+# and their percentile rows reference that pair.
+DAILY_TABLES = {
+    'raw.stock_ohlcv_daily': ["PRIMARY KEY (date, tic)"],
+    **{f'core.{domain}_metrics': ["PRIMARY KEY (inference_id, date)", "UNIQUE (tic, date)"]
+       for domain in METRIC_DOMAINS},
+    **{f'core.{domain}_percentiles': ["UNIQUE (tic, date)", "UNIQUE (inference_id, date)",
+                                      f"FOREIGN KEY (inference_id, date) REFERENCES core.{domain}_metrics (inference_id, date) ON DELETE CASCADE"]
+       for domain in METRIC_DOMAINS},
+    'core.stock_scores': ["UNIQUE (tic, date)"],
+    'core.price_features': ["PRIMARY KEY (tic, date)"],
+}
+
+
+def partition_by() -> str:
+    """PARTITION BY clause closing a daily table's CREATE TABLE ('' when partitioning is off)."""
+    return "PARTITION BY RANGE (date)" if PARTITIONED else ""
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s);", (table,))
+    return cursor.fetchone() is not None
+
+
+def referencing_keys(cursor, table: str) -> list:
+    """(table, columns, referenced columns) of every foreign key pointing at `table`."""
+    cursor.execute("""
+        SELECT c.conrelid::regclass::text,
+            ARRAY(SELECT a.attname::text FROM unnest(c.conkey) WITH ORDINALITY AS k(attnum, i)
+                  JOIN pg_attribute AS a ON a.attrelid = c.conrelid AND a.attnum = k.attnum ORDER BY k.i),
+            ARRAY(SELECT a.attname::text FROM unnest(c.confkey) WITH ORDINALITY AS k(attnum, i)
+                  JOIN pg_attribute AS a ON a.attrelid = c.confrelid AND a.attnum = k.attnum ORDER BY k.i)
+        FROM pg_constraint AS c
+        WHERE c.contype = 'f'
+          AND c.confrelid = to_regclass(%s)
+          AND c.conparentid = 0;
+    """, (table,))
+    return cursor.fetchall()
+
+
+def create_year_partition(cursor, table: str, year: int) -> bool:
+    """
+    Add the `year` partition of `table` unless it exists; returns True if created.
+    Rows of that year already sitting in the default partition are moved into it.
+    Rows of other tables referencing the moved rows (the percentiles of a
+    metrics table) are set aside and restored around the move, so their
+    ON DELETE CASCADE foreign keys do not delete them.
+    """
+    name = f"{table}_y{year}"
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (name,))
+    if cursor.fetchone()[0]:
+        return False
+
+    bounds = f"FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+    in_year = f"date >= '{year}-01-01' AND date < '{year + 1}-01-01'"
+    cursor.execute(f"SELECT 1 FROM {table}_default WHERE {in_year} LIMIT 1;")
+    if cursor.fetchone() is None:
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds};")
+    else:
+        # A new partition may not overlap rows in the default one: move them first
+        cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS);")
+        set_aside = []
+        for referencing, columns, referenced in referencing_keys(cursor, table):
+            held = f"held_{referencing.split('.')[-1]}"
+            cursor.execute(f"CREATE TEMP TABLE {held} (LIKE {referencing}) ON COMMIT DROP;")
+            cursor.execute(f"""
+                WITH held AS (
+                    DELETE FROM {referencing}
+                    WHERE ({", ".join(columns)}) IN (
+                        SELECT {", ".join(referenced)} FROM {table}_default WHERE {in_year}
+                    )
+                    RETURNING *
+                )
+                INSERT INTO {held} SELECT * FROM held;
+            """)
+            set_aside.append((referencing, held))
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {table}_default WHERE {in_year} RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved;
+        """)
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds};")
+        for referencing, held in set_aside:
+            cursor.execute(f"INSERT INTO {referencing} SELECT * FROM {held};")
+            cursor.execute(f"DROP TABLE {held};")
+    return True
+
+
+def create_partitions(cursor, table: str, first_year: int = PARTITION_FIRST_YEAR,
+                      years_ahead: int = PARTITION_YEARS_AHEAD) -> int:
+    """
+    Default partition, yearly partitions from first_year through years_ahead
+    years from now, and the date indexes of a partitioned daily table.
+    Indexes on the parent are created on every present and future partition.
+    Tables created before partitioning was enabled are left to migrate_partitioning.py.
+    """
+    if not is_partitioned(cursor, table):
+        print(f"Table '{table}' is not partitioned; run migrate_partitioning.py to convert it.")
+        return 0
+    name = table.split('.')[1]
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT;")
+    created = sum(create_year_partition(cursor, table, year)
+                  for year in range(first_year, date.today().year + years_ahead + 1))
+
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {name}_date_brin ON {table} USING BRIN (date);")
+    if not {"UNIQUE (tic, date)", "PRIMARY KEY (tic, date)"} & set(DAILY_TABLES[table]):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name}_tic_date_idx ON {table} (tic, date);")
+    return created
+
+
+def ensure_partitions(conn, years_ahead: int = PARTITION_YEARS_AHEAD) -> int:
+    """Add the partitions for the current and coming years to every partitioned daily table."""
+    created = 0
+    with conn.cursor() as cursor:
+        for table in DAILY_TABLES:
+            if is_partitioned(cursor, table):
+                this_year = date.today().year
+                created += sum(create_year_partition(cursor, table, year)
+                               for year in range(this_year, this_year + years_ahead + 1))
+    conn.commit()
+    return created
+
+
+if __name__ == "__main__":
+    conn = connect_to_db()
+    if conn:
+        created = ensure_partitions(conn)
+        print(f"Created {created} yearly partitions.")
+        conn.close()
@@ -1,75 +1,136 @@
 import pandas as pd
 from typing import Optional
 import os
+import asyncio
 from psycopg import connect
+from psycopg_pool import AsyncConnectionPool
 import numpy as np
 import database.config
 
 # Connect to PostgreSQL
+def connection_params(type: str = "localhost") -> Optional[tuple]:
+    """(conninfo, kwargs) of a connection of `type`; None when its environment variables are missing."""
+    if type == "localhost":
+        # 1. Fetch Variables
+        db_name = os.getenv("PGDATABASE")
+        db_user = os.getenv("PGUSER")
+        db_pass = os.getenv("PGPASSWORD")
+        db_host = os.getenv("PGHOST")
+        db_port = os.getenv("PGPORT")
+        sslmode = os.getenv("PGSSLMODE")
+
+        # 2. Debug: Check for missing values
+        missing_vars = []
+        if not db_name: missing_vars.append("PGDATABASE")
+        if not db_user: missing_vars.append("PGUSER")
+        if not db_pass: missing_vars.append("PGPASSWORD")
+        if not db_host: missing_vars.append("PGHOST")
+        if not db_port: missing_vars.append("PGPORT")
+        if not sslmode: missing_vars.append("PGSSLMODE")
+
+        if missing_vars:
+            print(f"❌ ERROR: Missing environment variables for localhost: {', '.join(missing_vars)}")
+            return None
+
+        return "", dict(
+            dbname=db_name,
+            user=db_user,
+            password=db_pass,
+            host=db_host,
+            port=db_port,
+            sslmode=sslmode
+        )
+
+    elif type == "supabase":
+        # 1. Fetch Variable
+        connection_string = os.getenv("SUPABASE_TRANSACTION")
+
+        # 2. Debug: Check if missing
+        if not connection_string:
+            print("❌ ERROR: Missing environment variable 'SUPABASE_TRANSACTION'")
+            return None
+
+        # 3. Connect with prepare_threshold=None to DISABLE prepared statements.
+        #    In psycopg3: 0 = prepare immediately, None = NEVER prepare.
+        #    PgBouncer transaction mode cannot handle named prepared statements.
+        return connection_string, dict(
+            connect_timeout=120, 
+            keepalives=1, 
+            keepalives_idle=30, 
+            keepalives_interval=10, 
+            keepalives_count=5,
+            sslmode='require',
+            prepare_threshold=None
+        )
+    else:
+        raise ValueError(f"Invalid connection type specified: {type}")
+
+
 def connect_to_db(type: str = "localhost"):
     try:
-        if type == "localhost":
-            # 1. Fetch Variables
-            db_name = os.getenv("PGDATABASE")
-            db_user = os.getenv("PGUSER")
-            db_pass = os.getenv("PGPASSWORD")
-            db_host = os.getenv("PGHOST")
-            db_port = os.getenv("PGPORT")
-            sslmode = os.getenv("PGSSLMODE")
-
-            # 2. Debug: Check for missing values
-            missing_vars = []
-            if not db_name: missing_vars.append("PGDATABASE")
-            if not db_user: missing_vars.append("PGUSER")
-            if not db_pass: missing_vars.append("PGPASSWORD")
-            if not db_host: missing_vars.append("PGHOST")
-            if not db_port: missing_vars.append("PGPORT")
-            if not sslmode: missing_vars.append("PGSSLMODE")
-
-            if missing_vars:
-                print(f"❌ ERROR: Missing environment variables for localhost: {', '.join(missing_vars)}")
-                return None
-
-            # 3. Connect
-            conn = connect(
-                dbname=db_name,
-                user=db_user,
-                password=db_pass,
-                host=db_host,
-                port=db_port,
-                sslmode=sslmode
-            )
-
-        elif type == "supabase":
-            # 1. Fetch Variable
-            connection_string = os.getenv("SUPABASE_TRANSACTION")
-
-            # 2. Debug: Check if missing
-            if not connection_string:
-                print("❌ ERROR: Missing environment variable 'SUPABASE_TRANSACTION'")
-                return None
-
-            # 3. Connect with prepare_threshold=None to DISABLE prepared statements.
-            #    In psycopg3: 0 = prepare immediately, None = NEVER prepare.
-            #    PgBouncer transaction mode cannot handle named prepared statements.
-            conn = connect(
-                connection_string, 
-                connect_timeout=120, 
-                keepalives=1, 
-                keepalives_idle=30, 
-                keepalives_interval=10, 
-                keepalives_count=5,
-                sslmode='require',
-                prepare_threshold=None
-            )
-        else:
-            raise ValueError(f"Invalid connection type specified: {type}")
-        
-        return conn
+        params = connection_params(type)
+        if params is None:
+            return None
+        conninfo, kwargs = params
+        # 3. Connect
+        return connect(conninfo, **kwargs)
 
     except Exception as e:
         print(f"❌ Connection Failed ({type}): {e}")
         return None
+
+
+# Async connections for coroutine nodes: one AsyncConnectionPool per event loop
+# and connection type, since a pool cannot be shared across loops.
+ASYNC_POOL_SIZE = int(os.getenv("PG_ASYNC_POOL_SIZE", "10"))
+_async_pools = {}  # (event loop, type) -> Task opening the pool
+
+
+async def _open_async_pool(type: str) -> AsyncConnectionPool:
+    params = connection_params(type)
+    if params is None:
+        raise RuntimeError(f"Missing database environment variables for {type}.")
+    conninfo, kwargs = params
+    pool = AsyncConnectionPool(conninfo, kwargs=kwargs, min_size=1, max_size=ASYNC_POOL_SIZE, open=False)
+    await pool.open()
+    return pool
+
+
+async def get_async_pool(type: str = "localhost") -> AsyncConnectionPool:
+    """The running event loop's pool of `type` connections, opened on first use."""
+    loop = asyncio.get_running_loop()
+    key = (loop, type)
+    if key not in _async_pools:
+        # Concurrent first callers await the same opening task
+        _async_pools[key] = loop.create_task(_open_async_pool(type))
+    try:
+        return await _async_pools[key]
+    except Exception:
+        _async_pools.pop(key, None)
+        raise
+
+
+async def close_async_pool(type: str = "localhost"):
+    """Close the running event loop's pool; call it before the loop ends (e.g. at the end of asyncio.run)."""
+    task = _async_pools.pop((asyncio.get_running_loop(), type), None)
+    if task is not None and task.done() and not task.exception():
+        await task.result().close()
+
+
+async def aexecute_query(sql: str, params: Optional[tuple] = None, type: str = "localhost"):
+    """Async execute_query on a connection from the event loop's pool."""
+    try:
+        pool = await get_async_pool(type)
+        async with pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                records = await cursor.fetchall()
+
+                # Create a DataFrame from the fetched records
+                return pd.DataFrame(records, columns=[desc[0] for desc in cursor.description])
+    except Exception as e:
+        print(f"Error executing query: {e}")
+        return None
     
     
     
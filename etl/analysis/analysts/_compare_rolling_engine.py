@@ -0,0 +1,362 @@
+"""Golden comparison: rolling_engine summaries vs the original per-date loop of analysts/main.py, plus timings."""
+import sys
+import os
+import time
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import numpy as np
+import pandas as pd
+from database.utils import connect_to_db
+from etl.analysis.analysts.main import SUMMARY_TABLES, HISTORY_DAYS, read_ohlcv_data, read_analyst_pts, \
+    read_analyst_grades, find_previous_pts, transform_records
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_TICKERS = 5  # first tickers of core.stock_profiles with both price targets and grades
+RTOL = 1e-12  # sums run in a different order, and implied returns were Decimal divisions
+# ──────────────────────────────────────────────────────────────────
+
+
+# ─── Reference: original etl/analysis/analysts/main.py ────────────
+
+def timestamp_to_trading_date(timestamp):
+    """Original scalar etl.utils.timestamp_to_trading_date, kept as the reference."""
+    timestamp = pd.to_datetime(timestamp)
+    if timestamp.hour < 9 or (timestamp.hour == 9 and timestamp.minute < 30):
+        timestamp -= pd.Timedelta(days=1)
+    return timestamp.date()
+
+
+def aggregate_analyst_pts(df, start_date, end_date):
+    """
+    Aggregate price target (PT) statistics and PT action counts for a 30-day window.
+
+    Applies trading-date attribution via `timestamp_to_trading_date`, filters rows
+    to (start_date, end_date] (open-right interval), and computes:
+      - pt_stats: {count, high, low, p25, median, p75, mean, stddev, dispersion}
+      - pt_actions: {upgrade_n, downgrade_n, reiterate_n, init_n}
+        (based on `pt_change` from `find_previous_pts`)
+
+    Args:
+        df (pd.DataFrame): Analyst PT notes with at least:
+            ['tic','published_at','pt','pt_change'] and optionally
+            ['price_target','adj_price_target'] if `pt` isn’t precomputed.
+        start_date (date): Exclusive lower bound of the window.
+        end_date (date): Inclusive upper bound of the window.
+
+    Returns:
+        dict: {
+          "pt_stats": {...},
+          "pt_actions": {...}
+        }
+
+    Notes:
+        - `dispersion` = p75 - p25; fallback to (high - low) if quantiles unavailable.
+        - Ensure `find_previous_pts` has been applied before calling this function
+          if you want accurate action counts.
+    """
+    df = df.copy()  # Ensure we are working on a copy
+    df.loc[:, 'trading_date'] = df['published_at'].apply(timestamp_to_trading_date)
+    df = df[(df['trading_date'] <= end_date) & (df['trading_date'] > start_date)]
+
+    # Only get the most updated pt based on analyst_name and company
+    df = df.sort_values('published_at').groupby(['analyst_name', 'company'], as_index=False).last()
+
+    df.loc[:, 'pt'] = df['pt'].astype(float)
+    pt_stats = {
+        "pt_count": len(df),
+        "pt_high": df['pt'].max(),
+        "pt_low": df['pt'].min(),
+        "pt_p25": df['pt'].quantile(0.25),
+        "pt_median": df['pt'].median(),
+        "pt_p75": df['pt'].quantile(0.75),
+        "pt_mean": df['pt'].mean(),
+        "pt_stddev": df['pt'].std(),
+        "pt_dispersion": df['pt'].quantile(0.75) - df['pt'].quantile(0.25) if not df['pt'].empty else df['pt'].max() - df['pt'].min()
+    }
+
+    pt_actions = {
+        "pt_upgrade_n": (df['pt_change'] == 'upgrade').sum(),
+        "pt_downgrade_n": (df['pt_change'] == 'downgrade').sum(),
+        "pt_reiterate_n": (df['pt_change'] == 'reiterate').sum(),
+        "pt_init_n": (df['pt_change'] == 'initialize').sum()
+    }
+
+    return {"pt_stats": pt_stats, "pt_actions": pt_actions}
+
+
+def aggregate_analyst_grades(df, start_date, end_date):
+    """
+    Aggregate grade distribution and grade action counts for a 30-day window.
+
+    Applies trading-date attribution via `timestamp_to_trading_date`, filters rows
+    to (start_date, end_date], and computes:
+      - grade_stats: {count, buy_n, hold_n, sell_n, buy_ratio, hold_ratio,
+                      sell_ratio, grade_balance}
+      - grade_actions: {upgrade_n, downgrade_n, reiterate_n, init_n}
+
+    Args:
+        df (pd.DataFrame): Analyst grade actions with at least:
+            ['tic','published_at','new_grade','previous_grade','grade_change'].
+            Grades should be (or be mappable to) Buy/Hold/Sell.
+        start_date (date): Exclusive lower bound.
+        end_date (date): Inclusive upper bound.
+
+    Returns:
+        dict: {
+          "grade_stats": {...},
+          "grade_actions": {...}
+        }
+
+    Notes:
+        - `grade_balance` = (buy_n - sell_n) / count.
+        - Apply your grade normalization map before calling this function.
+    """
+    df = df.copy()  # Ensure we are working on a copy
+    df.loc[:, 'trading_date'] = df['published_at'].apply(timestamp_to_trading_date)
+    df = df[(df['trading_date'] <= end_date) & (df['trading_date'] > start_date)]
+
+    # Only get the most updated pt based on company
+    _df = df.sort_values('published_at').groupby(['company'], as_index=False).last()
+
+    grade_stats = {
+        "grade_count": len(_df),
+        "grade_buy_n": (_df['new_grade'] == 1).sum(),
+        "grade_hold_n": (_df['new_grade'] == 0).sum(),
+        "grade_sell_n": (_df['new_grade'] == -1).sum(),
+        "grade_buy_ratio": (_df['new_grade'] == 1).sum() / len(_df) if len(_df) > 0 else 0,
+        "grade_hold_ratio": (_df['new_grade'] == 0).sum() / len(_df) if len(_df) > 0 else 0,
+        "grade_sell_ratio": (_df['new_grade'] == -1).sum() / len(_df) if len(_df) > 0 else 0,
+        "grade_balance": (_df['new_grade'].sum() / len(_df) if len(_df) > 0 else 0)
+    }
+
+
+    df.loc[:, 'action_code'] = df['action'].apply(lambda x: {'upgrade': 2, 'downgrade': 2, 'reiterate': 1, 'initialize': 0}.get(x, np.nan))
+    # if pd.to_datetime(end_date) == pd.Timestamp('2025-09-02'):
+    #     print("Debug: End date is 2025-09-02")
+    #     import pdb; pdb.set_trace()
+    _df = df.sort_values(['action_code', 'published_at']).groupby(['company'], as_index=False).last()
+
+    grade_actions = {
+        "grade_upgrade_n": (_df['action'] == 'upgrade').sum(),
+        "grade_downgrade_n": (_df['action'] == 'downgrade').sum(),
+        "grade_reiterate_n": (_df['action'] == 'reiterate').sum(),
+        "grade_init_n": (_df['action'] == 'initialize').sum()
+    }
+
+    return {"grade_stats": grade_stats, "grade_actions": grade_actions}
+
+
+def aggregate_analyst_returns(df, start_date, end_date):
+    """
+    Aggregate analyst-implied return statistics and return action counts.
+
+    Implied return per note is defined as:
+        return_i = (pt_i / price_when_posted_i) - 1
+    This function:
+      1) Attributes events to trading dates via `timestamp_to_trading_date`.
+      2) Filters to (start_date, end_date].
+      3) Computes return_stats: {mean, median, p25, p75, stddev, dispersion, high, low}.
+      4) Computes return_actions: {upgrade_n, downgrade_n, reiterate_n, init_n} where
+         changes are measured vs each analyst's previous note:
+             Δreturn = return_new - return_prev
+         and the upgrade/downgrade thresholds are **volatility-adjusted** using
+         `price_stats.stddev` from the same window (see `stock_price_statistics`).
+
+    Args:
+        df (pd.DataFrame): Analyst PT notes with fields:
+            ['tic','published_at','pt','price_when_posted','prev_pt','prev_price_when_posted']
+            (previous fields required for Δreturn classification).
+        start_date (date): Exclusive lower bound of the 30-day window.
+        end_date (date): Inclusive upper bound of the 30-day window.
+
+    Returns:
+        dict: {
+          "return_stats": {...},
+          "return_actions": {...}
+        }
+
+    Notes:
+        - Ensure previous-note fields are populated (e.g., via `find_previous_pts`)
+          if you need return action counts.
+        - The volatility-adjusted threshold should be sourced from
+          `price_stats['stddev']` computed for the same (start_date, end_date].
+    """
+    df = df.copy()  # Ensure we are working on a copy
+    df.loc[:, 'trading_date'] = df['published_at'].apply(timestamp_to_trading_date)
+    df = df[(df['trading_date'] <= end_date) & (df['trading_date'] > start_date)]
+
+    # Only get the most updated pt based on analyst_name and company
+    df = df.sort_values('published_at').groupby(['company'], as_index=False).last()
+
+    df.loc[:, 'implied_return'] = (df['pt'] / df['price_when_posted']) - 1
+    df.loc[:, 'implied_return'] = df['implied_return'].astype(float)
+    return_stats = {
+        "ret_mean": df['implied_return'].mean(),
+        "ret_median": df['implied_return'].median(),
+        "ret_p25": df['implied_return'].quantile(0.25),
+        "ret_p75": df['implied_return'].quantile(0.75),
+        "ret_stddev": df['implied_return'].std(),
+        "ret_dispersion": df['implied_return'].quantile(0.75) - df['implied_return'].quantile(0.25) if not df['implied_return'].empty else df['implied_return'].max() - df['implied_return'].min(),
+        "ret_high": df['implied_return'].max(),
+        "ret_low": df['implied_return'].min()
+    }
+
+    return {"ret_stats": return_stats}
+
+
+def stock_price_statistics(df, start_date, end_date):
+    """
+    Compute price statistics over the 30-day window for volatility-aware comparisons.
+
+    Filters daily OHLCV rows to (start_date, end_date] and computes summary stats
+    on the `close` (or `adj close` if your input has it). Intended to produce the
+    `price_stats` block used both for context and as a **dynamic threshold source**
+    (stddev) for volatility-adjusted return action classification.
+
+    Args:
+        df (pd.DataFrame): Daily price data with columns:
+            ['tic','date','open','high','low','close','volume'].
+        start_date (date): Exclusive lower bound of the window.
+        end_date (date): Inclusive upper bound of the window.
+
+    Returns:
+        dict: {
+          "price_stats": {
+            "start": float,
+            "end": float,
+            "high": float,
+            "low": float,
+            "p25": float,
+            "median": float,
+            "p75": float,
+            "mean": float,
+            "stddev": float
+          }
+        }
+
+    Notes:
+        - Uses the first and last available closes within the window for `start`/`end`.
+        - If your pipeline uses adjusted prices, pass that column as `close`.
+        - The returned `stddev` (of daily closes) is referenced by `aggregate_analyst_returns`
+          to set volatility-adjusted thresholds for return upgrades/downgrades.
+    """
+    df = df.copy()  # Ensure we are working on a copy
+    df = df[(df['date'] <= end_date) & (df['date'] > start_date)]
+
+    df.loc[:, 'close'] = df['close'].astype(float)
+    price_stats = {
+        "price_start": df['close'].iloc[0] if not df.empty else None,
+        "price_end": df['close'].iloc[-1] if not df.empty else None,
+        "price_high": df['close'].max(),
+        "price_low": df['close'].min(),
+        "price_p25": df['close'].quantile(0.25),
+        "price_median": df['close'].median(),
+        "price_p75": df['close'].quantile(0.75),
+        "price_mean": df['close'].mean(),
+        "price_stddev": df['close'].std()
+    }
+
+    return {"price_stats": price_stats}
+
+
+def reference_transform_records(tic, conn, cursor, num_months, latest_date):
+    results = []
+
+    # Fetch data
+    ohlcv_data = read_ohlcv_data(tic, conn)
+    analyst_pts = read_analyst_pts(tic, conn)
+    analyst_grades = read_analyst_grades(tic, conn)
+    
+    analyst_pts = find_previous_pts(analyst_pts)
+
+    cursor.execute(f"SELECT date FROM raw.stock_ohlcv_daily WHERE tic = '{tic}';")
+    dates = cursor.fetchall()
+
+    for date in dates:
+        end_date = date[0]
+        start_date = (date[0] - pd.DateOffset(months=num_months)).date()
+
+        if start_date < latest_date:
+            continue  # Skip if start_date is before the latest_date threshold
+
+        pt_aggregations = {}
+        return_aggregations = {}
+        if not analyst_pts.empty:
+            pt_aggregations = aggregate_analyst_pts(analyst_pts, start_date, end_date)
+            return_aggregations = aggregate_analyst_returns(analyst_pts, start_date, end_date)
+        
+        grade_aggregations = {}
+        if not analyst_grades.empty:
+            grade_aggregations = aggregate_analyst_grades(analyst_grades, start_date, end_date)
+        price_aggregations = stock_price_statistics(ohlcv_data, start_date, end_date)
+
+        # Combine results
+        if analyst_pts.empty and analyst_grades.empty:
+            continue  # Skip if no data to aggregate
+
+        result = {
+            "tic": tic,
+            "start_date": start_date,
+            "end_date": end_date,
+            **pt_aggregations['pt_stats'],
+            **pt_aggregations['pt_actions'],
+            **grade_aggregations['grade_stats'],
+            **grade_aggregations['grade_actions'],
+            **return_aggregations['ret_stats'],
+            **price_aggregations['price_stats'],
+        }
+
+        results.append(result)
+    
+    df = pd.DataFrame(results)
+    return df
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df['end_date'] = pd.to_datetime(df['end_date'])
+    df['start_date'] = pd.to_datetime(df['start_date'])
+    df = df.sort_values('end_date').reset_index(drop=True)
+    for col in df.columns:
+        if col not in ('tic', 'start_date', 'end_date'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+    return df
+
+
+conn = connect_to_db()
+if conn is None:
+    sys.exit(1)
+cursor = conn.cursor()
+latest_date = (pd.Timestamp.today() - pd.Timedelta(days=HISTORY_DAYS)).date()
+
+cursor.execute("SELECT tic FROM core.stock_profiles;")
+tickers = []
+for (tic,) in cursor.fetchall():
+    # The per-date loop fails on tickers missing either price targets or grades
+    if not read_analyst_pts(tic, conn).empty and not read_analyst_grades(tic, conn).empty:
+        tickers.append(tic)
+    if len(tickers) == N_TICKERS:
+        break
+
+failures = 0
+for tic in tickers:
+    t0 = time.perf_counter()
+    new = transform_records(conn, latest_date, tic=tic)
+    t1 = time.perf_counter()
+    for name, (num_months, _) in SUMMARY_TABLES.items():
+        t2 = time.perf_counter()
+        expected = reference_transform_records(tic, conn, cursor, num_months, latest_date)
+        t3 = time.perf_counter()
+        try:
+            pd.testing.assert_frame_equal(_normalize(expected), _normalize(new[name])[list(expected.columns)],
+                                          check_exact=False, rtol=RTOL, atol=1e-12)
+            print(f"✅ {tic} {name}: {len(expected)} rows identical; per-date loop {t3 - t2:.2f}s")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {tic} {name}: mismatch: {e}")
+    print(f"   {tic}: engine {t1 - t0:.2f}s for all three summaries")
+
+conn.close()
+sys.exit(1 if failures else 0)
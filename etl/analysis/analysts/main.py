@@ -1,14 +1,42 @@
 from database.utils import connect_to_db, insert_records, read_sql_query
-from etl.utils import timestamp_to_trading_date, convert_numpy_types
+from etl.transform.metrics.batch_engine import ticker_filter
+from etl.transform.metrics.incremental import INCREMENTAL, OVERLAP_DAYS
+from etl.analysis.analysts.rolling_engine import summarize_ticker, PRICE_STATS
+from etl.transform.metrics.prices.compute_price_features import JOB as PRICE_FEATURES
+from etl.trading_calendar import get_calendar
 import pandas as pd
 import numpy as np
 
+# Summary name -> (window length in months, target table)
+SUMMARY_TABLES = {
+    'monthly': (1, 'core.analyst_rating_monthly_summary'),
+    'quarterly': (3, 'core.analyst_rating_quarterly_summary'),
+    'yearly': (12, 'core.analyst_rating_yearly_summary'),
+}
+HISTORY_DAYS = 365 * 2  # windows starting earlier than this are not (re)computed
 
-def read_ohlcv_data(tic, conn):
+
+def read_ohlcv_data(tic, conn, since=None):
+    """Daily closes of one ticker (every ticker when tic is None), from `since` on if given."""
     query = f"""
         SELECT tic, date, open, high, low, close, volume
         FROM raw.stock_ohlcv_daily
-        WHERE tic = '{tic}';
+        WHERE {ticker_filter(tic)}{f" AND date >= '{since}'::date" if since else ''};
+    """
+    df = read_sql_query(query, conn)
+    return df
+
+
+def read_price_features(tic, conn, since=None):
+    """
+    Daily closes and the window price stats of every summary length from
+    core.price_features, for one ticker (every ticker when tic is None).
+    """
+    columns = ", ".join(f"{stat}_{num_months}m" for num_months, _ in SUMMARY_TABLES.values() for stat in PRICE_STATS)
+    query = f"""
+        SELECT tic, date, close, {columns}
+        FROM {PRICE_FEATURES}
+        WHERE {ticker_filter(tic)}{f" AND date >= '{since}'::date" if since else ''};
     """
     df = read_sql_query(query, conn)
     return df
@@ -20,8 +48,8 @@ def read_analyst_pts(tic, conn):
                 title, site, analyst_name, company, 
                 price_target, adj_price_target, price_when_posted
         FROM core.analyst_price_targets
-        WHERE tic = '{tic}'
-        ORDER BY published_at;
+        WHERE {ticker_filter(tic)}
+        ORDER BY tic, published_at;
     """
     df = read_sql_query(query, conn)
     return df
@@ -32,12 +60,19 @@ def read_analyst_grades(tic, conn):
                 title, site, company, 
                 new_grade, previous_grade, action, price_when_posted
         FROM core.analyst_grades
-        WHERE tic = '{tic}';
+        WHERE {ticker_filter(tic)};
     """
     df = read_sql_query(query, conn)
 
     return df
 
+
+def read_last_end_dates(conn, table: str) -> pd.Series:
+    """tic -> latest end_date already stored in a summary table."""
+    df = read_sql_query(f"SELECT tic, MAX(end_date) AS end_date FROM {table} GROUP BY tic;", conn)
+    return df.set_index('tic')['end_date']
+
+
 def find_previous_pts(df):
     """
     Annotate a PT DataFrame with previous-note context per (tic, analyst).
@@ -102,317 +137,68 @@ def find_previous_pts(df):
 
 
 
-def aggregate_analyst_pts(df, start_date, end_date):
-    """
-    Aggregate price target (PT) statistics and PT action counts for a 30-day window.
-
-    Applies trading-date attribution via `timestamp_to_trading_date`, filters rows
-    to (start_date, end_date] (open-right interval), and computes:
-      - pt_stats: {count, high, low, p25, median, p75, mean, stddev, dispersion}
-      - pt_actions: {upgrade_n, downgrade_n, reiterate_n, init_n}
-        (based on `pt_change` from `find_previous_pts`)
-
-    Args:
-        df (pd.DataFrame): Analyst PT notes with at least:
-            ['tic','published_at','pt','pt_change'] and optionally
-            ['price_target','adj_price_target'] if `pt` isn’t precomputed.
-        start_date (date): Exclusive lower bound of the window.
-        end_date (date): Inclusive upper bound of the window.
-
-    Returns:
-        dict: {
-          "pt_stats": {...},
-          "pt_actions": {...}
-        }
-
-    Notes:
-        - `dispersion` = p75 - p25; fallback to (high - low) if quantiles unavailable.
-        - Ensure `find_previous_pts` has been applied before calling this function
-          if you want accurate action counts.
-    """
-    df = df.copy()  # Ensure we are working on a copy
-    df.loc[:, 'trading_date'] = df['published_at'].apply(timestamp_to_trading_date)
-    df = df[(df['trading_date'] <= end_date) & (df['trading_date'] > start_date)]
-
-    # Only get the most updated pt based on analyst_name and company
-    df = df.sort_values('published_at').groupby(['analyst_name', 'company'], as_index=False).last()
-
-    df.loc[:, 'pt'] = df['pt'].astype(float)
-    pt_stats = {
-        "pt_count": len(df),
-        "pt_high": df['pt'].max(),
-        "pt_low": df['pt'].min(),
-        "pt_p25": df['pt'].quantile(0.25),
-        "pt_median": df['pt'].median(),
-        "pt_p75": df['pt'].quantile(0.75),
-        "pt_mean": df['pt'].mean(),
-        "pt_stddev": df['pt'].std(),
-        "pt_dispersion": df['pt'].quantile(0.75) - df['pt'].quantile(0.25) if not df['pt'].empty else df['pt'].max() - df['pt'].min()
-    }
-
-    pt_actions = {
-        "pt_upgrade_n": (df['pt_change'] == 'upgrade').sum(),
-        "pt_downgrade_n": (df['pt_change'] == 'downgrade').sum(),
-        "pt_reiterate_n": (df['pt_change'] == 'reiterate').sum(),
-        "pt_init_n": (df['pt_change'] == 'initialize').sum()
-    }
-
-    return {"pt_stats": pt_stats, "pt_actions": pt_actions}
-
-
-def aggregate_analyst_grades(df, start_date, end_date):
-    """
-    Aggregate grade distribution and grade action counts for a 30-day window.
-
-    Applies trading-date attribution via `timestamp_to_trading_date`, filters rows
-    to (start_date, end_date], and computes:
-      - grade_stats: {count, buy_n, hold_n, sell_n, buy_ratio, hold_ratio,
-                      sell_ratio, grade_balance}
-      - grade_actions: {upgrade_n, downgrade_n, reiterate_n, init_n}
-
-    Args:
-        df (pd.DataFrame): Analyst grade actions with at least:
-            ['tic','published_at','new_grade','previous_grade','grade_change'].
-            Grades should be (or be mappable to) Buy/Hold/Sell.
-        start_date (date): Exclusive lower bound.
-        end_date (date): Inclusive upper bound.
-
-    Returns:
-        dict: {
-          "grade_stats": {...},
-          "grade_actions": {...}
-        }
-
-    Notes:
-        - `grade_balance` = (buy_n - sell_n) / count.
-        - Apply your grade normalization map before calling this function.
-    """
-    df = df.copy()  # Ensure we are working on a copy
-    df.loc[:, 'trading_date'] = df['published_at'].apply(timestamp_to_trading_date)
-    df = df[(df['trading_date'] <= end_date) & (df['trading_date'] > start_date)]
-
-    # Only get the most updated pt based on company
-    _df = df.sort_values('published_at').groupby(['company'], as_index=False).last()
-
-    grade_stats = {
-        "grade_count": len(_df),
-        "grade_buy_n": (_df['new_grade'] == 1).sum(),
-        "grade_hold_n": (_df['new_grade'] == 0).sum(),
-        "grade_sell_n": (_df['new_grade'] == -1).sum(),
-        "grade_buy_ratio": (_df['new_grade'] == 1).sum() / len(_df) if len(_df) > 0 else 0,
-        "grade_hold_ratio": (_df['new_grade'] == 0).sum() / len(_df) if len(_df) > 0 else 0,
-        "grade_sell_ratio": (_df['new_grade'] == -1).sum() / len(_df) if len(_df) > 0 else 0,
-        "grade_balance": (_df['new_grade'].sum() / len(_df) if len(_df) > 0 else 0)
-    }
-
-
-    df.loc[:, 'action_code'] = df['action'].apply(lambda x: {'upgrade': 2, 'downgrade': 2, 'reiterate': 1, 'initialize': 0}.get(x, np.nan))
-    # if pd.to_datetime(end_date) == pd.Timestamp('2025-09-02'):
-    #     print("Debug: End date is 2025-09-02")
-    #     import pdb; pdb.set_trace()
-    _df = df.sort_values(['action_code', 'published_at']).groupby(['company'], as_index=False).last()
-
-    grade_actions = {
-        "grade_upgrade_n": (_df['action'] == 'upgrade').sum(),
-        "grade_downgrade_n": (_df['action'] == 'downgrade').sum(),
-        "grade_reiterate_n": (_df['action'] == 'reiterate').sum(),
-        "grade_init_n": (_df['action'] == 'initialize').sum()
-    }
-
-    return {"grade_stats": grade_stats, "grade_actions": grade_actions}
-
-
-def aggregate_analyst_returns(df, start_date, end_date):
+def transform_records(conn, latest_date, tic=None, last_end_dates: dict = None) -> dict:
     """
-    Aggregate analyst-implied return statistics and return action counts.
-
-    Implied return per note is defined as:
-        return_i = (pt_i / price_when_posted_i) - 1
-    This function:
-      1) Attributes events to trading dates via `timestamp_to_trading_date`.
-      2) Filters to (start_date, end_date].
-      3) Computes return_stats: {mean, median, p25, p75, stddev, dispersion, high, low}.
-      4) Computes return_actions: {upgrade_n, downgrade_n, reiterate_n, init_n} where
-         changes are measured vs each analyst's previous note:
-             Δreturn = return_new - return_prev
-         and the upgrade/downgrade thresholds are **volatility-adjusted** using
-         `price_stats.stddev` from the same window (see `stock_price_statistics`).
-
-    Args:
-        df (pd.DataFrame): Analyst PT notes with fields:
-            ['tic','published_at','pt','price_when_posted','prev_pt','prev_price_when_posted']
-            (previous fields required for Δreturn classification).
-        start_date (date): Exclusive lower bound of the 30-day window.
-        end_date (date): Inclusive upper bound of the 30-day window.
-
-    Returns:
-        dict: {
-          "return_stats": {...},
-          "return_actions": {...}
-        }
-
-    Notes:
-        - Ensure previous-note fields are populated (e.g., via `find_previous_pts`)
-          if you need return action counts.
-        - The volatility-adjusted threshold should be sourced from
-          `price_stats['stddev']` computed for the same (start_date, end_date].
+    Monthly, quarterly and yearly analyst rating summaries for one ticker (every
+    ticker when tic is None), one row per trading date whose window starts on or
+    after `latest_date`.
+    `last_end_dates` (summary name -> tic -> stored end_date) limits each summary
+    to the end dates after what is stored, recomputing the last OVERLAP_DAYS
+    sessions up to it so that notes published before the open and attributed
+    to the previous day are picked up.
+    Returns summary name -> DataFrame.
     """
-    df = df.copy()  # Ensure we are working on a copy
-    df.loc[:, 'trading_date'] = df['published_at'].apply(timestamp_to_trading_date)
-    df = df[(df['trading_date'] <= end_date) & (df['trading_date'] > start_date)]
-
-    # Only get the most updated pt based on analyst_name and company
-    df = df.sort_values('published_at').groupby(['company'], as_index=False).last()
-
-    df.loc[:, 'implied_return'] = (df['pt'] / df['price_when_posted']) - 1
-    df.loc[:, 'implied_return'] = df['implied_return'].astype(float)
-    return_stats = {
-        "ret_mean": df['implied_return'].mean(),
-        "ret_median": df['implied_return'].median(),
-        "ret_p25": df['implied_return'].quantile(0.25),
-        "ret_p75": df['implied_return'].quantile(0.75),
-        "ret_stddev": df['implied_return'].std(),
-        "ret_dispersion": df['implied_return'].quantile(0.75) - df['implied_return'].quantile(0.25) if not df['implied_return'].empty else df['implied_return'].max() - df['implied_return'].min(),
-        "ret_high": df['implied_return'].max(),
-        "ret_low": df['implied_return'].min()
-    }
-
-    return {"ret_stats": return_stats}
-
-
-def stock_price_statistics(df, start_date, end_date):
-    """
-    Compute price statistics over the 30-day window for volatility-aware comparisons.
-
-    Filters daily OHLCV rows to (start_date, end_date] and computes summary stats
-    on the `close` (or `adj close` if your input has it). Intended to produce the
-    `price_stats` block used both for context and as a **dynamic threshold source**
-    (stddev) for volatility-adjusted return action classification.
-
-    Args:
-        df (pd.DataFrame): Daily price data with columns:
-            ['tic','date','open','high','low','close','volume'].
-        start_date (date): Exclusive lower bound of the window.
-        end_date (date): Inclusive upper bound of the window.
-
-    Returns:
-        dict: {
-          "price_stats": {
-            "start": float,
-            "end": float,
-            "high": float,
-            "low": float,
-            "p25": float,
-            "median": float,
-            "p75": float,
-            "mean": float,
-            "stddev": float
-          }
-        }
-
-    Notes:
-        - Uses the first and last available closes within the window for `start`/`end`.
-        - If your pipeline uses adjusted prices, pass that column as `close`.
-        - The returned `stddev` (of daily closes) is referenced by `aggregate_analyst_returns`
-          to set volatility-adjusted thresholds for return upgrades/downgrades.
-    """
-    df = df.copy()  # Ensure we are working on a copy
-    df = df[(df['date'] <= end_date) & (df['date'] > start_date)]
-
-    df.loc[:, 'close'] = df['close'].astype(float)
-    price_stats = {
-        "price_start": df['close'].iloc[0] if not df.empty else None,
-        "price_end": df['close'].iloc[-1] if not df.empty else None,
-        "price_high": df['close'].max(),
-        "price_low": df['close'].min(),
-        "price_p25": df['close'].quantile(0.25),
-        "price_median": df['close'].median(),
-        "price_p75": df['close'].quantile(0.75),
-        "price_mean": df['close'].mean(),
-        "price_stddev": df['close'].std()
-    }
-
-    return {"price_stats": price_stats}
-
-
-def transform_records(tic, conn, cursor, num_months, latest_date):
-    results = []
-
-    # Fetch data
-    ohlcv_data = read_ohlcv_data(tic, conn)
-    analyst_pts = read_analyst_pts(tic, conn)
+    # summary name -> tic -> end dates after this session are (re)computed
+    recompute_after = {}
+    for name, ends in (last_end_dates or {}).items():
+        ends = ends.dropna()
+        recompute_after[name] = pd.Series(get_calendar(conn).offset(ends.to_numpy(), -OVERLAP_DAYS), index=ends.index)
+    price_data = read_price_features(tic, conn, since=latest_date)
+    analyst_pts = find_previous_pts(read_analyst_pts(tic, conn))
     analyst_grades = read_analyst_grades(tic, conn)
-    
-    analyst_pts = find_previous_pts(analyst_pts)
-
-    cursor.execute(f"SELECT date FROM raw.stock_ohlcv_daily WHERE tic = '{tic}';")
-    dates = cursor.fetchall()
-
-    for date in dates:
-        end_date = date[0]
-        start_date = (date[0] - pd.DateOffset(months=num_months)).date()
-
-        if start_date < latest_date:
-            continue  # Skip if start_date is before the latest_date threshold
-
-        pt_aggregations = {}
-        return_aggregations = {}
-        if not analyst_pts.empty:
-            pt_aggregations = aggregate_analyst_pts(analyst_pts, start_date, end_date)
-            return_aggregations = aggregate_analyst_returns(analyst_pts, start_date, end_date)
-        
-        grade_aggregations = {}
-        if not analyst_grades.empty:
-            grade_aggregations = aggregate_analyst_grades(analyst_grades, start_date, end_date)
-        price_aggregations = stock_price_statistics(ohlcv_data, start_date, end_date)
-
-        # Combine results
-        if analyst_pts.empty and analyst_grades.empty:
+    pts_by_tic = dict(tuple(analyst_pts.groupby('tic', sort=False)))
+    grades_by_tic = dict(tuple(analyst_grades.groupby('tic', sort=False)))
+
+    results = {name: [] for name in SUMMARY_TABLES}
+    for tic, prices in price_data.groupby('tic', sort=False):
+        pts = pts_by_tic.get(tic, analyst_pts.iloc[0:0])
+        grades = grades_by_tic.get(tic, analyst_grades.iloc[0:0])
+        if pts.empty and grades.empty:
             continue  # Skip if no data to aggregate
 
-        result = {
-            "tic": tic,
-            "start_date": start_date,
-            "end_date": end_date,
-            **pt_aggregations['pt_stats'],
-            **pt_aggregations['pt_actions'],
-            **grade_aggregations['grade_stats'],
-            **grade_aggregations['grade_actions'],
-            **return_aggregations['ret_stats'],
-            **price_aggregations['price_stats'],
-        }
-
-        results.append(result)
-    
-    df = pd.DataFrame(results)
-    return df
+        dates = np.unique(pd.to_datetime(prices['date']).to_numpy(dtype='datetime64[D]'))
+        windows = {}
+        for name, (num_months, _) in SUMMARY_TABLES.items():
+            after = recompute_after.get(name, pd.Series(dtype='datetime64[ns]')).get(tic)
+            end_dates = dates[(pd.DatetimeIndex(dates) - pd.DateOffset(months=num_months)) >= pd.Timestamp(latest_date)]
+            if after is not None and not pd.isna(after):
+                end_dates = end_dates[end_dates > np.datetime64(after, 'D')]
+            windows[name] = (num_months, end_dates)
+
+        for name, df in summarize_ticker(pts, grades, prices, windows).items():
+            df.insert(0, 'tic', tic)
+            results[name].append(df)
 
-def main():
+    return {name: pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            for name, frames in results.items()}
+
+def main(incremental: bool = INCREMENTAL):
     conn = connect_to_db()
     if conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT tic FROM core.stock_profiles;")
-        tic_list = cursor.fetchall()
-
         # Control how far back to process data
-        latest_date = (pd.Timestamp.today() - pd.Timedelta(days=365 * 2)).date()
-
-
-        for tic in tic_list:
-            tic = tic[0]
-            df = transform_records(tic, conn, cursor, 1, latest_date)
-            total_records = insert_records(conn, df, "core.analyst_rating_monthly_summary", ["tic", "end_date"])
-            print(f"Processed {total_records} monthly records for {tic}")
+        latest_date = (pd.Timestamp.today() - pd.Timedelta(days=HISTORY_DAYS)).date()
 
-            df = transform_records(tic, conn, cursor, 3, latest_date)
-            total_records = insert_records(conn, df, "core.analyst_rating_quarterly_summary", ["tic", "end_date"])
-            print(f"Processed {total_records} quarterly records for {tic}")
+        # Only append end dates after what each summary table already holds
+        last_end_dates = {name: read_last_end_dates(conn, table)
+                          for name, (_, table) in SUMMARY_TABLES.items()} if incremental else None
 
-            df = transform_records(tic, conn, cursor, 12, latest_date)
-            total_records = insert_records(conn, df, "core.analyst_rating_yearly_summary", ["tic", "end_date"])
-            print(f"Processed {total_records} yearly records for {tic}")
+        results = transform_records(conn, latest_date, last_end_dates=last_end_dates)
+        for name, (_, table) in SUMMARY_TABLES.items():
+            df = results[name]
+            total_records = insert_records(conn, df, table, ["tic", "end_date"]) if not df.empty else 0
+            print(f"Processed {total_records} {name} records for {df['tic'].nunique() if not df.empty else 0} tickers")
 
         conn.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,258 @@
+import numpy as np
+import pandas as pd
+from etl.trading_calendar import to_trading_date
+
+# Rolling-window engine for the analyst rating summaries.
+# Notes are mapped to trading dates and sorted once per ticker. Every
+# (start_date, end_date] window of every length then becomes a [lo, hi) slice of
+# the sorted notes, found with searchsorted. Within a slice only the latest note
+# of each analyst/company counts: note i is that note when lo <= i < hi and the
+# key's next note is at or after hi. Per-column "last non-null" values come from a
+# forward fill within the key, so windows never re-group or re-sort the notes.
+# Each chunk of consecutive windows only looks at the notes between its first
+# window's start and its last window's end, so the dense (windows x notes)
+# blocks grow with the window length, not with the ticker's whole history.
+
+# Grade actions ranked as in the original sort: the highest code wins, ties go to the latest note
+ACTION_CODES = {'upgrade': 2, 'downgrade': 2, 'reiterate': 1, 'initialize': 0}
+# Unmapped (non-null) actions sorted after every code, so they outrank all of them
+ACTION_RANKS = ['unmapped'] + [str(code) for code in sorted(set(ACTION_CODES.values()), reverse=True)]
+WINDOW_CHUNK = 128  # consecutive windows evaluated per dense (windows x notes) block
+# core.price_features window stats copied into the summaries (as <stat>_<months>m)
+PRICE_STATS = ['price_start', 'price_high', 'price_low', 'price_p25', 'price_median',
+               'price_p75', 'price_mean', 'price_stddev']
+
+
+def prepare_notes(df: pd.DataFrame, keys: list, columns: list) -> dict:
+    """
+    Sort one ticker's notes by published_at and precompute, per note:
+    its trading date, the index of the key's next note, and for each column the
+    key's last non-null value so far and the index of the note it came from.
+    Notes with a null key are dropped, as groupby() drops them.
+    """
+    df = df.dropna(subset=keys).sort_values('published_at', kind='mergesort').reset_index(drop=True)
+    n = len(df)
+    idx = pd.Series(np.arange(n, dtype=float))
+    key_id = df.groupby(keys, sort=False).ngroup().to_numpy()
+
+    notes = {
+        'n': n,
+        'trading_date': to_trading_date(df['published_at']) if n else np.array([], dtype='datetime64[D]'),
+        'next': idx.groupby(key_id).shift(-1).fillna(n).to_numpy(dtype=int),
+        'values': {},
+        'sources': {},
+    }
+    for col in columns:
+        source = idx.where(df[col].notna()).groupby(key_id).ffill().fillna(-1).to_numpy(dtype=int)
+        values = df[col].to_numpy()
+        notes['sources'][col] = source
+        notes['values'][col] = np.where(source >= 0, values[np.maximum(source, 0)], None)
+    return notes
+
+
+def window_bounds(trading_dates: np.ndarray, start_dates: np.ndarray, end_dates: np.ndarray) -> tuple:
+    """[lo, hi) note slices for the (start_date, end_date] windows."""
+    lo = np.searchsorted(trading_dates, start_dates, side='right')
+    hi = np.searchsorted(trading_dates, end_dates, side='right')
+    return lo, hi
+
+
+def slice_notes(notes: dict, start: int, stop: int) -> dict:
+    """Notes [start, stop) as their own notes dict, with note indices shifted by -start."""
+    return {
+        'n': stop - start,
+        'trading_date': notes['trading_date'][start:stop],
+        'next': notes['next'][start:stop] - start,
+        'values': {col: values[start:stop] for col, values in notes['values'].items()},
+        'sources': {col: sources[start:stop] - start for col, sources in notes['sources'].items()},
+    }
+
+
+def _latest(notes: dict, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """(windows x notes) mask of the latest note of each key inside each window."""
+    i = np.arange(notes['n'])
+    return (i >= lo[:, None]) & (i < hi[:, None]) & (notes['next'] >= hi[:, None])
+
+
+def _column(notes: dict, latest: np.ndarray, lo: np.ndarray, col: str) -> np.ndarray:
+    """(windows x notes) last non-null `col` of each key in the window, NaN elsewhere."""
+    ok = latest & (notes['sources'][col] >= lo[:, None])
+    return np.where(ok, pd.to_numeric(pd.Series(notes['values'][col]), errors='coerce').to_numpy(dtype=float), np.nan)
+
+
+def _has(notes: dict, latest: np.ndarray, lo: np.ndarray, col: str, value) -> np.ndarray:
+    """(windows x notes) whether the key's last non-null `col` in the window equals `value`."""
+    ok = latest & (notes['sources'][col] >= lo[:, None])
+    return ok & (notes['values'][col] == value)
+
+
+def _lerp(a: np.ndarray, b: np.ndarray, t: np.ndarray) -> np.ndarray:
+    # numpy.percentile's linear interpolation, so results match Series.quantile bit for bit
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def summary_stats(values: np.ndarray) -> dict:
+    """
+    Row-wise count, high, low, p25, median, p75, mean and stddev of a
+    (windows x notes) block, ignoring NaN (pandas conventions: NaN when empty,
+    stddev NaN below two values).
+    """
+    count = (~np.isnan(values)).sum(axis=1)
+    ordered = np.sort(values, axis=1)  # NaN sorts last
+    last = np.maximum(count - 1, 0)
+
+    def pick(pos):
+        return np.take_along_axis(ordered, pos[:, None], axis=1)[:, 0] if ordered.shape[1] else np.full(len(pos), np.nan)
+
+    def quantile(q):
+        virtual = q * last
+        below = np.floor(virtual).astype(int)
+        return _lerp(pick(below), pick(np.minimum(below + 1, last)), virtual - below)
+
+    empty = count == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = np.where(np.isnan(values), 0.0, values).sum(axis=1)
+        mean = total / count
+        squares = np.where(np.isnan(values), 0.0, (values - mean[:, None]) ** 2).sum(axis=1)
+        std = np.sqrt(squares / (count - 1))
+    stats = {
+        'count': count,
+        'high': pick(last),
+        'low': pick(np.zeros_like(last)),
+        'p25': quantile(0.25),
+        'median': (pick(last // 2) + pick(count // 2)) / 2,
+        'p75': quantile(0.75),
+        'mean': mean,
+        'stddev': np.where(count > 1, std, np.nan),
+    }
+    return {name: np.where(empty, np.nan, value) if name != 'count' else value for name, value in stats.items()}
+
+
+def pt_block(notes: dict, lo: np.ndarray, hi: np.ndarray) -> dict:
+    """pt_stats and pt_actions over the latest note of each (analyst_name, company)."""
+    latest = _latest(notes, lo, hi)
+    stats = summary_stats(_column(notes, latest, lo, 'pt'))
+    return {
+        'pt_count': latest.sum(axis=1),
+        'pt_high': stats['high'],
+        'pt_low': stats['low'],
+        'pt_p25': stats['p25'],
+        'pt_median': stats['median'],
+        'pt_p75': stats['p75'],
+        'pt_mean': stats['mean'],
+        'pt_stddev': stats['stddev'],
+        'pt_dispersion': stats['p75'] - stats['p25'],
+        'pt_upgrade_n': _has(notes, latest, lo, 'pt_change', 'upgrade').sum(axis=1),
+        'pt_downgrade_n': _has(notes, latest, lo, 'pt_change', 'downgrade').sum(axis=1),
+        'pt_reiterate_n': _has(notes, latest, lo, 'pt_change', 'reiterate').sum(axis=1),
+        'pt_init_n': _has(notes, latest, lo, 'pt_change', 'initialize').sum(axis=1),
+    }
+
+
+def return_block(notes: dict, lo: np.ndarray, hi: np.ndarray) -> dict:
+    """ret_stats of pt / price_when_posted - 1 over the latest values of each company."""
+    latest = _latest(notes, lo, hi)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        implied = _column(notes, latest, lo, 'pt') / _column(notes, latest, lo, 'price_when_posted') - 1
+    stats = summary_stats(implied)
+    return {
+        'ret_mean': stats['mean'],
+        'ret_median': stats['median'],
+        'ret_p25': stats['p25'],
+        'ret_p75': stats['p75'],
+        'ret_stddev': stats['stddev'],
+        'ret_dispersion': stats['p75'] - stats['p25'],
+        'ret_high': stats['high'],
+        'ret_low': stats['low'],
+    }
+
+
+def grade_block(notes: dict, lo: np.ndarray, hi: np.ndarray) -> dict:
+    """grade_stats over each company's latest grade and grade_actions over its highest-ranked action."""
+    latest = _latest(notes, lo, hi)
+    count = latest.sum(axis=1)
+    grades = _column(notes, latest, lo, 'new_grade')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        def ratio(n):
+            return np.where(count > 0, n / count, 0)
+        buy, hold, sell = ((grades == g).sum(axis=1) for g in (1, 0, -1))
+        block = {
+            'grade_count': count,
+            'grade_buy_n': buy,
+            'grade_hold_n': hold,
+            'grade_sell_n': sell,
+            'grade_buy_ratio': ratio(buy),
+            'grade_hold_ratio': ratio(hold),
+            'grade_sell_ratio': ratio(sell),
+            'grade_balance': ratio(np.nansum(grades, axis=1)),
+        }
+
+    # Walk the action ranks from the top: a company counts at the first rank it has a note in
+    decided = np.zeros(latest.shape, dtype=bool)
+    for rank in ACTION_RANKS:
+        present = latest & (notes['sources'][f'action_{rank}'] >= lo[:, None])
+        chosen = present & ~decided
+        for action, code in ACTION_CODES.items():
+            if str(code) == rank:
+                name = 'init' if action == 'initialize' else action
+                block[f'grade_{name}_n'] = (chosen & (notes['values'][f'action_{rank}'] == action)).sum(axis=1)
+        decided |= present
+    return block
+
+
+def price_block(prices: pd.DataFrame, num_months: int, end_dates: np.ndarray) -> dict:
+    """
+    price_stats of the (end_date - num_months, end_date] windows, read from the
+    ticker's core.price_features rows (indexed by date), which hold the same windows.
+    """
+    rows = prices.reindex(pd.DatetimeIndex(end_dates))
+    block = {'price_start': rows[f'price_start_{num_months}m'].to_numpy(),
+             'price_end': rows['close'].to_numpy()}
+    for stat in PRICE_STATS[1:]:
+        block[stat] = rows[f'{stat}_{num_months}m'].to_numpy()
+    return block
+
+
+def prepare_grades(df: pd.DataFrame) -> dict:
+    """prepare_notes for grades, with one action column per rank for the action pick."""
+    df = df.copy()
+    ranks = df['action'].map({action: str(code) for action, code in ACTION_CODES.items()})
+    ranks = ranks.where(ranks.notna() | df['action'].isna(), 'unmapped')
+    for rank in ACTION_RANKS:
+        df[f'action_{rank}'] = df['action'].where(ranks == rank)
+    return prepare_notes(df, ['company'], ['new_grade'] + [f'action_{rank}' for rank in ACTION_RANKS])
+
+
+def summarize_ticker(pts: pd.DataFrame, grades: pd.DataFrame, prices: pd.DataFrame, windows: dict) -> dict:
+    """
+    One ticker's summary rows for every window length in a single sweep.
+    `windows` maps a name to (length in months, datetime64[D] end dates), and
+    `prices` holds the ticker's core.price_features rows.
+    Returns name -> DataFrame with start_date, end_date and the stat columns.
+    """
+    # Map trading dates and sort once; every window below only slices these
+    pt_notes = prepare_notes(pts, ['analyst_name', 'company'], ['pt', 'pt_change'])
+    return_notes = prepare_notes(pts, ['company'], ['pt', 'price_when_posted'])
+    grade_notes = prepare_grades(grades)
+    prices = prices.set_index(pd.to_datetime(prices['date'])).astype({'close': float})
+
+    results = {}
+    for name, (months, end_dates) in windows.items():
+        start_dates = (pd.DatetimeIndex(end_dates) - pd.DateOffset(months=months)).to_numpy(dtype='datetime64[D]')
+        blocks = []
+        for c in range(0, len(end_dates), WINDOW_CHUNK):
+            s, e = start_dates[c:c + WINDOW_CHUNK], end_dates[c:c + WINDOW_CHUNK]
+            block = {}
+            for notes, build in [(pt_notes, pt_block), (grade_notes, grade_block), (return_notes, return_block)]:
+                lo, hi = window_bounds(notes['trading_date'], s, e)
+                first = lo.min() if len(lo) else 0
+                block.update(build(slice_notes(notes, first, max(hi.max() if len(hi) else 0, first)),
+                                   lo - first, hi - first))
+            block.update(price_block(prices, months, e))
+            blocks.append(pd.DataFrame(block))
+        df = pd.concat(blocks, ignore_index=True) if blocks else pd.DataFrame()
+        df.insert(0, 'start_date', pd.to_datetime(start_dates).date)
+        df.insert(1, 'end_date', pd.to_datetime(end_dates).date)
+        results[name] = df
+    return results
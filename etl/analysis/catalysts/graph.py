@@ -1,15 +1,25 @@
 import time
 from typing import Dict, List, Literal
 from langgraph.graph import START, END, StateGraph
+from langgraph.types import Send
 
 # Nodes and State imports
 from states import CatalystSession, Catalyst, catalyst_session_factory
 from nodes import (
     retriever_node, 
     stage1_node, 
+    existing_catalysts_node,
     stage2_node, 
-    stage3_node
+    merge_stage2_node,
+    stage3_node,
+    merge_stage3_node,
+    astage1_node,
+    astage2_node,
+    astage3_node,
+    group_tasks,
+    validation_tasks
 )
+from etl.utils import llm_node
 
 # --- Routing Logic ---
 
@@ -23,6 +33,16 @@ def should_continue(state: CatalystSession) -> Literal["stage1_node", END]:
         return END
     return "stage1_node"
 
+
+def send_groups(state: CatalystSession) -> List[Send]:
+    """Map step: one parallel Stage 2 task per group (none ends the run)."""
+    return [Send("stage2_node", task) for task in group_tasks(state)]
+
+
+def send_catalysts(state: CatalystSession) -> List[Send]:
+    """Map step: one parallel Stage 3 task per synthesized catalyst (none ends the run)."""
+    return [Send("stage3_node", task) for task in validation_tasks(state)]
+
 # --- Graph Construction ---
 
 def create_graph() -> StateGraph:
@@ -30,9 +50,12 @@ def create_graph() -> StateGraph:
 
     # Define Nodes
     graph.add_node("retriever_node", retriever_node)
-    graph.add_node("stage1_node", stage1_node)
-    graph.add_node("stage2_node", stage2_node)
-    graph.add_node("stage3_node", stage3_node)
+    graph.add_node("stage1_node", llm_node(stage1_node, astage1_node))
+    graph.add_node("existing_catalysts_node", existing_catalysts_node)
+    graph.add_node("stage2_node", llm_node(stage2_node, astage2_node))
+    graph.add_node("merge_stage2_node", merge_stage2_node)
+    graph.add_node("stage3_node", llm_node(stage3_node, astage3_node))
+    graph.add_node("merge_stage3_node", merge_stage3_node)
 
     # Define Edges
     graph.add_edge(START, "retriever_node")
@@ -43,9 +66,14 @@ def create_graph() -> StateGraph:
         should_continue
     )
 
-    graph.add_edge("stage1_node", "stage2_node")
-    graph.add_edge("stage2_node", "stage3_node")
-    graph.add_edge("stage3_node", END)
+    # Groups are synthesized, then catalysts validated, in parallel Send tasks;
+    # each merge node runs once all tasks of its step are done
+    graph.add_edge("stage1_node", "existing_catalysts_node")
+    graph.add_conditional_edges("existing_catalysts_node", send_groups, ["stage2_node"])
+    graph.add_edge("stage2_node", "merge_stage2_node")
+    graph.add_conditional_edges("merge_stage2_node", send_catalysts, ["stage3_node"])
+    graph.add_edge("stage3_node", "merge_stage3_node")
+    graph.add_edge("merge_stage3_node", END)
 
     return graph
 
@@ -7,7 +7,12 @@ from graph import create_graph
 from tqdm import tqdm
 from datetime import datetime, timezone
 import os
-from etl.utils import fix_quotes
+import asyncio
+from etl.utils import fix_quotes, LLM_CONCURRENCY
+from etl.checkpointing import RESUME, get_checkpointer, thread_config, start_input, astart_input, forget
+from etl.embeddings import warm_query_embedding_cache
+from prompts import CATALYST_QUERIES
+from nodes import EMBEDDING_MODEL
 import database.config
 
 
@@ -56,13 +61,8 @@ QUERY = """
 """
 
 
-def main(tic: str, top_k: int = 3, year: int = None, month: int = None,
-         batch_size: int = 10, sleep_time: int = 65):
-    conn = connect_to_db()
-    if not conn:
-        print("Could not connect to database.")
-        return
-
+def read_states(conn, tic: str, top_k: int = 3, year: int = None, month: int = None) -> list:
+    """One graph state per month of `tic` with news or transcripts newer than its latest catalyst version, oldest first."""
     query = QUERY.format(tic=tic)
     df = read_sql_query(query, conn)
     # Construct states from the retrieved records
@@ -83,34 +83,195 @@ def main(tic: str, top_k: int = 3, year: int = None, month: int = None,
                 calendar_month=row['month'],
                 top_k=top_k,
             ))
-        
+    return states
+
+
+def run_thread_id(state: dict) -> str:
+    """Checkpoint thread of one (tic, month) run."""
+    query_params = state['query_params']
+    return f"catalysts:{state['company_info'].ticker}:{query_params.calendar_year}-{query_params.calendar_month}"
+
+
+def to_records(final_state: dict) -> tuple:
+    """core.catalyst_versions rows of the valid catalysts of a finished graph run, and its (create, update, invalid) counts."""
+    n_invalid = 0
+    n_create = 0
+    n_update = 0
+    # Build chunk_map to derive dates from citation chunk_ids
+    chunk_map = {chunk['chunk_id']: chunk for chunk in final_state.get("raw_chunks", [])}
+
+    processed_data = []
+    for catalyst in final_state.get("final_catalysts", []):
+        n_create += 1 if catalyst.action == "create" else 0
+        n_update += 1 if catalyst.action == "update" else 0
+        n_invalid += 1 if not catalyst.is_valid else 0
+
+        if catalyst.is_valid:
+            # Derive date from the latest citation chunk
+            citation_dates = [
+                chunk_map[c.chunk_id]['date']
+                for c in catalyst.citations if c.chunk_id in chunk_map
+            ]
+            catalyst_date = max(citation_dates) if citation_dates else None
+
+            # Generate UUID for new catalysts
+            catalyst_id = catalyst.catalyst_id if catalyst.catalyst_id else str(uuid.uuid4())
+
+            out = {
+                "catalyst_id": catalyst_id,
+                "tic": final_state["company_info"].ticker,
+                "date": catalyst_date,
+                "catalyst_type": catalyst.catalyst_type,
+                "title": fix_quotes(catalyst.title),
+                "summary": fix_quotes(catalyst.summary),
+                "sentiment": catalyst.sentiment,
+                "time_horizon": catalyst.time_horizon,
+                "magnitude": catalyst.magnitude,
+                "impact_area": catalyst.impact_area,
+                "mention_count": len(catalyst.citations),
+                "chunk_ids": [c.chunk_id for c in catalyst.citations],
+                "citations": [fix_quotes(c.quote) for c in catalyst.citations],
+                "updated_at": datetime.now(timezone.utc),
+            }
+            processed_data.append(out)
+    return processed_data, n_create, n_update, n_invalid
+
+
+def write_records(conn, processed_data: list):
+    """
+    Insert one month's catalyst versions in a single transaction, rolling it
+    back and raising when the insert fails.
+    """
+    try:
+        # version_no and the master table are maintained by DB triggers, as in main()
+        if not insert_records(conn, pd.DataFrame(processed_data), "core.catalyst_versions", commit=False):
+            raise RuntimeError("no catalyst versions were written")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
-    # Create and compile the graph
+
+async def aprocess_ticker(app, conn, tic: str, states: list, write_lock: asyncio.Lock) -> tuple:
+    """
+    Concurrent-mode run of one ticker: its months run in order, each one's
+    catalysts written before the next starts, since Stage 2 matches new
+    evidence against the catalysts already stored. Writes share `conn`, so
+    they run one at a time (under `write_lock`) in a worker thread; a failed
+    write stops the ticker. Returns (create, update, invalid).
+    """
+    totals = [0, 0, 0]
+    for state in states:
+        thread_id = run_thread_id(state)
+        run_input = await astart_input(app, state, thread_id)
+        retries = 3
+        while retries > 0:
+            try:
+                final_state = await app.ainvoke(run_input, thread_config(thread_id))
+                break
+            except Exception as e:
+                # A 429 blocks the shared rate limiter, so the retry waits only until the provider's reset
+                retries -= 1
+                if retries == 0:
+                    print(f"Failed to process {tic} "
+                          f"{state['query_params'].calendar_year}-{state['query_params'].calendar_month} "
+                          f"after multiple retries: {e}")
+                    break
+                print(f"Error processing {tic}: {e}. Retrying...")
+                # With checkpointing on, the retry continues the run from its last checkpoint
+                run_input = await astart_input(app, state, thread_id, resume=True)
+        if retries == 0:
+            continue
+
+        processed_data, n_create, n_update, n_invalid = to_records(final_state)
+        if processed_data:
+            async with write_lock:
+                await asyncio.to_thread(write_records, conn, processed_data)
+            totals = [totals[0] + n_create, totals[1] + n_update, totals[2] + n_invalid]
+        forget([thread_id])
+    return tuple(totals)
+
+
+async def aprocess_tickers(app, conn, ticker_states: dict, concurrency: int) -> dict:
+    """
+    Run up to `concurrency` tickers at once; tic -> (create, update, invalid)
+    of the tickers that completed. A failing ticker is reported and skipped
+    without cancelling the others.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    progress = tqdm(total=len(ticker_states), desc=f"Processing tickers (concurrency {concurrency})")
+
+    async def run(tic: str, states: list) -> tuple:
+        try:
+            async with limit:
+                return await aprocess_ticker(app, conn, tic, states, write_lock)
+        finally:
+            progress.update(1)
+
+    results = await asyncio.gather(*[run(tic, states) for tic, states in ticker_states.items()],
+                                   return_exceptions=True)
+    progress.close()
+    for tic, result in zip(ticker_states, results):
+        if isinstance(result, BaseException):
+            print(f"Error processing catalysts for {tic}: {result}")
+    return {tic: result for tic, result in zip(ticker_states, results) if not isinstance(result, BaseException)}
+
+
+def main_concurrent(tickers: list, top_k: int = 3, concurrency: int = LLM_CONCURRENCY):
+    """Concurrent mode of the __main__ loop: `concurrency` tickers in flight, each one's months in order."""
+    conn = connect_to_db()
+    if not conn:
+        print("Could not connect to database.")
+        return
+    ticker_states = {tic: read_states(conn, tic, top_k) for tic in tickers}
+    ticker_states = {tic: states for tic, states in ticker_states.items() if states}
+
+    warm_query_embedding_cache([q for queries in CATALYST_QUERIES.values() for q in queries],
+                               model=EMBEDDING_MODEL)
+    app = create_graph().compile(checkpointer=get_checkpointer())
+
+    start_time = time.time()
+    results = asyncio.run(aprocess_tickers(app, conn, ticker_states, concurrency))
+    conn.close()
+    total_create, total_update, total_invalid = (sum(r[k] for r in results.values()) for k in range(3))
+    print(f"\n{len(results)} of {len(ticker_states)} tickers — Total Create: {total_create}, Total Update: {total_update}, Invalid: {total_invalid}, "
+          f"Total: {total_create + total_update + total_invalid}")
+    print(f"Catalyst AI Agent completed in {time.time() - start_time:.2f} seconds.")
+
+
+def main(tic: str, top_k: int = 3, year: int = None, month: int = None):
+    conn = connect_to_db()
+    if not conn:
+        print("Could not connect to database.")
+        return
+
+    states = read_states(conn, tic, top_k, year, month)
+
+    # Pre-warm the query embedding cache so the retriever makes no embedding calls
+    warm_query_embedding_cache([q for queries in CATALYST_QUERIES.values() for q in queries],
+                               model=EMBEDDING_MODEL)
+
+    # Create and compile the graph; runs are checkpointed when enabled (see etl/checkpointing.py)
     graph = create_graph()
-    app = graph.compile()
+    app = graph.compile(checkpointer=get_checkpointer())
 
     start_time = time.time()
     total_invalid = 0
     total_create = 0
     total_update = 0
 
-    for i, state in enumerate(tqdm(states, desc=f"Processing states - {tic}")):
-        n_invalid = 0
-        n_create = 0
-        n_update = 0
-        if i > 0 and i % batch_size == 0:
-            print(f"\n[Rate Limit Protection] Processed {batch_size} items. Sleeping for {sleep_time} seconds...")
-            time.sleep(sleep_time)
-        
+    # Requests are paced by the shared RPM/TPM limiter of run_llm (etl/rate_limiter.py)
+    for state in tqdm(states, desc=f"Processing states - {tic}"):
+        thread_id = run_thread_id(state)
+        run_input = start_input(app, state, thread_id)
         retries = 3
         while retries > 0:
             try:
-                final_state = app.invoke(state)
+                final_state = app.invoke(run_input, thread_config(thread_id))
                 break
             except Exception as e:
-                if "rate limit" in str(e).lower() or "429" in str(e):
-                    print(f"Hit rate limit on {tic}. Sleeping for {sleep_time}s before retry...")
-                    time.sleep(sleep_time)
+                # A 429 blocks the shared rate limiter, so the retry waits only until the provider's reset
                 retries -= 1
                 if retries == 0:
                     print(f"Failed to process {tic} "
@@ -118,48 +279,15 @@ def main(tic: str, top_k: int = 3, year: int = None, month: int = None,
                           f"after multiple retries: {e}")
                     break
                 print(f"Error processing {tic}: {e}. Retrying...")
+                # With checkpointing on, the retry continues the run from its last checkpoint
+                run_input = start_input(app, state, thread_id, resume=True)
         if retries == 0:
             continue
 
-        # Build chunk_map to derive dates from citation chunk_ids
-        chunk_map = {chunk['chunk_id']: chunk for chunk in final_state.get("raw_chunks", [])}
-
-        processed_data = []
-        for catalyst in final_state.get("final_catalysts", []):
-            n_create += 1 if catalyst.action == "create" else 0
-            n_update += 1 if catalyst.action == "update" else 0
-            n_invalid += 1 if not catalyst.is_valid else 0
-    
-            if catalyst.is_valid:
-                # Derive date from the latest citation chunk
-                citation_dates = [
-                    chunk_map[c.chunk_id]['date']
-                    for c in catalyst.citations if c.chunk_id in chunk_map
-                ]
-                catalyst_date = max(citation_dates) if citation_dates else None
-
-                # Generate UUID for new catalysts
-                catalyst_id = catalyst.catalyst_id if catalyst.catalyst_id else str(uuid.uuid4())
-
-                out = {
-                    "catalyst_id": catalyst_id,
-                    "tic": final_state["company_info"].ticker,
-                    "date": catalyst_date,
-                    "catalyst_type": catalyst.catalyst_type,
-                    "title": fix_quotes(catalyst.title),
-                    "summary": fix_quotes(catalyst.summary),
-                    "sentiment": catalyst.sentiment,
-                    "time_horizon": catalyst.time_horizon,
-                    "magnitude": catalyst.magnitude,
-                    "impact_area": catalyst.impact_area,
-                    "mention_count": len(catalyst.citations),
-                    "chunk_ids": [c.chunk_id for c in catalyst.citations],
-                    "citations": [fix_quotes(c.quote) for c in catalyst.citations],
-                    "updated_at": datetime.now(timezone.utc),
-                }
-                processed_data.append(out)
+        processed_data, n_create, n_update, n_invalid = to_records(final_state)
 
         if not processed_data:
+            forget([thread_id])
             continue
 
         try:
@@ -167,6 +295,7 @@ def main(tic: str, top_k: int = 3, year: int = None, month: int = None,
             # version_no is auto-assigned by DB trigger (trg_auto_version_no)
             # master table is auto-upserted by DB trigger (trg_upsert_catalyst_master)
             insert_records(conn, df_out, "core.catalyst_versions")
+            forget([thread_id])
             print(f"\n{tic} — Create: {n_create}, Update: {n_update}, Invalid: {n_invalid}, Total: {n_create + n_update + n_invalid}")
             total_invalid += n_invalid
             total_create += n_create
@@ -193,19 +322,17 @@ if __name__ == "__main__":
         cursor.execute("SELECT tic FROM core.stock_profiles;")
         records = cursor.fetchall()
         conn.close()
-        batch_size = 10  # number of companies to process before sleeping
-        sleep_time = 125  # seconds to sleep between batches to avoid rate limits
-        for i, record in enumerate(records):
-            tic = record[0]
-            try:
-                print(f"\nProcessing {tic} ({i+1}/{len(records)})...")
-                main(tic=tic, top_k=3, batch_size=batch_size, sleep_time=sleep_time)
-                if i > 0 and i % batch_size == 0:
-                    print(f"\n[Rate Limit Protection] Processed {batch_size} items. Sleeping for {sleep_time} seconds...")
-                    time.sleep(sleep_time)
-            except Exception as e:
-                print(f"Connection lost or error on {tic}. Reconnecting...")
-                time.sleep(5)
+        if LLM_CONCURRENCY > 1:
+            main_concurrent([record[0] for record in records], top_k=3)
+        else:
+            for i, record in enumerate(records):
+                tic = record[0]
+                try:
+                    print(f"\nProcessing {tic} ({i+1}/{len(records)})...")
+                    main(tic=tic, top_k=3)
+                except Exception as e:
+                    print(f"Connection lost or error on {tic}. Reconnecting...")
+                    time.sleep(5)
             
             
         # main(tic="AAPL", top_k=3)
@@ -1,18 +1,18 @@
 import uuid
 from database.utils import execute_query
-from langchain_openai import OpenAIEmbeddings
 from typing import Dict, List, Literal, Optional, Union
 from prompts import CATALYST_QUERIES, CATALYST_CONFIG, STAGE1_HUMAN_PROMPT, STAGE2_HUMAN_PROMPT, \
     STAGE1_SYSTEM_MESSAGE, STAGE2_SYSTEM_MESSAGE, STAGE3_HUMAN_PROMPT, STAGE3_SYSTEM_MESSAGE
-from states import CatalystSession, Catalyst, Chunk, CompanyInfo
+from states import CatalystSession, Catalyst, Chunk, CompanyInfo, GroupTask, ValidationTask
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
-from etl.utils import run_llm, parse_json_with_fallback
+from etl.utils import run_llm, arun_llm, parse_json_with_fallback
+from etl.embeddings import embed_queries
 import json
 import os
 from datetime import date, timedelta
 import database.config
 
-embedding_model = OpenAIEmbeddings(model=os.getenv("OPENAI_EMBEDDING_MODEL"), timeout=30, max_retries=2)
+EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL")
 MIN_COSINE_SIMILARITY = 0.35  # Minimum similarity threshold for retrieved chunks
 
 # Helper function to build SQL query
@@ -96,12 +96,14 @@ def retriever_node(state: CatalystSession) -> Dict:
     # Store unique chunks in a dictionary keyed by chunk_id
     deduplicated_chunks = {}
 
+    # 1. Embed every catalyst query in one call (cached across ticker-months)
+    query_texts = [q for queries in CATALYST_QUERIES.values() for q in queries]
+    query_vecs = dict(zip(query_texts, embed_queries(query_texts, model=EMBEDDING_MODEL)))
+
     # Iterate through all category keys in your CATALYST_QUERIES dictionary
     for category, queries in CATALYST_QUERIES.items():
         for query_text in queries:
-            # 1. Generate the embedding for the query string
-            # Replace 'get_embedding' with your actual embedding function/API call
-            query_vec = embedding_model.embed_query(query_text)
+            query_vec = query_vecs[query_text]
             vec_str = "[" + ",".join(map(str, query_vec)) + "]"
             
             # 2. Search both News and Earnings Transcripts
@@ -150,15 +152,9 @@ def retriever_node(state: CatalystSession) -> Dict:
 
 
 
-def stage1_node(state: CatalystSession) -> Dict:
-    """
-    Refined Stage 1 logic using proper JSON structures and 
-    mapping logic for integer-to-UUID resolution.
-    """
-    # 1. Access state data
+def stage1_messages(state: CatalystSession) -> tuple:
+    """Stage 1 prompt and the map of its temporary chunk IDs back to chunk UUIDs."""
     raw_chunks: List[Chunk] = state["raw_chunks"]
-    if not raw_chunks:
-        return {"uuid_groups": [], "errors": ["No chunks available for grouping."]}
 
     # 2. Structure Company Info for the LLM
     # state["company_info"] is a Pydantic model
@@ -190,221 +186,310 @@ def stage1_node(state: CatalystSession) -> Dict:
         SystemMessage(content=STAGE1_SYSTEM_MESSAGE),
         HumanMessage(content=human_prompt)
     ]
+    return messages, temp_id_to_uuid
+
+
+def stage1_output(llm_raw: str, temp_id_to_uuid: Dict) -> Dict:
+    llm_groups = parse_json_with_fallback(llm_raw) 
+    
+    # 6. Re-map Temporary IDs back to real UUIDs
+    final_uuid_groups = []
+    for group in llm_groups:
+        # Only include IDs that actually exist in our mapping
+        uuid_group = [temp_id_to_uuid[tid] for tid in group if tid in temp_id_to_uuid]
+        if uuid_group:
+            # Limit enforced here as a safety check (max 3 per group)
+            final_uuid_groups.append(uuid_group[:3])
+
+    # Limit to top 4 unique groups total as per your Stage 1 instructions
+    return {"uuid_groups": final_uuid_groups[:4]}
+
+
+def stage1_node(state: CatalystSession) -> Dict:
+    """
+    Refined Stage 1 logic using proper JSON structures and 
+    mapping logic for integer-to-UUID resolution.
+    """
+    # 1. Access state data
+    if not state["raw_chunks"]:
+        return {"uuid_groups": [], "errors": ["No chunks available for grouping."]}
+    messages, temp_id_to_uuid = stage1_messages(state)
 
     # 5. Run LLM and Parse
     try:
-        llm_raw = run_llm(messages).content
-        llm_groups = parse_json_with_fallback(llm_raw) 
-        
-        # 6. Re-map Temporary IDs back to real UUIDs
-        final_uuid_groups = []
-        for group in llm_groups:
-            # Only include IDs that actually exist in our mapping
-            uuid_group = [temp_id_to_uuid[tid] for tid in group if tid in temp_id_to_uuid]
-            if uuid_group:
-                # Limit enforced here as a safety check (max 3 per group)
-                final_uuid_groups.append(uuid_group[:3])
-
-        # Limit to top 4 unique groups total as per your Stage 1 instructions
-        return {"uuid_groups": final_uuid_groups[:4]}
+        return stage1_output(run_llm(messages, route="catalysts.stage1").content, temp_id_to_uuid)
+    except Exception as e:
+        return {"errors": [f"Stage 1 Error: {str(e)}"]}
+
 
+async def astage1_node(state: CatalystSession) -> Dict:
+    """Async stage1_node (concurrent mode)."""
+    if not state["raw_chunks"]:
+        return {"uuid_groups": [], "errors": ["No chunks available for grouping."]}
+    messages, temp_id_to_uuid = stage1_messages(state)
+    try:
+        return stage1_output((await arun_llm(messages, route="catalysts.stage1")).content, temp_id_to_uuid)
     except Exception as e:
         return {"errors": [f"Stage 1 Error: {str(e)}"]}
     
 
-def retrieve_existing_catalyst(tic: str, chunk_id: str) -> List[Dict]:
+def retrieve_existing_catalysts(tic: str, chunk_ids: List[str]) -> Dict[str, Dict]:
     """
-    Fetch existing catalysts from core.catalyst_master filtered by ticker
-    and where chunk_id is contained in the row's chunk_ids array.
-    Returns the most recent match.
+    Fetch existing catalysts from core.catalyst_master for all `chunk_ids` in
+    one query: chunk_id -> the most recent row of `tic` whose chunk_ids
+    array contains it. Chunks no catalyst cites are left out.
     """
-    sql = f"""
-        SELECT catalyst_id::TEXT, tic, date, catalyst_type, title, summary,
-               sentiment, impact_area, magnitude, time_horizon, chunk_ids
-        FROM core.catalyst_master
-        WHERE tic = '{tic}'
-          AND '{chunk_id}' = ANY(chunk_ids)
-        ORDER BY date DESC
-        LIMIT 1;
+    if not chunk_ids:
+        return {}
+    sql = """
+        SELECT DISTINCT ON (k.chunk_id)
+               k.chunk_id AS matched_chunk_id,
+               m.catalyst_id::TEXT, m.tic, m.date, m.catalyst_type, m.title, m.summary,
+               m.sentiment, m.impact_area, m.magnitude, m.time_horizon, m.chunk_ids
+        FROM core.catalyst_master AS m
+        JOIN unnest(%s::text[]) AS k(chunk_id)
+            ON k.chunk_id = ANY(m.chunk_ids)
+        WHERE m.tic = %s
+        ORDER BY k.chunk_id, m.date DESC;
     """
-    df = execute_query(sql)
+    df = execute_query(sql, (list(chunk_ids), tic))
     if df is None or df.empty:
-        return []
-    return df.to_dict(orient="records")
+        return {}
+    return {record.pop('matched_chunk_id'): record for record in df.to_dict(orient="records")}
+
+
+def existing_catalysts_node(state: CatalystSession) -> Dict:
+    """Look up the stored catalysts of every chunk of every Stage 1 group at once."""
+    chunk_ids = sorted({str(uid) for group in state["uuid_groups"] for uid in group})
+    return {"existing_by_chunk": retrieve_existing_catalysts(state["company_info"].ticker, chunk_ids)}
+
+
+def group_tasks(state: CatalystSession) -> List[GroupTask]:
+    """One Stage 2 task per Stage 1 group."""
+    chunk_map = {chunk['chunk_id']: chunk for chunk in state["raw_chunks"]}
+    return [
+        {
+            "group_index": i,
+            "group_uuids": group_uuids,
+            "chunk_map": chunk_map,
+            "company_info": state["company_info"],
+            "existing_by_chunk": state.get("existing_by_chunk") or {},
+        }
+        for i, group_uuids in enumerate(state["uuid_groups"])
+    ]
+
 
-def stage2_node(state: CatalystSession) -> Dict:
+def stage2_messages(group_uuids: List[str], chunk_map: Dict, company_info: CompanyInfo,
+                    existing_by_chunk: Dict) -> Optional[tuple]:
     """
-    Iterates through uuid_groups, synthesizes each into a CatalystRecord,
-    and handles reconciliation with existing catalysts.
+    The existing catalyst a group of chunks continues (None when new) and the
+    Stage 2 prompt, or None when the catalyst already cites every chunk.
     """
-    uuid_groups = state["uuid_groups"]
-    raw_chunks = state["raw_chunks"]
-    company_info = state["company_info"]
+    # Gather the 1-3 chunks for this specific event, sorted oldest-first for narrative flow
+    group_chunks = [chunk_map[uid] for uid in group_uuids if uid in chunk_map]
+    group_chunks.sort(key=lambda x: (x['date'], x['cosine_sim']), reverse=False)
+
+    # 3. Existing catalyst of the first chunk (oldest first) that one cites
+    matched_existing = next(
+        (existing_by_chunk[str(chunk['chunk_id'])] for chunk in group_chunks
+         if str(chunk['chunk_id']) in existing_by_chunk),
+        None
+    )
+
+    # Skip if all group chunks are already known to this catalyst (no new evidence)
+    if matched_existing:
+        existing_chunk_ids = set(matched_existing.get('chunk_ids', []))
+        if set(group_uuids).issubset(existing_chunk_ids):
+            # print(f"  ⏭️  Skipping group — all chunks already in catalyst: {matched_existing['catalyst_id']}")
+            return None
+
+    # Format evidence block for the prompt
+    evidence_text = ""
+    for chunk in group_chunks:
+        evidence_text += f"Source ID: {chunk['chunk_id']}\nDate: {chunk['date']}\nContent: {chunk['content']}\n---\n"
+
+    # 4. Build the Analyst Prompt with existing catalyst context
+    human_prompt = STAGE2_HUMAN_PROMPT.format(
+        company_info=company_info.model_dump_json(),
+        existing_catalyst_json=json.dumps(matched_existing if matched_existing else {}, default=str),
+        chunks_for_this_group=evidence_text
+    )
+
+    messages = [
+        SystemMessage(content=STAGE2_SYSTEM_MESSAGE),
+        HumanMessage(content=human_prompt)
+    ]
+    return matched_existing, messages
+
 
-    # 1. Index raw_chunks by composite ID (event_id:chunk_id) for fast lookup
-    chunk_map = {chunk['chunk_id']: chunk for chunk in raw_chunks}
+def stage2_output(llm_raw: str) -> Catalyst:
+    catalyst_json = parse_json_with_fallback(llm_raw)
     
-    new_catalysts = []
-    existing_catalysts = []
-    node_errors = []
-
-    # 2. Process each group (Max 4 groups from Stage 1)
-    for group_uuids in uuid_groups:
-        try:
-            # Gather the 1-3 chunks for this specific event, sorted oldest-first for narrative flow
-            group_chunks = [chunk_map[uid] for uid in group_uuids if uid in chunk_map]
-            group_chunks.sort(key=lambda x: (x['date'], x['cosine_sim']), reverse=False)
-
-            # 3. Retrieve existing catalyst by iterating through chunks until a match is found
-            matched_existing = None
-            for chunk in group_chunks:
-                existing = retrieve_existing_catalyst(
-                    tic=company_info.ticker,
-                    chunk_id=str(chunk['chunk_id'])
-                )
-                if existing:
-                    matched_existing = existing[0]
-                    break
-
-            # Skip if all group chunks are already known to this catalyst (no new evidence)
-            if matched_existing:
-                existing_chunk_ids = set(matched_existing.get('chunk_ids', []))
-                if set(group_uuids).issubset(existing_chunk_ids):
-                    # print(f"  ⏭️  Skipping group — all chunks already in catalyst: {matched_existing['catalyst_id']}")
-                    continue
+    # This validation step ensures the LLM didn't hallucinate a tag 
+    # outside of your Literal ImpactArea or CatalystType
+    record = Catalyst(**catalyst_json)
+
+    # Enforce 1 citation per chunk_id (keep first, drop duplicates)
+    seen_chunks = set()
+    deduped = []
+    for c in record.citations:
+        if c.chunk_id not in seen_chunks:
+            seen_chunks.add(c.chunk_id)
+            deduped.append(c)
+    record.citations = deduped
+    return record
+
+
+def stage2_node(task: GroupTask) -> Dict:
+    """
+    Synthesizes one Stage 1 group (a Send task) into a Catalyst, reconciled
+    with the existing catalyst its chunks already belong to.
+    """
+    out = {"group_catalysts": [], "existing_catalysts": [], "errors": []}
+    try:
+        prepared = stage2_messages(task["group_uuids"], task["chunk_map"], task["company_info"],
+                                   task["existing_by_chunk"])
+        if prepared is not None:
+            matched_existing, messages = prepared
+            out["existing_catalysts"].append(matched_existing)
+            # 5. Run LLM and Parse into Pydantic Model
+            out["group_catalysts"].append((task["group_index"], stage2_output(run_llm(messages, route="catalysts.stage2", validate=stage2_output).content)))
+    except Exception as e:
+        out["errors"].append(f"Failed synthesizing group {task['group_uuids']}: {str(e)}")
+    return out
 
-            existing_catalysts.append(matched_existing)
 
-            # Format evidence block for the prompt
-            evidence_text = ""
-            for chunk in group_chunks:
-                evidence_text += f"Source ID: {chunk['chunk_id']}\nDate: {chunk['date']}\nContent: {chunk['content']}\n---\n"
+async def astage2_node(task: GroupTask) -> Dict:
+    """Async stage2_node (concurrent mode)."""
+    out = {"group_catalysts": [], "existing_catalysts": [], "errors": []}
+    try:
+        prepared = stage2_messages(task["group_uuids"], task["chunk_map"], task["company_info"],
+                                   task["existing_by_chunk"])
+        if prepared is not None:
+            matched_existing, messages = prepared
+            out["existing_catalysts"].append(matched_existing)
+            out["group_catalysts"].append((task["group_index"], stage2_output((await arun_llm(messages, route="catalysts.stage2", validate=stage2_output)).content)))
+    except Exception as e:
+        out["errors"].append(f"Failed synthesizing group {task['group_uuids']}: {str(e)}")
+    return out
+
+
+def merge_stage2_node(state: CatalystSession) -> Dict:
+    """Collect the Stage 2 catalysts in group order."""
+    return {"final_catalysts": [record for _, record in sorted(state["group_catalysts"], key=lambda x: x[0])]}
 
-            # 4. Build the Analyst Prompt with existing catalyst context
-            human_prompt = STAGE2_HUMAN_PROMPT.format(
-                company_info=company_info.model_dump_json(),
-                existing_catalyst_json=json.dumps(matched_existing if matched_existing else {}, default=str),
-                chunks_for_this_group=evidence_text
+
+def stage3_messages(record: Catalyst, chunk_map: Dict, company_info: CompanyInfo, existing_map: Dict) -> list:
+    # 1. Gather source text using citation chunk IDs
+    source_text_parts = []
+    for cid in [c.chunk_id for c in record.citations]:
+        chunk = chunk_map.get(cid)
+        if chunk:
+            source_text_parts.append(
+                f"[ID: {cid}] [Date: {chunk['date']}] \"{chunk['content']}\""
             )
+    source_text_block = "\n".join(source_text_parts)
 
-            messages = [
-                SystemMessage(content=STAGE2_SYSTEM_MESSAGE),
-                HumanMessage(content=human_prompt)
-            ]
+    # 2. Build the Stage 2 output JSON for the prompt
+    stage2_json = json.dumps(record.model_dump(), ensure_ascii=False, default=str)
 
-            # 5. Run LLM and Parse into Pydantic Model
-            llm_raw = run_llm(messages).content
-            catalyst_json = parse_json_with_fallback(llm_raw)
-            
-            # This validation step ensures the LLM didn't hallucinate a tag 
-            # outside of your Literal ImpactArea or CatalystType
-            record = Catalyst(**catalyst_json)
-
-            # Enforce 1 citation per chunk_id (keep first, drop duplicates)
-            seen_chunks = set()
-            deduped = []
-            for c in record.citations:
-                if c.chunk_id not in seen_chunks:
-                    seen_chunks.add(c.chunk_id)
-                    deduped.append(c)
-            record.citations = deduped
-
-            new_catalysts.append(record)
-
-        except Exception as e:
-            node_errors.append(f"Failed synthesizing group {group_uuids}: {str(e)}")
-
-    # 5. Return the additions to the final_catalysts list
-    # Annotated[List, operator.add] in states.py handles the append automatically
-    return {
-        "final_catalysts": new_catalysts,
-        "existing_catalysts": existing_catalysts,
-        "errors": node_errors
-    }
-
-def stage3_node(state: CatalystSession) -> Dict:
-    """
-    Validates synthesized catalysts against their source chunks.
-    Uses the proper STAGE3 prompts from prompts.py and cross-references
-    citations against original raw_chunks.
-    
-    Returns validated catalysts via set_reducer (overwrites, not appends)
-    to avoid duplicating the Stage 2 output.
-    """
-    catalysts: List[Catalyst] = state["final_catalysts"]
-    raw_chunks = state["raw_chunks"]
-    company_info = state["company_info"]
-    existing_catalysts = state.get("existing_catalysts", [])
-    new_errors = []
+    # 3. Construct the prompt using the designed templates
+    # Look up definition from CATALYST_CONFIG, fallback to formatted name
+    definition = CATALYST_CONFIG.get(record.catalyst_type, {}).get(
+        "definition", record.catalyst_type.replace("_", " ").title()
+    )
+    # Resolve prior sentiment for update actions
+    prior_sentiment_str = "N/A (new catalyst)"
+    if record.action == "update" and record.catalyst_id:
+        prior = existing_map.get(record.catalyst_id)
+        if prior:
+            prior_sentiment_str = str(prior.get('sentiment', 'unknown'))
+
+    human_prompt = STAGE3_HUMAN_PROMPT.format(
+        catalyst_type=record.catalyst_type,
+        definition=definition,
+        company_info=company_info.model_dump_json(),
+        source_text_chunks=source_text_block,
+        stage2_json_output=stage2_json,
+        prior_sentiment=prior_sentiment_str
+    )
+
+    return [
+        SystemMessage(content=STAGE3_SYSTEM_MESSAGE),
+        HumanMessage(content=human_prompt)
+    ]
+
+
+def stage3_output(record: Catalyst, llm_raw: str):
+    val_result = parse_json_with_fallback(llm_raw)
+
+    # 5. Update the record — LLM returns is_valid: 0|1
+    is_valid = val_result.get("is_valid", 0)
+    record.is_valid = bool(is_valid)
+    record.rejection_reason = val_result.get("rejection_reason", "")
+
+
+def stage3_failed(record: Catalyst, e: Exception) -> str:
+    """Reject a record whose validation could not run; returns the error to log."""
+    record.is_valid = False
+    record.rejection_reason = f"System Error: {str(e)}"
+    return f"Validation failed for '{record.title[:30]}...': {str(e)}"
 
+
+def validation_tasks(state: CatalystSession) -> List[ValidationTask]:
+    """One Stage 3 task per synthesized catalyst."""
     # Build lookup: catalyst_id -> existing catalyst record (for sentiment check)
     existing_map = {}
-    for ec in existing_catalysts:
+    for ec in state.get("existing_catalysts", []):
         if ec and isinstance(ec, dict) and 'catalyst_id' in ec:
             existing_map[ec['catalyst_id']] = ec
 
     # Build a lookup from composite ID -> chunk content for source verification
-    chunk_map = {chunk['chunk_id']: chunk for chunk in raw_chunks}
-
-    for record in catalysts:
-        try:
-            # 1. Gather source text using citation chunk IDs
-            source_text_parts = []
-            for cid in [c.chunk_id for c in record.citations]:
-                chunk = chunk_map.get(cid)
-                if chunk:
-                    source_text_parts.append(
-                        f"[ID: {cid}] [Date: {chunk['date']}] \"{chunk['content']}\""
-                    )
-            source_text_block = "\n".join(source_text_parts)
-
-            # 2. Build the Stage 2 output JSON for the prompt
-            stage2_json = json.dumps(record.model_dump(), ensure_ascii=False, default=str)
-
-            # 3. Construct the prompt using the designed templates
-            # Look up definition from CATALYST_CONFIG, fallback to formatted name
-            definition = CATALYST_CONFIG.get(record.catalyst_type, {}).get(
-                "definition", record.catalyst_type.replace("_", " ").title()
-            )
-            # Resolve prior sentiment for update actions
-            prior_sentiment_str = "N/A (new catalyst)"
-            if record.action == "update" and record.catalyst_id:
-                prior = existing_map.get(record.catalyst_id)
-                if prior:
-                    prior_sentiment_str = str(prior.get('sentiment', 'unknown'))
-
-            human_prompt = STAGE3_HUMAN_PROMPT.format(
-                catalyst_type=record.catalyst_type,
-                definition=definition,
-                company_info=company_info.model_dump_json(),
-                source_text_chunks=source_text_block,
-                stage2_json_output=stage2_json,
-                prior_sentiment=prior_sentiment_str
-            )
+    chunk_map = {chunk['chunk_id']: chunk for chunk in state["raw_chunks"]}
+    return [
+        {
+            "catalyst_index": i,
+            "record": record,
+            "chunk_map": chunk_map,
+            "company_info": state["company_info"],
+            "existing_map": existing_map,
+        }
+        for i, record in enumerate(state["final_catalysts"])
+    ]
+
 
-            messages = [
-                SystemMessage(content=STAGE3_SYSTEM_MESSAGE),
-                HumanMessage(content=human_prompt)
-            ]
-
-            # 4. Run Validation LLM
-            llm_raw = run_llm(messages).content
-            val_result = parse_json_with_fallback(llm_raw)
-
-            # 5. Update the record — LLM returns is_valid: 0|1
-            is_valid = val_result.get("is_valid", 0)
-            record.is_valid = bool(is_valid)
-            record.rejection_reason = val_result.get("rejection_reason", "")
-
-        except Exception as e:
-            error_msg = f"Validation failed for '{record.title[:30]}...': {str(e)}"
-            new_errors.append(error_msg)
-            record.is_valid = False
-            record.rejection_reason = f"System Error: {str(e)}"
-
-    # Use set_reducer semantics: return the full validated list to REPLACE stage 2 output
-    # This avoids doubling catalysts via the add_reducer
-    return {
-        "final_catalysts": catalysts, 
-        "errors": new_errors 
-    }
\ No newline at end of file
+def stage3_node(task: ValidationTask) -> Dict:
+    """
+    Validates one synthesized catalyst (a Send task) against its source chunks.
+    Uses the proper STAGE3 prompts from prompts.py and cross-references
+    citations against original raw_chunks.
+    """
+    record = task["record"].model_copy()
+    new_errors = []
+    try:
+        messages = stage3_messages(record, task["chunk_map"], task["company_info"], task["existing_map"])
+        # 4. Run Validation LLM
+        stage3_output(record, run_llm(messages, route="catalysts.stage3").content)
+    except Exception as e:
+        new_errors.append(stage3_failed(record, e))
+    return {"validated_catalysts": [(task["catalyst_index"], record)], "errors": new_errors}
+
+
+async def astage3_node(task: ValidationTask) -> Dict:
+    """Async stage3_node (concurrent mode)."""
+    record = task["record"].model_copy()
+    new_errors = []
+    try:
+        messages = stage3_messages(record, task["chunk_map"], task["company_info"], task["existing_map"])
+        stage3_output(record, (await arun_llm(messages, route="catalysts.stage3")).content)
+    except Exception as e:
+        new_errors.append(stage3_failed(record, e))
+    return {"validated_catalysts": [(task["catalyst_index"], record)], "errors": new_errors}
+
+
+def merge_stage3_node(state: CatalystSession) -> Dict:
+    """
+    Returns the validated catalysts in Stage 2 order via set_reducer
+    (overwrites, not appends) to replace the Stage 2 output.
+    """
+    return {"final_catalysts": [record for _, record in sorted(state["validated_catalysts"], key=lambda x: x[0])]}
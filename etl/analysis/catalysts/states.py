@@ -102,17 +102,41 @@ class CatalystSession(TypedDict):
     
     # Use the wrapped reducers here
     raw_chunks: Annotated[List[Chunk], set_reducer]
-    existing_catalysts: Optional[List[Catalyst]] = []
+    # Stored catalysts matched by the Stage 2 groups (appended by the parallel Stage 2 tasks)
+    existing_catalysts: Annotated[List[Dict], add_reducer]
     
     # Stage 1: Grouping Output
     uuid_groups: Annotated[List[List[str]], set_reducer]
+    # chunk_id -> most recent stored catalyst citing it, for the chunks of every group
+    existing_by_chunk: Annotated[Dict[str, Dict], set_reducer]
     
+    # Stage 2 & 3 map outputs: (index, Catalyst) from the parallel tasks, in completion order
+    group_catalysts: Annotated[List[tuple], add_reducer]
+    validated_catalysts: Annotated[List[tuple], add_reducer]
+
     # Stage 2 & 3: Final Results
     final_catalysts: Annotated[List[Catalyst], set_reducer]
     
     errors: Annotated[List[str], add_reducer]
 
 
+# --- 4. Map Step Payloads (sent to one Stage 2 / Stage 3 task each) ---
+class GroupTask(TypedDict):
+    group_index: int
+    group_uuids: List[str]
+    chunk_map: Dict[str, Dict]
+    company_info: CompanyInfo
+    existing_by_chunk: Dict[str, Dict]
+
+
+class ValidationTask(TypedDict):
+    catalyst_index: int
+    record: Catalyst
+    chunk_map: Dict[str, Dict]
+    company_info: CompanyInfo
+    existing_map: Dict[str, Dict]
+
+
 # --- Helper: State Factory ---
 
 def catalyst_session_factory(
@@ -142,6 +166,9 @@ def catalyst_session_factory(
         "raw_chunks": [],
         "existing_catalysts": [], 
         "uuid_groups": [],
+        "existing_by_chunk": {},
+        "group_catalysts": [],
+        "validated_catalysts": [],
         "final_catalysts": [],
         "errors": []
     }
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""Per-transcript latency of the transcript graph, sync invoke vs ainvoke, on stored transcripts (calls the LLM API)."""
+import sys
+import os
+import time
+import asyncio
+import statistics
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import etl.llm_cache
+from database.utils import connect_to_db, read_sql_query, close_async_pool
+from graph import create_graph
+from main import build_states, warm_embedding_cache
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_TRANSCRIPTS = 10  # latest analyzed transcripts
+# ──────────────────────────────────────────────────────────────────
+
+QUERY = """
+    SELECT et.event_id, et.tic, sm.name, sm.sector, sm.industry, sm.short_summary,
+        et.calendar_year, et.calendar_quarter, et.earnings_date, et.transcript_sha256
+    FROM core.earnings_transcripts AS et
+    JOIN core.earnings_transcript_analysis AS eta
+    ON et.tic = eta.tic
+        AND et.calendar_year = eta.calendar_year
+        AND et.calendar_quarter = eta.calendar_quarter
+    JOIN core.stock_profiles AS sm
+    ON et.tic = sm.tic
+    ORDER BY et.earnings_date DESC
+    LIMIT %s;
+"""
+
+
+def run_sync(app, state) -> float:
+    start = time.perf_counter()
+    app.invoke(state)
+    return time.perf_counter() - start
+
+
+async def run_async(app, state) -> float:
+    start = time.perf_counter()
+    try:
+        await app.ainvoke(state)
+    finally:
+        await close_async_pool()
+    return time.perf_counter() - start
+
+
+def summary(latencies: list) -> str:
+    return (f"median {statistics.median(latencies):.1f}s, mean {statistics.mean(latencies):.1f}s, "
+            f"max {max(latencies):.1f}s")
+
+
+if __name__ == "__main__":
+    etl.llm_cache.LLM_CACHE = False  # both graphs have to reach the model
+    conn = connect_to_db()
+    if not conn:
+        sys.exit("Could not connect to database.")
+    states = build_states(read_sql_query(QUERY, conn, (N_TRANSCRIPTS,)))
+    conn.close()
+    warm_embedding_cache(states)  # templated queries are cached for both graphs alike
+
+    app = create_graph().compile()
+    sync_latencies, async_latencies = [], []
+    for i, (state, _, _) in enumerate(states):
+        # Alternate which graph goes first, so neither always sees the warmer caches
+        if i % 2 == 0:
+            sync_latencies.append(run_sync(app, state))
+            async_latencies.append(asyncio.run(run_async(app, state)))
+        else:
+            async_latencies.append(asyncio.run(run_async(app, state)))
+            sync_latencies.append(run_sync(app, state))
+        print(f"{state.company_info['tic']} {state.company_info['calendar_year']} "
+              f"Q{state.company_info['calendar_quarter']}: "
+              f"sync {sync_latencies[-1]:.1f}s, async {async_latencies[-1]:.1f}s")
+
+    print(f"{len(states)} transcripts")
+    print(f"Sync invoke: {summary(sync_latencies)}")
+    print(f"ainvoke:     {summary(async_latencies)}")
+    print(f"Median speedup x{statistics.median(sync_latencies) / statistics.median(async_latencies):.2f}")
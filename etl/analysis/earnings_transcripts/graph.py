@@ -2,13 +2,20 @@ from langgraph.graph import START, END
 from langgraph.graph import StateGraph
 from langgraph.types import Command
 from typing import Literal
+import asyncio
 import time  # Import the time module for timing
 from nodes import (
     past_retriever_node, future_retriever_node, risk_retriever_node,
     past_analysis_node, future_analysis_node, risk_analysis_node,
     risk_response_analysis_node, risk_response_retriever_node,
-    risk_response_queries_powered_by_llm
+    risk_response_queries_powered_by_llm,
+    apast_retriever_node, afuture_retriever_node, arisk_retriever_node,
+    arisk_response_retriever_node,
+    apast_analysis_node, afuture_analysis_node, arisk_analysis_node,
+    arisk_response_analysis_node, arisk_response_queries_powered_by_llm
 )
+from etl.utils import llm_node
+from database.utils import close_async_pool
 from states import merged_state_factory, MergedState, PastState, FutureState, RiskState
 
 
@@ -30,17 +37,19 @@ def create_graph() -> StateGraph:
     graph.add_node("fanout", fanout)
 
     # branch nodes
-    graph.add_node("past_retriever_node", past_retriever_node)
-    graph.add_node("future_retriever_node", future_retriever_node)
-    graph.add_node("risk_retriever_node", risk_retriever_node)
+    # Every node has a coroutine counterpart: under ainvoke the three branches
+    # overlap on one event loop (database, embedding and LLM I/O included)
+    graph.add_node("past_retriever_node", llm_node(past_retriever_node, apast_retriever_node))
+    graph.add_node("future_retriever_node", llm_node(future_retriever_node, afuture_retriever_node))
+    graph.add_node("risk_retriever_node", llm_node(risk_retriever_node, arisk_retriever_node))
 
-    graph.add_node("past_analysis_node", past_analysis_node)
-    graph.add_node("future_analysis_node", future_analysis_node)
-    graph.add_node("risk_analysis_node", risk_analysis_node)
+    graph.add_node("past_analysis_node", llm_node(past_analysis_node, apast_analysis_node))
+    graph.add_node("future_analysis_node", llm_node(future_analysis_node, afuture_analysis_node))
+    graph.add_node("risk_analysis_node", llm_node(risk_analysis_node, arisk_analysis_node))
 
-    graph.add_node("risk_response_queries_powered_by_llm", risk_response_queries_powered_by_llm)
-    graph.add_node("risk_response_retriever_node", risk_response_retriever_node)
-    graph.add_node("risk_response_analysis_node", risk_response_analysis_node)
+    graph.add_node("risk_response_queries_powered_by_llm", llm_node(risk_response_queries_powered_by_llm, arisk_response_queries_powered_by_llm))
+    graph.add_node("risk_response_retriever_node", llm_node(risk_response_retriever_node, arisk_response_retriever_node))
+    graph.add_node("risk_response_analysis_node", llm_node(risk_response_analysis_node, arisk_response_analysis_node))
 
     # wiring
     graph.add_edge(START, "fanout")
@@ -64,6 +73,13 @@ def create_graph() -> StateGraph:
     return graph
 
 
+async def ainvoke(app, state) -> dict:
+    """One ainvoke run on its own event loop, closing the loop's connection pool after it."""
+    try:
+        return await app.ainvoke(state)
+    finally:
+        await close_async_pool()
+
 
 if __name__ == "__main__":
     graph = create_graph()
@@ -106,7 +122,7 @@ if __name__ == "__main__":
     #         )
 
     # import pdb; pdb.set_trace()
-    result = app.invoke(state)
+    result = asyncio.run(ainvoke(app, state))
 
     print(result)
     # print("===========past===============")
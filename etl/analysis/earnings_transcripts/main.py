@@ -1,64 +1,52 @@
 import time
 import os
 import pandas as pd
-from database.utils import connect_to_db, insert_records, read_sql_query
+from database.utils import connect_to_db, insert_records, read_sql_query, close_async_pool
 from states import merged_state_factory, MergedState
 from graph import create_graph
 from tqdm import tqdm
 import ast
-from etl.utils import fix_quotes
+import asyncio
+from etl.utils import fix_quotes, LLM_CONCURRENCY, abatch_as_completed
+from etl.checkpointing import get_checkpointer, thread_config, astart_input, forget
+from etl.embeddings import warm_query_embedding_cache
+from nodes import EMBEDDING_MODEL
 
 
 
-def main(tic: str, calendar_year: int = 2024, calendar_quarter: int = 4, sleep_time: int = None):
-    """Main function to execute the stock profile summarization pipeline."""
-    # Connect to the database
-    conn = connect_to_db()
-    if conn:
-        if calendar_year is None or calendar_quarter is None:
-            query_latest_year_quarter = """
-            SELECT calendar_year, calendar_quarter
-            FROM core.earnings_transcript_analysis
-            WHERE tic = %s
-            ORDER BY calendar_year DESC, calendar_quarter DESC
-            LIMIT 1;
+def read_records(conn, tic: str, calendar_year: int = None, calendar_quarter: int = None) -> pd.DataFrame:
+    """
+    Transcripts of `tic` to analyze: the given quarter, or with calendar_year or
+    calendar_quarter None every quarter after the latest analyzed one (from 2025).
+    """
+    if calendar_year is None or calendar_quarter is None:
+        query_latest_year_quarter = """
+        SELECT calendar_year, calendar_quarter
+        FROM core.earnings_transcript_analysis
+        WHERE tic = %s
+        ORDER BY calendar_year DESC, calendar_quarter DESC
+        LIMIT 1;
+        """
+        latest_df = read_sql_query(query_latest_year_quarter, conn, params=(tic,))
+        if not latest_df.empty:
+            calendar_year = int(latest_df.loc[0, 'calendar_year'])
+            calendar_quarter = int(latest_df.loc[0, 'calendar_quarter'])
+            query = """
+                SELECT et.event_id, et.tic, sm.name, sm.sector, sm.industry, sm.short_summary, 
+                    et.calendar_year, et.calendar_quarter, et.earnings_date, et.transcript_sha256
+                FROM core.earnings_transcripts AS et
+                LEFT JOIN core.earnings_transcript_analysis AS eta
+                ON et.tic = eta.tic
+                    AND et.calendar_year = eta.calendar_year
+                    AND et.calendar_quarter = eta.calendar_quarter
+                JOIN core.stock_profiles AS sm 
+                ON et.tic = sm.tic
+                WHERE et.tic = %s
+                    AND (et.calendar_year, et.calendar_quarter) > (%s, %s)
+                    AND et.calendar_year >= 2025
+                    AND et.transcript_sha256 IS DISTINCT FROM eta.transcript_sha256;
             """
-            latest_df = read_sql_query(query_latest_year_quarter, conn, params=(tic,))
-            if not latest_df.empty:
-                calendar_year = int(latest_df.loc[0, 'calendar_year'])
-                calendar_quarter = int(latest_df.loc[0, 'calendar_quarter'])
-                query = """
-                    SELECT et.event_id, et.tic, sm.name, sm.sector, sm.industry, sm.short_summary, 
-                        et.calendar_year, et.calendar_quarter, et.earnings_date, et.transcript_sha256
-                    FROM core.earnings_transcripts AS et
-                    LEFT JOIN core.earnings_transcript_analysis AS eta
-                    ON et.tic = eta.tic
-                        AND et.calendar_year = eta.calendar_year
-                        AND et.calendar_quarter = eta.calendar_quarter
-                    JOIN core.stock_profiles AS sm 
-                    ON et.tic = sm.tic
-                    WHERE et.tic = %s
-                        AND (et.calendar_year, et.calendar_quarter) > (%s, %s)
-                        AND et.calendar_year >= 2025
-                        AND et.transcript_sha256 IS DISTINCT FROM eta.transcript_sha256;
-                """
-                query_params = (tic, calendar_year, calendar_quarter)
-            else:
-                query = """
-                    SELECT et.event_id, et.tic, sm.name, sm.sector, sm.industry, sm.short_summary, 
-                        et.calendar_year, et.calendar_quarter, et.earnings_date, et.transcript_sha256
-                    FROM core.earnings_transcripts AS et
-                    LEFT JOIN core.earnings_transcript_analysis AS eta
-                    ON et.tic = eta.tic
-                        AND et.calendar_year = eta.calendar_year
-                        AND et.calendar_quarter = eta.calendar_quarter
-                    JOIN core.stock_profiles AS sm 
-                    ON et.tic = sm.tic
-                    WHERE et.tic = %s
-                        AND et.calendar_year >= 2025
-                        AND et.transcript_sha256 IS DISTINCT FROM eta.transcript_sha256;
-                """
-                query_params = (tic,)
+            query_params = (tic, calendar_year, calendar_quarter)
         else:
             query = """
                 SELECT et.event_id, et.tic, sm.name, sm.sector, sm.industry, sm.short_summary, 
@@ -71,23 +59,33 @@ def main(tic: str, calendar_year: int = 2024, calendar_quarter: int = 4, sleep_t
                 JOIN core.stock_profiles AS sm 
                 ON et.tic = sm.tic
                 WHERE et.tic = %s
-                    AND (et.calendar_year, et.calendar_quarter) = (%s, %s)
+                    AND et.calendar_year >= 2025
                     AND et.transcript_sha256 IS DISTINCT FROM eta.transcript_sha256;
             """
-            query_params = (tic, calendar_year, calendar_quarter)
-        df = read_sql_query(query, conn, params=query_params)
-
-        if df.empty:
-            print(f"No new or updated earnings transcripts to process. - {tic}")
-            return
+            query_params = (tic,)
     else:
-        print("Could not connect to database.")
-        return
+        query = """
+            SELECT et.event_id, et.tic, sm.name, sm.sector, sm.industry, sm.short_summary, 
+                et.calendar_year, et.calendar_quarter, et.earnings_date, et.transcript_sha256
+            FROM core.earnings_transcripts AS et
+            LEFT JOIN core.earnings_transcript_analysis AS eta
+            ON et.tic = eta.tic
+                AND et.calendar_year = eta.calendar_year
+                AND et.calendar_quarter = eta.calendar_quarter
+            JOIN core.stock_profiles AS sm 
+            ON et.tic = sm.tic
+            WHERE et.tic = %s
+                AND (et.calendar_year, et.calendar_quarter) = (%s, %s)
+                AND et.transcript_sha256 IS DISTINCT FROM eta.transcript_sha256;
+        """
+        query_params = (tic, calendar_year, calendar_quarter)
+    df = read_sql_query(query, conn, params=query_params)
+    return df
 
 
-
-    # Construct states from the retrieved records
-    states = [
+def build_states(df: pd.DataFrame) -> list:
+    """(state, event_id, transcript_sha256) per transcript row."""
+    return [
         (merged_state_factory(
             tic=row['tic'],
             company_name=row['name'],
@@ -102,110 +100,214 @@ def main(tic: str, calendar_year: int = 2024, calendar_quarter: int = 4, sleep_t
     ]
 
 
-    # Create and compile the graph
-    graph = create_graph()
-    app = graph.compile()
+def warm_embedding_cache(states: list):
+    """Pre-warm the query embedding cache with every templated query in one batch."""
+    warm_query_embedding_cache(
+        [q for state in states
+           for retriever in (state[0].past_retriever, state[0].future_retriever, state[0].risk_retriever)
+           for q in retriever["queries"]],
+        model=EMBEDDING_MODEL,
+    )
 
-    # Start timing
-    start_time = time.time()
-    processed_data = []
-
-    # Use tqdm to track progress
-    for state in tqdm(states, desc=f"Processing earnings transcripts - {tic} - {calendar_year} Q{calendar_quarter}"):
-        retries = 5
-        while retries > 0:
-            try:
-                final_state = app.invoke(state[0])
-                final_state['event_id'] = state[1]  # Add event_id to the final state
-                final_state['transcript_sha256'] = state[2]  # Add transcript_sha256 to the final state
-                out = {
-                    "event_id": final_state.get("event_id"),
-                    "tic": final_state.get("company_info", {}).get("tic"),
-                    "calendar_year": final_state.get("company_info", {}).get("calendar_year"),
-                    "calendar_quarter": final_state.get("company_info", {}).get("calendar_quarter"),
-                    "sentiment": final_state.get("past_analysis", {}).get("sentiment"),
-                    "durability": final_state.get("past_analysis", {}).get("durability"),
-                    "performance_factors": final_state.get("past_analysis", {}).get("performance_factors"),
-                    "past_summary": fix_quotes(final_state.get("past_analysis", {}).get("past_summary")),
-                    "guidance_direction": final_state.get("future_analysis", {}).get("guidance_direction"),
-                    "revenue_outlook": final_state.get("future_analysis", {}).get("revenue_outlook"),
-                    "margin_outlook": final_state.get("future_analysis", {}).get("margin_outlook"),
-                    "earnings_outlook": final_state.get("future_analysis", {}).get("earnings_outlook"),
-                    "cashflow_outlook": final_state.get("future_analysis", {}).get("cashflow_outlook"),
-                    "growth_acceleration": final_state.get("future_analysis", {}).get("growth_acceleration"),
-                    "future_outlook_sentiment": final_state.get("future_analysis", {}).get("future_outlook_sentiment"),
-                    "growth_drivers": final_state.get("future_analysis", {}).get("growth_drivers"),
-                    "future_summary": fix_quotes(final_state.get("future_analysis", {}).get("future_summary")),
-                    "risk_mentioned": final_state.get("risk_analysis", {}).get("risk_mentioned"),
-                    "risk_impact": final_state.get("risk_analysis", {}).get("risk_impact"),
-                    "risk_time_horizon": final_state.get("risk_analysis", {}).get("risk_time_horizon"),
-                    "risk_factors": final_state.get("risk_analysis", {}).get("risk_factors"),
-                    "risk_summary": fix_quotes(final_state.get("risk_analysis", {}).get("risk_summary")),
-                    "mitigation_mentioned": final_state.get("risk_response_analysis", {}).get("mitigation_mentioned"),
-                    "mitigation_effectiveness": final_state.get("risk_response_analysis", {}).get("mitigation_effectiveness"),
-                    "mitigation_time_horizon": final_state.get("risk_response_analysis", {}).get("mitigation_time_horizon"),
-                    "mitigation_actions": final_state.get("risk_response_analysis", {}).get("mitigation_actions"),
-                    "mitigation_summary": fix_quotes(final_state.get("risk_response_analysis", {}).get("mitigation_summary")),
-                    "transcript_sha256": final_state.get("transcript_sha256"),
-                }
-                break
-            except Exception as e:
-                retries -= 1
-                if retries == 0:
-                    print(f"Failed to process {tic} after multiple retries: {e}")
-                    raise e
-                print(f"Error processing {tic}: {e}. Retrying...")
-                
-
-        processed_data.append(out)
-
-    # Load processed data into core.earnings_transcript_analysis
+
+def run_thread_id(state: tuple) -> str:
+    """Checkpoint thread of one transcript's run."""
+    company_info = state[0].company_info
+    return (f"earnings_transcripts:{company_info['tic']}:"
+            f"{company_info['calendar_year']}Q{company_info['calendar_quarter']}:{state[2]}")
+
+
+def to_record(final_state: dict, event_id, transcript_sha256) -> dict:
+    """core.earnings_transcript_analysis row of a finished graph run."""
+    final_state['event_id'] = event_id  # Add event_id to the final state
+    final_state['transcript_sha256'] = transcript_sha256  # Add transcript_sha256 to the final state
+    return {
+        "event_id": final_state.get("event_id"),
+        "tic": final_state.get("company_info", {}).get("tic"),
+        "calendar_year": final_state.get("company_info", {}).get("calendar_year"),
+        "calendar_quarter": final_state.get("company_info", {}).get("calendar_quarter"),
+        "sentiment": final_state.get("past_analysis", {}).get("sentiment"),
+        "durability": final_state.get("past_analysis", {}).get("durability"),
+        "performance_factors": final_state.get("past_analysis", {}).get("performance_factors"),
+        "past_summary": fix_quotes(final_state.get("past_analysis", {}).get("past_summary")),
+        "guidance_direction": final_state.get("future_analysis", {}).get("guidance_direction"),
+        "revenue_outlook": final_state.get("future_analysis", {}).get("revenue_outlook"),
+        "margin_outlook": final_state.get("future_analysis", {}).get("margin_outlook"),
+        "earnings_outlook": final_state.get("future_analysis", {}).get("earnings_outlook"),
+        "cashflow_outlook": final_state.get("future_analysis", {}).get("cashflow_outlook"),
+        "growth_acceleration": final_state.get("future_analysis", {}).get("growth_acceleration"),
+        "future_outlook_sentiment": final_state.get("future_analysis", {}).get("future_outlook_sentiment"),
+        "growth_drivers": final_state.get("future_analysis", {}).get("growth_drivers"),
+        "future_summary": fix_quotes(final_state.get("future_analysis", {}).get("future_summary")),
+        "risk_mentioned": final_state.get("risk_analysis", {}).get("risk_mentioned"),
+        "risk_impact": final_state.get("risk_analysis", {}).get("risk_impact"),
+        "risk_time_horizon": final_state.get("risk_analysis", {}).get("risk_time_horizon"),
+        "risk_factors": final_state.get("risk_analysis", {}).get("risk_factors"),
+        "risk_summary": fix_quotes(final_state.get("risk_analysis", {}).get("risk_summary")),
+        "mitigation_mentioned": final_state.get("risk_response_analysis", {}).get("mitigation_mentioned"),
+        "mitigation_effectiveness": final_state.get("risk_response_analysis", {}).get("mitigation_effectiveness"),
+        "mitigation_time_horizon": final_state.get("risk_response_analysis", {}).get("mitigation_time_horizon"),
+        "mitigation_actions": final_state.get("risk_response_analysis", {}).get("mitigation_actions"),
+        "mitigation_summary": fix_quotes(final_state.get("risk_response_analysis", {}).get("mitigation_summary")),
+        "transcript_sha256": final_state.get("transcript_sha256"),
+    }
+
+
+def load_records(conn, processed_data: list) -> int:
+    """Upsert analysis rows into core.earnings_transcript_analysis."""
+    df = pd.DataFrame(processed_data)
+    # Convert JSON array strings to Python lists for array columns
+    array_cols = [
+        "performance_factors", "growth_drivers", "risk_factors", "mitigation_actions"
+    ]
+    
+    for col in array_cols:
+        if col in df.columns:
+            df[col] = df[col].astype(object)
+            df[col] = df[col].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) and x.startswith('[') else x)
+    return insert_records(conn, df, "core.earnings_transcript_analysis", ["tic", "calendar_year", "calendar_quarter"])
+
+
+async def process_concurrently(app, states: list, conn, concurrency: int) -> tuple:
+    """
+    Run the graph over `states` (any mix of tickers and quarters) with
+    `concurrency` runs in flight, writing each analysis as it completes.
+    Writes run in a worker thread so the runs in flight keep going; this loop
+    is their only caller, so writes on `conn` stay sequential.
+    Returns (records written, transcripts that failed every retry).
+    """
     total_records = 0
-    if conn:
-        df = pd.DataFrame(processed_data)
-        # Convert JSON array strings to Python lists for array columns
-        array_cols = [
-            "performance_factors", "growth_drivers", "risk_factors", "mitigation_actions"
-        ]
-        
-        for col in array_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(object)
-                df[col] = df[col].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) and x.startswith('[') else x)
-        total_records = insert_records(conn, df, "core.earnings_transcript_analysis", ["tic", "calendar_year", "calendar_quarter"])
+    failed = 0
+    try:
+        async for i, final_state in abatch_as_completed(app, [state[0] for state in states], concurrency, retries=5,
+                                                        desc=f"Processing earnings transcripts (concurrency {concurrency})",
+                                                        thread_ids=[run_thread_id(state) for state in states]):
+            if isinstance(final_state, Exception):
+                print(f"Failed to process {states[i][0].company_info['tic']} after multiple retries: {final_state}")
+                failed += 1
+                continue
+            record = to_record(final_state, states[i][1], states[i][2])
+            total_records += await asyncio.to_thread(load_records, conn, [record])
+            await asyncio.to_thread(forget, [run_thread_id(states[i])])
+    finally:
+        await close_async_pool()
+    return total_records, failed
+
+
+async def process_sequentially(app, states: list, conn, desc: str) -> int:
+    """
+    Run the graph over `states` one transcript at a time (each run's branches
+    still overlap under ainvoke), retrying a failed run up to 5 times (from its
+    last checkpoint when checkpointing is on), and writing each analysis as it completes.
+    Returns the number of records written.
+    """
+    total_records = 0
+    try:
+        # Use tqdm to track progress; requests are paced by the shared rate limiter of run_llm
+        for state in tqdm(states, desc=desc):
+            tic = state[0].company_info['tic']
+            thread_id = run_thread_id(state)
+            run_input = await astart_input(app, state[0], thread_id)
+            retries = 5
+            while retries > 0:
+                try:
+                    final_state = await app.ainvoke(run_input, thread_config(thread_id))
+                    out = to_record(final_state, state[1], state[2])
+                    break
+                except Exception as e:
+                    retries -= 1
+                    if retries == 0:
+                        print(f"Failed to process {tic} after multiple retries: {e}")
+                        raise e
+                    print(f"Error processing {tic}: {e}. Retrying...")
+                    run_input = await astart_input(app, state[0], thread_id, resume=True)
+
+            total_records += load_records(conn, [out])
+            forget([thread_id])
+    finally:
+        await close_async_pool()
+    return total_records
+
+
+def main_concurrent(tickers: list, concurrency: int = LLM_CONCURRENCY):
+    """
+    Concurrent mode of the __main__ loop: every ticker's quarters after its
+    latest analysis are queued up front and analyzed `concurrency` at a time.
+    A ticker's quarters are independent, so they run in parallel too.
+    """
+    conn = connect_to_db()
+    if not conn:
+        print("Could not connect to database.")
+        return
+    states = [state for tic in tickers for state in build_states(read_records(conn, tic))]
+    if not states:
+        print("No new or updated earnings transcripts to process.")
         conn.close()
+        return
+    warm_embedding_cache(states)
+
+    app = create_graph().compile(checkpointer=get_checkpointer())
+    start_time = time.time()
+    total_records, failed = asyncio.run(process_concurrently(app, states, conn, concurrency))
+    conn.close()
+    print(f"Inserted/Updated {total_records} records in {time.time() - start_time:.2f} seconds.")
+    print(f"Total number of records is {len(states) - failed} ({failed} failed).")
+
+
+def main(tic: str, calendar_year: int = 2024, calendar_quarter: int = 4):
+    """Main function to execute the stock profile summarization pipeline."""
+    # Connect to the database
+    conn = connect_to_db()
+    if conn:
+        df = read_records(conn, tic, calendar_year, calendar_quarter)
+
+        if df.empty:
+            print(f"No new or updated earnings transcripts to process. - {tic}")
+            return
+    else:
+        print("Could not connect to database.")
+        return
+
+
+
+    # Construct states from the retrieved records
+    states = build_states(df)
+
+
+    # Pre-warm the query embedding cache with every templated query in one batch
+    warm_embedding_cache(states)
+
+    # Create and compile the graph; runs are checkpointed when enabled (see etl/checkpointing.py)
+    graph = create_graph()
+    app = graph.compile(checkpointer=get_checkpointer())
+
+    # Start timing; each analysis is loaded into core.earnings_transcript_analysis as it completes
+    start_time = time.time()
+    total_records = asyncio.run(process_sequentially(
+        app, states, conn, desc=f"Processing earnings transcripts - {tic} - {calendar_year} Q{calendar_quarter}"))
+    conn.close()
 
     # End timing
     end_time = time.time()
-    elapsed = end_time - start_time
-    print(f"Inserted/Updated {total_records} records in {elapsed:.2f} seconds.")
-    print(f"Total number of records is {len(processed_data)}.")
-
-    # Adaptive rate limiting: sleep only for the remaining time up to the target interval
-    if sleep_time is not None:
-        remaining = max(0, sleep_time - elapsed)
-        if remaining > 0:
-            print(f"Rate limiting: sleeping {remaining:.0f}s (elapsed {elapsed:.1f}s, target {sleep_time}s)")
-            time.sleep(remaining)
+    print(f"Inserted/Updated {total_records} records in {end_time - start_time:.2f} seconds.")
+    print(f"Total number of records is {len(states)}.")
 
 if __name__ == "__main__":
     conn = connect_to_db()
-    sleep_time = 125  # seconds to sleep between runs to avoid rate limits
-    batch_size = 10  # number of companies to process before sleeping
     if conn:
         cursor = conn.cursor()
         cursor.execute("SELECT tic FROM core.stock_profiles;")
         records = cursor.fetchall()
-        for i, record in enumerate(records):
-            tic = record[0]
-            print(f"\nProcessing {tic} ({i+1}/{len(records)})")
-            main(tic=tic, calendar_year=None, calendar_quarter=None, sleep_time=sleep_time)
-            # main(tic=tic, calendar_year=2024, calendar_quarter=4)
-            # main(tic=tic, calendar_year=2025, calendar_quarter=1)
-            # main(tic=tic, calendar_year=2025, calendar_quarter=2)
-            # main(tic=tic, calendar_year=2025, calendar_quarter=3)
-            # main(tic=tic, calendar_year=2025, calendar_quarter=4)
-            if i > 0 and i % batch_size == 0:
-                print(f"\n[Rate Limit Protection] Processed {batch_size} items. Sleeping for {sleep_time} seconds...")
-                time.sleep(sleep_time)
+        if LLM_CONCURRENCY > 1:
+            main_concurrent([record[0] for record in records])
+        else:
+            for i, record in enumerate(records):
+                tic = record[0]
+                print(f"\nProcessing {tic} ({i+1}/{len(records)})")
+                main(tic=tic, calendar_year=None, calendar_quarter=None)
+                # main(tic=tic, calendar_year=2024, calendar_quarter=4)
+                # main(tic=tic, calendar_year=2025, calendar_quarter=1)
+                # main(tic=tic, calendar_year=2025, calendar_quarter=2)
+                # main(tic=tic, calendar_year=2025, calendar_quarter=3)
+                # main(tic=tic, calendar_year=2025, calendar_quarter=4)
         conn.close()
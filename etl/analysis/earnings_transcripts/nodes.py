@@ -1,14 +1,18 @@
 from states import PastState, FutureState, RiskState, RiskResponseState, MergedState
-from database.utils import execute_query
-from etl.utils import parse_json_with_fallback, run_llm
+from database.utils import execute_query, aexecute_query
+from etl.utils import parse_json_with_fallback, run_llm, arun_llm
+from etl.embeddings import embed_queries, aembed_queries
 from typing import Literal, Optional
 from prompts import PAST_PERFORMANCE_SYSTEM_MESSAGE, FUTURE_OUTLOOK_SYSTEM_MESSAGE, \
                     RISK_FACTORS_SYSTEM_MESSAGE, RISK_RESPONSE_SYSTEM_MESSAGE, \
                     HUMAN_PROMPT_TEMPLATE, RISK_RESPONSE_QUERY_GEN_SYSTEM_MESSAGE, \
                     RISK_RESPONSE_QUERY_GEN_HUMAN_MESSAGE
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from functools import partial
+from functools import partial, lru_cache
+from collections import OrderedDict
+import numpy as np
+import threading
+import asyncio
 import json
 import os
 import database.config
@@ -48,6 +52,7 @@ STAGES = {
 }
 
 # Retrieval constants
+EMBEDDING_MODEL = "text-embedding-3-small"  # Must match core.earnings_transcript_embeddings
 MIN_SIMILARITY = 0.25  # Minimum cosine similarity threshold for chunk inclusion
 
 # Boilerplate phrases to filter out (e.g., legal safe-harbor disclaimers)
@@ -84,47 +89,172 @@ def _build_company_prompt(company_info: dict, context: str = '') -> str:
 
 # ---- Retriever Node ----
 
-def retriever(state: MergedState,
-              type: Literal["past", "future", "risk", "risk_response"]
-              ) -> dict:
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small", timeout=30, max_retries=2)
+# "memory" scores every query against the transcript's chunk matrix in NumPy;
+# "sql" runs one pgvector ORDER BY query per query vector.
+RETRIEVAL_MODE = os.getenv("TRANSCRIPT_RETRIEVAL_MODE", "memory")
+TRANSCRIPT_CACHE_SIZE = 8  # Transcripts kept in memory; all four stages of one run share an entry
+
+_transcript_matrix_lock = threading.Lock()
+
+
+TRANSCRIPT_MATRIX_SQL = """
+    SELECT
+        c.chunk_id,
+        c.chunk,
+        e.embedding::real[] AS embedding
+    FROM core.earnings_transcript_embeddings e
+    JOIN core.earnings_transcript_chunks c
+    USING (tic, calendar_year, calendar_quarter, chunk_id)
+    WHERE c.tic = %s
+        AND c.calendar_year = %s
+        AND c.calendar_quarter = %s
+    ORDER BY c.chunk_id;
+"""
+
+
+@lru_cache(maxsize=TRANSCRIPT_CACHE_SIZE)
+def _load_transcript_matrix(tic: str, calendar_year: int, calendar_quarter: int) -> dict:
+    """
+    Load one transcript's chunks and unit-normalized embeddings in a single query.
+    Returns {"chunk_ids", "chunks", "embeddings" (n x d), "is_boilerplate" (n,)}.
+    """
+    return _build_transcript_matrix(execute_query(TRANSCRIPT_MATRIX_SQL, (tic, calendar_year, calendar_quarter)))
+
+
+def _build_transcript_matrix(results) -> dict:
+    if results is None or results.empty:
+        raise RuntimeError("No chunks found for the given parameters.")
+
+    embeddings = np.array(results["embedding"].tolist(), dtype=np.float64)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1.0, norms)
+
+    chunks = results["chunk"].tolist()
+    lowered = results["chunk"].str.lower()
+    is_boilerplate = np.zeros(len(chunks), dtype=bool)
+    for bp in BOILERPLATE_PHRASES:
+        is_boilerplate |= lowered.str.contains(bp, regex=False).to_numpy()
+
+    return {
+        "chunk_ids": results["chunk_id"].tolist(),
+        "chunks": chunks,
+        "embeddings": embeddings,
+        "is_boilerplate": is_boilerplate,
+    }
+
+
+def get_transcript_matrix(tic: str, calendar_year: int, calendar_quarter: int) -> dict:
+    """Thread-safe accessor so parallel retriever branches load each transcript once."""
+    with _transcript_matrix_lock:
+        return _load_transcript_matrix(tic, int(calendar_year), int(calendar_quarter))
+
+
+# Async counterpart of the lru_cache: per event loop, the loading tasks of the
+# TRANSCRIPT_CACHE_SIZE most recent transcripts
+_atranscript_matrices = {}  # event loop -> OrderedDict[(tic, year, quarter)] -> Task
+
+
+async def _aload_transcript_matrix(tic: str, calendar_year: int, calendar_quarter: int) -> dict:
+    return _build_transcript_matrix(await aexecute_query(TRANSCRIPT_MATRIX_SQL, (tic, calendar_year, calendar_quarter)))
+
+
+async def aget_transcript_matrix(tic: str, calendar_year: int, calendar_quarter: int) -> dict:
+    """Async get_transcript_matrix: concurrent branches of one run await the same load."""
+    loop = asyncio.get_running_loop()
+    for stale in [l for l in _atranscript_matrices if l.is_closed()]:
+        del _atranscript_matrices[stale]
+    tasks = _atranscript_matrices.setdefault(loop, OrderedDict())
+    key = (tic, int(calendar_year), int(calendar_quarter))
+    if key in tasks:
+        tasks.move_to_end(key)
+    else:
+        tasks[key] = loop.create_task(_aload_transcript_matrix(*key))
+        while len(tasks) > TRANSCRIPT_CACHE_SIZE:
+            tasks.popitem(last=False)
+    task = tasks[key]
+    try:
+        return await task
+    except Exception:
+        # A failed load is not cached, so a retried run queries again
+        if tasks.get(key) is task:
+            del tasks[key]
+        raise
+
+
+def _score_in_memory(company_info: dict, query_vecs: list, top_k: int) -> tuple[list, list]:
+    """Score all query vectors against the transcript with one matrix multiply (see _score_matrix)."""
+    matrix = get_transcript_matrix(company_info["tic"], company_info["calendar_year"],
+                                   company_info["calendar_quarter"])
+    return _score_matrix(matrix, query_vecs, top_k)
+
+
+async def _ascore_in_memory(company_info: dict, query_vecs: list, top_k: int) -> tuple[list, list]:
+    """Async _score_in_memory."""
+    matrix = await aget_transcript_matrix(company_info["tic"], company_info["calendar_year"],
+                                          company_info["calendar_quarter"])
+    return _score_matrix(matrix, query_vecs, top_k)
+
+
+def _score_matrix(matrix: dict, query_vecs: list, top_k: int) -> tuple[list, list]:
+    """
+    Mirrors the SQL path: per query keep the top_k nearest chunks, drop boilerplate
+    and chunks below MIN_SIMILARITY, then keep the first hit per chunk in
+    (query, rank) order. Returns (chunks, scores) in that insertion order.
+    """
+    queries = np.asarray(query_vecs, dtype=np.float64)
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries / np.where(norms == 0, 1.0, norms)
+
+    similarity = queries @ matrix["embeddings"].T                    # (q, n)
+    k = min(top_k, similarity.shape[1])
+    top_idx = np.argsort(-similarity, axis=1, kind="stable")[:, :k]   # (q, k)
+    top_sim = np.take_along_axis(similarity, top_idx, axis=1)
+
+    flat_idx = top_idx.ravel()
+    flat_sim = top_sim.ravel()
+    keep = ~matrix["is_boilerplate"][flat_idx] & (flat_sim >= MIN_SIMILARITY)
+    flat_idx, flat_sim = flat_idx[keep], flat_sim[keep]
+
+    # First occurrence of each chunk, kept in insertion order
+    _, first = np.unique(flat_idx, return_index=True)
+    first = np.sort(first)
+    chunks = [matrix["chunks"][i] for i in flat_idx[first]]
+    scores = flat_sim[first].tolist()
+    return chunks, scores
+
+
+SCORE_SQL = """
+    SELECT
+        c.tic,
+        c.calendar_year,
+        c.calendar_quarter,
+        c.chunk_id,
+        c.chunk,
+        1 - (e.embedding <=> %s::vector) AS similarity
+    FROM core.earnings_transcript_embeddings e
+    JOIN core.earnings_transcript_chunks c
+    USING (tic, calendar_year, calendar_quarter, chunk_id)
+    WHERE c.tic = %s 
+        AND c.calendar_year = %s 
+        AND c.calendar_quarter = %s
+    ORDER BY e.embedding <=> %s::vector
+    LIMIT %s;
+"""
+
+
+def _score_params(company_info: dict, query_vec: list, top_k: int) -> tuple:
+    vec_str = "[" + ",".join(map(str, query_vec)) + "]"
+    return (vec_str, company_info["tic"], company_info["calendar_year"],
+            company_info["calendar_quarter"], vec_str, top_k)
+
+
+def _merge_sql_results(results_per_query: list) -> tuple[list, list]:
+    """First hit per chunk over the per-query results, in (query, rank) order."""
     all_chunks = []
     all_scores = []
     seen_chunks = set()
-    company_info = state.company_info
-    retriever_cfg = getattr(state, STAGES[type]["retriever"])
-    query_texts = retriever_cfg["queries"]
-
-    if len(query_texts) == 0:
-        raise ValueError("query_texts cannot be empty.")
-
-    # Batch embed all queries at once for efficiency
-    query_vecs = embedding_model.embed_documents(query_texts)
-
-    for query_vec in query_vecs:
-        vec_str = "[" + ",".join(map(str, query_vec)) + "]"
-        sql = """
-            SELECT
-                c.tic,
-                c.calendar_year,
-                c.calendar_quarter,
-                c.chunk_id,
-                c.chunk,
-                1 - (e.embedding <=> %s::vector) AS similarity
-            FROM core.earnings_transcript_embeddings e
-            JOIN core.earnings_transcript_chunks c
-            USING (tic, calendar_year, calendar_quarter, chunk_id)
-            WHERE c.tic = %s 
-                AND c.calendar_year = %s 
-                AND c.calendar_quarter = %s
-            ORDER BY e.embedding <=> %s::vector
-            LIMIT %s;
-        """
-        params = (vec_str, company_info["tic"], company_info["calendar_year"],
-                  company_info["calendar_quarter"], vec_str, retriever_cfg["top_k"])
-
-        results = execute_query(sql, params)
 
+    for results in results_per_query:
         for row in results.itertuples():
             # Skip boilerplate/safe-harbor disclaimer chunks
             if any(bp in row.chunk.lower() for bp in BOILERPLATE_PHRASES):
@@ -134,6 +264,71 @@ def retriever(state: MergedState,
                 all_scores.append(row.similarity)
                 seen_chunks.add(row.chunk_id)
 
+    return all_chunks, all_scores
+
+
+def _score_with_sql(company_info: dict, query_vecs: list, top_k: int) -> tuple[list, list]:
+    """Score each query vector with a pgvector nearest-neighbour query."""
+    return _merge_sql_results([execute_query(SCORE_SQL, _score_params(company_info, query_vec, top_k))
+                               for query_vec in query_vecs])
+
+
+async def _ascore_with_sql(company_info: dict, query_vecs: list, top_k: int) -> tuple[list, list]:
+    """Async _score_with_sql: the per-query searches run concurrently on pooled connections."""
+    return _merge_sql_results(await asyncio.gather(*[
+        aexecute_query(SCORE_SQL, _score_params(company_info, query_vec, top_k))
+        for query_vec in query_vecs
+    ]))
+
+
+def retriever(state: MergedState,
+              type: Literal["past", "future", "risk", "risk_response"]
+              ) -> dict:
+    company_info = state.company_info
+    retriever_cfg = getattr(state, STAGES[type]["retriever"])
+    query_texts = retriever_cfg["queries"]
+
+    if len(query_texts) == 0:
+        raise ValueError("query_texts cannot be empty.")
+
+    # Batch embed all queries at once, served from the query embedding cache when warm
+    query_vecs = embed_queries(query_texts, model=EMBEDDING_MODEL)
+
+    if RETRIEVAL_MODE == "memory":
+        all_chunks, all_scores = _score_in_memory(company_info, query_vecs, retriever_cfg["top_k"])
+    elif RETRIEVAL_MODE == "sql":
+        all_chunks, all_scores = _score_with_sql(company_info, query_vecs, retriever_cfg["top_k"])
+    else:
+        raise ValueError(f"Unsupported retrieval mode: {RETRIEVAL_MODE}")
+
+    return retriever_output(type, retriever_cfg, all_chunks, all_scores)
+
+
+async def aretriever(state: MergedState,
+                     type: Literal["past", "future", "risk", "risk_response"]
+                     ) -> dict:
+    """Async retriever: embedding and database I/O run on the event loop (see create_graph)."""
+    company_info = state.company_info
+    retriever_cfg = getattr(state, STAGES[type]["retriever"])
+    query_texts = retriever_cfg["queries"]
+
+    if len(query_texts) == 0:
+        raise ValueError("query_texts cannot be empty.")
+
+    query_vecs = await aembed_queries(query_texts, model=EMBEDDING_MODEL)
+
+    if RETRIEVAL_MODE == "memory":
+        all_chunks, all_scores = await _ascore_in_memory(company_info, query_vecs, retriever_cfg["top_k"])
+    elif RETRIEVAL_MODE == "sql":
+        all_chunks, all_scores = await _ascore_with_sql(company_info, query_vecs, retriever_cfg["top_k"])
+    else:
+        raise ValueError(f"Unsupported retrieval mode: {RETRIEVAL_MODE}")
+
+    return retriever_output(type, retriever_cfg, all_chunks, all_scores)
+
+
+def retriever_output(type: Literal["past", "future", "risk", "risk_response"],
+                     retriever_cfg: dict, all_chunks: list, all_scores: list) -> dict:
     if not all_chunks:
         raise RuntimeError("No chunks found for the given parameters.")
 
@@ -144,7 +339,7 @@ def retriever(state: MergedState,
     all_chunks = [c for _, c in sorted_pairs]
 
     return { STAGES[type]["retriever"]: {"top_k": retriever_cfg["top_k"], 
-                                         "queries": query_texts,
+                                         "queries": retriever_cfg["queries"],
                                          "chunks": all_chunks, 
                                          "chunks_score": all_scores} }
 
@@ -154,10 +349,10 @@ def retriever(state: MergedState,
 
 MAX_LLM_RETRIES = 2  # Retries within analysis node before raising to outer retry logic
 
-def analysis_node(state: MergedState,
-                  type: Literal['past', 'future', 'risk', 'risk_response'],
-                  history: Optional[Literal['past', 'future', 'risk', 'risk_response']] = None
-                  ) -> dict:
+def analysis_messages(state: MergedState,
+                      type: Literal['past', 'future', 'risk', 'risk_response'],
+                      history: Optional[Literal['past', 'future', 'risk', 'risk_response']] = None
+                      ) -> list:
     cfg = STAGES[type]
     company_info = state.company_info
     retriever_data = getattr(state, cfg["retriever"])
@@ -170,23 +365,58 @@ def analysis_node(state: MergedState,
     human_prompt = HumanMessage(content=prompt)
     if history:
         history_data = _to_dict(getattr(state, STAGES[history]['analysis']))
-        messages = [system_prompt, AIMessage(content=json.dumps(history_data)), human_prompt]
-    else:
-        messages = [system_prompt, human_prompt]
+        return [system_prompt, AIMessage(content=json.dumps(history_data)), human_prompt]
+    return [system_prompt, human_prompt]
+
+
+def analysis_output(raw_response: str, type: Literal['past', 'future', 'risk', 'risk_response']) -> dict:
+    cfg = STAGES[type]
+    output = parse_json_with_fallback(raw_response)
+    if not output:
+        raise ValueError("Empty or unparseable JSON from LLM")
+    # Pydantic validation: rejects wrong types, out-of-range enums, etc.
+    validated = cfg["base_model"](**output)
+    return {cfg["analysis"]: validated.model_dump()}
+
+
+def analysis_node(state: MergedState,
+                  type: Literal['past', 'future', 'risk', 'risk_response'],
+                  history: Optional[Literal['past', 'future', 'risk', 'risk_response']] = None
+                  ) -> dict:
+    messages = analysis_messages(state, type, history)
 
     # Retry loop with Pydantic validation (enforces structured output)
-    model_cls = cfg["base_model"]
     last_error = None
     raw_response = None
     for attempt in range(MAX_LLM_RETRIES):
         try:
-            raw_response = run_llm(messages).content
-            output = parse_json_with_fallback(raw_response)
-            if not output:
-                raise ValueError("Empty or unparseable JSON from LLM")
-            # Pydantic validation: rejects wrong types, out-of-range enums, etc.
-            validated = model_cls(**output)
-            return {cfg["analysis"]: validated.model_dump()}
+            raw_response = run_llm(messages, route="earnings_transcripts.analysis",
+                                   validate=partial(analysis_output, type=type)).content
+            return analysis_output(raw_response, type)
+        except Exception as e:
+            last_error = e
+            if attempt < MAX_LLM_RETRIES - 1:
+                print(f"[analysis_node] '{type}' attempt {attempt + 1} failed: {e}. Retrying...")
+    raise RuntimeError(
+        f"Analysis node failed for type '{type}' after {MAX_LLM_RETRIES} attempts: {last_error}\n"
+        f"Raw response:\n{raw_response}"
+    )
+
+
+async def aanalysis_node(state: MergedState,
+                         type: Literal['past', 'future', 'risk', 'risk_response'],
+                         history: Optional[Literal['past', 'future', 'risk', 'risk_response']] = None
+                         ) -> dict:
+    """Async analysis_node (concurrent mode)."""
+    messages = analysis_messages(state, type, history)
+
+    last_error = None
+    raw_response = None
+    for attempt in range(MAX_LLM_RETRIES):
+        try:
+            raw_response = (await arun_llm(messages, route="earnings_transcripts.analysis",
+                                           validate=partial(analysis_output, type=type))).content
+            return analysis_output(raw_response, type)
         except Exception as e:
             last_error = e
             if attempt < MAX_LLM_RETRIES - 1:
@@ -201,15 +431,23 @@ past_analysis_node = partial(analysis_node, type='past')
 future_analysis_node = partial(analysis_node, type='future')
 risk_analysis_node = partial(analysis_node, type='risk')
 risk_response_analysis_node = partial(analysis_node, type='risk_response', history='risk')
+apast_analysis_node = partial(aanalysis_node, type='past')
+afuture_analysis_node = partial(aanalysis_node, type='future')
+arisk_analysis_node = partial(aanalysis_node, type='risk')
+arisk_response_analysis_node = partial(aanalysis_node, type='risk_response', history='risk')
 
 past_retriever_node = partial(retriever, type='past')
 future_retriever_node = partial(retriever, type='future')
 risk_retriever_node = partial(retriever, type='risk')
 risk_response_retriever_node = partial(retriever, type='risk_response')
+apast_retriever_node = partial(aretriever, type='past')
+afuture_retriever_node = partial(aretriever, type='future')
+arisk_retriever_node = partial(aretriever, type='risk')
+arisk_response_retriever_node = partial(aretriever, type='risk_response')
 
 
-def queries_powered_by_llm(state: MergedState,
-                           type: Literal['past', 'future', 'risk', 'risk_response']) -> dict:
+def queries_messages(state: MergedState,
+                     type: Literal['past', 'future', 'risk', 'risk_response']) -> list:
     cfg = STAGES[type]
     company_info = state.company_info
     prompt = cfg["query_gen_human_message"].format(
@@ -220,20 +458,39 @@ def queries_powered_by_llm(state: MergedState,
         calendar_year=company_info["calendar_year"],
         calendar_quarter=company_info["calendar_quarter"],
     )
-    messages = [
+    return [
         SystemMessage(content=cfg["query_gen_system_message"]),
         AIMessage(content=json.dumps(_to_dict(state.risk_analysis))),
         HumanMessage(content=prompt),
     ]
-    raw = run_llm(messages).content
+
+
+def queries_output(state: MergedState, raw: str,
+                   type: Literal['past', 'future', 'risk', 'risk_response']) -> dict:
     response = parse_json_with_fallback(raw)
     if not response or "queries" not in response:
         raise ValueError(f"Failed to parse queries from LLM response: {raw[:200]}")
-    return {cfg["retriever"]: {
+    return {STAGES[type]["retriever"]: {
         "top_k": state.risk_response_retriever["top_k"],
         "queries": response["queries"],
         "chunks": [],
         "chunks_score": [],
     }}
 
+
+def queries_powered_by_llm(state: MergedState,
+                           type: Literal['past', 'future', 'risk', 'risk_response']) -> dict:
+    raw = run_llm(queries_messages(state, type), route="earnings_transcripts.queries",
+                  validate=lambda content: queries_output(state, content, type)).content
+    return queries_output(state, raw, type)
+
+
+async def aqueries_powered_by_llm(state: MergedState,
+                                  type: Literal['past', 'future', 'risk', 'risk_response']) -> dict:
+    """Async queries_powered_by_llm (concurrent mode)."""
+    raw = (await arun_llm(queries_messages(state, type), route="earnings_transcripts.queries",
+                          validate=lambda content: queries_output(state, content, type))).content
+    return queries_output(state, raw, type)
+
 risk_response_queries_powered_by_llm = partial(queries_powered_by_llm, type='risk_response')
+arisk_response_queries_powered_by_llm = partial(aqueries_powered_by_llm, type='risk_response')
@@ -0,0 +1,97 @@
+"""Throughput of the news graph, sequential vs concurrent, against a fixed-latency fake LLM (no API or database needed)."""
+import sys
+import os
+import time
+import json
+import asyncio
+import tempfile
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from langchain_core.messages import AIMessage
+import etl.utils
+import etl.rate_limiter
+import etl.llm_cache
+from etl.utils import abatch_as_completed
+from states import News
+from graph import create_graph
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_NEWS = 200
+LATENCY = 0.2  # seconds per LLM request
+CONCURRENCY = [1, 4, 16, 32]  # above OPENAI_LLM_CONCURRENCY (32) the model semaphore caps requests in flight
+NOISE_EVERY = 4  # every 4th article stops after stage 1
+# ──────────────────────────────────────────────────────────────────
+
+STAGE1 = {"category": "fundamental", "event_type": "earnings"}
+NOISE = {"category": "noise", "event_type": "other"}
+STAGE2 = {"time_horizon": 1, "duration": 1, "magnitude": 1, "affected_dimensions": ["revenue"], "sentiment": 1}
+
+
+class FakeChat:
+    """Stands in for ChatOpenAI: answers after LATENCY seconds, routed on the prompt."""
+
+    def reply(self, messages) -> AIMessage:
+        prompt = messages[-1].content
+        if "- Event Type:" in prompt:
+            return AIMessage(content=json.dumps(STAGE2))
+        return AIMessage(content=json.dumps(NOISE if "noise-" in prompt else STAGE1))
+
+    def invoke(self, messages):
+        time.sleep(LATENCY)
+        return self.reply(messages)
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(LATENCY)
+        return self.reply(messages)
+
+
+def sample_news() -> list:
+    return [
+        News(tic="AAPL", company_name="Apple Inc.", industry="Technology", sector="Consumer Electronics",
+             company_description="Apple designs smartphones and personal computers.",
+             headline=f"{'noise-' if i % NOISE_EVERY == 0 else ''}Headline {i}", summary=f"Summary {i}",
+             url=f"https://example.com/{i}", publisher="Newswire", published_at="2025-01-02 12:00:00")
+        for i in range(N_NEWS)
+    ]
+
+
+async def run_concurrently(app, states: list, concurrency: int) -> list:
+    results = [None] * len(states)
+    async for i, final_state in abatch_as_completed(app, states, concurrency, desc=f"concurrency {concurrency}"):
+        results[i] = final_state
+    return results
+
+
+def summarize(results: list) -> list:
+    return [(r.get("category"), r.get("sentiment")) for r in results]
+
+
+if __name__ == "__main__":
+    # Keep the fake requests out of the real rate-limit budget, and unthrottled
+    etl.rate_limiter.STATE_FILE = os.path.join(tempfile.mkdtemp(), "rate_limits.json")
+    etl.rate_limiter.RATE_LIMITS[("openai", "chat")] = (10 ** 6, 10 ** 9)
+    etl.llm_cache.LLM_CACHE = False  # every run has to reach the fake model
+    fake = FakeChat()
+    etl.utils.llm_chatgpt = fake
+    etl.utils._async_chatgpt = lambda: fake
+    app = create_graph().compile()
+    states = sample_news()
+    llm_calls = N_NEWS + N_NEWS - len(range(0, N_NEWS, NOISE_EVERY))
+
+    start = time.perf_counter()
+    reference = [app.invoke(state) for state in states]
+    sequential = time.perf_counter() - start
+    print(f"Sequential invoke: {N_NEWS / sequential:.1f} news/s ({llm_calls} LLM calls at {LATENCY}s)")
+
+    failures = 0
+    for concurrency in CONCURRENCY:
+        start = time.perf_counter()
+        results = asyncio.run(run_concurrently(app, states, concurrency))
+        elapsed = time.perf_counter() - start
+        same = summarize(results) == summarize(reference)
+        failures += not same
+        print(f"Concurrency {concurrency:>3}: {N_NEWS / elapsed:.1f} news/s, "
+              f"speedup x{sequential / elapsed:.1f}{'' if same else ' ❌ results differ from sequential'}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,92 @@
+"""Batched vs single-item news triage on a sample of stored news: agreement, LLM calls and tokens per item (calls the LLM API)."""
+import sys
+import os
+import time
+from collections import Counter
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import etl.utils
+import etl.llm_cache
+import nodes
+from database.utils import connect_to_db
+from prompts import STAGE1_BATCH_SYSTEM_MESSAGE, STAGE2_BATCH_SYSTEM_MESSAGE
+from graph import create_graph, create_batch_graph
+from main import read_states, build_runs, to_records
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_SAMPLE = 200  # latest stored news items
+BATCH_SIZES = [5, 10]
+STAGE1_FIELDS = ['category', 'event_type']
+STAGE2_FIELDS = ['time_horizon', 'magnitude', 'sentiment', 'affected_dimensions']
+# ──────────────────────────────────────────────────────────────────
+
+
+class Meter:
+    """Counts the LLM requests and tokens behind nodes.run_llm, split into batched and single-item ones."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def run_llm(self, messages, *args, **kwargs):
+        response = etl.utils.run_llm(messages, *args, **kwargs)
+        batched = messages[0].content in (STAGE1_BATCH_SYSTEM_MESSAGE, STAGE2_BATCH_SYSTEM_MESSAGE)
+        self.calls["batched" if batched else "single"] += 1
+        usage = response.usage_metadata or {}
+        self.input_tokens += usage.get("input_tokens", 0)
+        self.output_tokens += usage.get("output_tokens", 0)
+        return response
+
+
+def run(states: list, batch_size: int) -> tuple:
+    """Records of every sampled item in one mode, and the meter of its requests."""
+    meter = Meter()
+    nodes.run_llm = meter.run_llm
+    app = (create_batch_graph() if batch_size > 1 else create_graph()).compile()
+    records = []
+    for graph_input, keys in build_runs(states, batch_size):
+        records.extend(to_records(app.invoke(graph_input), keys))
+    return records, meter
+
+
+def agreement(reference: list, records: list, fields: list) -> dict:
+    """Share of items whose field equals the single-item answer (over items both modes gave a value)."""
+    result = {}
+    for field in fields:
+        pairs = [(r[field], b[field]) for r, b in zip(reference, records)
+                 if r[field] is not None and b[field] is not None]
+        same = sum((set(x) == set(y)) if isinstance(x, list) else (x == y) for x, y in pairs)
+        result[field] = same / len(pairs) if pairs else float('nan')
+    return result
+
+
+if __name__ == "__main__":
+    etl.llm_cache.LLM_CACHE = False  # every mode has to reach the model
+    conn = connect_to_db()
+    if not conn:
+        sys.exit("Could not connect to database.")
+    states = read_states(conn, limit=N_SAMPLE, pending_only=False)
+    conn.close()
+    n = len(states)
+
+    results = {}
+    for batch_size in [1] + BATCH_SIZES:
+        start = time.perf_counter()
+        records, meter = run(states, batch_size)
+        results[batch_size] = (records, meter, time.perf_counter() - start)
+
+    reference = results[1][0]
+    print(f"{n} news items, {len({state[0].tic for state in states})} tickers")
+    for batch_size, (records, meter, elapsed) in results.items():
+        calls = sum(meter.calls.values())
+        line = (f"Batch size {batch_size:>3}: {calls / n:.2f} calls/item "
+                f"({meter.calls['single']} single-item), "
+                f"{meter.input_tokens / n:,.0f} prompt + {meter.output_tokens / n:,.0f} completion tokens/item, "
+                f"{elapsed:.0f}s")
+        if batch_size > 1:
+            match = agreement(reference, records, STAGE1_FIELDS + STAGE2_FIELDS)
+            line += "\n    agreement with single-item: " + ", ".join(f"{k} {v:.0%}" for k, v in match.items())
+        print(line)
@@ -0,0 +1,42 @@
+"""Offline evaluation of the news noise prefilter: precision on skipped items and share skipped per threshold (no LLM calls)."""
+import sys
+import os
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from database.utils import connect_to_db
+from prefilter import TRAINING_ROWS, NEWS_PREFILTER_THRESHOLD, read_training_data, train_prefilter, noise_probabilities
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+HOLDOUT = 0.2  # newest share of the labelled news, scored by a classifier fit on the older rest
+THRESHOLDS = [0.8, 0.9, 0.95, 0.98, 0.99]
+# ──────────────────────────────────────────────────────────────────
+
+
+if __name__ == "__main__":
+    conn = connect_to_db()
+    if not conn:
+        sys.exit("Could not connect to database.")
+    labelled = read_training_data(conn, limit=TRAINING_ROWS)
+    conn.close()
+
+    labelled = labelled.sort_values('published_at').reset_index(drop=True)
+    split = int(len(labelled) * (1 - HOLDOUT))
+    train, test = labelled.iloc[:split], labelled.iloc[split:]
+    classifier = train_prefilter(train)
+    if classifier is None or test.empty:
+        sys.exit(f"Not enough labelled news with embeddings to evaluate ({len(labelled)} rows).")
+
+    probabilities = noise_probabilities(classifier, test['embedding'])
+    is_noise = test['is_noise'].to_numpy(dtype=bool)
+    print(f"Train: {len(train)} items up to {train['published_at'].max()}, "
+          f"test: {len(test)} newer items ({is_noise.mean():.1%} noise per the LLM)")
+    print(f"{'threshold':>9}  {'skipped':>8}  {'precision':>9}  {'noise caught':>12}  {'non-noise lost':>14}")
+    for threshold in sorted(set(THRESHOLDS + [NEWS_PREFILTER_THRESHOLD])):
+        skipped = probabilities >= threshold
+        precision = is_noise[skipped].mean() if skipped.any() else float('nan')
+        caught = skipped[is_noise].mean() if is_noise.any() else float('nan')
+        print(f"{threshold:>9.2f}  {skipped.mean():>8.1%}  {precision:>9.1%}  {caught:>12.1%}  "
+              f"{int((skipped & ~is_noise).sum()):>14}"
+              f"{'  <- NEWS_PREFILTER_THRESHOLD' if threshold == NEWS_PREFILTER_THRESHOLD else ''}")
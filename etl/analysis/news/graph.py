@@ -1,7 +1,9 @@
 from langgraph.graph import START, END
 from langgraph.graph import StateGraph
-from nodes import stage1, stage2
-from states import News
+from nodes import stage1, stage2, astage1, astage2
+from nodes import stage1_batch, stage2_batch, astage1_batch, astage2_batch, survivors
+from etl.utils import llm_node
+from states import News, NewsBatch
 import time  # Import the time module for timing
 
 
@@ -14,7 +16,7 @@ def create_graph() -> StateGraph:
 
 
     # Add Stage 1 node
-    graph.add_node(STAGE1, stage1)
+    graph.add_node(STAGE1, llm_node(stage1, astage1))
     graph.add_edge(START, STAGE1)
 
     # Conditional edge based on Stage 1 output
@@ -26,7 +28,7 @@ def create_graph() -> StateGraph:
     graph.add_conditional_edges(STAGE1, is_noise)
 
     # Add Stage 2 node
-    graph.add_node(STAGE2, stage2)
+    graph.add_node(STAGE2, llm_node(stage2, astage2))
 
 
     # Final end node
@@ -34,6 +36,28 @@ def create_graph() -> StateGraph:
 
     return graph
 
+
+def create_batch_graph() -> StateGraph:
+    """Batched mode: the same two stages over a NewsBatch, one request per stage for all its items."""
+    graph = StateGraph(NewsBatch)
+    STAGE1 = "stage1"
+    STAGE2 = "stage2"
+
+    graph.add_node(STAGE1, llm_node(stage1_batch, astage1_batch))
+    graph.add_edge(START, STAGE1)
+
+    # Stage 2 runs unless every item of the batch is noise
+    def all_noise(state: NewsBatch) -> str:
+        if not survivors(state):
+            return END
+        return STAGE2
+
+    graph.add_conditional_edges(STAGE1, all_noise)
+    graph.add_node(STAGE2, llm_node(stage2_batch, astage2_batch))
+    graph.add_edge(STAGE2, END)
+
+    return graph
+
 if __name__ == "__main__":
     start_time = time.time()  # Record the start time
     graph = create_graph()
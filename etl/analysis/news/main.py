@@ -1,44 +1,85 @@
+import os
 import time
+import asyncio
 import pandas as pd
 from database.utils import connect_to_db, insert_records, read_sql_query
-from states import News
-from graph import create_graph
+from states import News, NewsBatch
+from graph import create_graph, create_batch_graph
 from tqdm import tqdm  # Import tqdm for progress tracking
+from etl.utils import LLM_CONCURRENCY, abatch_as_completed, hash_text
+from etl.checkpointing import get_checkpointer, thread_config, start_input, forget
+from prefilter import NEWS_PREFILTER, split_prefiltered
 
+# Completed analyses are written in batches of this many rows
+FLUSH_SIZE = 50
+# Batched mode: news items of one ticker per Stage 1 / Stage 2 request (1 = one item per request)
+NEWS_BATCH_SIZE = int(os.getenv("NEWS_BATCH_SIZE", "1"))
 
 
-def main():
-    """Main function to execute the news analysis pipeline."""
-    # Connect to the database
-    conn = connect_to_db()
-    if conn:
-        query = """
-                SELECT 
-                    n.event_id,
-                    n.tic,
-                    n.url,
-                    n.title,
-                    n.content,
-                    n.publisher,
-                    n.published_at,
-                    n.raw_json_sha256,
-                    sp.name,
-                    sp.industry,
-                    sp.sector,
-                    sp.short_summary
-                FROM core.news AS n
-                LEFT JOIN core.news_analysis AS a
-                    ON n.tic = a.tic 
-                    AND n.url = a.url
-                LEFT JOIN core.stock_profiles AS sp
-                    ON n.tic = sp.tic
-                WHERE a.raw_json_sha256 IS NULL 
-                OR n.raw_json_sha256 <> a.raw_json_sha256;
-        """
-        df = read_sql_query(query, conn)
+def to_record(final_state: dict, event_id, raw_json_sha256) -> dict:
+    """core.news_analysis row of a finished graph run."""
+    return {
+        "event_id": event_id,
+        "tic": final_state.get("tic"),
+        "url": final_state.get("url"),
+        "title": final_state.get("headline"),
+        "content": final_state.get("summary"),
+        "publisher": final_state.get("publisher"),
+        "published_at": final_state.get("published_at"),
+        "category": final_state.get("category"),
+        "event_type": final_state.get("event_type"),
+        "time_horizon": final_state.get("time_horizon"),
+        "duration": final_state.get("duration"),
+        "magnitude": final_state.get("magnitude"),
+        "affected_dimensions": final_state.get("affected_dimensions"),
+        "sentiment": final_state.get("sentiment"),
+        "raw_json_sha256": raw_json_sha256
+    }
+
+
+def to_records(final_state: dict, keys: list) -> list:
+    """core.news_analysis rows of a finished graph run: one per item of a batch run."""
+    if "items" not in final_state:
+        return [to_record(final_state, *keys[0])]
+    return [to_record(dict(item), *key) for item, key in zip(final_state["items"], keys)]
+
+
+def read_states(conn, limit: int = None, pending_only: bool = True) -> list:
+    """
+    (News, event_id, raw_json_sha256) of the news whose analysis is missing or
+    stale; with pending_only=False, of the latest news regardless. Near-duplicate
+    members of a core.news_clusters cluster are left out.
+    """
+    query = f"""
+            SELECT 
+                n.event_id,
+                n.tic,
+                n.url,
+                n.title,
+                n.content,
+                n.publisher,
+                n.published_at,
+                n.raw_json_sha256,
+                sp.name,
+                sp.industry,
+                sp.sector,
+                sp.short_summary
+            FROM core.news AS n
+            LEFT JOIN core.news_analysis AS a
+                ON n.tic = a.tic 
+                AND n.url = a.url
+            LEFT JOIN core.stock_profiles AS sp
+                ON n.tic = sp.tic
+            LEFT JOIN core.news_clusters AS c
+                ON n.event_id = c.event_id
+            WHERE c.is_canonical IS NOT FALSE  -- near-duplicates take their canonical's labels
+            {"AND (a.raw_json_sha256 IS NULL OR n.raw_json_sha256 <> a.raw_json_sha256)" if pending_only else ""}
+            {f"ORDER BY n.published_at DESC LIMIT {int(limit)}" if limit else ""};
+    """
+    df = read_sql_query(query, conn)
 
     # Construct states from the retrieved records
-    states = [
+    return [
         (News(
             tic=row['tic'],
             company_name=row['name'],
@@ -54,60 +95,193 @@ def main():
         for _, row in df.iterrows()
     ]
 
-    # Create and compile the graph
-    graph = create_graph()
-    app = graph.compile()
+
+def fan_out_cluster_labels(conn) -> int:
+    """
+    Copy the labels of each cluster's canonical analysis to the cluster's
+    near-duplicate members whose analysis is missing, stale or older than it.
+    """
+    query = """
+        INSERT INTO core.news_analysis (
+            event_id, tic, url, title, content, publisher, published_at,
+            category, event_type, time_horizon, duration, magnitude,
+            affected_dimensions, sentiment, raw_json_sha256, updated_at
+        )
+        SELECT
+            n.event_id, n.tic, n.url, n.title, n.content, n.publisher, n.published_at,
+            a.category, a.event_type, a.time_horizon, a.duration, a.magnitude,
+            a.affected_dimensions, a.sentiment, n.raw_json_sha256, NOW()
+        FROM core.news_clusters AS c
+        JOIN core.news AS n
+            ON n.event_id = c.event_id
+        JOIN core.news_analysis AS a
+            ON a.event_id = c.cluster_id
+        LEFT JOIN core.news_analysis AS m
+            ON m.tic = n.tic
+            AND m.url = n.url
+        WHERE NOT c.is_canonical
+            AND (m.raw_json_sha256 IS NULL
+                OR m.raw_json_sha256 <> n.raw_json_sha256
+                OR m.updated_at < a.updated_at)
+        ON CONFLICT (tic, url)
+        DO UPDATE SET
+            event_id = EXCLUDED.event_id,
+            title = EXCLUDED.title,
+            content = EXCLUDED.content,
+            publisher = EXCLUDED.publisher,
+            published_at = EXCLUDED.published_at,
+            category = EXCLUDED.category,
+            event_type = EXCLUDED.event_type,
+            time_horizon = EXCLUDED.time_horizon,
+            duration = EXCLUDED.duration,
+            magnitude = EXCLUDED.magnitude,
+            affected_dimensions = EXCLUDED.affected_dimensions,
+            sentiment = EXCLUDED.sentiment,
+            raw_json_sha256 = EXCLUDED.raw_json_sha256,
+            updated_at = NOW();
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            total_records = cursor.rowcount
+        conn.commit()
+        return total_records
+    except Exception as e:
+        conn.rollback()
+        print(f"Error fanning out cluster labels: {e}")
+        return 0
+
+
+def build_runs(states: list, batch_size: int = NEWS_BATCH_SIZE) -> list:
+    """
+    Graph inputs with the (event_id, raw_json_sha256) of their items: one News
+    per run, or with batch_size > 1, NewsBatch chunks of one ticker's items.
+    """
+    if batch_size <= 1:
+        return [(state[0], [state[1:]]) for state in states]
+    by_ticker = {}
+    for state in states:
+        by_ticker.setdefault(state[0].tic, []).append(state)
+    return [
+        (NewsBatch(items=[state[0] for state in chunk]), [state[1:] for state in chunk])
+        for ticker_states in by_ticker.values()
+        for chunk in (ticker_states[i:i + batch_size] for i in range(0, len(ticker_states), batch_size))
+    ]
+
+
+def run_thread_id(keys: list) -> str:
+    """Checkpoint thread of a run, from the (event_id, raw_json_sha256) of its items."""
+    if len(keys) == 1:
+        return f"news:{keys[0][0]}:{keys[0][1]}"
+    return "news-batch:" + hash_text(",".join(f"{event_id}:{sha}" for event_id, sha in keys))
+
+
+def flush(conn, processed_data: list, thread_ids: list) -> int:
+    """Write finished analyses to core.news_analysis and drop the checkpoints of their runs."""
+    if not processed_data:
+        return 0
+    total_records = insert_records(conn, pd.DataFrame(processed_data), "core.news_analysis", ["tic", "url"])
+    forget(thread_ids)
+    return total_records
+
+
+async def process_concurrently(app, runs: list, conn, concurrency: int) -> tuple:
+    """
+    Run the graph over `runs` with `concurrency` runs in flight, writing the
+    analyses as they complete. Returns (records written, major news count).
+    Writes run in a worker thread so the runs in flight keep going; this loop
+    is their only caller, so writes on `conn` stay sequential.
+    """
+    total_records = 0
+    no_major_news = 0
+    processed_data = []
+    finished_threads = []
+    thread_ids = [run_thread_id(run[1]) for run in runs]
+    async for i, final_state in abatch_as_completed(app, [run[0] for run in runs], concurrency,
+                                                    desc=f"Processing states (concurrency {concurrency})",
+                                                    thread_ids=thread_ids):
+        if isinstance(final_state, Exception):
+            print(f"Failed to process event IDs {[key[0] for key in runs[i][1]]} after multiple retries: {final_state}")
+            raise final_state
+        records = to_records(final_state, runs[i][1])
+        no_major_news += sum(record["magnitude"] == 1 for record in records)
+        processed_data.extend(records)
+        finished_threads.append(thread_ids[i])
+        if len(processed_data) >= FLUSH_SIZE:
+            total_records += await asyncio.to_thread(flush, conn, processed_data, finished_threads)
+            processed_data, finished_threads = [], []
+    total_records += await asyncio.to_thread(flush, conn, processed_data, finished_threads)
+    return total_records, no_major_news
+
+
+def main(concurrency: int = LLM_CONCURRENCY, batch_size: int = NEWS_BATCH_SIZE, prefilter: bool = NEWS_PREFILTER):
+    """Main function to execute the news analysis pipeline."""
+    # Connect to the database
+    conn = connect_to_db()
+    if conn:
+        states = read_states(conn)
+        if prefilter and states:
+            # High-confidence noise is labelled locally and never reaches the LLM
+            prefiltered, states = split_prefiltered(conn, states)
+            if prefiltered:
+                records = [to_record(dict(state[0]), *state[1:]) for state in prefiltered]
+                n_prefiltered = insert_records(conn, pd.DataFrame(records), "core.news_analysis", ["tic", "url"])
+                print(f"Inserted/Updated {n_prefiltered} prefiltered noise records.")
+    runs = build_runs(states, batch_size)
+
+    # Create and compile the graph; runs are checkpointed when enabled (see etl/checkpointing.py)
+    graph = create_batch_graph() if batch_size > 1 else create_graph()
+    app = graph.compile(checkpointer=get_checkpointer())
 
     # Start timing
     start_time = time.time()
 
+    if conn and concurrency > 1:
+        total_records, no_major_news = asyncio.run(process_concurrently(app, runs, conn, concurrency))
+        print(f"Fanned out cluster labels to {fan_out_cluster_labels(conn)} near-duplicate news items.")
+        conn.close()
+        end_time = time.time()
+        print(f"Inserted/Updated {total_records} records in {end_time - start_time:.2f} seconds.")
+        print(f"Total number of major news is {no_major_news}.")
+        return
+
     no_major_news = 0
+    total_records = 0
     processed_data = []
+    finished_threads = []
     retries = 3
 
     # Use tqdm to track progress
-    for state in tqdm(states, desc="Processing states"):
+    for run in tqdm(runs, desc="Processing states"):
+        thread_id = run_thread_id(run[1])
+        run_input = start_input(app, run[0], thread_id)
         while retries > 0:
             try:
-                final_state = app.invoke(state[0])
+                final_state = app.invoke(run_input, thread_config(thread_id))
                 retries = 3  # reset retries for next state
                 break
             except Exception as e:
                 retries -= 1
                 if retries == 0:
-                    print(f"Failed to process event ID {state[1]} after multiple retries: {e}")
+                    print(f"Failed to process event IDs {[key[0] for key in run[1]]} after multiple retries: {e}")
                     raise e
-                print(f"Error processing event ID {state[1]}: {e}. Retrying...")
-
-        if "magnitude" in final_state and final_state["magnitude"] == 1:
-            no_major_news += 1
-        final_state["event_id"] = state[1]  # Add the event ID to the final state
-        final_state["raw_json_sha256"] = state[2]  # Add the hash to the final state
-        out = {
-                    "event_id": final_state.get("event_id"),    
-                    "tic": final_state.get("tic"),
-                    "url": final_state.get("url"),
-                    "title": final_state.get("headline"),
-                    "content": final_state.get("summary"),
-                    "publisher": final_state.get("publisher"),
-                    "published_at": final_state.get("published_at"),
-                    "category": final_state.get("category"),
-                    "event_type": final_state.get("event_type"),
-                    "time_horizon": final_state.get("time_horizon"),
-                    "duration": final_state.get("duration"),
-                    "magnitude": final_state.get("magnitude"),
-                    "affected_dimensions": final_state.get("affected_dimensions"),
-                    "sentiment": final_state.get("sentiment"),
-                    "raw_json_sha256": final_state.get("raw_json_sha256")
-                }
-        processed_data.append(out)
-
-    df = pd.DataFrame(processed_data)
-
-    # Load processed data into core.news_analysis
-    total_records = 0
+                print(f"Error processing event IDs {[key[0] for key in run[1]]}: {e}. Retrying...")
+                # With checkpointing on, the retry continues the run from its last checkpoint
+                run_input = start_input(app, run[0], thread_id, resume=True)
+
+        records = to_records(final_state, run[1])
+        no_major_news += sum(record["magnitude"] == 1 for record in records)
+        processed_data.extend(records)
+        finished_threads.append(thread_id)
+
+        # Load processed data into core.news_analysis in small batches, so a crash loses at most one batch
+        if conn and len(processed_data) >= FLUSH_SIZE:
+            total_records += flush(conn, processed_data, finished_threads)
+            processed_data, finished_threads = [], []
+
     if conn:
-        total_records = insert_records(conn, df, "core.news_analysis", ["tic", "url"])
+        total_records += flush(conn, processed_data, finished_threads)
+        print(f"Fanned out cluster labels to {fan_out_cluster_labels(conn)} near-duplicate news items.")
         conn.close()
 
     # End timing
@@ -117,4 +291,4 @@ def main():
     
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,17 +1,16 @@
-from states import News
+from states import News, NewsBatch
 from prompts import STAGE1_PROMPT, STAGE2_PROMPT, STAGE1_SYSTEM_MESSAGE, STAGE2_SYSTEM_MESSAGE
+from prompts import (STAGE1_BATCH_SYSTEM_MESSAGE, STAGE1_BATCH_PROMPT, STAGE1_BATCH_ITEM,
+                     STAGE2_BATCH_SYSTEM_MESSAGE, STAGE2_BATCH_PROMPT, STAGE2_BATCH_ITEM)
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
-from etl.utils import run_llm, parse_json_from_llm
+from etl.utils import run_llm, arun_llm, parse_json_from_llm
+from pydantic import ValidationError
+import asyncio
 import json
 
 
 
-def stage1(state: News) -> dict:
-    """Run Stage 1 LLM classifier.
-    Description: This stage classifies the news into a category and event type based on the headline and summary.
-    Input: News (headline, summary, etc.)
-    Output: {"category": <str>, "event_type": <str>} 
-    """
+def stage1_messages(state: News) -> list:
     prompt = STAGE1_PROMPT.format(
         tic=state.tic,
         company_name=state.company_name,
@@ -25,9 +24,16 @@ def stage1(state: News) -> dict:
     )
     system_prompt = SystemMessage(content=STAGE1_SYSTEM_MESSAGE)
     human_prompt = HumanMessage(content=prompt)
-    messages = [system_prompt, human_prompt]
-    response = parse_json_from_llm(run_llm(messages).content)
-    
+    return [system_prompt, human_prompt]
+
+def state_validator(state: News, output):
+    """validate callback of run_llm: the answer's fields, as parsed by `output`, must make a valid News."""
+    return lambda content: state.model_validate({**dict(state), **output(content)})
+
+def stage1_output(content: str) -> dict:
+    return stage1_fields(parse_json_from_llm(content))
+
+def stage1_fields(response: dict) -> dict:
     category = response.get("category")
     event_type = response.get("event_type")
     return {
@@ -35,18 +41,21 @@ def stage1(state: News) -> dict:
         "event_type": event_type
     }
 
-def stage2(state: News) -> dict:
-    """Run Stage 2 LLM analysis using Stage 1 outputs.
-    Description: This stage analyzes the impact, duration, and sentiment of the news based on Stage 1 outputs.
-    Input: News + Stage 1 results
-    Output: {
-        "time_horizon": <str>,
-        "duration": <str>,
-        "magnitude": <str>,
-        "affected_dimensions": <list>,
-        "sentiment": <str>
-    }
+def stage1(state: News) -> dict:
+    """Run Stage 1 LLM classifier.
+    Description: This stage classifies the news into a category and event type based on the headline and summary.
+    Input: News (headline, summary, etc.)
+    Output: {"category": <str>, "event_type": <str>} 
     """
+    return stage1_output(run_llm(stage1_messages(state), route="news.stage1",
+                                 validate=state_validator(state, stage1_output)).content)
+
+async def astage1(state: News) -> dict:
+    """Async stage1 (concurrent mode)."""
+    return stage1_output((await arun_llm(stage1_messages(state), route="news.stage1",
+                                                validate=state_validator(state, stage1_output))).content)
+
+def stage2_messages(state: News) -> list:
     prompt = STAGE2_PROMPT.format(
         tic=state.tic,
         company_name=state.company_name,
@@ -63,9 +72,12 @@ def stage2(state: News) -> dict:
 
     system_prompt = SystemMessage(content=STAGE2_SYSTEM_MESSAGE)
     human_prompt = HumanMessage(content=prompt)
-    messages = [system_prompt, human_prompt]
-    response = parse_json_from_llm(run_llm(messages).content)
+    return [system_prompt, human_prompt]
+
+def stage2_output(content: str) -> dict:
+    return stage2_fields(parse_json_from_llm(content))
 
+def stage2_fields(response: dict) -> dict:
     time_horizon = response.get("time_horizon")
     duration = response.get("duration")
     magnitude = response.get("magnitude")
@@ -79,3 +91,126 @@ def stage2(state: News) -> dict:
         "sentiment": sentiment
     }
 
+def stage2(state: News) -> dict:
+    """Run Stage 2 LLM analysis using Stage 1 outputs.
+    Description: This stage analyzes the impact, duration, and sentiment of the news based on Stage 1 outputs.
+    Input: News + Stage 1 results
+    Output: {
+        "time_horizon": <str>,
+        "duration": <str>,
+        "magnitude": <str>,
+        "affected_dimensions": <list>,
+        "sentiment": <str>
+    }
+    """
+    return stage2_output(run_llm(stage2_messages(state), route="news.stage2",
+                                 validate=state_validator(state, stage2_output)).content)
+
+async def astage2(state: News) -> dict:
+    """Async stage2 (concurrent mode)."""
+    return stage2_output((await arun_llm(stage2_messages(state), route="news.stage2",
+                                                validate=state_validator(state, stage2_output))).content)
+
+
+# ─── Batched mode: several items of one ticker per request ────────
+
+def batch_item_id(i: int) -> str:
+    return f"n{i + 1}"
+
+def batch_messages(items: list, system_message: str, prompt: str, item_prompt: str) -> list:
+    """Company context once, then every item under its id."""
+    company = items[0]
+    news_items = "".join(
+        item_prompt.format(item_id=batch_item_id(i), **dict(item))
+        for i, item in enumerate(items)
+    )
+    prompt = prompt.format(
+        tic=company.tic,
+        company_name=company.company_name,
+        industry=company.industry,
+        sector=company.sector,
+        company_description=company.company_description,
+        items=news_items
+    )
+    return [SystemMessage(content=system_message), HumanMessage(content=prompt)]
+
+def batch_outputs(content: str, items: list, fields) -> dict:
+    """
+    Position -> output fields of the items a batched answer covers. Entries are
+    matched on their id; an item whose id is missing, or whose fields are
+    incomplete or invalid for News, is left out to be re-submitted alone.
+    """
+    response = parse_json_from_llm(content)
+    entries = response if isinstance(response, list) else [response]
+    by_id = {str(entry.get("id")): entry for entry in entries if isinstance(entry, dict)}
+    outputs = {}
+    for i, item in enumerate(items):
+        entry = by_id.get(batch_item_id(i))
+        if entry is None:
+            continue
+        output = fields(entry)
+        if any(value is None for value in output.values()):
+            continue
+        try:
+            item.model_validate({**dict(item), **output})
+        except ValidationError:
+            continue
+        outputs[i] = output
+    return outputs
+
+def stage1_batch_messages(items: list) -> list:
+    return batch_messages(items, STAGE1_BATCH_SYSTEM_MESSAGE, STAGE1_BATCH_PROMPT, STAGE1_BATCH_ITEM)
+
+def stage2_batch_messages(items: list) -> list:
+    return batch_messages(items, STAGE2_BATCH_SYSTEM_MESSAGE, STAGE2_BATCH_PROMPT, STAGE2_BATCH_ITEM)
+
+def survivors(state: NewsBatch) -> list:
+    """Positions of the items Stage 1 did not classify as noise."""
+    return [i for i, item in enumerate(state.items) if item.category != "noise"]
+
+def stage1_batch(state: NewsBatch) -> dict:
+    """Stage 1 over all items of the batch in one request; items missing from the answer run through stage1 alone."""
+    items = state.items
+    if len(items) == 1:
+        return {"items": [items[0].model_copy(update=stage1(items[0]))]}
+    outputs = batch_outputs(run_llm(stage1_batch_messages(items), route="news.stage1").content, items, stage1_fields)
+    return {"items": [item.model_copy(update=outputs[i] if i in outputs else stage1(item))
+                      for i, item in enumerate(items)]}
+
+async def astage1_batch(state: NewsBatch) -> dict:
+    """Async stage1_batch (concurrent mode)."""
+    items = state.items
+    if len(items) == 1:
+        return {"items": [items[0].model_copy(update=await astage1(items[0]))]}
+    outputs = batch_outputs((await arun_llm(stage1_batch_messages(items), route="news.stage1")).content, items, stage1_fields)
+    missing = [i for i in range(len(items)) if i not in outputs]
+    outputs.update(zip(missing, await asyncio.gather(*[astage1(items[i]) for i in missing])))
+    return {"items": [item.model_copy(update=outputs[i]) for i, item in enumerate(items)]}
+
+def stage2_batch(state: NewsBatch) -> dict:
+    """Stage 2 over the batch's Stage 1 survivors in one request, re-submitting missing ones alone."""
+    items = list(state.items)
+    positions = survivors(state)
+    batch = [items[i] for i in positions]
+    if len(batch) == 1:
+        outputs = {0: stage2(batch[0])}
+    else:
+        outputs = batch_outputs(run_llm(stage2_batch_messages(batch), route="news.stage2").content, batch, stage2_fields)
+    for j, i in enumerate(positions):
+        items[i] = items[i].model_copy(update=outputs[j] if j in outputs else stage2(items[i]))
+    return {"items": items}
+
+async def astage2_batch(state: NewsBatch) -> dict:
+    """Async stage2_batch (concurrent mode)."""
+    items = list(state.items)
+    positions = survivors(state)
+    batch = [items[i] for i in positions]
+    if len(batch) == 1:
+        outputs = {0: await astage2(batch[0])}
+    else:
+        outputs = batch_outputs((await arun_llm(stage2_batch_messages(batch), route="news.stage2")).content, batch, stage2_fields)
+    missing = [j for j in range(len(batch)) if j not in outputs]
+    outputs.update(zip(missing, await asyncio.gather(*[astage2(batch[j]) for j in missing])))
+    for j, i in enumerate(positions):
+        items[i] = items[i].model_copy(update=outputs[j])
+    return {"items": items}
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from database.utils import read_sql_query
+from etl.embeddings import DEFAULT_EMBEDDING_MODEL
+
+# Optional triage ahead of Stage 1: a logistic regression over the stored
+# core.news_embeddings vectors (mean of an article's chunks) estimates the
+# probability that a news item is noise. It is retrained on every run from the
+# LLM labels in core.news_analysis. Items at or above NEWS_PREFILTER_THRESHOLD
+# are labelled noise without an LLM call; items below it, or without an
+# embedding yet, go to the graph as before.
+# Pre-filtered rows are stored with event_type 'prefiltered' and left out of
+# training, so the classifier only ever learns from LLM labels.
+# _evaluate_prefilter.py reports the precision on skipped items and the share
+# skipped per threshold.
+
+NEWS_PREFILTER = os.getenv("NEWS_PREFILTER", "0") == "1"
+NEWS_PREFILTER_THRESHOLD = float(os.getenv("NEWS_PREFILTER_THRESHOLD", "0.95"))
+PREFILTER_EVENT_TYPE = "prefiltered"
+TRAINING_ROWS = 50000  # latest LLM-labelled items the classifier is fit on
+MIN_TRAINING_ROWS = 500  # fewer labels than this (or a single class) leaves the prefilter off
+
+
+def _stack(vectors) -> np.ndarray:
+    return np.array([np.asarray(v, dtype=float) for v in vectors])
+
+
+def read_training_data(conn, limit: int = TRAINING_ROWS, model: str = DEFAULT_EMBEDDING_MODEL) -> pd.DataFrame:
+    """Latest LLM-labelled news: published_at, is_noise and the mean embedding of the item's chunks."""
+    query = """
+        SELECT a.published_at, a.category = 'noise' AS is_noise, AVG(e.embedding)::real[] AS embedding
+        FROM core.news_analysis AS a
+        JOIN core.news_embeddings AS e
+            ON e.tic = a.tic
+            AND e.url = a.url
+        WHERE a.category IS NOT NULL
+            AND a.event_type IS DISTINCT FROM %s
+            AND e.embedding_model = %s
+        GROUP BY a.tic, a.url, a.published_at, a.category
+        ORDER BY a.published_at DESC
+        LIMIT %s;
+    """
+    return read_sql_query(query, conn, (PREFILTER_EVENT_TYPE, model, limit))
+
+
+def train_prefilter(training: pd.DataFrame) -> LogisticRegression:
+    """Noise classifier fit on read_training_data rows; None when there is too little to learn from."""
+    if len(training) < MIN_TRAINING_ROWS or training['is_noise'].nunique() < 2:
+        return None
+    classifier = LogisticRegression(max_iter=1000)
+    classifier.fit(_stack(training['embedding']), training['is_noise'].astype(bool))
+    return classifier
+
+
+def read_news_vectors(conn, keys: list, model: str = DEFAULT_EMBEDDING_MODEL) -> dict:
+    """(tic, url) -> mean chunk embedding, for the keys that have been embedded."""
+    if not keys:
+        return {}
+    query = """
+        SELECT e.tic, e.url, AVG(e.embedding)::real[] AS embedding
+        FROM core.news_embeddings AS e
+        JOIN unnest(%s::text[], %s::text[]) AS k(tic, url)
+            ON e.tic = k.tic
+            AND e.url = k.url
+        WHERE e.embedding_model = %s
+        GROUP BY e.tic, e.url;
+    """
+    tics, urls = zip(*keys)
+    df = read_sql_query(query, conn, (list(tics), list(urls), model))
+    return {(row['tic'], row['url']): row['embedding'] for _, row in df.iterrows()}
+
+
+def noise_probabilities(classifier: LogisticRegression, vectors: list) -> np.ndarray:
+    noise = list(classifier.classes_).index(True)
+    return classifier.predict_proba(_stack(vectors))[:, noise]
+
+
+def split_prefiltered(conn, states: list, threshold: float = NEWS_PREFILTER_THRESHOLD) -> tuple:
+    """
+    Split (News, event_id, raw_json_sha256) states into (prefiltered, remaining):
+    prefiltered states come back with their News labelled noise.
+    """
+    classifier = train_prefilter(read_training_data(conn))
+    if classifier is None:
+        print("News prefilter skipped: not enough labelled news with embeddings to train on.")
+        return [], states
+    keys = [(state[0].tic, state[0].url) for state in states]
+    vectors = read_news_vectors(conn, keys)
+    embedded = [i for i, key in enumerate(keys) if key in vectors]
+    noise = set()
+    if embedded:
+        probabilities = noise_probabilities(classifier, [vectors[keys[i]] for i in embedded])
+        noise = {i for i, p in zip(embedded, probabilities) if p >= threshold}
+
+    prefiltered = [
+        (state[0].model_copy(update={"category": "noise", "event_type": PREFILTER_EVENT_TYPE}), *state[1:])
+        for i, state in enumerate(states) if i in noise
+    ]
+    remaining = [state for i, state in enumerate(states) if i not in noise]
+    print(f"News prefilter: {len(prefiltered)} of {len(states)} items labelled noise "
+          f"without an LLM call (threshold {threshold}).")
+    return prefiltered, remaining
@@ -1,8 +1,5 @@
-# System Message for Stage 1 - News Category & Event Type Classifier
-STAGE1_SYSTEM_MESSAGE = """
-You are a financial news classification agent. 
-Given a company’s profile and a news item (headline + summary), classify the story into a factual **category** and **event_type**.
-
+# Decision rules of Stage 1, shared by the single-item and batched system messages
+STAGE1_RULES = """
 Decision Rules (apply in order):
 
 1. **fundamental** → introduces verifiable *new* business facts or official disclosures  
@@ -26,7 +23,13 @@ Categories and Example Event Types:
 - market_perception: ["analyst_action","media_narrative","investor_letter","forecast_opinion","social_sentiment"]
 - technical: ["price_movement","volume_spike","options_activity","etf_flow","market_structure"]
 - noise: ["duplicate","clickbait","irrelevant"]
+"""
 
+# System Message for Stage 1 - News Category & Event Type Classifier
+STAGE1_SYSTEM_MESSAGE = """
+You are a financial news classification agent. 
+Given a company’s profile and a news item (headline + summary), classify the story into a factual **category** and **event_type**.
+""" + STAGE1_RULES + """
 Return strict JSON only in this exact structure (no extra text or commentary):
 {
   "category": "one of ['fundamental','market_perception','technical','noise']",
@@ -48,27 +51,15 @@ Classify the following news for ticker {tic}:
 - Published At: {published_at}
 """
 
-# System Message for Stage 2 - News Impact, Duration & Sentiment Classifier
-STAGE2_SYSTEM_MESSAGE = """
-You are a financial news impact analysis agent. 
-Given the company's profile, headline, summary, and Stage-1 labels (category, event_type), assess the news impact on company fundamentals or market perception.
-
+# Encodings and rules of Stage 2, shared by the single-item and batched system messages
+STAGE2_ENCODINGS = """
 Encodings:
 - time_horizon: 0 = short_term (≤1 week) | 1 = mid_term (≤3 months) | 2 = long_term (>3 months)
 - magnitude: -1 = minor | 0 = moderate | 1 = major
 - sentiment: -1 = negative | 0 = neutral | 1 = positive
+"""
 
-Return strict JSON only in this exact structure (no extra text or commentary):
-{
-  "time_horizon": <integer>,        # 0 = short_term (≤1 week), 1 = mid_term (≤3 months), 2 = long_term (>3 months)
-  "duration": "<string>",            # specific duration text, e.g. "1 week", "3 months", "1 year"
-  "magnitude": <integer>,            # -1 = minor, 0 = moderate, 1 = major
-  "affected_dimensions": [           # JSON array of lowercase strings; 1–3 directly impacted items
-      "revenue", "profit", "cash", "cost", "risk", "technology", "sentiment"
-  ],
-  "sentiment": <integer>             # -1 = negative, 0 = neutral, 1 = positive
-}
-
+STAGE2_RULES = """
 Rules:
 1. **Factual strength** — verified company events (earnings, M&A, regulation, production, guidance, lawsuits) = strong;  
    analyst opinions or forecasts = moderate; commentary = weak.  
@@ -108,6 +99,23 @@ Rules:
    Forecast-only or speculative opinion pieces default to **magnitude = -1** unless verifiable evidence exists.
 """
 
+# System Message for Stage 2 - News Impact, Duration & Sentiment Classifier
+STAGE2_SYSTEM_MESSAGE = """
+You are a financial news impact analysis agent. 
+Given the company's profile, headline, summary, and Stage-1 labels (category, event_type), assess the news impact on company fundamentals or market perception.
+""" + STAGE2_ENCODINGS + """
+Return strict JSON only in this exact structure (no extra text or commentary):
+{
+  "time_horizon": <integer>,        # 0 = short_term (≤1 week), 1 = mid_term (≤3 months), 2 = long_term (>3 months)
+  "duration": "<string>",            # specific duration text, e.g. "1 week", "3 months", "1 year"
+  "magnitude": <integer>,            # -1 = minor, 0 = moderate, 1 = major
+  "affected_dimensions": [           # JSON array of lowercase strings; 1–3 directly impacted items
+      "revenue", "profit", "cash", "cost", "risk", "technology", "sentiment"
+  ],
+  "sentiment": <integer>             # -1 = negative, 0 = neutral, 1 = positive
+}
+""" + STAGE2_RULES
+
 
 # Prompt for Stage 2 - News Impact, Duration & Sentiment Classifier
 STAGE2_PROMPT = """
@@ -128,3 +136,83 @@ Analyze the following news for ticker {tic}:
 
 
 
+
+
+# System Message for batched Stage 1 - several news items of one company per request
+STAGE1_BATCH_SYSTEM_MESSAGE = """
+You are a financial news classification agent. 
+Given a company’s profile and a list of news items (headline + summary), each tagged with an id, classify every story independently into a factual **category** and **event_type**.
+""" + STAGE1_RULES + """
+Return a strict JSON array only (no extra text or commentary), with exactly one object per news item, in any order:
+[
+  {
+    "id": "the item's id, copied exactly",
+    "category": "one of ['fundamental','market_perception','technical','noise']",
+    "event_type": "one valid option for that category"
+  }
+]
+"""
+
+
+# Prompt for batched Stage 1: company context once, then the items
+STAGE1_BATCH_PROMPT = """
+Classify each of the following news items for ticker {tic}:
+- Company Name: {company_name}
+- Industry: {industry}
+- Sector: {sector}
+- Description: {company_description}
+
+News items:
+{items}
+"""
+
+STAGE1_BATCH_ITEM = """
+[id: {item_id}]
+- Headline: {headline}
+- Summary: {summary}
+- Publisher: {publisher}
+- Published At: {published_at}
+"""
+
+# System Message for batched Stage 2 - the Stage 1 survivors of one company per request
+STAGE2_BATCH_SYSTEM_MESSAGE = """
+You are a financial news impact analysis agent. 
+Given the company's profile and a list of news items, each tagged with an id and carrying its headline, summary and Stage-1 labels (category, event_type), assess every item's impact on company fundamentals or market perception independently.
+""" + STAGE2_ENCODINGS + """
+Return a strict JSON array only (no extra text or commentary), with exactly one object per news item, in any order:
+[
+  {
+    "id": "<the item's id, copied exactly>",
+    "time_horizon": <integer>,        # 0 = short_term (≤1 week), 1 = mid_term (≤3 months), 2 = long_term (>3 months)
+    "duration": "<string>",            # specific duration text, e.g. "1 week", "3 months", "1 year"
+    "magnitude": <integer>,            # -1 = minor, 0 = moderate, 1 = major
+    "affected_dimensions": [           # JSON array of lowercase strings; 1–3 directly impacted items
+        "revenue", "profit", "cash", "cost", "risk", "technology", "sentiment"
+    ],
+    "sentiment": <integer>             # -1 = negative, 0 = neutral, 1 = positive
+  }
+]
+""" + STAGE2_RULES
+
+
+# Prompt for batched Stage 2: company context once, then the items
+STAGE2_BATCH_PROMPT = """
+Analyze each of the following news items for ticker {tic}:
+- Company Name: {company_name}
+- Industry: {industry}
+- Sector: {sector}
+- Description: {company_description}
+
+News items:
+{items}
+"""
+
+STAGE2_BATCH_ITEM = """
+[id: {item_id}]
+- Headline: {headline}
+- Summary: {summary}
+- Publisher: {publisher}
+- Published At: {published_at}
+- Category: {category}
+- Event Type: {event_type}
+"""
@@ -43,4 +43,8 @@ class News(BaseModel):
     duration: Optional[str] = Field(None, description="Duration of the news impact")
     magnitude: Optional[Tri] = Field(None, description="Impact magnitude of the news")
     affected_dimensions: Optional[List[AffectedDimensions]] = Field(None, description="Affected dimensions of the news")
-    sentiment: Optional[Tri] = Field(None, description="Sentiment of the news")
\ No newline at end of file
+    sentiment: Optional[Tri] = Field(None, description="Sentiment of the news")
+
+class NewsBatch(BaseModel):
+    # Batched mode: news items of one ticker, classified and analyzed together
+    items: List[News] = Field(..., description="News items of one ticker")
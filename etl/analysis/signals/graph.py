@@ -1,6 +1,7 @@
 from langgraph.graph import StateGraph, START, END
 from states import Signal
-from nodes import is_signal_node
+from nodes import is_signal_node, ais_signal_node
+from etl.utils import llm_node
 import json
 
 
@@ -10,7 +11,7 @@ def create_graph() -> StateGraph:
     The graph has a single node: summarize_company_profile.
     """
     graph = StateGraph(Signal)
-    graph.add_node("is_signal_node", is_signal_node)
+    graph.add_node("is_signal_node", llm_node(is_signal_node, ais_signal_node))
     graph.add_edge(START, "is_signal_node")
     graph.add_edge("is_signal_node", END)
     return graph
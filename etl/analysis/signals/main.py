@@ -5,6 +5,9 @@ from states import Signal
 from graph import create_graph
 from tqdm import tqdm
 from typing import Literal
+import asyncio
+from etl.utils import LLM_CONCURRENCY, abatch_as_completed
+from etl.checkpointing import RESUME, get_checkpointer, thread_config, start_input, forget
 
 
 QUERY = {
@@ -16,6 +19,10 @@ QUERY = {
             FROM core.news_chunks AS n
             JOIN core.stock_profiles AS sp
                 ON n.tic = sp.tic
+            LEFT JOIN core.news_chunk_signal AS s
+                ON n.event_id = s.event_id
+                AND n.chunk_id = s.chunk_id
+            {where}
             ORDER BY n.published_at DESC;
         """,
     "earnings_transcript": 
@@ -27,10 +34,20 @@ QUERY = {
             FROM core.earnings_transcript_chunks AS e
             JOIN core.stock_profiles AS sp
                 ON e.tic = sp.tic
+            LEFT JOIN core.earnings_transcript_chunk_signal AS s
+                ON e.event_id = s.event_id
+                AND e.chunk_id = s.chunk_id
+            {where}
             ORDER BY e.calendar_year DESC, e.calendar_quarter DESC;
         """
 }
 
+# Resumed runs only classify chunks without a signal for their current content
+PENDING = {
+    "news": "WHERE s.chunk_sha256 IS DISTINCT FROM n.chunk_sha256",
+    "earnings_transcript": "WHERE s.chunk_sha256 IS DISTINCT FROM e.chunk_sha256",
+}
+
 COLUMNS = {
     "news": [
         "tic", "event_id", "chunk_id", "chunk_sha256", "raw_json_sha256",
@@ -43,12 +60,57 @@ COLUMNS = {
 }
 
 
-def main(type: Literal["news", "earnings_transcript"] = "news"):
-    """Main function to execute the content signal classification pipeline."""
+# Completed signals are written in batches of this many rows
+FLUSH_SIZE = 100
+
+
+def run_thread_id(type: str, record: dict) -> str:
+    """Checkpoint thread of one chunk's run."""
+    return f"{type}_signal:{record['event_id']}:{record['chunk_id']}:{record['chunk_sha256']}"
+
+
+def flush(conn, processed_data: list, type: str) -> int:
+    """Write finished signals and drop the checkpoints of their runs."""
+    if not processed_data:
+        return 0
+    total_records = insert_records(conn, pd.DataFrame(processed_data)[COLUMNS[type]],
+                                   f'core.{type}_chunk_signal', ['event_id', 'chunk_id'])
+    forget([run_thread_id(type, record) for record in processed_data])
+    return total_records
+
+
+async def process_concurrently(app, states: list, conn, type: str, concurrency: int) -> int:
+    """
+    Run the graph over `states` with `concurrency` runs in flight, writing signals
+    as they complete. Writes run in a worker thread so the runs in flight keep
+    going; this loop is their only caller, so writes on `conn` stay sequential.
+    """
+    total_records = 0
+    processed_data = []
+    async for i, final_state in abatch_as_completed(app, [state[0] for state in states], concurrency,
+                                                    desc=f"Processing {type} signals (concurrency {concurrency})",
+                                                    thread_ids=[run_thread_id(type, state[1]) for state in states]):
+        if isinstance(final_state, Exception):
+            print(f"Failed to process {states[i][1]['event_id']} after multiple retries: {final_state}")
+            raise final_state
+        processed_data.append({**states[i][1], 'is_signal': final_state['is_signal'], 'reason': final_state['reason']})
+        if len(processed_data) >= FLUSH_SIZE:
+            total_records += await asyncio.to_thread(flush, conn, processed_data, type)
+            processed_data = []
+    total_records += await asyncio.to_thread(flush, conn, processed_data, type)
+    return total_records
+
+
+def main(type: Literal["news", "earnings_transcript"] = "news", concurrency: int = LLM_CONCURRENCY,
+         resume: bool = RESUME):
+    """
+    Main function to execute the content signal classification pipeline.
+    With resume, chunks already classified for their current content are skipped.
+    """
     # Connect to the database
     conn = connect_to_db()
     if conn:
-        query = QUERY[type]
+        query = QUERY[type].format(where=PENDING[type] if resume else "")
         df = read_sql_query(query, conn)
         
     else:
@@ -81,20 +143,31 @@ def main(type: Literal["news", "earnings_transcript"] = "news"):
         }
         states.append((state, df))
 
-    # Create and compile the graph
+    # Create and compile the graph; runs are checkpointed when enabled (see etl/checkpointing.py)
     graph = create_graph()
-    app = graph.compile()
+    app = graph.compile(checkpointer=get_checkpointer())
 
     # Start timing
     start_time = time.time()
+    if concurrency > 1:
+        total_records = asyncio.run(process_concurrently(app, states, conn, type, concurrency))
+        conn.close()
+        end_time = time.time()
+        print(f"Processed {len(states)} records in {end_time - start_time:.2f} seconds.")
+        print(f"Total number of records is {total_records}.")
+        return
+
     processed_data = []
+    total_records = 0
     retries = 3
 
     # Use tqdm to track progress
     for state in tqdm(states, desc=f"Processing {type} signals"):
+        thread_id = run_thread_id(type, state[1])
+        run_input = start_input(app, state[0], thread_id)
         while retries > 0:
             try:
-                final_state = app.invoke(state[0])
+                final_state = app.invoke(run_input, thread_config(thread_id))
                 retries = 3  # reset retries for next state
                 break
             except Exception as e:
@@ -103,16 +176,18 @@ def main(type: Literal["news", "earnings_transcript"] = "news"):
                     print(f"Failed to process {state[1]['event_id']} after multiple retries: {e}")
                     raise e
                 print(f"Error processing {state[1]['event_id']}: {e}. Retrying...")
+                # With checkpointing on, the retry continues the run from its last checkpoint
+                run_input = start_input(app, state[0], thread_id, resume=True)
         df = state[1]
         df['is_signal'] = final_state['is_signal']
         df['reason'] = final_state['reason']
         processed_data.append(df)
-    # Load processed data into core.stock_metadata
-    total_records = 0
+        # Load processed data into core.{type}_chunk_signal in small batches, so a crash loses at most one batch
+        if conn and len(processed_data) >= FLUSH_SIZE:
+            total_records += flush(conn, processed_data, type)
+            processed_data = []
     if conn:
-        processed_data = pd.DataFrame(processed_data)
-        processed_data = processed_data[COLUMNS[type]]
-        total_records = insert_records(conn, processed_data, f'core.{type}_chunk_signal', ['event_id', 'chunk_id'])
+        total_records += flush(conn, processed_data, type)
         
 
         conn.close()
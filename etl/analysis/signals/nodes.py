@@ -1,14 +1,10 @@
 from states import Signal
 from prompts import SYSTEM_PROMPT, HUMAN_PROMPT
-from etl.utils import run_llm, parse_json_from_llm  # Adjust import if needed
+from etl.utils import run_llm, arun_llm, parse_json_from_llm  # Adjust import if needed
 import json
 
 
-def is_signal_node(state: Signal) -> dict:
-    """
-    Calls LLM to generate both summary and short_summary for a company profile.
-    Fills the output fields in the state and returns it.
-    """
+def is_signal_messages(state: Signal) -> list:
     # Prepare the prompt
     system_prompt = SYSTEM_PROMPT.format(
         company_info=state.company_info
@@ -17,13 +13,14 @@ def is_signal_node(state: Signal) -> dict:
         company_info=state.company_info,
         content=state.content
     )
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": human_prompt}
     ]
-    # Call the LLM (assume run_llm returns an object with .content)
-    response = run_llm(messages)
-    result = parse_json_from_llm(response.content)
+
+
+def is_signal_output(content: str) -> dict:
+    result = parse_json_from_llm(content)
     # print(result)
     # Extract values, defaulting to 'No Signal' if parsing is ambiguous
     is_signal_raw = result.get("is_signal", 0)
@@ -35,4 +32,25 @@ def is_signal_node(state: Signal) -> dict:
     return {
         "is_signal": is_signal_raw, 
         "reason": reason
-    }
\ No newline at end of file
+    }
+
+
+def validate_signal(state: Signal):
+    """validate callback of run_llm: the parsed answer must make a valid Signal."""
+    return lambda content: Signal.model_validate({**dict(state), **is_signal_output(content)})
+
+
+def is_signal_node(state: Signal) -> dict:
+    """
+    Calls LLM to generate both summary and short_summary for a company profile.
+    Fills the output fields in the state and returns it.
+    """
+    # Call the LLM (assume run_llm returns an object with .content)
+    return is_signal_output(run_llm(is_signal_messages(state), route="signals.is_signal",
+                                    validate=validate_signal(state)).content)
+
+
+async def ais_signal_node(state: Signal) -> dict:
+    """Async is_signal_node (concurrent mode)."""
+    return is_signal_output((await arun_llm(is_signal_messages(state), route="signals.is_signal",
+                                                   validate=validate_signal(state))).content)
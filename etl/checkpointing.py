@@ -0,0 +1,103 @@
+import os
+import sys
+import sqlite3
+import asyncio
+from typing import Optional
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# Durable LangGraph checkpoints for the analysis drivers, opt-in with
+# ANALYSIS_CHECKPOINTS=1. Each graph run is then a thread keyed by its item
+# (e.g. "news:<event_id>:<raw_json_sha256>", "catalysts:<tic>:<year>-<month>")
+# and is checkpointed after every step into one SQLite file shared by the
+# drivers on the host (ANALYSIS_CHECKPOINT_FILE, by default under logs/).
+# With ANALYSIS_RESUME=1, or --resume on a driver's command line (both imply
+# checkpointing), a run that a crash interrupted continues from its last
+# completed node, and a run that finished before its result was written replays
+# its final state without calling any node. Otherwise every run starts over.
+# Items whose results were written are skipped by the drivers' pending-work
+# queries, and their threads are deleted once written.
+# With checkpointing off, get_checkpointer() returns None, so the graphs compile
+# without a checkpointer and the helpers below do nothing.
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHECKPOINT_FILE = os.getenv("ANALYSIS_CHECKPOINT_FILE",
+                            os.path.join(PROJECT_ROOT, "logs", "analysis_checkpoints.sqlite"))
+RESUME = os.getenv("ANALYSIS_RESUME", "0") == "1" or "--resume" in sys.argv
+CHECKPOINTS = RESUME or os.getenv("ANALYSIS_CHECKPOINTS", "0") == "1"
+
+
+class Checkpointer(SqliteSaver):
+    """
+    SqliteSaver whose async methods run the sync ones in a worker thread, so
+    one compiled graph checkpoints under both invoke and ainvoke.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = ""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    def delete_threads(self, thread_ids: list):
+        """Drop every checkpoint and pending write of `thread_ids`."""
+        rows = [(str(thread_id),) for thread_id in thread_ids]
+        with self.cursor() as cur:
+            cur.executemany("DELETE FROM checkpoints WHERE thread_id = ?", rows)
+            cur.executemany("DELETE FROM writes WHERE thread_id = ?", rows)
+
+
+_checkpointer: Optional[Checkpointer] = None
+
+
+def get_checkpointer() -> Optional[Checkpointer]:
+    """The process-wide checkpointer on CHECKPOINT_FILE; None when checkpointing is off."""
+    global _checkpointer
+    if not CHECKPOINTS:
+        return None
+    if _checkpointer is None:
+        os.makedirs(os.path.dirname(os.path.abspath(CHECKPOINT_FILE)), exist_ok=True)
+        _checkpointer = Checkpointer(sqlite3.connect(CHECKPOINT_FILE, check_same_thread=False))
+    return _checkpointer
+
+
+def thread_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": str(thread_id)}}
+
+
+def start_input(app, graph_input, thread_id: str, resume: bool = RESUME):
+    """
+    Input of an item's run: None, which continues the thread from its last
+    checkpoint, when resuming a thread that has one; otherwise `graph_input`,
+    after dropping any stale checkpoints of the thread (new input would be
+    merged into their state). An app compiled without a checkpointer always
+    gets `graph_input`.
+    """
+    if app.checkpointer is None:
+        return graph_input
+    if resume and app.get_state(thread_config(thread_id)).values:
+        return None
+    get_checkpointer().delete_threads([thread_id])
+    return graph_input
+
+
+async def astart_input(app, graph_input, thread_id: str, resume: bool = RESUME):
+    """Async start_input."""
+    if app.checkpointer is None:
+        return graph_input
+    if resume and (await app.aget_state(thread_config(thread_id))).values:
+        return None
+    await asyncio.to_thread(get_checkpointer().delete_threads, [thread_id])
+    return graph_input
+
+
+def forget(thread_ids: list):
+    """Delete the checkpoints of runs whose results have been written."""
+    if thread_ids and CHECKPOINTS:
+        get_checkpointer().delete_threads(thread_ids)
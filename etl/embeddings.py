@@ -0,0 +1,198 @@
+from langchain_openai import OpenAIEmbeddings
+from database.utils import connect_to_db, get_async_pool
+from etl.utils import hash_text
+from etl.rate_limiter import get_rate_limiter, estimate_tokens
+from typing import Optional
+import json
+import asyncio
+import os
+import database.config
+
+DEFAULT_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+# One client per model name, shared by every embedder in the process
+_embedding_clients = {}
+
+# In-process copy of ref.query_embedding_cache: {(model, text): [float, ...]}
+_query_embedding_cache = {}
+
+
+def get_embedding_client(model: Optional[str] = None) -> OpenAIEmbeddings:
+    """Return a shared OpenAIEmbeddings client for the given model."""
+    model = model or DEFAULT_EMBEDDING_MODEL
+    if model not in _embedding_clients:
+        _embedding_clients[model] = OpenAIEmbeddings(model=model, timeout=30, max_retries=2)
+    return _embedding_clients[model]
+
+
+def embed_documents(texts: list[str], model: Optional[str] = None) -> list[list[float]]:
+    """Embed `texts` in one API call, paced by the shared rate limiter of the embedding model."""
+    model = model or DEFAULT_EMBEDDING_MODEL
+    limiter = get_rate_limiter("openai", model, kind="embedding")
+    limiter.acquire(estimate_tokens(texts))
+    try:
+        return get_embedding_client(model).embed_documents(texts)
+    except Exception as e:
+        limiter.record_error(e)
+        raise
+
+
+async def aembed_documents(texts: list[str], model: Optional[str] = None) -> list[list[float]]:
+    """Async embed_documents: other tasks of the loop run while this one waits for its turn or the API."""
+    model = model or DEFAULT_EMBEDDING_MODEL
+    limiter = get_rate_limiter("openai", model, kind="embedding")
+    await limiter.aacquire(estimate_tokens(texts))
+    try:
+        return await get_embedding_client(model).aembed_documents(texts)
+    except Exception as e:
+        await asyncio.to_thread(limiter.record_error, e)
+        raise
+
+
+def _parse_vector(value) -> list[float]:
+    """pgvector columns come back as '[0.1,0.2,...]' strings unless an adapter is registered."""
+    if isinstance(value, str):
+        return json.loads(value)
+    return [float(v) for v in value]
+
+
+_READ_CACHE_SQL = """
+    SELECT query_text, embedding
+    FROM ref.query_embedding_cache
+    WHERE embedding_model = %s
+        AND query_sha256 = ANY(%s);
+"""
+
+_WRITE_CACHE_SQL = """
+    INSERT INTO ref.query_embedding_cache (embedding_model, query_sha256, query_text, embedding, updated_at)
+    VALUES (%s, %s, %s, %s::vector, now())
+    ON CONFLICT (embedding_model, query_sha256) DO NOTHING;
+"""
+
+
+def _cache_rows(model: str, embeddings: dict) -> list:
+    return [
+        (model, hash_text(text), text, "[" + ",".join(map(str, vec)) + "]")
+        for text, vec in embeddings.items()
+    ]
+
+
+def _read_cached_embeddings(conn, model: str, texts: list[str]) -> dict:
+    """Fetch cached vectors for `texts` in a single round trip."""
+    cursor = conn.cursor()
+    cursor.execute(_READ_CACHE_SQL, (model, [hash_text(t) for t in texts]))
+    return {row[0]: _parse_vector(row[1]) for row in cursor.fetchall()}
+
+
+def _write_cached_embeddings(conn, model: str, embeddings: dict) -> int:
+    """Upsert freshly computed vectors into ref.query_embedding_cache."""
+    cursor = conn.cursor()
+    cursor.executemany(_WRITE_CACHE_SQL, _cache_rows(model, embeddings))
+    conn.commit()
+    return len(embeddings)
+
+
+def embed_queries(texts: list[str], model: Optional[str] = None) -> list[list[float]]:
+    """
+    Embed retrieval query texts through the (model, text) cache.
+
+    Lookup order is the in-process dict, then ref.query_embedding_cache, then the
+    embedding API. Misses are embedded in one batch and written back to both caches,
+    so repeated queries cost zero API calls once the cache is warm.
+    The database cache is best-effort: if it is unreachable, vectors are still
+    returned and kept in memory for the rest of the run.
+    """
+    model = model or DEFAULT_EMBEDDING_MODEL
+    if len(texts) == 0:
+        return []
+
+    missing = list(dict.fromkeys(t for t in texts if (model, t) not in _query_embedding_cache))
+
+    if missing:
+        conn = connect_to_db()
+        try:
+            if conn:
+                try:
+                    for text, vec in _read_cached_embeddings(conn, model, missing).items():
+                        _query_embedding_cache[(model, text)] = vec
+                except Exception as e:
+                    conn.rollback()
+                    print(f"⚠️ Query embedding cache read failed: {e}")
+
+            missing = [t for t in missing if (model, t) not in _query_embedding_cache]
+            if missing:
+                vectors = embed_documents(missing, model)
+                fresh = dict(zip(missing, vectors))
+                for text, vec in fresh.items():
+                    _query_embedding_cache[(model, text)] = vec
+                if conn:
+                    try:
+                        _write_cached_embeddings(conn, model, fresh)
+                    except Exception as e:
+                        conn.rollback()
+                        print(f"⚠️ Query embedding cache write failed: {e}")
+        finally:
+            if conn:
+                conn.close()
+
+    return [_query_embedding_cache[(model, t)] for t in texts]
+
+
+async def aembed_queries(texts: list[str], model: Optional[str] = None) -> list[list[float]]:
+    """
+    Async embed_queries: same cache lookup order, with the database round trips
+    on the event loop's connection pool and the API call through aembed_documents.
+    """
+    model = model or DEFAULT_EMBEDDING_MODEL
+    if len(texts) == 0:
+        return []
+
+    missing = list(dict.fromkeys(t for t in texts if (model, t) not in _query_embedding_cache))
+
+    if missing:
+        try:
+            pool = await get_async_pool()
+        except Exception as e:
+            pool = None
+            print(f"⚠️ Query embedding cache unavailable: {e}")
+
+        if pool:
+            try:
+                async with pool.connection() as conn:
+                    cursor = await conn.execute(_READ_CACHE_SQL, (model, [hash_text(t) for t in missing]))
+                    for text, vec in await cursor.fetchall():
+                        _query_embedding_cache[(model, text)] = _parse_vector(vec)
+            except Exception as e:
+                print(f"⚠️ Query embedding cache read failed: {e}")
+
+        missing = [t for t in missing if (model, t) not in _query_embedding_cache]
+        if missing:
+            vectors = await aembed_documents(missing, model)
+            fresh = dict(zip(missing, vectors))
+            for text, vec in fresh.items():
+                _query_embedding_cache[(model, text)] = vec
+            if pool:
+                try:
+                    # The pool commits the connection's transaction on exit
+                    async with pool.connection() as conn:
+                        async with conn.cursor() as cursor:
+                            await cursor.executemany(_WRITE_CACHE_SQL, _cache_rows(model, fresh))
+                except Exception as e:
+                    print(f"⚠️ Query embedding cache write failed: {e}")
+
+    return [_query_embedding_cache[(model, t)] for t in texts]
+
+
+def embed_query(text: str, model: Optional[str] = None) -> list[float]:
+    """Embed a single query text through the cache."""
+    return embed_queries([text], model)[0]
+
+
+def warm_query_embedding_cache(texts: list[str], model: Optional[str] = None) -> int:
+    """
+    Pre-load the cache for a job's known query texts in one batch.
+    Returns the number of distinct texts now held in memory for `model`.
+    """
+    texts = list(dict.fromkeys(texts))
+    embed_queries(texts, model)
+    return len(texts)
@@ -0,0 +1,140 @@
+import os
+import json
+import itertools
+import threading
+from langchain_core.messages import AIMessage
+from database.utils import connect_to_db
+
+# Persistent LLM response cache in ref.llm_response_cache, read and written by
+# run_llm / arun_llm. Entries are keyed by the hash of (provider, model,
+# temperature, messages), so a graph retried after a late-stage failure, or a
+# row re-analyzed with an unchanged prompt, replays the completed calls without
+# an API request. Entries expire LLM_CACHE_TTL_DAYS after they were written;
+# every PRUNE_EVERY writes the least recently hit entries beyond
+# LLM_CACHE_MAX_ROWS are evicted as well.
+# The cache is best-effort: when the database is unreachable the calls go to
+# the API as before.
+
+LLM_CACHE = os.getenv("LLM_CACHE", "1") == "1"
+LLM_CACHE_TTL_DAYS = int(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "200000"))
+PRUNE_EVERY = 1000
+
+# One autocommit connection per thread: arun_llm reaches the cache through asyncio.to_thread
+_local = threading.local()
+_unavailable = False
+_writes = itertools.count(1)
+
+
+def _connection():
+    global _unavailable
+    conn = getattr(_local, "conn", None)
+    if conn is None or conn.closed:
+        conn = connect_to_db()
+        if conn is None:
+            print("⚠️ LLM response cache disabled: could not connect to database.")
+            _unavailable = True
+            return None
+        conn.autocommit = True
+        _local.conn = conn
+    return conn
+
+
+def _drop_connection():
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def read_cached_response(key: str) -> AIMessage:
+    """Cached response of a prompt key, or None on a miss, an expired entry or a cache error."""
+    if not LLM_CACHE or _unavailable:
+        return None
+    conn = _connection()
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE ref.llm_response_cache
+                SET last_hit_at = now()
+                WHERE prompt_sha256 = %s
+                    AND created_at > now() - make_interval(days => %s)
+                RETURNING response;
+            """, (key, LLM_CACHE_TTL_DAYS))
+            row = cursor.fetchone()
+    except Exception as e:
+        print(f"⚠️ LLM response cache read failed: {e}")
+        _drop_connection()
+        return None
+    if row is None:
+        return None
+    response = row[0] if isinstance(row[0], dict) else json.loads(row[0])
+    return AIMessage(content=response["content"],
+                     usage_metadata=response.get("usage_metadata"),
+                     response_metadata={**response.get("response_metadata", {}), "cache_hit": True})
+
+
+def write_cached_response(key: str, provider: str, model: str, response) -> bool:
+    """Store (or refresh) the response of a prompt key; returns True if written."""
+    if not LLM_CACHE or _unavailable:
+        return False
+    conn = _connection()
+    if conn is None:
+        return False
+    # Rate-limit headers describe the moment of the call, not the answer
+    metadata = {k: v for k, v in (response.response_metadata or {}).items() if k not in ("headers", "cache_hit")}
+    payload = json.dumps({"content": response.content,
+                          "usage_metadata": response.usage_metadata,
+                          "response_metadata": metadata}, default=str)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO ref.llm_response_cache (prompt_sha256, provider, model, response, created_at, last_hit_at)
+                VALUES (%s, %s, %s, %s::jsonb, now(), now())
+                ON CONFLICT (prompt_sha256) DO UPDATE SET
+                    response = EXCLUDED.response,
+                    created_at = EXCLUDED.created_at,
+                    last_hit_at = EXCLUDED.last_hit_at;
+            """, (key, provider, model or "", payload))
+        if next(_writes) % PRUNE_EVERY == 0:
+            prune_llm_response_cache(conn)
+    except Exception as e:
+        print(f"⚠️ LLM response cache write failed: {e}")
+        _drop_connection()
+        return False
+    return True
+
+
+def prune_llm_response_cache(conn, ttl_days: int = LLM_CACHE_TTL_DAYS, max_rows: int = LLM_CACHE_MAX_ROWS) -> int:
+    """Delete expired entries, then the least recently hit ones beyond max_rows; returns rows deleted."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            DELETE FROM ref.llm_response_cache
+            WHERE created_at <= now() - make_interval(days => %s);
+        """, (ttl_days,))
+        deleted = cursor.rowcount
+        cursor.execute("""
+            DELETE FROM ref.llm_response_cache
+            WHERE prompt_sha256 IN (
+                SELECT prompt_sha256
+                FROM ref.llm_response_cache
+                ORDER BY last_hit_at DESC
+                OFFSET %s
+            );
+        """, (max_rows,))
+        deleted += cursor.rowcount
+    conn.commit()
+    return deleted
+
+
+if __name__ == "__main__":
+    conn = connect_to_db()
+    if conn:
+        deleted = prune_llm_response_cache(conn)
+        print(f"Evicted {deleted} LLM response cache entries.")
+        conn.close()
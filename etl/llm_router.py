@@ -0,0 +1,184 @@
+import os
+import atexit
+import threading
+import numpy as np
+import pandas as pd
+from etl.rate_limiter import get_rate_limiter, is_rate_limit_error
+
+# Model routing of run_llm / arun_llm. Every LLM node passes a route name
+# ("news.stage1", "catalysts.stage2", ...); LLM_ROUTES maps it to a tier and
+# LLM_TIERS maps the tier to its models, in order of preference. A call goes
+# to the first model of its tier that has rate-limit budget left, so once the
+# preferred provider's quota is spent the other provider's is used instead of
+# sleeping. A 429, a timeout or a 5xx fails the call over to the next model.
+# Tiers are configured as comma-separated "<provider>[:<model name>]" lists,
+# where provider is an LLM_MODEL value and the model name defaults to the
+# provider's OPENAI_LLM_MODEL / GEMINI_LLM_MODEL:
+#   LLM_TRIAGE_MODELS="chatgpt:gpt-5-nano,gemini:models/gemini-2.5-flash-lite"
+# Unconfigured tiers use LLM_MODEL followed by the other provider (when its
+# model is set), so by default every node keeps its current model and only
+# gains the failover. LLM_ROUTE_TIERS="news.stage2=triage,..." moves routes.
+# Per route and model, calls, cache hits, failovers, errors, latency and
+# tokens are counted in-process and printed when the process exits
+# (LLM_ROUTE_STATS=0 turns the report off).
+# The SDK clients are built with max_retries=0, so a 429 or a timeout reaches
+# the router at once instead of being retried on the same model first. Once
+# every model of the tier has failed with one, the router goes through the tier
+# again after a backoff, up to LLM_RETRIES more times.
+
+LLM_MODEL = os.getenv("LLM_MODEL", "chatgpt")
+
+# LLM_MODEL value -> (provider, default model name) of its rate limiter and cache entries
+LLM_PROVIDERS = {
+    "chatgpt": ("openai", os.getenv("OPENAI_LLM_MODEL")),
+    "gemini": ("gemini", os.getenv("GEMINI_LLM_MODEL")),
+}
+
+
+def parse_models(value: str) -> list:
+    """[(provider, model name)] of a "<provider>[:<model name>]" list; [] for an empty value."""
+    models = []
+    for item in (value or "").split(","):
+        provider, _, model_name = item.strip().partition(":")
+        if not provider:
+            continue
+        if provider not in LLM_PROVIDERS:
+            raise ValueError(f"Unsupported model: {provider}")
+        models.append((provider, model_name or LLM_PROVIDERS[provider][1]))
+    return models
+
+
+def default_models() -> list:
+    """LLM_MODEL, then every other provider whose model is configured."""
+    return [(LLM_MODEL, LLM_PROVIDERS[LLM_MODEL][1])] + [
+        (provider, model_name) for provider, (_, model_name) in LLM_PROVIDERS.items()
+        if provider != LLM_MODEL and model_name
+    ]
+
+
+LLM_TIERS = {
+    "default": parse_models(os.getenv("LLM_DEFAULT_MODELS")) or default_models(),
+}
+LLM_TIERS["triage"] = parse_models(os.getenv("LLM_TRIAGE_MODELS")) or LLM_TIERS["default"]
+LLM_TIERS["synthesis"] = parse_models(os.getenv("LLM_SYNTHESIS_MODELS")) or LLM_TIERS["default"]
+
+# Route -> tier; routes not listed here use the default tier
+LLM_ROUTES = {
+    "news.stage1": "triage",
+    "signals.is_signal": "triage",
+    "catalysts.stage1": "triage",
+    "earnings_transcripts.queries": "triage",
+    "news.stage2": "synthesis",
+    "catalysts.stage2": "synthesis",
+    "catalysts.stage3": "synthesis",
+    "earnings_transcripts.analysis": "synthesis",
+}
+LLM_ROUTES.update(dict(item.strip().split("=", 1) for item in os.getenv("LLM_ROUTE_TIERS", "").split(",") if "=" in item))
+
+LLM_ROUTE_STATS = os.getenv("LLM_ROUTE_STATS", "1") == "1"
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))  # passes over the tier after the first (the SDK's old default)
+LLM_RETRY_BACKOFF = 1.0  # seconds before the first retry pass, doubled on each later one
+
+
+def route_models(route: str = None, model: str = None) -> list:
+    """Models of a call, in order of preference: `model` alone when given, else the tier of `route`."""
+    if model is not None:
+        if model not in LLM_PROVIDERS:
+            raise ValueError(f"Unsupported model: {model}")
+        return [(model, LLM_PROVIDERS[model][1])]
+    tier = LLM_ROUTES.get(route, "default")
+    if tier not in LLM_TIERS:
+        raise ValueError(f"Unknown LLM tier {tier} of route {route}")
+    return LLM_TIERS[tier]
+
+
+def rate_limiter(candidate: tuple):
+    """Shared rate limiter of a (provider, model name) candidate."""
+    return get_rate_limiter(LLM_PROVIDERS[candidate[0]][0], candidate[1])
+
+
+def by_budget(candidates: list, tokens: int) -> list:
+    """
+    `candidates` with the ones that have budget for the request now first, in
+    order of preference, then the rest by how soon they will.
+    """
+    if len(candidates) < 2:
+        return list(candidates)
+    waits = [max(rate_limiter(candidate).wait_time(tokens), 0.0) for candidate in candidates]
+    return [candidates[i] for i in sorted(range(len(candidates)), key=lambda i: (waits[i], i))]
+
+
+def attempts(candidates: list) -> list:
+    """
+    (candidate, seconds to wait first) of every try of a call: the candidates
+    in order, then LLM_RETRIES more passes over them, each after a backoff.
+    """
+    return [(candidate, LLM_RETRY_BACKOFF * 2 ** (n - 1) if n and i == 0 else 0.0)
+            for n in range(LLM_RETRIES + 1) for i, candidate in enumerate(candidates)]
+
+
+def is_failover_error(e: Exception) -> bool:
+    """A 429, a timeout or a 5xx: errors that another provider may not have."""
+    if is_rate_limit_error(e) or isinstance(e, TimeoutError):
+        return True
+    status = getattr(e, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    text = f"{type(e).__name__} {e}".lower()
+    return "timeout" in text or "timed out" in text
+
+
+class RouteStats:
+    """Per (route, provider, model name): call counts, latencies and token usage of one process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = {}
+
+    def _row(self, route: str, candidate: tuple) -> dict:
+        key = (route or "unrouted", *candidate)
+        if key not in self.rows:
+            self.rows[key] = {"calls": 0, "cache_hits": 0, "failovers": 0, "errors": 0, "latencies": [],
+                              "waits": [], "input_tokens": 0, "output_tokens": 0}
+        return self.rows[key]
+
+    def record_hit(self, route: str, candidate: tuple):
+        with self.lock:
+            self._row(route, candidate)["cache_hits"] += 1
+
+    def record_call(self, route: str, candidate: tuple, wait: float, latency: float, response=None,
+                    error: Exception = None, failover: bool = False):
+        """One API request: seconds spent waiting for budget and on the request, and its outcome."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        with self.lock:
+            row = self._row(route, candidate)
+            row["calls"] += 1
+            row["waits"].append(wait)
+            row["latencies"].append(latency)
+            row["errors"] += error is not None
+            row["failovers"] += failover
+            row["input_tokens"] += usage.get("input_tokens", 0)
+            row["output_tokens"] += usage.get("output_tokens", 0)
+
+    def to_frame(self) -> pd.DataFrame:
+        with self.lock:
+            rows = [{"route": route, "provider": provider, "model": model_name,
+                     "calls": row["calls"], "cache_hits": row["cache_hits"], "errors": row["errors"],
+                     "failovers": row["failovers"],
+                     "p50_s": np.median(row["latencies"]) if row["latencies"] else np.nan,
+                     "p95_s": np.percentile(row["latencies"], 95) if row["latencies"] else np.nan,
+                     "wait_s": sum(row["waits"]),
+                     "input_tokens": row["input_tokens"], "output_tokens": row["output_tokens"]}
+                    for (route, provider, model_name), row in sorted(self.rows.items())]
+        return pd.DataFrame(rows)
+
+    def report(self):
+        if not self.rows:
+            return
+        print("\nLLM routes:")
+        print(self.to_frame().to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+
+route_stats = RouteStats()
+if LLM_ROUTE_STATS:
+    atexit.register(route_stats.report)
@@ -1,14 +1,13 @@
 from database.utils import connect_to_db
-from langchain_openai import OpenAIEmbeddings
+from etl.embeddings import embed_queries, embed_query
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import os
 import json
 import database.config
 
-# Initialize the embedding model
+# Embedding model; vectors are served through the shared query embedding cache
 embedding_model_name = os.getenv("OPENAI_EMBEDDING_MODEL")
-embedding_model = OpenAIEmbeddings(model=embedding_model_name, timeout=30, max_retries=2)
 
 
 init_grade_mapping = [
@@ -56,8 +55,8 @@ def initialize_analyst_grade_mapping_table():
     """
     conn = connect_to_db()
     total_records_inserted = 0
-    for grade_original, grade_normalized, grade_value in init_grade_mapping:
-        embedding = embedding_model.embed_query(grade_original)
+    embeddings = embed_queries([grade[0] for grade in init_grade_mapping], model=embedding_model_name)
+    for (grade_original, grade_normalized, grade_value), embedding in zip(init_grade_mapping, embeddings):
         embedding_model_used = embedding_model_name
         total_records_inserted += insert_record(conn, grade_original, grade_normalized, grade_value, embedding, embedding_model_used)
     conn.commit()
@@ -109,7 +108,7 @@ def classify_grade_embedding_similarity(new_grade, ref_grade_list, grade_mapping
     Classify a new analyst grade into "Buy", "Hold", or "Sell" using embedding similarity.
 
     """
-    new_grade_embedding = embedding_model.embed_query(new_grade)
+    new_grade_embedding = embed_query(new_grade, model=embedding_model_name)
     # Compute similarity scores
     similarities = {}
     for ref_grade in ref_grade_list:
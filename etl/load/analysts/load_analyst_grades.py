@@ -1,7 +1,8 @@
 import pandas as pd
 import json
 from database.utils import connect_to_db, insert_records, execute_query
-from grade_mapping import get_mapping, classify_grade_embedding_similarity, ref_grade_list
+from grade_mapping import get_mapping, classify_grade_embedding_similarity, ref_grade_list, embedding_model_name
+from etl.embeddings import warm_query_embedding_cache
 
 
 grade_mapping = get_mapping()  
@@ -78,7 +79,10 @@ def normalize_analyst_grades(df):
         unclassified_previous_grades = df[df['previous_grade_normalized'].isna()]['previous_grade']
         # unique unclassified grades
         unclassified_grades = pd.concat([unclassified_new_grades, unclassified_previous_grades]).unique()
-        
+        # Embed all unclassified grades in one batch before classifying them one by one
+        warm_query_embedding_cache([str(g) for g in unclassified_grades if pd.notna(g) and g != ""],
+                                   model=embedding_model_name)
+
         for grade in unclassified_grades:
             if pd.notna(grade) and grade != "":
                 classification = classify_grade_embedding_similarity(str(grade), ref_grade_list, grade_mapping, update=True)
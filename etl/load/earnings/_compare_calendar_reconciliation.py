@@ -0,0 +1,156 @@
+"""Golden comparison: reconcile_earnings_calendar vs the original per-ticker fuzzy lookup, plus timings."""
+import sys
+import os
+import time
+
+# Ensure project root is on PYTHONPATH (utils below is etl/load/earnings/utils.py)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import numpy as np
+import pandas as pd
+from database.utils import connect_to_db
+from utils import read_earnings_calendar, reconcile_earnings_calendar, describe_diagnostics
+import load_earnings
+import load_earnings_transcripts
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_TICKERS = None  # None = every ticker of core.stock_profiles
+# ──────────────────────────────────────────────────────────────────
+
+
+# ─── Reference: original etl/load/earnings/utils.py ───────────────
+
+def fuzzy_lookup_earnings_calendar(tic, df, calendar_df, cols):
+    """
+    Update the earnings_date in df based on a fuzzy match with calendar_df.
+    The fuzzy match is based on abs(df['earnings_date'] - calendar_df['earnings_date']) < 30 days.
+    """
+    df['earnings_date'] = pd.to_datetime(df['earnings_date'])
+    calendar_df['earnings_date'] = pd.to_datetime(calendar_df['earnings_date'])
+    df = df.sort_values('earnings_date')
+    calendar_df = calendar_df.sort_values('earnings_date')
+    calendar_df['_earnings_date'] = calendar_df['earnings_date']
+    calendar_df['_fiscal_date'] = calendar_df['fiscal_date']
+    calendar_df['_session'] = calendar_df['session']
+    calendar_df['_calendar_year'] = calendar_df['calendar_year']
+    calendar_df['_calendar_quarter'] = calendar_df['calendar_quarter']
+    calendar_df['_fiscal_year'] = calendar_df['fiscal_year']
+    calendar_df['_fiscal_quarter'] = calendar_df['fiscal_quarter']
+    calendar_df['index'] = np.arange(len(calendar_df))
+
+    merged_df = pd.merge_asof(
+        df,
+        calendar_df,
+        on='earnings_date',
+        by='tic',
+        direction='nearest',
+        tolerance=pd.Timedelta(days=20),
+        suffixes=('', '_cal')
+    )
+    merged_df['calendar_year'] = merged_df['_calendar_year']
+    merged_df['calendar_quarter'] = merged_df['_calendar_quarter']
+    merged_df['earnings_date'] = merged_df['_earnings_date']
+    merged_df['fiscal_year'] = merged_df['_fiscal_year']
+    merged_df['fiscal_quarter'] = merged_df['_fiscal_quarter']
+    merged_df['fiscal_date'] = merged_df['_fiscal_date']
+    merged_df['session'] = merged_df['_session']
+
+    merged_df = merged_df.dropna(subset=['index'])
+    merged_df = merged_df.sort_values('earnings_date', ascending=False)
+
+    if merged_df.shape[0] == 0:
+        pass
+    else:
+        index = merged_df.iloc[0]['index']
+        for i in range(1, len(merged_df)):
+            if merged_df.iloc[i]['index'] != index - 1:
+                merged_df = merged_df.iloc[:i-1]
+                break
+            index = merged_df.iloc[i]['index']
+
+    if merged_df['index'].duplicated().any():
+        raise ValueError(f"Duplicate matches found for tic {tic} after fuzzy lookup.")
+    if merged_df['index'].isnull().any():
+        raise ValueError(f"Missing matches found for tic {tic} after fuzzy lookup.")
+    if len(merged_df) < 3:
+        raise ValueError(f"Too few matches ({len(merged_df)}) found for tic {tic} after fuzzy lookup.")
+
+    merged_df = merged_df[cols]
+    return merged_df
+
+
+def reference(events_df, calendar_df, cols, tickers):
+    """Original loader loop: per-ticker reads, earliest-date filter and fuzzy lookup; tic -> frame or error."""
+    results = {}
+    for tic in tickers:
+        df = events_df[events_df['tic'] == tic].copy()
+        tic_calendar_df = calendar_df[calendar_df['tic'] == tic].copy()
+        earliest_date = tic_calendar_df['earnings_date'].min()
+        df = df[pd.to_datetime(df['earnings_date']) >= pd.to_datetime(earliest_date) - pd.Timedelta(days=20)]
+        try:
+            results[tic] = fuzzy_lookup_earnings_calendar(tic, df, tic_calendar_df, cols)
+        except ValueError as e:
+            results[tic] = e
+    return results
+
+
+def compare(events_df, calendar_df, cols, tickers) -> int:
+    """Check reconcile_earnings_calendar against the reference on one event table; returns the failures."""
+    start = time.perf_counter()
+    expected = reference(events_df, calendar_df, cols, tickers)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reconciled_df, diagnostics = reconcile_earnings_calendar(events_df, calendar_df, cols, tickers)
+    batch_time = time.perf_counter() - start
+    print(f"  {describe_diagnostics(diagnostics)}")
+
+    failures = 0
+    for tic, result in expected.items():
+        status = diagnostics.at[tic, 'status']
+        if isinstance(result, Exception):
+            if status == 'ok':
+                print(f"  ❌ {tic}: reference raised '{result}', batch kept {diagnostics.at[tic, 'kept']} quarters")
+                failures += 1
+            continue
+        if status != 'ok':
+            print(f"  ❌ {tic}: reference kept {len(result)} quarters, batch reports '{status}'")
+            failures += 1
+            continue
+        try:
+            pd.testing.assert_frame_equal(result.reset_index(drop=True),
+                                          reconciled_df[reconciled_df['tic'] == tic].reset_index(drop=True),
+                                          check_dtype=False)
+        except AssertionError as e:
+            print(f"  ❌ {tic}: {e}")
+            failures += 1
+
+    raised = sum(isinstance(result, Exception) for result in expected.values())
+    print(f"  {len(expected) - failures}/{len(expected)} tickers identical ({raised} rejected by both); "
+          f"per-ticker {reference_time:.2f}s, batch {batch_time:.2f}s")
+    return failures
+
+
+if __name__ == "__main__":
+    conn = connect_to_db()
+    if conn is None:
+        sys.exit(1)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT tic FROM core.stock_profiles ORDER BY tic;")
+        tickers = [record[0] for record in cursor.fetchall()][:N_TICKERS]
+    conn.close()
+
+    calendar_df = read_earnings_calendar()
+    earnings_cols = ['tic', 'calendar_year', 'calendar_quarter', 'earnings_date',
+                     'fiscal_year', 'fiscal_quarter', 'fiscal_date', 'session',
+                     'eps', 'eps_estimated', 'revenue', 'revenue_estimated',
+                     'source', 'raw_json', 'raw_json_sha256']
+    transcript_cols = ['tic', 'calendar_year', 'calendar_quarter', 'earnings_date', 'transcript',
+                       'transcript_sha256', 'source', 'raw_json', 'raw_json_sha256']
+
+    failures = 0
+    print("raw.earnings:")
+    failures += compare(load_earnings.read_records(), calendar_df, earnings_cols, tickers)
+    print("raw.earnings_transcripts:")
+    failures += compare(load_earnings_transcripts.read_records(), calendar_df, transcript_cols, tickers)
+    sys.exit(1 if failures else 0)
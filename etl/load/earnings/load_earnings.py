@@ -1,15 +1,17 @@
 import pandas as pd
 import numpy as np
 from database.utils import connect_to_db, insert_records, execute_query
-from utils import read_earnings_calendar, fuzzy_lookup_earnings_calendar
+from utils import read_earnings_calendar, reconcile_earnings_calendar, describe_diagnostics
 import json
 
 
 
-def read_records(tic):
+def read_records(tic=None):
     """
-    Reads data from the raw.earnings table and returns it as a pandas DataFrame.
+    Reads data from the raw.earnings table (one tic, or every tic when tic is None)
+    and returns it as a pandas DataFrame.
     """
+    where = f"WHERE tic = '{tic}'" if tic is not None else ""
     query = f"""
     SELECT 
         tic,
@@ -24,7 +26,7 @@ def read_records(tic):
         raw_json,
         raw_json_sha256
     FROM raw.earnings r
-    WHERE tic = '{tic}';
+    {where};
     """
 
     # Connect to the database
@@ -53,21 +55,23 @@ def main():
     if conn:
         cursor = conn.cursor()
         cursor.execute("SELECT tic FROM core.stock_profiles;")
-        records = cursor.fetchall()
-        for record in records:
-            tic = record[0]
-            earnings_df = read_records(tic)
-            calendar_df = read_earnings_calendar(tic)
-            earliest_date = calendar_df['earnings_date'].min()
-            earnings_df = earnings_df[pd.to_datetime(earnings_df['earnings_date']) >= pd.to_datetime(earliest_date) - pd.Timedelta(days=20)]
-            cols = ['tic', 'calendar_year', 'calendar_quarter', 'earnings_date', 
-                           'fiscal_year', 'fiscal_quarter', 'fiscal_date', 'session',
-                           'eps', 'eps_estimated', 'revenue', 'revenue_estimated',
-                           'source', 'raw_json', 'raw_json_sha256'
-                           ]
-            earnings_df = fuzzy_lookup_earnings_calendar(tic, earnings_df, calendar_df, cols)
-            earnings_df['raw_json'] = earnings_df['raw_json'].apply(lambda x: json.dumps(x) if pd.notnull(x) else None)
-            total_records = load_records(earnings_df)
+        tickers = [record[0] for record in cursor.fetchall()]
+
+        # Reconcile the whole universe against the calendar at once
+        earnings_df = read_records()
+        earnings_df = earnings_df[earnings_df['tic'].isin(tickers)]
+        calendar_df = read_earnings_calendar()
+        cols = ['tic', 'calendar_year', 'calendar_quarter', 'earnings_date', 
+                       'fiscal_year', 'fiscal_quarter', 'fiscal_date', 'session',
+                       'eps', 'eps_estimated', 'revenue', 'revenue_estimated',
+                       'source', 'raw_json', 'raw_json_sha256'
+                       ]
+        earnings_df, diagnostics = reconcile_earnings_calendar(earnings_df, calendar_df, cols, tickers)
+        print(f"Earnings calendar: {describe_diagnostics(diagnostics)}")
+        earnings_df['raw_json'] = earnings_df['raw_json'].apply(lambda x: json.dumps(x) if pd.notnull(x) else None)
+
+        for tic, tic_df in earnings_df.groupby('tic', sort=False):
+            total_records = load_records(tic_df)
             print(f"For {tic}: Total records processed = {total_records}")
         conn.close()
 
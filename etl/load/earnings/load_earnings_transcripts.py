@@ -1,12 +1,14 @@
 import pandas as pd
 import json
 from database.utils import connect_to_db, insert_records, insert_record, execute_query
-from utils import read_earnings_calendar, fuzzy_lookup_earnings_calendar
+from utils import read_earnings_calendar, reconcile_earnings_calendar, describe_diagnostics
 
-def read_records(tic):
+def read_records(tic=None):
     """
-    Reads data from the raw.earnings table and returns it as a pandas DataFrame.
+    Reads data from the raw.earnings_transcripts table (one tic, or every tic when
+    tic is None) and returns it as a pandas DataFrame.
     """
+    where = f"WHERE tic = '{tic}'" if tic is not None else ""
     query = f"""
     SELECT 
         tic,
@@ -17,7 +19,7 @@ def read_records(tic):
         raw_json_sha256,
         transcript_sha256
     FROM raw.earnings_transcripts as e
-    WHERE tic = '{tic}';
+    {where};
     """
 
     # Connect to the database
@@ -46,27 +48,29 @@ def main():
     if conn:
         cursor = conn.cursor()
         cursor.execute("SELECT tic FROM core.stock_profiles;")
-        records = cursor.fetchall()
-        for record in records:
-            tic = record[0]
-            transcripts_df = read_records(tic)
-            calendar_df = read_earnings_calendar(tic)
-            earliest_date = calendar_df['earnings_date'].min()
-            transcripts_df = transcripts_df[pd.to_datetime(transcripts_df['earnings_date']) >= pd.to_datetime(earliest_date) - pd.Timedelta(days=20)]
-            cols = [
-                "tic",
-                "calendar_year",
-                "calendar_quarter",
-                "earnings_date",
-                "transcript",
-                "transcript_sha256",
-                "source",
-                "raw_json",
-                "raw_json_sha256"
-            ]
-            transcripts_df = fuzzy_lookup_earnings_calendar(tic, transcripts_df, calendar_df, cols)
-            transcripts_df['raw_json'] = transcripts_df['raw_json'].apply(lambda x: json.dumps(x) if pd.notnull(x) else None)
-            total_records = load_records(transcripts_df)
+        tickers = [record[0] for record in cursor.fetchall()]
+
+        # Reconcile the whole universe against the calendar at once
+        transcripts_df = read_records()
+        transcripts_df = transcripts_df[transcripts_df['tic'].isin(tickers)]
+        calendar_df = read_earnings_calendar()
+        cols = [
+            "tic",
+            "calendar_year",
+            "calendar_quarter",
+            "earnings_date",
+            "transcript",
+            "transcript_sha256",
+            "source",
+            "raw_json",
+            "raw_json_sha256"
+        ]
+        transcripts_df, diagnostics = reconcile_earnings_calendar(transcripts_df, calendar_df, cols, tickers)
+        print(f"Earnings calendar: {describe_diagnostics(diagnostics)}")
+        transcripts_df['raw_json'] = transcripts_df['raw_json'].apply(lambda x: json.dumps(x) if pd.notnull(x) else None)
+
+        for tic, tic_df in transcripts_df.groupby('tic', sort=False):
+            total_records = load_records(tic_df)
             print(f"For {tic}: Total records processed = {total_records}")
         conn.close()
 
@@ -2,11 +2,20 @@ import pandas as pd
 import numpy as np
 from database.utils import execute_query
 
+# Events are matched to the nearest calendar quarter of their tic within this window
+MATCH_TOLERANCE = pd.Timedelta(days=20)
+# Tickers with fewer reconciled quarters are reported and skipped
+MIN_MATCHES = 3
+CALENDAR_COLS = ['calendar_year', 'calendar_quarter', 'earnings_date',
+                 'fiscal_year', 'fiscal_quarter', 'fiscal_date', 'session']
 
-def read_earnings_calendar(tic):
+
+def read_earnings_calendar(tic=None):
     """
-    Reads data from the raw.earnings_calendar table and returns it as a pandas DataFrame.
+    Reads data from the core.earnings_calendar table (one tic, or every tic when tic
+    is None) and returns it as a pandas DataFrame.
     """
+    where = f"WHERE tic = '{tic}'" if tic is not None else ""
     query = f"""
     SELECT 
         tic,
@@ -18,7 +27,7 @@ def read_earnings_calendar(tic):
         fiscal_date,
         session
     FROM core.earnings_calendar
-    WHERE tic = '{tic}';
+    {where};
     """
 
     # Connect to the database
@@ -26,72 +35,93 @@ def read_earnings_calendar(tic):
     return df
 
 
-def fuzzy_lookup_earnings_calendar(tic, df, calendar_df, cols):
+def reconcile_earnings_calendar(df, calendar_df, cols, tickers=None):
     """
-    Update the earnings_date in df based on a fuzzy match with calendar_df.
-    The fuzzy match is based on abs(df['earnings_date'] - calendar_df['earnings_date']) < 30 days.
+    Match the events in df (any number of tickers) to core.earnings_calendar quarters.
+
+    Every event takes the calendar fields of the nearest quarter of its tic within
+    MATCH_TOLERANCE (one by-tic merge_asof). Per tic, the matches are then walked
+    back from the latest: at the first quarter that does not follow the previous
+    one (a gap, or two events on the same quarter) the run stops, and the quarter
+    before the break is dropped as well since either side may be the wrong match.
+
+    Returns:
+        (pd.DataFrame, pd.DataFrame): the reconciled rows (`cols`, latest first per
+        tic) of the tickers with at least MIN_MATCHES quarters, and one diagnostics
+        row per tic (df's tickers, or `tickers` when given): events, matched,
+        duplicates, truncated, kept, undated (calendar quarters without an
+        earnings_date, which cannot be matched) and status ('ok', 'no_calendar',
+        'too_few').
     """
+    df = df.copy()
     df['earnings_date'] = pd.to_datetime(df['earnings_date'])
-    calendar_df['earnings_date'] = pd.to_datetime(calendar_df['earnings_date'])
-    # Sort both dataframes by earnings_date for merge_asof
-    df = df.sort_values('earnings_date')
-    calendar_df = calendar_df.sort_values('earnings_date')
-    calendar_df['_earnings_date'] = calendar_df['earnings_date']
-    calendar_df['_fiscal_date'] = calendar_df['fiscal_date']
-    calendar_df['_session'] = calendar_df['session']
-    calendar_df['_calendar_year'] = calendar_df['calendar_year']
-    calendar_df['_calendar_quarter'] = calendar_df['calendar_quarter']
-    calendar_df['_fiscal_year'] = calendar_df['fiscal_year']
-    calendar_df['_fiscal_quarter'] = calendar_df['fiscal_quarter']
-    calendar_df['index'] = np.arange(len(calendar_df))
+    calendar_df = calendar_df[['tic'] + CALENDAR_COLS].rename(columns={col: f'_{col}' for col in CALENDAR_COLS})
+    calendar_df['_earnings_date'] = pd.to_datetime(calendar_df['_earnings_date'])
+    # merge_asof rejects null keys: undated quarters are counted in the diagnostics and left out
+    undated = calendar_df['_earnings_date'].isna()
+    undated_counts = undated.groupby(calendar_df['tic']).sum()
+    calendar_df = calendar_df[~undated].sort_values(['tic', '_earnings_date'], kind='mergesort')
+    calendar_df['earnings_date'] = calendar_df['_earnings_date']
+    # Position of each quarter in its tic's calendar: consecutive quarters differ by 1
+    calendar_df['index'] = calendar_df.groupby('tic').cumcount()
 
-    # Perform an asof merge to find the nearest match within 30 days
-    # We match on 'earnings_date' and group by 'tic' to ensure we only match the same stock
+    # merge_asof needs both sides sorted on the key; `by` keeps the matches within a tic
     merged_df = pd.merge_asof(
-        df,
-        calendar_df,
+        df.dropna(subset=['earnings_date']).sort_values('earnings_date', kind='mergesort'),
+        calendar_df.sort_values('earnings_date', kind='mergesort'),
         on='earnings_date',
         by='tic',
         direction='nearest',
-        tolerance=pd.Timedelta(days=20),
+        tolerance=MATCH_TOLERANCE,
         suffixes=('', '_cal')
     )
-    # if tic == 'AAPL':
-    #     import pdb; pdb.set_trace()
-    # import pdb; pdb.set_trace()
-    # Update earnings_df with matched calendar data
-    merged_df['calendar_year'] = merged_df['_calendar_year']
-    merged_df['calendar_quarter'] = merged_df['_calendar_quarter']
-    merged_df['earnings_date'] = merged_df['_earnings_date']
-    merged_df['fiscal_year'] = merged_df['_fiscal_year']
-    merged_df['fiscal_quarter'] = merged_df['_fiscal_quarter']
-    merged_df['fiscal_date'] = merged_df['_fiscal_date']
-    merged_df['session'] = merged_df['_session']
+    for col in CALENDAR_COLS:
+        merged_df[col] = merged_df.pop(f'_{col}')
 
-    # Drop rows where no match was found
-    merged_df = merged_df.dropna(subset=['index'])
-    merged_df = merged_df.sort_values('earnings_date', ascending=False)
+    # Drop rows where no match was found, latest quarter first within each tic
+    matched_df = merged_df.dropna(subset=['index'])
+    # An unmatched event turns the calendar's integer columns to float in merge_asof;
+    # fiscal_year / fiscal_quarter may be NULL in the calendar, hence the nullable dtype
+    matched_df = matched_df.astype({'calendar_year': 'Int64', 'calendar_quarter': 'Int64',
+                                    'fiscal_year': 'Int64', 'fiscal_quarter': 'Int64', 'index': int})
+    matched_df = matched_df.sort_values(['tic', 'earnings_date', 'index'], ascending=False).reset_index(drop=True)
 
-    # Validate that there is no duplicate or missing matches after the merge
-    if merged_df.shape[0] == 0:
-        pass
-    else:
-        index = merged_df.iloc[0]['index']
-        for i in range(1, len(merged_df)): 
-            if merged_df.iloc[i]['index'] != index - 1:
-                merged_df = merged_df.iloc[:i-1]
-                break
-            index = merged_df.iloc[i]['index']
+    # Contiguity: keep the rows before the first break, less the one preceding it
+    by_tic = matched_df.groupby('tic', sort=False)
+    step = by_tic['index'].diff()
+    position = by_tic.cumcount()
+    first_break = position.where(step.notna() & (step != -1)).groupby(matched_df['tic']).transform('min')
+    keep = first_break.isna() | (position < first_break - 1)
 
-    # check again whether there are any duplicates for col index
-    if merged_df['index'].duplicated().any():
-        raise ValueError(f"Duplicate matches found for tic {tic} after fuzzy lookup.")
-    if merged_df['index'].isnull().any():
-        raise ValueError(f"Missing matches found for tic {tic} after fuzzy lookup.")
-    if len(merged_df) < 3:
-        raise ValueError(f"Too few matches ({len(merged_df)}) found for tic {tic} after fuzzy lookup.")
+    if tickers is None:
+        tickers = df['tic'].unique()
+    diagnostics = pd.DataFrame({
+        'events': df.groupby('tic').size(),
+        'matched': matched_df.groupby('tic').size(),
+        'duplicates': matched_df.duplicated(['tic', 'index']).groupby(matched_df['tic']).sum(),
+        'truncated': (~keep).groupby(matched_df['tic']).sum(),
+        'kept': keep.groupby(matched_df['tic']).sum(),
+        'undated': undated_counts,
+    }).reindex(pd.Index(tickers, name='tic')).fillna(0).astype(int)
+    diagnostics['status'] = np.select(
+        [~diagnostics.index.isin(calendar_df['tic']), diagnostics['kept'] < MIN_MATCHES],
+        ['no_calendar', 'too_few'],
+        default='ok'
+    )
 
+    ok = diagnostics.index[diagnostics['status'] == 'ok']
+    reconciled_df = matched_df[keep & matched_df['tic'].isin(ok)]
+    return reconciled_df[cols].reset_index(drop=True), diagnostics
 
-    merged_df = merged_df[cols]
-    return merged_df
 
+def describe_diagnostics(diagnostics):
+    """One-line summary of reconcile_earnings_calendar diagnostics, naming the skipped tickers."""
+    skipped = diagnostics[diagnostics['status'] != 'ok']
+    summary = (f"{len(diagnostics) - len(skipped)}/{len(diagnostics)} tickers reconciled, "
+               f"{diagnostics['kept'].sum()} quarters kept, {diagnostics['truncated'].sum()} truncated, "
+               f"{diagnostics['duplicates'].sum()} duplicate matches")
+    if diagnostics['undated'].any():
+        summary += f", {diagnostics['undated'].sum()} undated calendar quarters"
+    if not skipped.empty:
+        summary += "; skipped " + ", ".join(f"{tic} ({status})" for tic, status in skipped['status'].items())
+    return summary
@@ -24,7 +24,10 @@ def process_and_load_chunks():
                 FROM core.news AS n
                 LEFT JOIN core.news_chunks AS nc
                 ON n.event_id = nc.event_id
+                LEFT JOIN core.news_clusters AS c
+                ON n.event_id = c.event_id
                 WHERE n.url IS NOT NULL
+                    AND c.is_canonical IS NOT FALSE  -- near-duplicates are not chunked (see dedup_news.py)
                     AND (n.raw_json_sha256 IS DISTINCT FROM nc.raw_json_sha256);
             """)
             records = cursor.fetchall()
@@ -0,0 +1,205 @@
+import os
+import re
+import zlib
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from database.utils import connect_to_db, insert_records, read_sql_query
+
+# Near-duplicate clustering of core.news, run after load_news.py. Each article
+# gets a MinHash signature of its normalized title + content; LSH over the
+# signature bands finds candidates among the same ticker's articles published
+# within WINDOW_HOURS, and the best candidate with an estimated Jaccard
+# similarity of at least SIMILARITY_THRESHOLD gives the article its cluster.
+# Articles without a match start a new cluster and are its canonical article.
+# Only canonical articles are chunked and analysed; the news analysis fans
+# their labels out to the other members of the cluster.
+# Incremental: only articles without a cluster row (or with a changed
+# raw_json_sha256) are hashed, and they are checked against an index of the
+# stored signatures in the time window around them.
+
+WINDOW_HOURS = int(os.getenv("NEWS_DEDUP_WINDOW_HOURS", "48"))
+SIMILARITY_THRESHOLD = float(os.getenv("NEWS_DEDUP_THRESHOLD", "0.5"))
+SHINGLE_SIZE = 3  # words per shingle
+BANDS, ROWS = 32, 4  # LSH bands x rows per band = signature length
+NUM_PERM = BANDS * ROWS
+
+_PRIME = 4294967311  # smallest prime above 2**32
+# Fixed seed: stored signatures are only comparable to ones hashed with the
+# same permutations, so changing it means clearing core.news_clusters.
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 2**32, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2**32, NUM_PERM, dtype=np.uint64)
+
+
+def normalize_text(text: str) -> list[str]:
+    """Lowercase alphanumeric tokens of `text`."""
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+def shingles(text: str) -> np.ndarray:
+    """32-bit hashes of the word SHINGLE_SIZE-grams of `text`."""
+    words = normalize_text(text)
+    grams = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    grams.discard("")
+    return np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype=np.uint64)
+
+
+def minhash(text: str) -> np.ndarray:
+    """
+    MinHash signature of `text` (NUM_PERM values). An empty text gets a
+    signature of _PRIME, which is never matched.
+    """
+    x = shingles(text)
+    if len(x) == 0:
+        return np.full(NUM_PERM, _PRIME, dtype=np.int64)
+    # x, _A < 2**32 and _B < 2**32, so x * _A + _B fits in uint64
+    return ((np.outer(x, _A) + _B) % _PRIME).min(axis=0).astype(np.int64)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+def band_keys(signature: np.ndarray) -> list:
+    return [(band, signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+
+def is_empty(signature: np.ndarray) -> bool:
+    return bool(signature[0] == _PRIME)
+
+
+class ClusterIndex:
+    """LSH buckets of the signatures of one run: (tic, band, band bytes) -> articles."""
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, article: dict):
+        if is_empty(article['minhash']):
+            return
+        for key in band_keys(article['minhash']):
+            self.buckets.setdefault((article['tic'], *key), []).append(article)
+
+    def candidates(self, article: dict) -> list:
+        if is_empty(article['minhash']):
+            return []
+        found = {}
+        for key in band_keys(article['minhash']):
+            for other in self.buckets.get((article['tic'], *key), []):
+                found[other['event_id']] = other
+        return list(found.values())
+
+
+def assign_clusters(articles: list, index: ClusterIndex,
+                    window_hours: int = WINDOW_HOURS, threshold: float = SIMILARITY_THRESHOLD) -> list:
+    """
+    Cluster `articles` (dicts with event_id, tic, published_at and minhash, in
+    any order) against `index` and against each other. Articles that already
+    have a cluster_id keep it. Returns the articles with cluster_id,
+    is_canonical and similarity set.
+    """
+    window = timedelta(hours=window_hours)
+    for article in sorted(articles, key=lambda a: a['published_at']):
+        if article.get('cluster_id') is None:
+            best, best_similarity = None, threshold
+            for other in index.candidates(article):
+                if other['event_id'] == article['event_id'] or abs(article['published_at'] - other['published_at']) > window:
+                    continue
+                s = similarity(article['minhash'], other['minhash'])
+                if s >= best_similarity:
+                    best, best_similarity = other, s
+            if best is None:
+                article.update(cluster_id=article['event_id'], is_canonical=True, similarity=None)
+            else:
+                article.update(cluster_id=best['cluster_id'], is_canonical=False, similarity=best_similarity)
+        index.add(article)
+    return articles
+
+
+def read_new_articles(conn) -> list:
+    """core.news articles without a cluster row, or whose raw_json_sha256 changed since clustering."""
+    query = """
+        SELECT n.event_id, n.tic, n.url, n.published_at, n.title, n.content, n.raw_json_sha256,
+            c.cluster_id, c.is_canonical, c.similarity
+        FROM core.news AS n
+        LEFT JOIN core.news_clusters AS c
+            ON n.event_id = c.event_id
+        WHERE n.raw_json_sha256 IS DISTINCT FROM c.raw_json_sha256;
+    """
+    df = read_sql_query(query, conn)
+    articles = []
+    for _, row in df.iterrows():
+        article = row.to_dict()
+        article['published_at'] = pd.Timestamp(article['published_at']).to_pydatetime()
+        if pd.isna(article['cluster_id']):
+            article['cluster_id'] = None
+        article['minhash'] = minhash(f"{row['title'] or ''} {row['content'] or ''}")
+        articles.append(article)
+    return articles
+
+
+def read_window_index(conn, tics: list, start, end) -> ClusterIndex:
+    """Index of the stored signatures of `tics` published between `start` and `end`."""
+    index = ClusterIndex()
+    if not tics:
+        return index
+    query = """
+        SELECT event_id, cluster_id, tic, published_at, minhash
+        FROM core.news_clusters
+        WHERE tic = ANY(%s)
+            AND published_at BETWEEN %s AND %s;
+    """
+    df = read_sql_query(query, conn, (list(tics), start, end))
+    for _, row in df.iterrows():
+        article = row.to_dict()
+        article['published_at'] = pd.Timestamp(article['published_at']).to_pydatetime()
+        article['minhash'] = np.asarray(article['minhash'], dtype=np.int64)
+        index.add(article)
+    return index
+
+
+def to_records(articles: list) -> pd.DataFrame:
+    columns = ['event_id', 'cluster_id', 'is_canonical', 'tic', 'url', 'published_at',
+               'similarity', 'minhash', 'raw_json_sha256']
+    df = pd.DataFrame([{col: article[col] for col in columns} for article in articles], columns=columns)
+    df['minhash'] = df['minhash'].apply(lambda s: [int(v) for v in s])
+    return df
+
+
+def main():
+    """
+    Main function to cluster the new core.news articles into near-duplicate groups.
+    """
+    conn = connect_to_db()
+    if not conn:
+        print("Could not connect to database.")
+        return
+
+    articles = read_new_articles(conn)
+    if not articles:
+        print("No new news articles to cluster.")
+        conn.close()
+        return
+
+    window = timedelta(hours=WINDOW_HOURS)
+    published = [article['published_at'] for article in articles]
+    new_ids = {article['event_id'] for article in articles}
+    index = read_window_index(conn, {article['tic'] for article in articles},
+                              min(published) - window, max(published) + window)
+    # Rows being re-hashed are re-added to the index with their new signature
+    for key, bucket in index.buckets.items():
+        index.buckets[key] = [article for article in bucket if article['event_id'] not in new_ids]
+
+    articles = assign_clusters(articles, index)
+    total_records = insert_records(conn, to_records(articles), "core.news_clusters", ["event_id"], batch_size=500)
+    conn.close()
+
+    n_members = sum(not article['is_canonical'] for article in articles)
+    print(f"Total records inserted/updated in core.news_clusters: {total_records} "
+          f"({n_members} near-duplicates of an earlier article).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,11 @@
 import os
 from database.utils import connect_to_db
-from langchain_openai import OpenAIEmbeddings
+from etl.embeddings import embed_documents
 from tqdm import tqdm
 import database.config
 
-# Initialize the embedding model
+# Embedding model; requests go through the shared client and rate limiter of etl.embeddings
 embedding_model_name = os.getenv("OPENAI_EMBEDDING_MODEL")
-embedding_model = OpenAIEmbeddings(model=embedding_model_name, timeout=30, max_retries=2)
 
 # Main function to process and store embeddings
 def process_and_store_embeddings():
@@ -38,7 +37,7 @@ def process_and_store_embeddings():
                 chunk_texts = [record[6] for record in batch]
 
                 # Generate embeddings for the batch
-                embeddings = embedding_model.embed_documents(chunk_texts)
+                embeddings = embed_documents(chunk_texts, embedding_model_name)
 
                 for record, embedding in zip(batch, embeddings):
                     chunk_id = record[0]
@@ -54,9 +54,10 @@ run_task "earnings/load_earnings_transcripts.py"
 run_task "earnings/chunk_earnings_transcripts.py"
 run_task "earnings/embed_earnings_transcripts.py"
 
-# 2. News Pipeline (Load -> Chunk -> Embed)
+# 2. News Pipeline (Load -> Dedup -> Chunk -> Embed)
 log "--- Processing News ---"
 run_task "news/load_news.py"
+run_task "news/dedup_news.py"
 run_task "news/chunk_news.py"
 run_task "news/embed_news.py"
 
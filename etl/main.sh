@@ -4,6 +4,9 @@ set -e
 
 echo "🚀 Starting Winsanity ETL Pipeline..."
 
+# 0. Yearly partitions for the coming year (no-op for unpartitioned tables)
+python3 ./database/partitioning.py
+
 # 1. Extract
 bash ./etl/extract/run_extract.sh
 
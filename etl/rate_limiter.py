@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import time
+import fcntl
+import asyncio
+import tempfile
+
+# Token-bucket limits on requests and tokens per minute, per (provider, kind, model).
+# Bucket levels live in one JSON file guarded by flock, so every graph run,
+# thread and process on the host draws from the same budget: a caller takes
+# one request and its estimated tokens before each API call and sleeps only
+# for as long as the deficit takes to refill. After the call the estimate is
+# corrected with the token usage of the response, the provider's
+# x-ratelimit-* headers overwrite the limits and cap the levels, and a 429
+# blocks the bucket until the provider's reset time.
+# The ETL runs on one host, so a local file is the shared state: it costs no
+# database round trip per call and needs no extra service.
+
+STATE_FILE = os.getenv("LLM_RATE_LIMIT_FILE",
+                       os.path.join(tempfile.gettempdir(), "stock_ai_llm_rate_limits.json"))
+
+# (provider, kind) -> (requests per minute, tokens per minute) until the first
+# response headers report the account's own limits
+RATE_LIMITS = {
+    ("openai", "chat"): (int(os.getenv("OPENAI_RPM", "500")), int(os.getenv("OPENAI_TPM", "200000"))),
+    ("openai", "embedding"): (int(os.getenv("OPENAI_EMBEDDING_RPM", "3000")),
+                              int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))),
+    ("gemini", "chat"): (int(os.getenv("GEMINI_RPM", "1000")), int(os.getenv("GEMINI_TPM", "1000000"))),
+}
+
+CHARS_PER_TOKEN = 4  # prompt size estimate before the response reports the real usage
+COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "1000"))
+RATE_LIMIT_BACKOFF = 20.0  # seconds a 429 blocks the bucket when the provider gives no reset time
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+_rate_limiters = {}
+
+
+def parse_reset(value) -> float:
+    """Seconds in a reset header: '6m0s', '120ms', '1.5s' or a bare number of seconds."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parts = _DURATION.findall(str(value))
+        return sum(float(n) * _UNIT_SECONDS[unit] for n, unit in parts) if parts else None
+
+
+def estimate_tokens(texts: list) -> int:
+    """Rough token count of message contents or plain strings."""
+    chars = 0
+    for text in texts:
+        content = text if isinstance(text, str) else getattr(text, "content", None)
+        if content is None and isinstance(text, dict):
+            content = text.get("content", "")
+        chars += len(content if isinstance(content, str) else json.dumps(content, default=str))
+    return chars // CHARS_PER_TOKEN + 1
+
+
+# openai.RateLimitError and google.api_core's ResourceExhausted / TooManyRequests, by name so
+# that neither SDK is imported here
+RATE_LIMIT_ERRORS = {"RateLimitError", "ResourceExhausted", "TooManyRequests"}
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """A 429 by the error's HTTP status or its provider's rate-limit type, never by its message."""
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return status == 429 or getattr(e, "code", None) == 429 \
+        or any(cls.__name__ in RATE_LIMIT_ERRORS for cls in type(e).__mro__)
+
+
+class RateLimiter:
+    """Shared RPM/TPM buckets of one provider model."""
+
+    def __init__(self, provider: str, model: str, kind: str = "chat"):
+        self.key = f"{provider}:{kind}:{model}"
+        self.rpm, self.tpm = RATE_LIMITS[(provider, kind)]
+
+    def _update(self, fn):
+        """Refill the bucket to now and apply `fn(bucket, now)` under the file lock; returns its result."""
+        fd = os.open(STATE_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "r+") as f:
+                try:
+                    state = json.load(f)
+                except json.JSONDecodeError:
+                    state = {}
+                now = time.time()
+                bucket = state.setdefault(self.key, {"rpm": self.rpm, "tpm": self.tpm, "requests": self.rpm,
+                                                     "tokens": self.tpm, "updated": now, "blocked_until": 0})
+                elapsed = max(0.0, now - bucket["updated"])
+                bucket["requests"] = min(bucket["rpm"], bucket["requests"] + elapsed * bucket["rpm"] / 60)
+                bucket["tokens"] = min(bucket["tpm"], bucket["tokens"] + elapsed * bucket["tpm"] / 60)
+                bucket["updated"] = now
+                result = fn(bucket, now)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+            return result
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _wait(bucket: dict, now: float, tokens: int) -> float:
+        need = min(tokens, bucket["tpm"])  # a prompt above the limit waits for a full bucket only
+        return max(bucket["blocked_until"] - now,
+                   (1 - bucket["requests"]) * 60 / bucket["rpm"],
+                   (need - bucket["tokens"]) * 60 / bucket["tpm"])
+
+    def _take(self, tokens: int) -> float:
+        """Take one request and `tokens` if both are available; else the seconds until they will be."""
+        def take(bucket, now):
+            wait = self._wait(bucket, now, tokens)
+            if wait <= 0:
+                bucket["requests"] -= 1
+                bucket["tokens"] -= tokens
+            return wait
+        return self._update(take)
+
+    def wait_time(self, tokens: int) -> float:
+        """Seconds until one request and `tokens` fit in the budget (<= 0 if they fit now); takes nothing."""
+        return self._update(lambda bucket, now: self._wait(bucket, now, tokens))
+
+    def acquire(self, tokens: int):
+        """Block until one request and `tokens` fit in the budget, then take them."""
+        while (wait := self._take(tokens)) > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int):
+        """
+        acquire() for coroutines: the locked file I/O runs in a thread, and the
+        loop runs other tasks while this one waits.
+        """
+        while (wait := await asyncio.to_thread(self._take, tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, estimated: int, response):
+        """Settle the estimate against the response's token usage and rate-limit headers."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        headers = (getattr(response, "response_metadata", None) or {}).get("headers") or {}
+
+        def settle(bucket, now):
+            if usage.get("total_tokens"):
+                bucket["tokens"] -= usage["total_tokens"] - estimated
+            for kind, limit in (("requests", "rpm"), ("tokens", "tpm")):
+                if headers.get(f"x-ratelimit-limit-{kind}"):
+                    bucket[limit] = float(headers[f"x-ratelimit-limit-{kind}"])
+                if headers.get(f"x-ratelimit-remaining-{kind}"):
+                    bucket[kind] = min(bucket[kind], float(headers[f"x-ratelimit-remaining-{kind}"]))
+        self._update(settle)
+
+    def record_error(self, e: Exception):
+        """On a 429, block the bucket until the provider's retry-after or reset time."""
+        if not is_rate_limit_error(e):
+            return
+        headers = getattr(getattr(e, "response", None), "headers", None) or {}
+        retry_after_ms = parse_reset(headers.get("retry-after-ms"))
+        waits = [retry_after_ms / 1000 if retry_after_ms is not None else parse_reset(headers.get("retry-after"))]
+        if waits[0] is None:
+            waits = [parse_reset(headers.get(f"x-ratelimit-reset-{kind}")) for kind in ("requests", "tokens")]
+        wait = max((w for w in waits if w is not None), default=RATE_LIMIT_BACKOFF)
+
+        def block(bucket, now):
+            bucket["blocked_until"] = max(bucket["blocked_until"], now + wait)
+        self._update(block)
+
+
+def get_rate_limiter(provider: str, model: str, kind: str = "chat") -> RateLimiter:
+    """Shared limiter of a provider model; its buckets are shared across processes through STATE_FILE."""
+    key = (provider, model, kind)
+    if key not in _rate_limiters:
+        _rate_limiters[key] = RateLimiter(provider, model, kind)
+    return _rate_limiters[key]
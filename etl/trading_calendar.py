@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+from database.utils import read_sql_query
+
+# Exchange trading calendar shared by the ETL and analysis jobs.
+# Sessions are the distinct dates in raw.stock_ohlcv_daily, so holidays and
+# market closures come from the prices we actually have; past the last stored
+# date (and when no prices are loaded) weekdays stand in for sessions. The
+# session array is read once per process (get_calendar) and every lookup is a
+# searchsorted over it, so whole columns are mapped in one call.
+
+MARKET_TZ = 'America/New_York'
+MARKET_OPEN = pd.Timedelta(hours=9, minutes=30)
+FALLBACK_START = np.datetime64('2000-01-01', 'D')
+FALLBACK_DAYS = 366  # weekday sessions appended after the last stored date
+
+
+def _as_days(dates) -> np.ndarray:
+    """Date-likes (scalar or array) as datetime64[D]."""
+    days = pd.to_datetime(dates)
+    if isinstance(days, pd.Timestamp):
+        return np.datetime64(days, 'D')
+    return pd.DatetimeIndex(days).to_numpy(dtype='datetime64[D]')
+
+
+def _weekdays(start: np.datetime64, end: np.datetime64) -> np.ndarray:
+    """Weekday dates in [start, end)."""
+    days = np.arange(start, end, dtype='datetime64[D]')
+    return days[np.is_busday(days)]
+
+
+def to_trading_date(timestamps, cutoff: pd.Timedelta = MARKET_OPEN) -> np.ndarray:
+    """
+    Vectorized market-open attribution: timestamps before the 09:30 cutoff map to
+    the previous calendar day, later ones to their own day. Time zone-aware input
+    is converted to America/New_York first; naive input is taken as New York time.
+    Returns datetime64[D] (NaT for missing timestamps). This does not skip
+    weekends or holidays; use TradingCalendar.to_trading_date for sessions.
+    """
+    ts = pd.to_datetime(timestamps)
+    ts = pd.DatetimeIndex([ts] if isinstance(ts, pd.Timestamp) else ts)
+    if ts.tz is not None:
+        ts = ts.tz_convert(MARKET_TZ).tz_localize(None)
+    # Shifting by the cutoff moves pre-open times to the previous day in one step
+    return (ts - cutoff).to_numpy(dtype='datetime64[D]')
+
+
+class TradingCalendar:
+    """Sorted array of session dates with vectorized lookups."""
+
+    def __init__(self, sessions):
+        self.sessions = np.unique(_as_days(sessions))
+
+    @classmethod
+    def from_db(cls, conn, fallback_days: int = FALLBACK_DAYS) -> "TradingCalendar":
+        """Sessions stored in raw.stock_ohlcv_daily, followed by `fallback_days` days of weekdays."""
+        df = read_sql_query("SELECT DISTINCT date::date AS date FROM raw.stock_ohlcv_daily ORDER BY 1;", conn)
+        stored = _as_days(df['date']) if not df.empty else np.array([], dtype='datetime64[D]')
+        start = stored[-1] + 1 if len(stored) else FALLBACK_START
+        end = max(start, np.datetime64(pd.Timestamp.today().date(), 'D')) + fallback_days
+        return cls(np.concatenate([stored, _weekdays(start, end)]))
+
+    @classmethod
+    def weekdays(cls, start=FALLBACK_START, end=None) -> "TradingCalendar":
+        """Calendar of every weekday in [start, end), up to a year from today by default."""
+        end = end or np.datetime64(pd.Timestamp.today().date(), 'D') + FALLBACK_DAYS
+        return cls(_weekdays(_as_days(start), _as_days(end)))
+
+    def is_session(self, dates) -> np.ndarray:
+        days = _as_days(dates)
+        i = np.minimum(np.searchsorted(self.sessions, days), len(self.sessions) - 1)
+        return self.sessions[i] == days
+
+    def _at(self, i: np.ndarray) -> np.ndarray:
+        # Positions outside the array have no session: NaT
+        ok = (i >= 0) & (i < len(self.sessions))
+        return np.where(ok, self.sessions[np.clip(i, 0, len(self.sessions) - 1)], np.datetime64('NaT'))
+
+    def next_session(self, dates) -> np.ndarray:
+        """First session strictly after each date."""
+        return self._at(np.searchsorted(self.sessions, _as_days(dates), side='right'))
+
+    def previous_session(self, dates) -> np.ndarray:
+        """Last session strictly before each date."""
+        return self._at(np.searchsorted(self.sessions, _as_days(dates), side='left') - 1)
+
+    def rollforward(self, dates) -> np.ndarray:
+        """Each date if it is a session, else the next session."""
+        return self._at(np.searchsorted(self.sessions, _as_days(dates), side='left'))
+
+    def rollback(self, dates) -> np.ndarray:
+        """Each date if it is a session, else the previous session."""
+        return self._at(np.searchsorted(self.sessions, _as_days(dates), side='right') - 1)
+
+    def offset(self, dates, n: int) -> np.ndarray:
+        """
+        Session `n` sessions after (n > 0) or before (n < 0) each date. A date that
+        is not a session counts from the session before it when n >= 0 and the one
+        after it when n < 0: offset(saturday, 1) is Monday, offset(saturday, -1) Friday.
+        """
+        days = _as_days(dates)
+        if n >= 0:
+            i = np.searchsorted(self.sessions, days, side='right') - 1 + n
+        else:
+            i = np.searchsorted(self.sessions, days, side='left') + n
+        return self._at(i)
+
+    def sessions_between(self, start, end) -> np.ndarray:
+        """Sessions in (start, end]."""
+        lo, hi = np.searchsorted(self.sessions, [_as_days(start), _as_days(end)], side='right')
+        return self.sessions[lo:hi]
+
+    def to_trading_date(self, timestamps, roll: str = 'forward', cutoff: pd.Timedelta = MARKET_OPEN) -> np.ndarray:
+        """
+        Market-open attribution (module-level to_trading_date) snapped to a session:
+        roll='forward' maps weekend/holiday dates to the next session, 'back' to the
+        previous one, None keeps the calendar day.
+        """
+        days = to_trading_date(timestamps, cutoff)
+        if roll is None:
+            return days
+        if roll not in ('forward', 'back'):
+            raise ValueError(f"Unknown roll: {roll}")
+        snapped = self.rollforward(days) if roll == 'forward' else self.rollback(days)
+        return np.where(np.isnat(days), days, snapped)
+
+
+_CALENDARS = {}  # 'db' / 'weekdays' -> TradingCalendar
+
+
+def get_calendar(conn=None) -> TradingCalendar:
+    """
+    Process-wide calendar: read from raw.stock_ohlcv_daily on the first call
+    that passes a connection and reused afterwards; weekdays until then.
+    """
+    if conn is not None and 'db' not in _CALENDARS:
+        _CALENDARS['db'] = TradingCalendar.from_db(conn)
+    if 'db' in _CALENDARS:
+        return _CALENDARS['db']
+    if 'weekdays' not in _CALENDARS:
+        _CALENDARS['weekdays'] = TradingCalendar.weekdays()
+    return _CALENDARS['weekdays']
@@ -1,6 +1,7 @@
 from langgraph.graph import StateGraph, START, END
 from states import CompanyProfileState
-from nodes import summarize_company_profile
+from nodes import summarize_company_profile, asummarize_company_profile
+from etl.utils import llm_node
 import json
 
 
@@ -10,7 +11,7 @@ def create_graph() -> StateGraph:
     The graph has a single node: summarize_company_profile.
     """
     graph = StateGraph(CompanyProfileState)
-    graph.add_node("summarize", summarize_company_profile)
+    graph.add_node("summarize", llm_node(summarize_company_profile, asummarize_company_profile))
     graph.add_edge(START, "summarize")
     graph.add_edge("summarize", END)
     return graph
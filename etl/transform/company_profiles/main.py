@@ -4,11 +4,48 @@ from database.utils import connect_to_db, read_sql_query, insert_records
 from states import CompanyProfileState
 from graph import create_graph
 from tqdm import tqdm
-from etl.utils import fix_quotes
+import asyncio
+from etl.utils import fix_quotes, LLM_CONCURRENCY, abatch_as_completed
 
+PROFILE_COLUMNS = ["tic","name","sector","industry","country",
+                   "market_cap","employees","exchange","currency",
+                   "website","description","summary","short_summary",
+                   "raw_json_sha256"]
+# Concurrent mode writes completed profiles in batches of this many rows
+FLUSH_SIZE = 10
 
 
-def main():
+def load_records(conn, processed_data: list) -> int:
+    """Upsert finished graph states into core.stock_profiles."""
+    processed_data = pd.DataFrame(processed_data)
+    processed_data.rename(columns={"company_name": "name"}, inplace=True)
+    processed_data['summary'] = processed_data['summary'].apply(lambda x: fix_quotes(x) if isinstance(x, str) else x)
+    processed_data['short_summary'] = processed_data['short_summary'].apply(lambda x: fix_quotes(x) if isinstance(x, str) else x)
+    processed_data = processed_data[PROFILE_COLUMNS]
+    return insert_records(conn, processed_data, 'core.stock_profiles', ['tic'], batch_size=10)
+
+
+async def process_concurrently(app, states: list, conn, concurrency: int) -> int:
+    """Run the graph over `states` with `concurrency` runs in flight, writing profiles as they complete."""
+    total_records = 0
+    processed_data = []
+    async for i, final_state in abatch_as_completed(app, [state[0] for state in states], concurrency,
+                                                    desc=f"Processing company profiles (concurrency {concurrency})"):
+        if isinstance(final_state, Exception):
+            print(f"Failed to process {states[i][0].tic} after multiple retries: {final_state}")
+            raise final_state
+        final_state['raw_json_sha256'] = states[i][1]
+        processed_data.append(final_state)
+        if len(processed_data) >= FLUSH_SIZE:
+            total_records += load_records(conn, processed_data)
+            processed_data = []
+    if processed_data:
+        total_records += load_records(conn, processed_data)
+    return total_records
+
+
+
+def main(concurrency: int = LLM_CONCURRENCY):
     """Main function to execute the stock profile summarization pipeline."""
     # Connect to the database
     conn = connect_to_db()
@@ -60,6 +97,14 @@ def main():
 
     # Start timing
     start_time = time.time()
+    if concurrency > 1:
+        total_records = asyncio.run(process_concurrently(app, states, conn, concurrency))
+        conn.close()
+        end_time = time.time()
+        print(f"Processed {len(states)} records in {end_time - start_time:.2f} seconds.")
+        print(f"Total number of records is {total_records}.")
+        return
+
     processed_data = []
     retries = 3
 
@@ -83,18 +128,7 @@ def main():
     # Load processed data into core.stock_metadata
     total_records = 0
     if conn:
-        processed_data = pd.DataFrame(processed_data)
-        processed_data.rename(columns={"company_name": "name"}, inplace=True)
-        processed_data['summary'] = processed_data['summary'].apply(lambda x: fix_quotes(x) if isinstance(x, str) else x)
-        processed_data['short_summary'] = processed_data['short_summary'].apply(lambda x: fix_quotes(x) if isinstance(x, str) else x)
-        processed_data = processed_data[["tic","name","sector","industry","country",
-                                         "market_cap","employees","exchange","currency",
-                                         "website","description","summary","short_summary",
-                                         "raw_json_sha256"]]
-        
-        total_records = insert_records(conn, processed_data, 'core.stock_profiles', ['tic'], batch_size=10)
-        
-
+        total_records = load_records(conn, processed_data)
         conn.close()
 
     # End timing
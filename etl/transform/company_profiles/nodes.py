@@ -1,14 +1,10 @@
 from states import CompanyProfileState
 from prompts import SYSTEM_PROMPT, HUMAN_PROMPT
-from etl.utils import run_llm, parse_json_from_llm  # Adjust import if needed
+from etl.utils import run_llm, arun_llm, parse_json_from_llm  # Adjust import if needed
 import json
 
 
-def summarize_company_profile(state: CompanyProfileState) -> dict:
-    """
-    Calls LLM to generate both summary and short_summary for a company profile.
-    Fills the output fields in the state and returns it.
-    """
+def summary_messages(state: CompanyProfileState) -> list:
     # Prepare the prompt
     system_prompt = SYSTEM_PROMPT
     human_prompt = HUMAN_PROMPT.format(
@@ -24,13 +20,28 @@ def summarize_company_profile(state: CompanyProfileState) -> dict:
         website=state.website or "",
         description=state.description or ""
     )
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": human_prompt}
     ]
-    # Call the LLM (assume run_llm returns an object with .content)
-    response = run_llm(messages)
-    result = parse_json_from_llm(response.content)
+
+
+def summary_output(content: str) -> dict:
+    result = parse_json_from_llm(content)
     summary = result.get("summary")
     short_summary = result.get("short_summary")
     return  {"summary": summary, "short_summary": short_summary}
+
+
+def summarize_company_profile(state: CompanyProfileState) -> dict:
+    """
+    Calls LLM to generate both summary and short_summary for a company profile.
+    Fills the output fields in the state and returns it.
+    """
+    # Call the LLM (assume run_llm returns an object with .content)
+    return summary_output(run_llm(summary_messages(state), route="company_profiles.summary").content)
+
+
+async def asummarize_company_profile(state: CompanyProfileState) -> dict:
+    """Async summarize_company_profile (concurrent mode)."""
+    return summary_output((await arun_llm(summary_messages(state), route="company_profiles.summary")).content)
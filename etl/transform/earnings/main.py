@@ -2,14 +2,16 @@ import pandas as pd
 from psycopg import connect
 from typing import Dict
 
-from sklearn import metrics
-
 from database.utils import connect_to_db, insert_records, read_sql_query
-from etl.utils import calculate_capped_rate, calculate_streak
+from etl.transform.metrics.batch_engine import ticker_filter
+from etl.transform.metrics.ratio_kernels import as_float, capped_rate
+from etl.transform.metrics.regime_kernels import group_positions, shift, rolling_sum, streak, \
+    eps_regime, surprise_class, surprise_regime
 
-def read_earnings(conn, tic: str) -> pd.DataFrame:
+def read_earnings(conn, tic: str = None) -> pd.DataFrame:
     """
-    Fetch earnings data for a specific ticker from the core.earnings table.
+    Fetch earnings data for a specific ticker (every ticker when tic is None)
+    from the core.earnings table.
 
     Args:
         conn: Database connection object.
@@ -27,10 +29,11 @@ def read_earnings(conn, tic: str) -> pd.DataFrame:
         ON e.tic = r.tic
             AND e.calendar_year = r.calendar_year
             AND e.calendar_quarter = r.calendar_quarter       
-        WHERE e.tic = '{tic}' 
+        JOIN core.stock_profiles AS sp ON e.tic = sp.tic
+        WHERE {ticker_filter(tic, 'e.tic')}
             AND e.eps IS NOT NULL 
             AND e.revenue IS NOT NULL
-        ORDER BY e.calendar_year, e.calendar_quarter;
+        ORDER BY e.tic, e.calendar_year, e.calendar_quarter;
     """
     # query = f"""
     #     SELECT e.event_id, e.tic, e.calendar_year, e.calendar_quarter,
@@ -57,57 +60,36 @@ def read_earnings(conn, tic: str) -> pd.DataFrame:
 
 
 
-def classify_eps_regime(df: pd.DataFrame) -> pd.DataFrame:
+def classify_eps_regime(df: pd.DataFrame, by: str = None) -> pd.DataFrame:
     """
     Classify EPS regime based on the direction and sign transition of EPS.
 
     Args:
-        df: DataFrame containing EPS and previous EPS data.
+        df: DataFrame containing EPS data, in time order within each `by` group.
+        by: Group column (e.g. 'tic') when df holds several tickers.
 
     Returns:
-        pd.Series: Series containing EPS regime classifications.
+        pd.DataFrame: df with the eps_regime column added.
     """
-    
-    df['eps_lag1'] = df['eps'].shift(1)
-    column = "eps_regime"
-
-    def eps_regime_logic(row: pd.Series) -> str:
-        eps, eps_prev = row['eps'], row['eps_lag1']
-        if pd.isnull(eps) or pd.isnull(eps_prev):
-            return 'unknown'
-        if eps_prev < 0 < eps:
-            return 'turnaround'
-        if eps_prev > 0 > eps:
-            return 'profit to loss'
-        if eps < 0 and eps_prev < 0 and eps > eps_prev:
-            return 'loss narrowing'
-        if eps < 0 and eps_prev < 0 and eps < eps_prev:
-            return 'loss widening'
-        if eps > 0 and eps_prev > 0 and eps > eps_prev:
-            return 'positive growth'
-        if eps > 0 and eps_prev > 0 and eps < eps_prev:
-            return 'profit decline'
-        if abs(eps - eps_prev) / max(abs(eps), abs(eps_prev), 1e-6) <= 0.05:
-            return 'flat'
-        return 'unknown'
-    
-    df[column] = df.apply(eps_regime_logic, axis=1)
-    df.drop(columns=['eps_lag1'], inplace=True)
+    eps = as_float(df['eps'])
+    df['eps_regime'] = eps_regime(eps, shift(eps, group_positions(df, by), 1))
     return df
 
 
 
-def compute_surprise_metrics(df: pd.DataFrame, prefix: str) -> pd.DataFrame:
-    
+def compute_surprise_metrics(df: pd.DataFrame, prefix: str, by: str = None) -> pd.DataFrame:
+    pos = group_positions(df, by)
+
     # Surprise Percentage
-    df[f'{prefix}_surprise'] = df.apply(lambda row: calculate_capped_rate(row[f'{prefix}'], row[f'{prefix}_estimated']), axis=1)
+    df[f'{prefix}_surprise'] = capped_rate(df[f'{prefix}'], df[f'{prefix}_estimated'])
 
     # Beat Count (Last 4 Quarters)
-    df[f'{prefix}_beat_flag'] = (df[f'{prefix}_surprise'] > 0).astype(int)
-    df[f'{prefix}_beat_count_4q'] = df[f'{prefix}_beat_flag'].fillna(0).rolling(window=4, min_periods=1).sum().astype(int)
+    beat_flag = (df[f'{prefix}_surprise'] > 0).astype(int)
+    df[f'{prefix}_beat_flag'] = beat_flag
+    df[f'{prefix}_beat_count_4q'] = rolling_sum(beat_flag.to_numpy(dtype=float), pos, window=4, min_periods=1).astype(int)
     
     # Beat Streak Length
-    df[f'{prefix}_beat_streak_length'] = calculate_streak(df[f'{prefix}_beat_flag'])
+    df[f'{prefix}_beat_streak_length'] = streak(beat_flag.to_numpy(dtype=float), pos).astype(int)
 
     return df
 
@@ -126,26 +108,7 @@ def compute_surprise_classification(df: pd.DataFrame, prefix: str) -> pd.DataFra
     class_column = f'{prefix}_surprise_class'
     surprise_column = f'{prefix}_surprise'
 
-    def classification_logic(surprise: float) -> str:
-        if pd.isnull(surprise):
-            return 'unknown'
-        if surprise >= 0.10:
-            return 'major beat'
-        elif 0.03 <= surprise < 0.10:
-            return 'moderate beat'
-        elif 0.01 <= surprise < 0.03:
-            return 'slight beat'
-        elif 0.0 <= surprise < 0.01:
-            return 'in-line (positive)'
-        elif -0.01 <= surprise < 0.0:
-            return 'in-line (negative)'
-        elif -0.05 <= surprise < -0.01:
-            return 'slight miss'
-        elif surprise < -0.05:
-            return 'major miss'
-        else:
-            return 'unknown'
-    df[class_column] = df[surprise_column].apply(classification_logic)
+    df[class_column] = surprise_class(as_float(df[surprise_column]))
 
     return df
 
@@ -154,27 +117,7 @@ def compute_surprise_regime(df: pd.DataFrame, prefix: str) -> pd.DataFrame:
     streak_column = f'{prefix}_beat_streak_length'
     regime_column = f'{prefix}_surprise_regime'
 
-    def regime_logic(row: pd.Series) -> str:
-        if pd.isnull(row[count_column]) or pd.isnull(row[streak_column]):
-            return 'unknown'
-        count = row[count_column]
-        streak = row[streak_column]
-        
-        if count >= 3 and streak >= 3:
-            return 'consistent outperform'
-        elif count >= 3 and 1 <= streak <= 2:
-            return 'frequent beat'
-        elif count == 3 and streak == 0:
-            return 'broken beat streak'
-        elif count == 2 and streak == 2:
-            return 'emerging beat'
-        elif count == 2 and streak < 2:
-            return 'mixed performance'
-        elif count <= 1 and streak <= 1:
-            return 'consistent miss'
-        else:
-            return 'unknown'
-    df[regime_column] = df.apply(regime_logic, axis=1)
+    df[regime_column] = surprise_regime(as_float(df[count_column]), as_float(df[streak_column]))
     return df
         
     
@@ -186,22 +129,16 @@ def main():
     # Connect to the database
     conn = connect_to_db()
     if conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT tic FROM core.stock_profiles;")
-        tics = cursor.fetchall()
-        for tic in tics:
-            tic = tic[0]
-            df = read_earnings(conn, tic)
-            df = classify_eps_regime(df)
-
-            for prefix in ['eps', 'revenue']:
-                df = compute_surprise_metrics(df, prefix)
-                df = compute_surprise_classification(df, prefix)
-                df = compute_surprise_regime(df, prefix)
-
- 
-            total_records = insert_records(conn, df, "core.earnings_metrics", ["tic", "calendar_year", "calendar_quarter"])
-            print(f"Inserted/Updated {total_records} records into core.earnings_metrics for {tic}.")
+        df = read_earnings(conn)
+        df = classify_eps_regime(df, by='tic')
+
+        for prefix in ['eps', 'revenue']:
+            df = compute_surprise_metrics(df, prefix, by='tic')
+            df = compute_surprise_classification(df, prefix)
+            df = compute_surprise_regime(df, prefix)
+
+        total_records = insert_records(conn, df, "core.earnings_metrics", ["tic", "calendar_year", "calendar_quarter"])
+        print(f"Inserted/Updated {total_records} records into core.earnings_metrics for {df['tic'].nunique()} tickers.")
         conn.close()
         # Display one record as a dictionary
         # record = df.iloc[-1].to_dict()
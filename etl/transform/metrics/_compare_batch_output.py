@@ -0,0 +1,69 @@
+"""Golden comparison: per-ticker transform_records vs the single-batch universe run."""
+import sys
+import os
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import pandas as pd
+from database.utils import connect_to_db, read_sql_query
+from etl.transform.metrics.batch_engine import read_universe_tickers
+from etl.transform.metrics.valuation import compute_valuation_metrics
+from etl.transform.metrics.profitability import compute_profitability_metrics
+from etl.transform.metrics.growth import compute_growth_metrics
+from etl.transform.metrics.efficiency import compute_efficiency_metrics
+from etl.transform.metrics.financial_health import compute_financial_health_metrics
+
+# ─── PARAMETERS (change these to test other tickers) ──────────────
+TICKERS = None  # None = every ticker in core.stock_profiles
+MODULES = {
+    "valuation": compute_valuation_metrics,
+    "profitability": compute_profitability_metrics,
+    "growth": compute_growth_metrics,
+    "efficiency": compute_efficiency_metrics,
+    "financial_health": compute_financial_health_metrics,
+}
+# ──────────────────────────────────────────────────────────────────
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values(['tic', 'date']).reset_index(drop=True)
+    metric_cols = [c for c in df.columns if c not in ('tic', 'date')]
+    return df.astype({c: float for c in metric_cols})
+
+
+conn = connect_to_db()
+if conn is None:
+    sys.exit(1)
+
+tickers = TICKERS or read_universe_tickers(conn)
+start_dates = read_sql_query("""
+    SELECT tic, MIN(earnings_date)::date AS start_date
+    FROM core.balance_sheets_quarterly
+    GROUP BY tic;
+""", conn).set_index('tic')['start_date']
+
+failures = 0
+for name, module in MODULES.items():
+    print("\n" + "=" * 80)
+    print(f"{name.upper()}")
+    print("=" * 80)
+
+    per_ticker = pd.concat([
+        module.transform_records(conn, tic, start_dates[tic])
+        for tic in tickers if tic in start_dates.index
+    ])
+    batch = module.transform_records(conn)
+    batch = batch[batch['tic'].isin(tickers)]
+
+    per_ticker = _normalize(per_ticker)
+    batch = _normalize(batch)
+    try:
+        pd.testing.assert_frame_equal(per_ticker, batch, check_exact=True)
+        print(f"✅ Identical: {len(batch)} rows x {batch.shape[1]} columns")
+    except AssertionError as e:
+        failures += 1
+        print(f"❌ Mismatch: {e}")
+
+conn.close()
+sys.exit(1 if failures else 0)
@@ -0,0 +1,58 @@
+"""Golden comparison: incremental transform_records (lookback-limited loads) vs the full-history batch run."""
+import sys
+import os
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import pandas as pd
+from database.utils import connect_to_db
+from etl.transform.metrics.valuation import compute_valuation_metrics
+from etl.transform.metrics.growth import compute_growth_metrics
+from etl.transform.metrics.efficiency import compute_efficiency_metrics
+from etl.transform.metrics.financial_health import compute_financial_health_metrics
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+RESUME_DAYS = [1, 30, 400]  # pretend the last run stopped this many days before each ticker's latest price
+RTOL = 1e-12  # rolling sums over a shorter history differ in the last ulp
+MODULES = {
+    "valuation": compute_valuation_metrics,
+    "growth": compute_growth_metrics,
+    "efficiency": compute_efficiency_metrics,
+    "financial_health": compute_financial_health_metrics,
+}
+# ──────────────────────────────────────────────────────────────────
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values(['tic', 'date']).reset_index(drop=True)
+    metric_cols = [c for c in df.columns if c not in ('tic', 'date')]
+    return df.astype({c: float for c in metric_cols})
+
+
+conn = connect_to_db()
+if conn is None:
+    sys.exit(1)
+
+failures = 0
+for name, module in MODULES.items():
+    print("\n" + "=" * 80)
+    print(f"{name.upper()}")
+    print("=" * 80)
+
+    full = module.transform_records(conn)
+    last_dates = full.groupby('tic')['date'].max()
+    for days in RESUME_DAYS:
+        start_dates = last_dates - pd.Timedelta(days=days)
+        incremental = module.transform_records(conn, start_dates=start_dates)
+        expected = full[full['date'] >= full['tic'].map(start_dates)]
+        try:
+            pd.testing.assert_frame_equal(_normalize(expected), _normalize(incremental),
+                                          check_exact=False, rtol=RTOL, atol=0)
+            print(f"✅ Resume {days}d back: {len(incremental)} of {len(full)} rows recomputed, identical")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ Resume {days}d back: mismatch: {e}")
+
+conn.close()
+sys.exit(1 if failures else 0)
@@ -0,0 +1,100 @@
+"""Randomized equivalence check: ratio_kernels vs the row-wise lambdas they replaced."""
+import sys
+import os
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import numpy as np
+import pandas as pd
+from etl.utils import calculate_capped_rate
+from etl.transform.metrics.ratio_kernels import mask, safe_divide, positive_divide, growth_rate, cagr, capped_rate
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_TRIALS = 200
+N_ROWS = 500
+SEED = 7
+# ──────────────────────────────────────────────────────────────────
+
+
+def _random_column(rng, n):
+    """Floats mixed with NaN, exact zeros, negatives and tiny magnitudes."""
+    values = rng.normal(0, 1, n) * 10.0 ** rng.integers(-8, 10, n)
+    kind = rng.random(n)
+    values[kind < 0.1] = np.nan
+    values[(kind >= 0.1) & (kind < 0.2)] = 0.0
+    values[(kind >= 0.2) & (kind < 0.25)] = rng.normal(0, 1e-7, ((kind >= 0.2) & (kind < 0.25)).sum())
+    return values
+
+
+def _row_reference(fn, *cols):
+    """Apply a scalar rule row by row, the way df.apply(axis=1) did."""
+    return np.array([_scalar(fn(*vals)) for vals in zip(*cols)], dtype=float)
+
+
+def _scalar(value):
+    # Lambdas returned None/complex in places; both were stored as NULL
+    if value is None or isinstance(value, complex):
+        return np.nan
+    return float(value)
+
+
+# Reference rules, copied from the lambdas in the metric modules
+REFERENCE = {
+    "safe_divide": (
+        lambda a, b: float(a) / float(b) if pd.notna(a) and pd.notna(b) and b != 0 else np.nan,
+        lambda a, b: safe_divide(a, b),
+    ),
+    "positive_divide": (
+        lambda a, b: float(a) / float(b) if b and b > 0 else np.nan,
+        lambda a, b: positive_divide(a, b),
+    ),
+    "ev_positive_divide": (
+        lambda a, b: float(a) / float(b) if a and b > 0 else np.nan,
+        lambda a, b: mask(positive_divide(a, b), a != 0),
+    ),
+    "growth_rate": (
+        lambda a, b: (a - b) / abs(b) if pd.notna(a) and pd.notna(b) and b != 0 else np.nan,
+        lambda a, b: growth_rate(a, b),
+    ),
+    "cagr_3y": (
+        lambda a, b: (float(a) / float(b)) ** (1/3) - 1 if pd.notna(a) and pd.notna(b) and b > 0 else np.nan,
+        lambda a, b: cagr(a, b, 3),
+    ),
+    "cagr_5y": (
+        lambda a, b: (float(a) / float(b)) ** (1/5) - 1 if pd.notna(a) and pd.notna(b) and b > 0 else np.nan,
+        lambda a, b: cagr(a, b, 5),
+    ),
+    "capped_rate": (
+        calculate_capped_rate,
+        lambda a, b: capped_rate(a, b),
+    ),
+    "cash_runway_months": (
+        lambda a, b: float(a) / (abs(float(b)) / 12) if pd.notna(a) and pd.notna(b) and b < 0 else np.nan,
+        lambda a, b: mask(safe_divide(a, np.abs(b) / 12), b < 0),
+    ),
+}
+
+
+rng = np.random.default_rng(SEED)
+failures = 0
+for name, (reference_fn, kernel_fn) in REFERENCE.items():
+    worst = 0.0
+    for _ in range(N_TRIALS):
+        a = _random_column(rng, N_ROWS)
+        b = _random_column(rng, N_ROWS)
+        with np.errstate(all='ignore'):
+            expected = _row_reference(reference_fn, a, b)
+            actual = kernel_fn(a, b)
+        same_nan = np.isnan(expected) == np.isnan(actual)
+        both = ~np.isnan(expected) & ~np.isnan(actual)
+        rel = np.abs(actual[both] - expected[both]) / np.maximum(np.abs(expected[both]), 1e-300)
+        worst = max(worst, rel.max() if rel.size else 0.0)
+        if not same_nan.all() or worst > 1e-12:
+            failures += 1
+            print(f"❌ {name}: NaN pattern or values differ (max rel err {worst:.2e})")
+            break
+    else:
+        print(f"✅ {name}: {N_TRIALS} x {N_ROWS} rows match (max rel err {worst:.2e})")
+
+sys.exit(1 if failures else 0)
@@ -0,0 +1,714 @@
+"""Randomized equivalence check: regime_kernels-based GSA and earnings metrics (one grouped call) vs the per-ticker row-wise originals."""
+import sys
+import os
+import time
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import numpy as np
+import pandas as pd
+from etl.utils import calculate_capped_rate, calculate_streak
+from etl.transform.metrics.ratio_kernels import capped_rate
+from etl.transform.metrics.gsa_framework import compute_growth_metrics as growth
+from etl.transform.metrics.gsa_framework import compute_stability_metrics as stability
+from etl.transform.metrics.gsa_framework import compute_accel_metrics as accel
+from etl.transform.earnings import main as earnings
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_TICKERS = 200
+MAX_QUARTERS = 40
+SEEDS = [0, 1]
+RTOL = 1e-10  # pandas' running-sum rolling std drifts ~1e-12 after large values; the kernels compute each window directly
+# ──────────────────────────────────────────────────────────────────
+
+
+# ─── Reference: original gsa_framework/compute_growth_metrics.py ──
+def calculate_growth(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate year-over-year growth for a specified column. Assumes data is sorted ascendingly by time.
+    4 periods ago is used for comparison.
+    """
+
+    
+    column_yoy_name = f"{column}_yoy_growth"
+    column_qoq_name = f"{column}_qoq_growth"
+    column_ttm_name = f"{column}_ttm_growth"
+    column_lag_1 = f"{column}_lag_1"
+    column_lag_4 = f"{column}_lag_4"
+    column_ttm = f"{column}_ttm"
+    column_ttm_lag_4 = f"{column}_ttm_lag_4"
+
+    df[column_lag_1] = df[column].shift(1)
+    df[column_lag_4] = df[column].shift(4)
+    
+
+
+    # Handle division by zero or NaNs for calculating YoY growth
+    df[column_yoy_name] = capped_rate(df[column], df[column_lag_4])
+    df[column_qoq_name] = capped_rate(df[column], df[column_lag_1])
+    
+    # Drop intermediate columns
+    df.drop(columns=[column_lag_1, column_lag_4], inplace=True)
+
+
+    # Create flags for positive growth; 1 if positive or zero, 0 if negative, NaN remains NaN
+    def get_positive_flag(value: float) -> int:
+        if pd.isna(value):
+            return np.nan
+        elif value > 0:
+            return 1
+        else:
+            return 0
+
+    flag_yoy_column = f"{column}_yoy_positive_flag"
+    df[flag_yoy_column] = df[column_yoy_name].apply(get_positive_flag)
+
+    flag_qoq_column = f"{column}_qoq_positive_flag"
+    df[flag_qoq_column] = df[column_qoq_name].apply(get_positive_flag)
+
+    if ttm:
+        df[column_ttm_lag_4] = df[column_ttm].shift(4)
+        df[column_ttm_name] = capped_rate(df[column_ttm], df[column_ttm_lag_4])
+        df.drop(columns=[column_ttm_lag_4], inplace=True)
+        flag_ttm_column = f"{column}_ttm_positive_flag"
+        df[flag_ttm_column] = df[column_ttm_name].apply(get_positive_flag)
+
+    return df
+
+
+def calculate_count_4q(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate the count of positive year-over-year growth periods for a specified column over the last 4 quarters.
+    """
+    flag_yoy_column = f"{column}_yoy_positive_flag"
+    count_yoy_column = f"{column}_yoy_count_4q"
+    flag_qoq_column = f"{column}_qoq_positive_flag"
+    count_qoq_column = f"{column}_qoq_count_4q"
+    flag_ttm_column = f"{column}_ttm_positive_flag"
+    count_ttm_column = f"{column}_ttm_count_4q"
+
+    # Calculate count of positive YoY growth over the last 4 periods
+    # output NaN if one of the 4 periods is NaN
+    df[count_yoy_column] = df[flag_yoy_column].rolling(window=4, min_periods=4).apply(lambda x: x.sum() if not x.isnull().any() else np.nan, raw=False)
+    # Calculate count of positive QoQ growth over the last 4 periods
+    df[count_qoq_column] = df[flag_qoq_column].rolling(window=4, min_periods=1).apply(lambda x: x.sum() if not x.isnull().any() else np.nan, raw=False)
+    if ttm:
+        # Calculate count of positive TTM growth over the last 4 periods
+        df[count_ttm_column] = df[flag_ttm_column].rolling(window=4, min_periods=1).apply(lambda x: x.sum() if not x.isnull().any() else np.nan, raw=False)
+
+    return df
+
+
+def calculate_streak_length(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate the length of the current streak of positive values for a specified column.
+    """
+    flag_yoy_column = f"{column}_yoy_positive_flag"
+    streak_yoy_column = f"{column}_yoy_streak_length"
+    flag_qoq_column = f"{column}_qoq_positive_flag"
+    streak_qoq_column = f"{column}_qoq_streak_length"
+    flag_ttm_column = f"{column}_ttm_positive_flag"
+    streak_ttm_column = f"{column}_ttm_streak_length"
+
+    df[streak_yoy_column] = calculate_streak(df[flag_yoy_column], on_value=1)
+    df[streak_qoq_column] = calculate_streak(df[flag_qoq_column], on_value=1)
+    if ttm:
+        df[streak_ttm_column] = calculate_streak(df[flag_ttm_column], on_value=1)
+
+    return df
+
+
+def calculate_yoy_growth_flag(df: pd.DataFrame, column: str, score_regime: list[float], ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate a boolean flag indicating whether year-over-year growth is positive for a specified column.
+    """
+    column_yoy_name = f"{column}_yoy_growth"
+    class_yoy_column = f"{column}_yoy_growth_class"
+    column_qoq_name = f"{column}_qoq_growth"
+    class_qoq_column = f"{column}_qoq_growth_class"
+    column_ttm_name = f"{column}_ttm_growth"
+    class_ttm_column = f"{column}_ttm_growth_class"
+
+    # 0 if YoY growth < score_regime[0], (Deep contraction)
+    # 1 if between score_regime[0] and score_regime[1], (Mild contraction)
+    # 2 if between score_regime[1] and score_regime[2], (Moderate growth)
+    # 3 if between score_regime[2] and score_regime[3], (Strong growth)
+    # 4 if greater than or equal to score_regime[3], (Very strong growth)
+    def get_growth_class(value: float) -> str:
+        if pd.isna(value):
+            return None
+        elif value < score_regime[0]:
+            return "deep contraction"
+        elif value < score_regime[1]:
+            return "mild contraction"
+        elif value < score_regime[2]:
+            return "moderate growth"
+        elif value < score_regime[3]:
+            return "strong growth"
+        else:
+            return "very strong growth"
+    df[class_yoy_column] = df[column_yoy_name].apply(get_growth_class)
+    df[class_qoq_column] = df[column_qoq_name].apply(get_growth_class)
+    if ttm:
+        df[class_ttm_column] = df[column_ttm_name].apply(get_growth_class)
+
+    return df
+
+
+def compute_growth_regime(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Compute growth regimes for a specified column.
+    """
+    count_yoy_column = f"{column}_yoy_count_4q"
+    streak_yoy_column = f"{column}_yoy_streak_length"
+    regime_yoy_column = f"{column}_yoy_growth_regime"
+    count_qoq_column = f"{column}_qoq_count_4q"
+    streak_qoq_column = f"{column}_qoq_streak_length"
+    regime_qoq_column = f"{column}_qoq_growth_regime"
+    count_ttm_column = f"{column}_ttm_count_4q"
+    streak_ttm_column = f"{column}_ttm_streak_length"
+    regime_ttm_column = f"{column}_ttm_growth_regime"
+
+    # 0 if growth_count_4q >= 3 and growth_streak_len >= 3 -> "Sustained Expansion"
+    # 1 if growth_count_4q >= 3 and growth_streak_len < 3 -> "Developing Expansion"
+    # 2 if growth_count_4q == 2 -> "Volatile Transition"
+    # 3 if growth_count_4q <= 1 and growth_streak_len <= 1 -> "Tentative Turnaround"
+    # 4 if growth_count_4q == 0 and growth_streak_len == 0 -> "Persistent Contraction"
+    def get_growth_regime(value_count: int, value_streak: int) -> str:
+        if pd.isna(value_count) or pd.isna(value_streak):
+            return None
+        elif value_count >= 3 and value_streak >= 3:
+            return "sustained expansion"
+        elif value_count >= 3 and 1 <= value_streak < 3:
+            return "developing expansion"
+        elif value_count >= 3 and value_streak == 0:
+            return "broken growth streak"
+        elif value_count == 2 and value_streak == 2:
+            return "emerging growth"
+        elif value_count == 2:
+            return "volatile growth"
+        elif value_count == 1 and value_streak == 1:
+            return "tentative turnaround"
+        elif value_count <= 1 and value_streak == 0:
+            return "persistent contraction"
+
+    df[regime_yoy_column] = df.apply(lambda x: get_growth_regime(x[count_yoy_column], x[streak_yoy_column]), axis=1)
+    df[regime_qoq_column] = df.apply(lambda x: get_growth_regime(x[count_qoq_column], x[streak_qoq_column]), axis=1)
+    if ttm:
+        df[regime_ttm_column] = df.apply(lambda x: get_growth_regime(x[count_ttm_column], x[streak_ttm_column]), axis=1)
+
+    return df  
+
+
+def compute_growth_metrics(df: pd.DataFrame, column: str, score_regime: list[float], ttm: bool = True) -> pd.DataFrame:
+    """
+    Compute all growth metrics for a specified column.
+    """
+    df = calculate_growth(df, column, ttm=ttm)
+    df = calculate_count_4q(df, column, ttm=ttm)
+    df = calculate_streak_length(df, column, ttm=ttm)
+    df = calculate_yoy_growth_flag(df, column, score_regime, ttm=ttm)
+    df = compute_growth_regime(df, column, ttm=ttm)
+    return df
+
+
+# ─── Reference: original gsa_framework/compute_stability_metrics.py
+def calculate_volatility(df: pd.DataFrame, column: str, threshold: float, ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate the volatility of year-over-year growth for a specified column over a rolling window.
+    """
+    growth_yoy_column = f"{column}_yoy_growth"
+    volatility_yoy_column = f"{column}_yoy_volatility_4q"
+    volatility_yoy_flag_column = f"{column}_yoy_volatility_flag"
+    growth_qoq_column = f"{column}_qoq_growth"
+    volatility_qoq_column = f"{column}_qoq_volatility_4q"
+    volatility_qoq_flag_column = f"{column}_qoq_volatility_flag"
+    growth_ttm_column = f"{column}_ttm_growth"
+    volatility_ttm_column = f"{column}_ttm_volatility_4q"
+    volatility_ttm_flag_column = f"{column}_ttm_volatility_flag"
+
+    # Calculate rolling standard deviation of YoY growth over a 4-period window excluding the current period
+    # Note: if it has NaN in the window, the result will be NaN
+    df[volatility_yoy_column] = df[growth_yoy_column].shift(1).rolling(window=4).std()
+    df.loc[df[growth_yoy_column].isna(), volatility_yoy_column] = np.nan
+    # Assign volatility flag based on threshold; NaNs remain NaN
+    df[volatility_yoy_flag_column] = df[volatility_yoy_column].apply(lambda x: 0 if x < threshold else 1)
+    df.loc[df[growth_yoy_column].isna(), volatility_yoy_flag_column] = np.nan
+
+
+    # Calculate rolling standard deviation of QoQ growth over a 4-period window excluding the current period
+    df[volatility_qoq_column] = df[growth_qoq_column].shift(1).rolling(window=4).std()
+    df.loc[df[growth_qoq_column].isna(), volatility_qoq_column] = np.nan
+    # Assign volatility flag based on threshold
+    df[volatility_qoq_flag_column] = df[volatility_qoq_column].apply(lambda x: 0 if x < threshold else 1)
+    df.loc[df[growth_qoq_column].isna(), volatility_qoq_flag_column] = np.nan
+
+    if ttm:
+        # Calculate rolling standard deviation of TTM growth over a 4-period window excluding the current period
+        df[volatility_ttm_column] = df[growth_ttm_column].shift(1).rolling(window=4).std()
+        df.loc[df[growth_ttm_column].isna(), volatility_ttm_column] = np.nan
+        # Assign volatility flag based on threshold
+        df[volatility_ttm_flag_column] = df[volatility_ttm_column].apply(lambda x: 0 if x < threshold/2 else 1)
+        df.loc[df[growth_ttm_column].isna(), volatility_ttm_flag_column] = np.nan
+
+
+    return df
+
+
+
+def compute_volatility_regime(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate the count of volatile periods for a specified column over the last 4 quarters.
+    """
+    growth_yoy_column = f"{column}_yoy_growth"
+    volatility_yoy_column = f"{column}_yoy_volatility_4q"
+    volatility_yoy_flag_column = f"{column}_yoy_volatility_flag"
+    drift_yoy_column = f"{column}_yoy_growth_drift"
+    outlier_yoy_flag_column = f"{column}_yoy_outlier_flag"
+    regime_yoy_column = f"{column}_yoy_stability_regime"
+
+    growth_qoq_column = f"{column}_qoq_growth"
+    volatility_qoq_column = f"{column}_qoq_volatility_4q"
+    volatility_qoq_flag_column = f"{column}_qoq_volatility_flag"
+    drift_qoq_column = f"{column}_qoq_growth_drift"
+    outlier_qoq_flag_column = f"{column}_qoq_outlier_flag"
+    regime_qoq_column = f"{column}_qoq_stability_regime"
+
+    growth_ttm_column = f"{column}_ttm_growth"
+    volatility_ttm_column = f"{column}_ttm_volatility_4q"
+    volatility_ttm_flag_column = f"{column}_ttm_volatility_flag"
+    drift_ttm_column = f"{column}_ttm_growth_drift"
+    outlier_ttm_flag_column = f"{column}_ttm_outlier_flag"
+    regime_ttm_column = f"{column}_ttm_stability_regime"
+
+   # Calculate drift as the mean of YoY growth over the past 4 periods excluding the current period
+    df[drift_yoy_column] = df[growth_yoy_column].shift(1).rolling(window=4).mean()
+    df.loc[df[growth_yoy_column].isna(), drift_yoy_column] = np.nan
+    df[drift_qoq_column] = df[growth_qoq_column].shift(1).rolling(window=4).mean()
+    df.loc[df[growth_qoq_column].isna(), drift_qoq_column] = np.nan
+
+
+    # Identify outliers where the absolute drift exceeds the 1.5 * volatility
+    df[outlier_yoy_flag_column] = df.apply(lambda x: 1 if abs(x[drift_yoy_column]) > 1.5 * x[volatility_yoy_column] else 0, axis=1)
+    df[outlier_qoq_flag_column] = df.apply(lambda x: 1 if abs(x[drift_qoq_column]) > 1.5 * x[volatility_qoq_column] else 0, axis=1)
+
+    df.loc[df[growth_yoy_column].isna(), outlier_yoy_flag_column] = np.nan
+    df.loc[df[growth_qoq_column].isna(), outlier_qoq_flag_column] = np.nan
+
+
+    # Determine stability regime based on volatility and outlier flags
+    # if volatility is low and no outlier → Stable
+    # if volatility is low and outlier → Stable but Disturbed
+    # if volatility is high → Volatile
+    # if volatility is low and drift < -0.02 → Structurally Deteriorating
+
+    def get_stability_regime(volatility_flag, outlier_flag, drift) -> str:
+        if np.isnan(volatility_flag) or np.isnan(outlier_flag) or np.isnan(drift):
+            return np.nan
+        if volatility_flag == 0:
+            if outlier_flag == 0:
+                if drift < -0.02:
+                    return "structurally deteriorating"
+                else:
+                    return "stable"
+            else:
+                return "stable but disturbed"
+        else:
+            return "volatile"
+    df[regime_yoy_column] = df.apply(lambda row: 
+                                     get_stability_regime(row[volatility_yoy_flag_column], 
+                                                          row[outlier_yoy_flag_column], 
+                                                          row[drift_yoy_column]), axis=1)
+    df[regime_qoq_column] = df.apply(lambda row: 
+                                     get_stability_regime(row[volatility_qoq_flag_column], 
+                                                          row[outlier_qoq_flag_column], 
+                                                          row[drift_qoq_column]), axis=1)
+    
+    if ttm:
+        df[drift_ttm_column] = df[growth_ttm_column].shift(1).rolling(window=4).mean()
+        df.loc[df[growth_ttm_column].isna(), drift_ttm_column] = np.nan
+        df[outlier_ttm_flag_column] = df.apply(lambda x: 1 if abs(x[drift_ttm_column]) > 1.5 * x[volatility_ttm_column] else 0, axis=1)
+        df.loc[df[growth_ttm_column].isna(), outlier_ttm_flag_column] = np.nan
+        df[regime_ttm_column] = df.apply(lambda row: 
+                                        get_stability_regime(row[volatility_ttm_flag_column], 
+                                                            row[outlier_ttm_flag_column], 
+                                                            row[drift_ttm_column]), axis=1)
+
+    return df
+
+def compute_stability_metrics(df: pd.DataFrame, column: str, volatility_threshold: float, ttm: bool = True) -> pd.DataFrame:
+    """
+    Compute stability metrics for a specified column in the DataFrame.
+    """
+    df = calculate_volatility(df, column, volatility_threshold, ttm=ttm)
+    df = compute_volatility_regime(df, column, ttm=ttm)
+    return df
+
+
+# ─── Reference: original gsa_framework/compute_accel_metrics.py ───
+def calculate_acceleration(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate the difference of year-over-year growth percentages to determine acceleration.
+    """
+    growth_yoy_name = f"{column}_yoy_growth"
+    accel_yoy_column = f"{column}_yoy_accel"
+    growth_qoq_name = f"{column}_qoq_growth"
+    accel_qoq_column = f"{column}_qoq_accel"
+    growth_ttm_name = f"{column}_ttm_growth"
+    accel_ttm_column = f"{column}_ttm_accel"
+
+    df[accel_yoy_column] = df[growth_yoy_name].astype(float) - df[growth_yoy_name].shift(1).astype(float)
+    df[accel_qoq_column] = df[growth_qoq_name].astype(float) - df[growth_qoq_name].shift(1).astype(float)
+    if ttm:
+        df[accel_ttm_column] = df[growth_ttm_name].astype(float) - df[growth_ttm_name].shift(1).astype(float)
+
+    return df
+
+
+def calculate_accel_count_4q(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate the count of positive acceleration periods for a specified column over the last 4 quarters.
+    """
+    accel_yoy_column = f"{column}_yoy_accel"
+    count_yoy_column = f"{column}_yoy_accel_count_4q"
+    accel_yoy_flag_column = f"{column}_yoy_accel_positive_flag" 
+    accel_qoq_column = f"{column}_qoq_accel"
+    count_qoq_column = f"{column}_qoq_accel_count_4q"
+    accel_qoq_flag_column = f"{column}_qoq_accel_positive_flag"
+    accel_ttm_column = f"{column}_ttm_accel"
+    count_ttm_column = f"{column}_ttm_accel_count_4q"
+    accel_ttm_flag_column = f"{column}_ttm_accel_positive_flag"
+
+    # Create a flag for positive acceleration
+    df[accel_yoy_flag_column] = (df[accel_yoy_column] > 0).astype(int)
+    df[accel_qoq_flag_column] = (df[accel_qoq_column] > 0).astype(int)
+    
+    df.loc[df[accel_yoy_column].isna(), accel_yoy_flag_column] = np.nan
+    df.loc[df[accel_qoq_column].isna(), accel_qoq_flag_column] = np.nan
+    
+
+    # Calculate count of positive acceleration over the last 4 periods
+    df[count_yoy_column] = df[accel_yoy_flag_column].fillna(0).rolling(window=4, min_periods=1).sum().astype(int)
+    df[count_qoq_column] = df[accel_qoq_flag_column].fillna(0).rolling(window=4, min_periods=1).sum().astype(int)
+    
+    df.loc[df[accel_yoy_flag_column].isna(), count_yoy_column] = np.nan
+    df.loc[df[accel_qoq_flag_column].isna(), count_qoq_column] = np.nan
+    
+    if ttm:
+        df[accel_ttm_flag_column] = (df[accel_ttm_column] > 0).astype(int)
+        df.loc[df[accel_ttm_column].isna(), accel_ttm_flag_column] = np.nan
+        df[count_ttm_column] = df[accel_ttm_flag_column].fillna(0).rolling(window=4, min_periods=1).sum().astype(int)
+        df.loc[df[accel_ttm_flag_column].isna(), count_ttm_column] = np.nan
+
+    return df
+
+def calculate_accel_streak_length(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Calculate the length of the current streak of positive acceleration for a specified column.
+    """
+    accel_yoy_column = f"{column}_yoy_accel"
+    streak_yoy_column = f"{column}_yoy_accel_streak_length"
+    accel_yoy_flag_column = f"{column}_yoy_accel_positive_flag"
+    accel_qoq_column = f"{column}_qoq_accel"
+    streak_qoq_column = f"{column}_qoq_accel_streak_length"
+    accel_qoq_flag_column = f"{column}_qoq_accel_positive_flag"
+    accel_ttm_column = f"{column}_ttm_accel"
+    streak_ttm_column = f"{column}_ttm_accel_streak_length"
+    accel_ttm_flag_column = f"{column}_ttm_accel_positive_flag"
+
+
+    # Calculate streak length using the utility function
+    df[streak_yoy_column] = calculate_streak(df[accel_yoy_flag_column])
+    df[streak_qoq_column] = calculate_streak(df[accel_qoq_flag_column])
+    if ttm:
+        df[streak_ttm_column] = calculate_streak(df[accel_ttm_flag_column])
+
+    return df
+
+def compute_accel_regime(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Compute acceleration regime based on acceleration and volatility metrics.
+    """
+    accel_yoy_count_column = f"{column}_yoy_accel_count_4q"
+    streak_yoy_length_column = f"{column}_yoy_accel_streak_length"
+    accel_yoy_regime_column = f"{column}_yoy_accel_regime"
+    accel_qoq_count_column = f"{column}_qoq_accel_count_4q"
+    streak_qoq_length_column = f"{column}_qoq_accel_streak_length"
+    accel_qoq_regime_column = f"{column}_qoq_accel_regime"
+    accel_ttm_count_column = f"{column}_ttm_accel_count_4q"
+    streak_ttm_length_column = f"{column}_ttm_accel_streak_length"
+    accel_ttm_regime_column = f"{column}_ttm_accel_regime"
+
+
+    # Acceleration Regime Table:
+    # 0 if accel_count_4q >= 3 and streak_length >= 2 → Sustained Acceleration
+    # 1 if accel_count_4q >= 3 and streak_length < 2 → Choppy Acceleration
+    # 2 if accel_count_4q = 2 and streak_length = 2 → Emerging Acceleration
+    # 3 if accel_count_4q = 2 and streak_length < 2 → Unstable Momentum
+    # 4 if accel_count_4q < 2 → Deceleration
+    def accel_regime_logic(accel_count, streak_length) -> str:
+        if np.isnan(accel_count) or np.isnan(streak_length):
+            return np.nan
+
+        if accel_count >= 3:
+            if streak_length >= 2:
+                return "sustained acceleration"
+            elif streak_length >= 1:
+                return "choppy acceleration"
+            else:
+                return "broken acceleration streak"
+        elif accel_count == 2:
+            if streak_length == 2:
+                return "emerging acceleration"
+            else:
+                return "unstable momentum"
+        elif accel_count == 1 and streak_length == 1:
+            return "broken deceleration streak"
+        else:
+            return "persistent deceleration"
+
+    df[accel_yoy_regime_column] = df.apply(lambda row:
+                                           accel_regime_logic(row[accel_yoy_count_column], row[streak_yoy_length_column]), axis=1)
+    df[accel_qoq_regime_column] = df.apply(lambda row:
+                                           accel_regime_logic(row[accel_qoq_count_column], row[streak_qoq_length_column]), axis=1)
+    if ttm:
+        df[accel_ttm_regime_column] = df.apply(lambda row:
+                                            accel_regime_logic(row[accel_ttm_count_column], row[streak_ttm_length_column]), axis=1)
+    return df
+
+
+def compute_accel_metrics(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+    """
+    Compute all acceleration metrics for a specified column.
+    """
+    df = calculate_acceleration(df, column, ttm=ttm)
+    df = calculate_accel_count_4q(df, column, ttm=ttm)
+    df = calculate_accel_streak_length(df, column, ttm=ttm)
+    df = compute_accel_regime(df, column, ttm=ttm)
+    return df
+
+
+# ─── Reference: original etl/transform/earnings/main.py ───────────
+def classify_eps_regime(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Classify EPS regime based on the direction and sign transition of EPS.
+
+    Args:
+        df: DataFrame containing EPS and previous EPS data.
+
+    Returns:
+        pd.Series: Series containing EPS regime classifications.
+    """
+    
+    df['eps_lag1'] = df['eps'].shift(1)
+    column = "eps_regime"
+
+    def eps_regime_logic(row: pd.Series) -> str:
+        eps, eps_prev = row['eps'], row['eps_lag1']
+        if pd.isnull(eps) or pd.isnull(eps_prev):
+            return 'unknown'
+        if eps_prev < 0 < eps:
+            return 'turnaround'
+        if eps_prev > 0 > eps:
+            return 'profit to loss'
+        if eps < 0 and eps_prev < 0 and eps > eps_prev:
+            return 'loss narrowing'
+        if eps < 0 and eps_prev < 0 and eps < eps_prev:
+            return 'loss widening'
+        if eps > 0 and eps_prev > 0 and eps > eps_prev:
+            return 'positive growth'
+        if eps > 0 and eps_prev > 0 and eps < eps_prev:
+            return 'profit decline'
+        if abs(eps - eps_prev) / max(abs(eps), abs(eps_prev), 1e-6) <= 0.05:
+            return 'flat'
+        return 'unknown'
+    
+    df[column] = df.apply(eps_regime_logic, axis=1)
+    df.drop(columns=['eps_lag1'], inplace=True)
+    return df
+
+
+
+def compute_surprise_metrics(df: pd.DataFrame, prefix: str) -> pd.DataFrame:
+    
+    # Surprise Percentage
+    df[f'{prefix}_surprise'] = df.apply(lambda row: calculate_capped_rate(row[f'{prefix}'], row[f'{prefix}_estimated']), axis=1)
+
+    # Beat Count (Last 4 Quarters)
+    df[f'{prefix}_beat_flag'] = (df[f'{prefix}_surprise'] > 0).astype(int)
+    df[f'{prefix}_beat_count_4q'] = df[f'{prefix}_beat_flag'].fillna(0).rolling(window=4, min_periods=1).sum().astype(int)
+    
+    # Beat Streak Length
+    df[f'{prefix}_beat_streak_length'] = calculate_streak(df[f'{prefix}_beat_flag'])
+
+    return df
+
+def compute_surprise_classification(df: pd.DataFrame, prefix: str) -> pd.DataFrame:
+    """
+    | **Range (surprise)** | **Class** | **Meaning / Signal** |
+    |:--|:--|:--|
+    | ≥ **+10%** | **Major Beat** | Exceptional outperformance — significantly above expectations. |
+    | **+3% to +10%** | **Moderate Beat** | Clear upside surprise — strong positive signal. |
+    | **+1% to +3%** | **Slight Beat** | Mild outperformance — modest but positive result. |
+    | **−1% to +1%** | **In-Line** | Effectively met expectations — neutral, within noise tolerance. |
+    | **−5% to −1%** | **Slight Miss** | Small shortfall — mild underperformance. |
+    | ≤ **−5%** | **Major Miss** | Clear disappointment — significant underperformance. |
+    """
+
+    class_column = f'{prefix}_surprise_class'
+    surprise_column = f'{prefix}_surprise'
+
+    def classification_logic(surprise: float) -> str:
+        if pd.isnull(surprise):
+            return 'unknown'
+        if surprise >= 0.10:
+            return 'major beat'
+        elif 0.03 <= surprise < 0.10:
+            return 'moderate beat'
+        elif 0.01 <= surprise < 0.03:
+            return 'slight beat'
+        elif 0.0 <= surprise < 0.01:
+            return 'in-line (positive)'
+        elif -0.01 <= surprise < 0.0:
+            return 'in-line (negative)'
+        elif -0.05 <= surprise < -0.01:
+            return 'slight miss'
+        elif surprise < -0.05:
+            return 'major miss'
+        else:
+            return 'unknown'
+    df[class_column] = df[surprise_column].apply(classification_logic)
+
+    return df
+
+def compute_surprise_regime(df: pd.DataFrame, prefix: str) -> pd.DataFrame:
+    count_column = f'{prefix}_beat_count_4q'
+    streak_column = f'{prefix}_beat_streak_length'
+    regime_column = f'{prefix}_surprise_regime'
+
+    def regime_logic(row: pd.Series) -> str:
+        if pd.isnull(row[count_column]) or pd.isnull(row[streak_column]):
+            return 'unknown'
+        count = row[count_column]
+        streak = row[streak_column]
+        
+        if count >= 3 and streak >= 3:
+            return 'consistent outperform'
+        elif count >= 3 and 1 <= streak <= 2:
+            return 'frequent beat'
+        elif count == 3 and streak == 0:
+            return 'broken beat streak'
+        elif count == 2 and streak == 2:
+            return 'emerging beat'
+        elif count == 2 and streak < 2:
+            return 'mixed performance'
+        elif count <= 1 and streak <= 1:
+            return 'consistent miss'
+        else:
+            return 'unknown'
+    df[regime_column] = df.apply(regime_logic, axis=1)
+    return df
+
+
+# ─── Comparison ───────────────────────────────────────────────────
+
+def random_quarters(seed: int) -> pd.DataFrame:
+    """Quarterly values for many tickers with NaNs, zeros, sign flips and repeated values."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(N_TICKERS):
+        n = int(rng.integers(1, MAX_QUARTERS + 1))
+        value = rng.normal(1.0, 1.0, n) * 10 ** rng.integers(0, 4)
+        value[rng.random(n) < 0.08] = np.nan
+        value[rng.random(n) < 0.05] = 0.0
+        repeat = rng.random(n) < 0.1
+        value[1:][repeat[1:]] = value[:-1][repeat[1:]]
+        estimated = value * (1 + rng.normal(0, 0.05, n))
+        estimated[rng.random(n) < 0.05] = np.nan
+        frames.append(pd.DataFrame({
+            'tic': f"T{i:04d}", 'calendar_year': 2000 + np.arange(n) // 4, 'calendar_quarter': np.arange(n) % 4 + 1,
+            'revenue': value, 'eps': value / 100, 'revenue_estimated': estimated, 'eps_estimated': estimated / 100,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def reference_gsa(df: pd.DataFrame) -> pd.DataFrame:
+    out = []
+    for _, g in df.groupby('tic', sort=False):
+        g = g.copy()
+        g['revenue_ttm'] = g['revenue'].rolling(window=4).sum()
+        g = compute_growth_metrics(g, column="revenue", score_regime=[-0.1, 0, 0.1, 0.3])
+        g = compute_stability_metrics(g, column="revenue", volatility_threshold=0.05)
+        g = compute_accel_metrics(g, column="revenue")
+        out.append(g)
+    return pd.concat(out)
+
+
+def kernel_gsa(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df['revenue_ttm'] = df.groupby('tic', sort=False)['revenue'].rolling(window=4).sum().reset_index(level=0, drop=True)
+    df = growth.compute_growth_metrics(df, column="revenue", score_regime=[-0.1, 0, 0.1, 0.3], by='tic')
+    df = stability.compute_stability_metrics(df, column="revenue", volatility_threshold=0.05, by='tic')
+    df = accel.compute_accel_metrics(df, column="revenue", by='tic')
+    return df
+
+
+def reference_earnings(df: pd.DataFrame) -> pd.DataFrame:
+    out = []
+    for _, g in df.groupby('tic', sort=False):
+        g = classify_eps_regime(g.copy())
+        for prefix in ['eps', 'revenue']:
+            g = compute_surprise_metrics(g, prefix)
+            g = compute_surprise_classification(g, prefix)
+            g = compute_surprise_regime(g, prefix)
+        out.append(g)
+    return pd.concat(out)
+
+
+def kernel_earnings(df: pd.DataFrame) -> pd.DataFrame:
+    df = earnings.classify_eps_regime(df.copy(), by='tic')
+    for prefix in ['eps', 'revenue']:
+        df = earnings.compute_surprise_metrics(df, prefix, by='tic')
+        df = earnings.compute_surprise_classification(df, prefix)
+        df = earnings.compute_surprise_regime(df, prefix)
+    return df
+
+
+def compare(expected: pd.DataFrame, actual: pd.DataFrame) -> list:
+    """Columns that differ; labels compare exactly (None and NaN both count as missing)."""
+    mismatches = []
+    if set(expected.columns) != set(actual.columns):
+        mismatches.append(f"columns {sorted(set(expected.columns) ^ set(actual.columns))}")
+    for col in expected.columns.intersection(actual.columns):
+        a, b = expected[col].reset_index(drop=True), actual[col].reset_index(drop=True)
+        numeric = pd.api.types.is_numeric_dtype(a) or pd.api.types.is_numeric_dtype(b)
+        if numeric and not (a.isna().all() and b.isna().all()):
+            a, b = a.astype(float).to_numpy(), b.astype(float).to_numpy()
+            same = np.isclose(a, b, rtol=RTOL, atol=0) | (np.isnan(a) & np.isnan(b))
+        else:
+            same = (a.isna() & b.isna()) | (a == b)
+        if not same.all():
+            mismatches.append(f"{col} ({int((~same).sum())} rows)")
+    return mismatches
+
+
+failures = 0
+for seed in SEEDS:
+    df = random_quarters(seed)
+    for name, reference, kernel in [("gsa", reference_gsa, kernel_gsa),
+                                    ("earnings", reference_earnings, kernel_earnings)]:
+        t0 = time.perf_counter()
+        expected = reference(df)
+        t1 = time.perf_counter()
+        actual = kernel(df)
+        t2 = time.perf_counter()
+        mismatches = compare(expected, actual)
+        if mismatches:
+            failures += 1
+            print(f"❌ seed {seed} {name}: mismatch in {', '.join(mismatches)}")
+        else:
+            print(f"✅ seed {seed} {name}: {len(df)} rows identical; "
+                  f"row-wise {t1 - t0:.2f}s, kernels {t2 - t1:.3f}s ({(t1 - t0) / (t2 - t1):.0f}x)")
+
+sys.exit(1 if failures else 0)
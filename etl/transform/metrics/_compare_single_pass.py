@@ -0,0 +1,56 @@
+"""Golden comparison: each Phase 2 module run on its own vs the shared-bundle run_metrics chunks."""
+import sys
+import os
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import pandas as pd
+from database.utils import connect_to_db
+from etl.transform.metrics.batch_engine import read_universe_tickers
+from etl.transform.metrics.run_metrics import QUARTERLY_JOBS, DAILY_JOBS, transform_chunk
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+CHUNK_SIZES = [0, 50]  # 0 = the whole universe as one bundle
+# ──────────────────────────────────────────────────────────────────
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    keys = ['tic', 'date'] if 'date' in df.columns else ['tic', 'calendar_year', 'calendar_quarter']
+    return df.sort_values(keys).reset_index(drop=True)
+
+
+conn = connect_to_db()
+if conn is None:
+    sys.exit(1)
+
+standalone = {job: module.transform_records(module.read_records(conn)) for job, module in QUARTERLY_JOBS.items()}
+standalone.update({job: module.transform_records(conn) for job, module in DAILY_JOBS.items()})
+tickers = read_universe_tickers(conn)
+
+failures = 0
+for chunk_size in CHUNK_SIZES:
+    print("\n" + "=" * 80)
+    print(f"CHUNK SIZE {chunk_size or 'universe'}")
+    print("=" * 80)
+
+    chunks = [None] if not chunk_size else [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+    parts = {job: [] for job in standalone}
+    for chunk in chunks:
+        outputs, memory = transform_chunk(conn, chunk)
+        for job, (_, df, _) in outputs.items():
+            parts[job].append(df)
+    print(f"Last bundle: {memory / 2**20:,.1f} MB")
+
+    for job, expected in standalone.items():
+        expected = _normalize(expected)
+        single_pass = _normalize(pd.concat(parts[job]))[expected.columns]
+        try:
+            pd.testing.assert_frame_equal(expected, single_pass, check_exact=True)
+            print(f"✅ {job}: identical, {len(single_pass)} rows")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {job}: mismatch: {e}")
+
+conn.close()
+sys.exit(1 if failures else 0)
@@ -0,0 +1,217 @@
+from contextlib import contextmanager
+from database.utils import read_sql_query
+import pandas as pd
+from etl.utils import convert_decimals_to_float
+
+# Shared loaders and window helpers for the Phase 2 metric modules.
+# Every helper takes `tic`: a ticker string reproduces the original per-ticker
+# queries, while tic=None loads the whole universe in one query so the rolling,
+# shift and merge_asof steps run once across all tickers (grouped by 'tic').
+# A list of tickers loads that chunk of the universe the same way.
+# Incremental runs pass `start_dates` (tic -> first date to emit) instead, so
+# only the new days and the quarterly lookback behind them are loaded.
+# Inside bundle_cache() every loader result is memoized by its query, so jobs
+# run back to back in one process (run_metrics.py) share a single read.
+
+QUARTERLY_KEY_COLUMNS = ['earnings_date', 'calendar_year', 'calendar_quarter']
+# Quarters kept at or before each start date: the 5y-ago TTM windows need 24,
+# the rest is headroom for forward-filled estimate growth rates
+QUARTERLY_LOOKBACK = 28
+
+
+_BUNDLE = None  # (loader, query, params) -> DataFrame while a bundle_cache() is open
+
+
+def ticker_filter(tic=None, column: str = 'tic') -> str:
+    """SQL predicate restricting `column` to one ticker or a list of tickers, or TRUE for the universe."""
+    if tic is None:
+        return "TRUE"
+    if isinstance(tic, str):
+        return f"{column} = '{tic}'"
+    tickers = ", ".join(f"'{t}'" for t in tic)
+    return f"{column} IN ({tickers})" if tickers else "FALSE"
+
+
+@contextmanager
+def bundle_cache():
+    """Memoize loader results until the block exits; yields the cache dict."""
+    global _BUNDLE
+    _BUNDLE = {}
+    try:
+        yield _BUNDLE
+    finally:
+        _BUNDLE = None
+
+
+def cached(loader: str, query: str, params, load) -> pd.DataFrame:
+    """
+    load() unless bundle_cache() already holds the result of the same loader,
+    query and params. Callers get a copy, so modules can add columns freely.
+    """
+    if _BUNDLE is None:
+        return load()
+    key = (loader, query, repr(params))
+    if key not in _BUNDLE:
+        _BUNDLE[key] = load()
+    return _BUNDLE[key].copy()
+
+
+def bundle_memory() -> int:
+    """Bytes held by the open bundle_cache() (0 when none is open)."""
+    if not _BUNDLE:
+        return 0
+    return int(sum(df.memory_usage(deep=True).sum() for df in _BUNDLE.values()))
+
+
+def start_dates_cte(start_dates: pd.Series) -> tuple:
+    """
+    SQL for a `start_dates (tic, start_date)` relation built from a tic-indexed
+    Series, plus the query params it needs.
+    """
+    cte = """
+        start_dates AS (
+            SELECT unnest(%s::text[]) AS tic, unnest(%s::date[]) AS start_date
+        )
+    """
+    params = (list(start_dates.index), [pd.Timestamp(d).date() for d in start_dates.values])
+    return cte, params
+
+
+def read_universe_tickers(conn) -> list:
+    """Tickers processed by the metric modules, in core.stock_profiles order."""
+    df = read_sql_query("SELECT tic FROM core.stock_profiles;", conn)
+    return df['tic'].tolist()
+
+
+def read_close_prices(conn, tic: str = None, date: str = None,
+                      start_dates: pd.Series = None) -> pd.DataFrame:
+    """
+    Daily close prices sorted by date.
+    For the universe, each ticker starts at its first balance sheet earnings date,
+    matching the start date the per-ticker loop passes in, or at its entry in
+    `start_dates` for incremental runs.
+    """
+    params = None
+    if start_dates is not None:
+        cte, params = start_dates_cte(start_dates)
+        # The constant lower bound lets a date-partitioned table skip the older years
+        params = params + (min(params[1], default=None),)
+        close_price_query = f"""
+            WITH {cte}
+            SELECT p.tic, p.date::date, p.close AS close_price
+            FROM raw.stock_ohlcv_daily AS p
+            JOIN start_dates AS s ON p.tic = s.tic
+            WHERE p.date::date >= s.start_date AND p.date >= %s::date
+            ORDER BY p.tic, p.date;
+        """
+    elif isinstance(tic, str):
+        close_price_query = f"""
+            SELECT tic, date::date, close AS close_price
+            FROM raw.stock_ohlcv_daily
+            WHERE tic = '{tic}' AND date::date >= '{date}'::date
+            ORDER BY date;
+        """
+    else:
+        close_price_query = f"""
+            WITH start_dates AS (
+                SELECT tic, MIN(earnings_date)::date AS start_date
+                FROM core.balance_sheets_quarterly
+                GROUP BY tic
+            )
+            SELECT p.tic, p.date::date, p.close AS close_price
+            FROM raw.stock_ohlcv_daily AS p
+            JOIN start_dates AS s ON p.tic = s.tic
+            JOIN core.stock_profiles AS sp ON p.tic = sp.tic
+            WHERE p.date::date >= s.start_date AND {ticker_filter(tic, 'p.tic')}
+            ORDER BY p.tic, p.date;
+        """
+
+    def load():
+        df = read_sql_query(close_price_query, conn, params)
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.sort_values('date', kind='mergesort').reset_index(drop=True)
+        return convert_decimals_to_float(df)
+    return cached('close_prices', close_price_query, params, load)
+
+
+def read_quarterly(conn, table: str, columns: str, tic=None, where: str = None,
+                   start_dates: pd.Series = None) -> pd.DataFrame:
+    """
+    Quarterly statement rows keyed by (tic, earnings_date), sorted per ticker
+    so that rolling/shift windows can be computed with groupby('tic').
+    `tic` is one ticker, a list of tickers, or None for the universe.
+    With `start_dates`, only the QUARTERLY_LOOKBACK quarters at or before each
+    ticker's start date are kept, plus every later quarter.
+    """
+    params = None
+    if start_dates is not None:
+        cte, params = start_dates_cte(start_dates)
+        query = f"""
+            WITH {cte},
+            quarters AS (
+                SELECT t.tic, t.calendar_year, t.calendar_quarter, t.earnings_date::date AS earnings_date,
+                       {columns},
+                       COUNT(*) FILTER (WHERE t.earnings_date::date <= s.start_date)
+                           OVER (PARTITION BY t.tic ORDER BY t.earnings_date DESC) AS quarters_back
+                FROM {table} AS t
+                JOIN start_dates AS s ON t.tic = s.tic
+                WHERE {where or 'TRUE'}
+            )
+            SELECT *
+            FROM quarters
+            WHERE quarters_back <= {QUARTERLY_LOOKBACK}
+            ORDER BY tic, earnings_date;
+        """
+    else:
+        query = f"""
+            SELECT tic, calendar_year, calendar_quarter, earnings_date::date,
+                   {columns}
+            FROM {table}
+            WHERE {ticker_filter(tic)}{f' AND {where}' if where else ''}
+            ORDER BY tic, earnings_date;
+        """
+
+    def load():
+        df = read_sql_query(query, conn, params)
+        df = df.drop(columns=['quarters_back'], errors='ignore')
+        df['earnings_date'] = pd.to_datetime(df['earnings_date'])
+        df = df.sort_values(['tic', 'earnings_date'], kind='mergesort').reset_index(drop=True)
+        return convert_decimals_to_float(df)
+    return cached('quarterly', query, params, load)
+
+
+def rolling_sum(df: pd.DataFrame, col: str, window: int = 4) -> pd.Series:
+    """Per-ticker trailing sum (TTM for window=4)."""
+    if df.empty:
+        return pd.Series(index=df.index, dtype=float)
+    return (df.groupby('tic', sort=False)[col]
+              .rolling(window=window).sum()
+              .reset_index(level=0, drop=True))
+
+
+def shift(df: pd.DataFrame, col: str, periods: int) -> pd.Series:
+    """Per-ticker shift; positive periods look back, negative look forward."""
+    return df.groupby('tic', sort=False)[col].shift(periods)
+
+
+def ffill(df: pd.DataFrame, col: str) -> pd.Series:
+    """Per-ticker forward fill, so values never leak into the next ticker."""
+    return df.groupby('tic', sort=False)[col].ffill()
+
+
+def merge_quarterly(df: pd.DataFrame, frames: list) -> pd.DataFrame:
+    """
+    As-of join each quarterly frame onto the daily price frame by ticker,
+    taking the latest quarter with earnings_date <= date.
+    """
+    for frame in frames:
+        df = pd.merge_asof(
+                df, frame.sort_values('earnings_date', kind='mergesort'),
+                left_on="date",
+                right_on="earnings_date",
+                by="tic",
+                direction="backward",
+                allow_exact_matches=True
+            )
+        df = df.drop(columns=QUARTERLY_KEY_COLUMNS)
+    return df
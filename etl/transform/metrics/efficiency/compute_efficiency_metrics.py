@@ -3,141 +3,58 @@ import pandas as pd
 import yfinance as yf
 import numpy as np
 from etl.utils import convert_decimals_to_float
-
-def transform_records(conn, tic: str, date: str) -> pd.DataFrame:
+from etl.transform.metrics.batch_engine import ticker_filter, read_close_prices, merge_quarterly
+from etl.transform.metrics.fundamentals.compute_fundamentals_ttm import read_fundamentals
+from etl.transform.metrics.ratio_kernels import mask, safe_divide
+from etl.transform.metrics.incremental import INCREMENTAL, QUARTERLY_FINGERPRINT, plan_incremental, describe_plan, load_with_watermarks
+
+JOB = 'core.efficiency_metrics'
+# Upstream rows that force a full recompute when they change (employees feeds revenue_per_employee)
+SOURCES = {
+    'core.balance_sheets_quarterly': QUARTERLY_FINGERPRINT,
+    'core.income_statements_quarterly': QUARTERLY_FINGERPRINT,
+    'core.cash_flow_statements_quarterly': QUARTERLY_FINGERPRINT,
+    'core.stock_profiles': "employees::text",
+}
+
+def transform_records(conn, tic: str = None, date: str = None,
+                      start_dates: pd.Series = None) -> pd.DataFrame:
+    """
+    Compute efficiency metrics for one ticker starting at `date`, or for every
+    ticker in a single batch when tic is None.
+    `start_dates` (tic -> first date) limits an incremental run to the new days.
+    """
     market_cap_query = f"""
         SELECT tic, market_cap, employees
         FROM core.stock_profiles
-        WHERE tic = '{tic}'
-        LIMIT 1;
+        WHERE {ticker_filter(tic)};
     """
     df_market_cap = read_sql_query(market_cap_query, conn)
     df_market_cap = convert_decimals_to_float(df_market_cap)
-    employees = df_market_cap.at[0, 'employees'] if not df_market_cap.empty else np.nan
-
-    close_price_query = f"""
-        SELECT tic, date::date, close AS close_price
-        FROM raw.stock_ohlcv_daily
-        WHERE tic = '{tic}' AND date::date >= '{date}'::date
-        ORDER BY date;
-    """
-    df = read_sql_query(close_price_query, conn)
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date')
-    df = convert_decimals_to_float(df)
-
-
-    balance_sheet_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date, total_assets,
-            total_debt, total_equity, cash_and_short_term_investments,
-            net_ppe, accounts_receivable, accounts_payable, inventory
-        FROM core.balance_sheets_quarterly
-        WHERE tic = '{tic}'
-        ORDER BY earnings_date;
-    """
-    df_balance_sheet = read_sql_query(balance_sheet_query, conn)
-    df_balance_sheet['earnings_date'] = pd.to_datetime(df_balance_sheet['earnings_date'])
-    df_balance_sheet = df_balance_sheet.sort_values('earnings_date')
-    df_balance_sheet = convert_decimals_to_float(df_balance_sheet)
-
-    df_balance_sheet['total_assets_avg'] = (df_balance_sheet['total_assets'] + df_balance_sheet.shift(4)['total_assets']) / 2
-    df_balance_sheet['net_ppe_avg'] = (df_balance_sheet['net_ppe'] + df_balance_sheet.shift(4)['net_ppe']) / 2
-    df_balance_sheet['accounts_receivable_avg'] = (df_balance_sheet['accounts_receivable'] + df_balance_sheet.shift(4)['accounts_receivable']) / 2
-    df_balance_sheet['accounts_payable_avg'] = (df_balance_sheet['accounts_payable'] + df_balance_sheet.shift(4)['accounts_payable']) / 2
-    df_balance_sheet['inventory_avg'] = (df_balance_sheet['inventory'] + df_balance_sheet.shift(4)['inventory']) / 2
-
-    income_statement_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date,
-               eps, revenue, ebit, ebitda, gross_profit, 
-               net_income, operating_expenses, cost_of_revenue,
-               income_tax_expense, income_before_tax
-        FROM core.income_statements_quarterly
-        WHERE tic = '{tic}'
-        ORDER BY earnings_date;
-    """
-    df_income = read_sql_query(income_statement_query, conn)
-    df_income['earnings_date'] = pd.to_datetime(df_income['earnings_date'])
-    df_income = df_income.sort_values('earnings_date')
-    df_income = convert_decimals_to_float(df_income)
-
-    df_income['revenue_ttm'] = df_income['revenue'].rolling(window=4).sum()
-    df_income['operating_expenses_ttm'] = df_income['operating_expenses'].rolling(window=4).sum()
-    df_income['cost_of_revenue_ttm'] = df_income['cost_of_revenue'].rolling(window=4).sum()
-
-    cash_flow_statement_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date,
-               free_cash_flow as fcf, operating_cash_flow as ocf
-        FROM core.cash_flow_statements_quarterly
-        WHERE tic = '{tic}' 
-        ORDER BY earnings_date;
-    """
-    df_cash_flow = read_sql_query(cash_flow_statement_query, conn)
-    df_cash_flow['earnings_date'] = pd.to_datetime(df_cash_flow['earnings_date'])
-    df_cash_flow = df_cash_flow.sort_values('earnings_date')
-    df_cash_flow = convert_decimals_to_float(df_cash_flow)
-
-    df_cash_flow['fcf_ttm'] = df_cash_flow['fcf'].rolling(window=4).sum()
-    df_cash_flow['ocf_ttm'] = df_cash_flow['ocf'].rolling(window=4).sum()
-    
-    df = pd.merge_asof(
-            df, df_balance_sheet,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
-    df = pd.merge_asof(
-            df, df_income,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
-    df = pd.merge_asof(
-            df, df_cash_flow,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
-
-    df['asset_turnover'] = df.apply(
-        lambda row: float(row['revenue_ttm']) / float(row['total_assets_avg'])
-        if pd.notna(row['revenue_ttm']) and pd.notna(row['total_assets_avg']) and row['total_assets_avg'] != 0 else np.nan, axis=1
-    )
-    df['fixed_asset_turnover'] = df.apply(
-        lambda row: float(row['revenue_ttm']) / float(row['net_ppe_avg'])
-        if pd.notna(row['revenue_ttm']) and pd.notna(row['net_ppe_avg']) and row['net_ppe_avg'] != 0 else np.nan, axis=1
-    )
-    df['revenue_per_employee'] = df.apply(
-        lambda row: float(row['revenue_ttm']) / float(employees)
-        if pd.notna(row['revenue_ttm']) and employees and employees != 0 else np.nan, axis=1
-    )
-    df['opex_ratio'] = df.apply(
-        lambda row: float(row['operating_expenses_ttm']) / float(row['revenue_ttm'])
-        if pd.notna(row['operating_expenses_ttm']) and pd.notna(row['revenue_ttm']) and row['revenue_ttm'] != 0 else np.nan, axis=1
-    )
-    df['dso'] = df.apply(
-        lambda row: (float(row['accounts_receivable_avg']) / float(row['revenue_ttm'])) * 365
-        if pd.notna(row['accounts_receivable_avg']) and row['accounts_receivable_avg'] != 0 \
-            and pd.notna(row['revenue_ttm']) and row['revenue_ttm'] != 0 else np.nan, axis=1
-    )
-    df['dio'] = df.apply(
-        lambda row: (float(row['inventory_avg']) / float(row['cost_of_revenue_ttm'])) * 365
-        if pd.notna(row['inventory_avg']) and row['inventory_avg'] != 0 \
-            and pd.notna(row['cost_of_revenue_ttm']) and row['cost_of_revenue_ttm'] != 0 else np.nan, axis=1
-    )
-    df['dpo'] = df.apply(
-        lambda row: (float(row['accounts_payable_avg']) / float(row['cost_of_revenue_ttm'])) * 365
-        if pd.notna(row['accounts_payable_avg']) and row['accounts_payable_avg'] != 0 \
-            and pd.notna(row['cost_of_revenue_ttm']) and row['cost_of_revenue_ttm'] != 0 else np.nan, axis=1
-    )
+    # First profile row per ticker, as the per-ticker LIMIT 1 query did
+    employees_by_tic = df_market_cap.drop_duplicates('tic').set_index('tic')['employees']
+
+    df = read_close_prices(conn, tic, date, start_dates)
+    quarters = read_fundamentals(conn, {
+        'balance_sheet': ['total_assets_avg', 'net_ppe_avg', 'accounts_receivable_avg',
+                          'accounts_payable_avg', 'inventory_avg'],
+        'income': [('revenue_gaap_ttm', 'revenue_ttm'), 'operating_expenses_ttm', 'cost_of_revenue_ttm'],
+    }, tic, start_dates)
+
+    df = merge_quarterly(df, list(quarters.values()))
+    df['employees'] = df['tic'].map(employees_by_tic)
+
+    df['asset_turnover'] = safe_divide(df['revenue_ttm'], df['total_assets_avg'])
+    df['fixed_asset_turnover'] = safe_divide(df['revenue_ttm'], df['net_ppe_avg'])
+    df['revenue_per_employee'] = safe_divide(df['revenue_ttm'], df['employees'])
+    df['opex_ratio'] = safe_divide(df['operating_expenses_ttm'], df['revenue_ttm'])
+    # Day-count ratios are left empty when the working-capital balance is zero
+    df['dso'] = mask(safe_divide(df['accounts_receivable_avg'], df['revenue_ttm']) * 365,
+                     df['accounts_receivable_avg'] != 0)
+    df['dio'] = mask(safe_divide(df['inventory_avg'], df['cost_of_revenue_ttm']) * 365,
+                     df['inventory_avg'] != 0)
+    df['dpo'] = mask(safe_divide(df['accounts_payable_avg'], df['cost_of_revenue_ttm']) * 365,
+                     df['accounts_payable_avg'] != 0)
 
     dso = df['dso'].fillna(0.0)
     dio = df['dio'].fillna(0.0)
@@ -155,17 +72,35 @@ def transform_records(conn, tic: str, date: str) -> pd.DataFrame:
 
 
 
-def load_records(transformed_df, conn):
+def load_records(transformed_df, conn, commit: bool = True):
 
     # Insert records into core.efficiency_metrics
-    total_records = insert_records(conn, transformed_df, 'core.efficiency_metrics', ['tic', 'date'])
+    total_records = insert_records(conn, transformed_df, JOB, ['tic', 'date'], commit=commit)
     return total_records
 
 
-def main():
+def main(batch: bool = True, incremental: bool = INCREMENTAL):
     # Connect to the database
     conn = connect_to_db()
     if conn is not None:
+        if batch:
+            # Load each source table once and compute every ticker together
+            plan = None
+            if incremental:
+                # Only the days after each ticker's watermark, unless a quarter changed
+                plan = plan_incremental(conn, JOB, SOURCES)
+                print(f"Processing all tickers incrementally: {describe_plan(plan)}")
+            else:
+                print("Processing all tickers in a single batch")
+            transformed_df = transform_records(conn, start_dates=None if plan is None else plan['start_date'])
+            if transformed_df.empty:
+                print("No new or updated records to process.")
+                return
+            # Rows and watermarks in one transaction: a failed write raises and moves no watermark
+            total_records = load_with_watermarks(conn, JOB, load_records, transformed_df, plan)
+            print(f"Total records inserted/updated: {total_records}")
+            return
+
         # Extract records
         cursor = conn.cursor()
         query = """
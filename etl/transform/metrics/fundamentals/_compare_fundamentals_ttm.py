@@ -0,0 +1,45 @@
+"""Golden comparison: stored core.fundamentals_ttm vs features recomputed from the statement tables."""
+import sys
+import os
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
+
+import pandas as pd
+from database.utils import connect_to_db, read_sql_query
+from etl.transform.metrics.fundamentals.compute_fundamentals_ttm import JOB, KEY_COLUMNS, FEATURES, SOURCES, \
+    transform_records
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+TICKERS = None  # None = every stored ticker
+# ──────────────────────────────────────────────────────────────────
+
+conn = connect_to_db()
+if conn is None:
+    sys.exit(1)
+
+date_columns = [date_column for _, _, _, date_column in SOURCES.values()]
+feature_columns = [col for cols in FEATURES.values() for col in cols]
+stored = read_sql_query(f"SELECT {', '.join(KEY_COLUMNS + date_columns + feature_columns)} FROM {JOB};", conn)
+fresh = transform_records(conn)
+if TICKERS:
+    stored = stored[stored['tic'].isin(TICKERS)]
+fresh = fresh.loc[fresh['tic'].isin(stored['tic'].unique()), list(stored.columns)]
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values(KEY_COLUMNS).reset_index(drop=True)
+    df[date_columns] = df[date_columns].apply(pd.to_datetime)
+    return df.astype({'calendar_year': int, 'calendar_quarter': int, **{c: float for c in feature_columns}})
+
+
+try:
+    pd.testing.assert_frame_equal(_normalize(stored), _normalize(fresh), check_exact=True)
+    print(f"✅ Identical: {len(stored)} ticker-quarters x {len(feature_columns)} features")
+    failures = 0
+except AssertionError as e:
+    print(f"❌ Stale or drifted rows: {e}")
+    failures = 1
+
+conn.close()
+sys.exit(failures)
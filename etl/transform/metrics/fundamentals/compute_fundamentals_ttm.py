@@ -0,0 +1,256 @@
+from database.utils import connect_to_db, insert_records, read_sql_query
+import pandas as pd
+from etl.utils import convert_decimals_to_float
+from etl.transform.metrics.batch_engine import ticker_filter, start_dates_cte, cached, read_quarterly, \
+    rolling_sum, shift, ffill, QUARTERLY_LOOKBACK
+from etl.transform.metrics.ratio_kernels import growth_rate
+from etl.transform.metrics.incremental import INCREMENTAL, QUARTERLY_SOURCES, plan_incremental, describe_plan, load_with_watermarks
+
+# Trailing fundamentals shared by the valuation, growth, efficiency and
+# financial health modules, materialized once per load in core.fundamentals_ttm.
+# One row per (tic, calendar_year, calendar_quarter); each source statement keeps
+# its own earnings_date column (<source>_date) so the modules can still as-of
+# join every source on its own dates. Features are computed over each ticker's
+# full quarterly history and stored as DOUBLE PRECISION, so the modules read
+# the same floats they used to derive themselves.
+
+JOB = 'core.fundamentals_ttm'
+
+# Source -> (table, selected columns, row filter, date column in core.fundamentals_ttm)
+SOURCES = {
+    'income': ('core.income_statements_quarterly', """
+            eps_diluted AS eps_gaap, revenue AS revenue_gaap, ebitda, ebit, operating_income,
+            operating_expenses, cost_of_revenue, interest_expense,
+            weighted_average_shares_diluted AS shares_outstanding
+    """, None, 'income_date'),
+    'balance_sheet': ('core.balance_sheets_quarterly', """
+            total_assets, total_debt, total_equity, cash_and_short_term_investments,
+            net_ppe, accounts_receivable, accounts_payable, inventory, retained_earnings,
+            total_current_assets, total_current_liabilities, total_liabilities
+    """, None, 'balance_sheet_date'),
+    'cash_flow': ('core.cash_flow_statements_quarterly', """
+            free_cash_flow AS fcf, operating_cash_flow AS ocf, dividends_paid, common_stock_repurchased
+    """, None, 'cash_flow_date'),
+    'earnings': ('core.earnings', """
+            eps, eps_estimated, revenue, revenue_estimated
+    """, "eps_estimated IS NOT NULL", 'earnings_date'),
+}
+
+# Balance sheet items stored as the average of the quarter and the same quarter a year earlier
+AVERAGED = ['total_assets', 'total_debt', 'total_equity', 'cash_and_short_term_investments',
+            'net_ppe', 'accounts_receivable', 'accounts_payable', 'inventory', 'retained_earnings',
+            'total_current_assets', 'total_current_liabilities', 'total_liabilities']
+# TTM lags: 1, 3 and 5 years back
+LAGS = {'prev': 4, '3y_ago': 12, '5y_ago': 20}
+
+# Source -> columns stored in core.fundamentals_ttm
+FEATURES = {
+    'income': ['shares_outstanding',
+               'ebitda_ttm', 'ebitda_ttm_prev', 'ebitda_ttm_3y_ago', 'ebitda_ttm_5y_ago',
+               'eps_gaap_ttm', 'eps_gaap_ttm_prev', 'eps_gaap_ttm_3y_ago', 'eps_gaap_ttm_5y_ago',
+               'revenue_gaap_ttm', 'revenue_gaap_ttm_prev', 'revenue_gaap_ttm_3y_ago', 'revenue_gaap_ttm_5y_ago',
+               'operating_income_ttm', 'operating_income_ttm_prev',
+               'ebit_ttm', 'interest_expense_ttm', 'operating_expenses_ttm', 'cost_of_revenue_ttm'],
+    'balance_sheet': ['total_debt', 'total_equity', 'cash_and_short_term_investments', 'inventory'] +
+                     [f"{col}_avg" for col in AVERAGED] + ['net_debt_avg'],
+    'cash_flow': ['fcf_ttm', 'fcf_ttm_prev', 'fcf_ttm_3y_ago', 'fcf_ttm_5y_ago', 'ocf_ttm',
+                  'dividends_paid_ttm', 'share_repurchased_ttm'],
+    'earnings': ['eps_ttm', 'eps_ttm_prev', 'eps_ttm_3y_ago', 'eps_ttm_5y_ago',
+                 'eps_forward', 'eps_forward_growth_rate',
+                 'revenue_ttm', 'revenue_ttm_prev', 'revenue_ttm_3y_ago', 'revenue_ttm_5y_ago',
+                 'revenue_forward', 'revenue_forward_growth_rate'],
+}
+KEY_COLUMNS = ['tic', 'calendar_year', 'calendar_quarter']
+
+
+def _add_lags(df: pd.DataFrame, col: str, lags: list) -> None:
+    for name in lags:
+        df[f"{col}_{name}"] = shift(df, col, LAGS[name])
+
+
+def income_features(df: pd.DataFrame) -> pd.DataFrame:
+    """TTM sums and their lags from income statement quarters sorted by tic and earnings_date."""
+    df = df.copy()
+    for col in ['ebitda', 'eps_gaap', 'revenue_gaap', 'operating_income', 'ebit',
+                'interest_expense', 'operating_expenses', 'cost_of_revenue']:
+        df[f"{col}_ttm"] = rolling_sum(df, col)
+    for col in ['ebitda_ttm', 'eps_gaap_ttm', 'revenue_gaap_ttm']:
+        _add_lags(df, col, ['prev', '3y_ago', '5y_ago'])
+    _add_lags(df, 'operating_income_ttm', ['prev'])
+    return df
+
+
+def balance_sheet_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Year-over-year averages of the balance sheet items."""
+    df = df.copy()
+    for col in AVERAGED:
+        df[f"{col}_avg"] = (df[col] + shift(df, col, 4)) / 2
+    df['net_debt_avg'] = df['total_debt_avg'] - df['cash_and_short_term_investments_avg']
+    return df
+
+
+def cash_flow_features(df: pd.DataFrame) -> pd.DataFrame:
+    """TTM cash flows; dividends and buybacks count as positive payouts."""
+    df = df.copy()
+    df['fcf_ttm'] = rolling_sum(df, 'fcf')
+    _add_lags(df, 'fcf_ttm', ['prev', '3y_ago', '5y_ago'])
+    df['ocf_ttm'] = rolling_sum(df, 'ocf')
+    df['dividends_paid'] = df['dividends_paid'].astype(float).fillna(0).abs()
+    df['dividends_paid_ttm'] = rolling_sum(df, 'dividends_paid')
+    df['common_stock_repurchased'] = df['common_stock_repurchased'].astype(float).fillna(0).abs()
+    df['share_repurchased_ttm'] = rolling_sum(df, 'common_stock_repurchased')
+    return df
+
+
+def earnings_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Reported and forward (estimate-based) EPS and revenue TTM from core.earnings."""
+    df = df.copy()
+    for name, actual, estimated in [('eps', 'eps', 'eps_estimated'), ('revenue', 'revenue', 'revenue_estimated')]:
+        df[f"{name}_est_ttm"] = rolling_sum(df, estimated)
+        df[f"{name}_forward"] = shift(df, f"{name}_est_ttm", -4)
+        df[f"{name}_ttm"] = rolling_sum(df, actual)
+        _add_lags(df, f"{name}_ttm", ['prev', '3y_ago', '5y_ago'])
+        df[f"{name}_forward_growth_rate"] = growth_rate(df[f"{name}_forward"], df[f"{name}_ttm"])
+        df[f"{name}_forward_growth_rate"] = ffill(df, f"{name}_forward_growth_rate")
+        df[f"{name}_forward"] = df[f"{name}_forward"].fillna(
+            df[f"{name}_ttm"] * (1 + df[f"{name}_forward_growth_rate"])
+        )
+    return df
+
+
+FEATURE_FUNCTIONS = {
+    'income': income_features,
+    'balance_sheet': balance_sheet_features,
+    'cash_flow': cash_flow_features,
+    'earnings': earnings_features,
+}
+
+
+def build_features(frames: dict) -> pd.DataFrame:
+    """
+    core.fundamentals_ttm rows from source -> quarterly frame (as read_quarterly
+    returns them): features per source, outer-joined on the ticker-quarter.
+    """
+    out = None
+    for source, frame in frames.items():
+        date_column = SOURCES[source][3]
+        features = FEATURE_FUNCTIONS[source](frame)
+        features = features[KEY_COLUMNS + ['earnings_date'] + FEATURES[source]]
+        features = features.rename(columns={'earnings_date': date_column})
+        out = features if out is None else out.merge(features, on=KEY_COLUMNS, how='outer')
+    for source, (_, _, _, date_column) in SOURCES.items():
+        out[date_column] = pd.to_datetime(out[date_column]).dt.date
+    columns = [col for cols in FEATURES.values() for col in cols]
+    out[columns] = out[columns].astype(float)
+    return out.sort_values(KEY_COLUMNS, kind='mergesort').reset_index(drop=True)
+
+
+def transform_records(conn, tic=None) -> pd.DataFrame:
+    """
+    Feature rows over the full quarterly history of one ticker, a list of
+    tickers, or every ticker when tic is None.
+    """
+    frames = {source: read_quarterly(conn, table, columns, tic, where=where)
+              for source, (table, columns, where, _) in SOURCES.items()}
+    return build_features(frames)
+
+
+def read_fundamentals(conn, columns: dict, tic: str = None, start_dates: pd.Series = None) -> dict:
+    """
+    Stored features in one query, split per source for merge_quarterly:
+    `columns` maps source -> feature columns (or (feature, alias) pairs), and each
+    returned frame has tic, calendar_year, calendar_quarter, earnings_date (the
+    source's own date) and those columns, for the quarters the source has.
+    With `start_dates`, only the QUARTERLY_LOOKBACK quarters at or before each
+    ticker's start date are kept, plus every later quarter, as read_quarterly does.
+    Every feature is read, so one query serves all modules inside bundle_cache().
+    """
+    select = ", ".join([date_column for _, _, _, date_column in SOURCES.values()] +
+                       [col for cols in FEATURES.values() for col in cols])
+    params = None
+    if start_dates is not None:
+        cte, params = start_dates_cte(start_dates)
+        quarter_date = f"LEAST({', '.join(date_column for _, _, _, date_column in SOURCES.values())})"
+        query = f"""
+            WITH {cte},
+            quarters AS (
+                SELECT f.tic, f.calendar_year, f.calendar_quarter, {select},
+                       COUNT(*) FILTER (WHERE {quarter_date} <= s.start_date)
+                           OVER (PARTITION BY f.tic ORDER BY f.calendar_year DESC, f.calendar_quarter DESC) AS quarters_back
+                FROM {JOB} AS f
+                JOIN start_dates AS s ON f.tic = s.tic
+            )
+            SELECT *
+            FROM quarters
+            WHERE quarters_back <= {QUARTERLY_LOOKBACK};
+        """
+    else:
+        query = f"""
+            SELECT tic, calendar_year, calendar_quarter, {select}
+            FROM {JOB}
+            WHERE {ticker_filter(tic)};
+        """
+    df = cached('fundamentals', query, params, lambda: convert_decimals_to_float(read_sql_query(query, conn, params)))
+
+    frames = {}
+    for source, cols in columns.items():
+        date_column = SOURCES[source][3]
+        pairs = [(col, col) if isinstance(col, str) else col for col in cols]
+        frame = df.loc[df[date_column].notna(), ['tic', 'calendar_year', 'calendar_quarter', date_column] +
+                       [name for name, _ in pairs]]
+        frame.columns = ['tic', 'calendar_year', 'calendar_quarter', 'earnings_date'] + [alias for _, alias in pairs]
+        frame['earnings_date'] = pd.to_datetime(frame['earnings_date'])
+        frame[[alias for _, alias in pairs]] = frame[[alias for _, alias in pairs]].astype(float)
+        frames[source] = frame.sort_values(['tic', 'earnings_date'], kind='mergesort').reset_index(drop=True)
+    return frames
+
+
+def load_records(transformed_df: pd.DataFrame, conn, commit: bool = True) -> int:
+    """Replace the stored quarters of every ticker in transformed_df, in one transaction."""
+    tickers = transformed_df['tic'].unique().tolist()
+    with conn.cursor() as cursor:
+        # Quarters that disappeared upstream must not linger
+        cursor.execute(f"DELETE FROM {JOB} WHERE tic = ANY(%s::text[]);", (tickers,))
+    total_records = insert_records(conn, transformed_df, JOB, KEY_COLUMNS, commit=False)
+    if commit:
+        conn.commit()
+    return total_records
+
+
+def main(incremental: bool = INCREMENTAL):
+    conn = connect_to_db()
+    if conn is not None:
+        plan = None
+        if incremental:
+            # Recompute only tickers with a new or restated quarter (or no watermark yet)
+            plan = plan_incremental(conn, JOB, QUARTERLY_SOURCES)
+            print(f"Refreshing fundamentals: {describe_plan(plan)}")
+            stale = plan.index[plan['full']].tolist()
+            if not stale:
+                print("No new or updated quarters to process.")
+                conn.close()
+                return
+        else:
+            print("Refreshing fundamentals for all tickers")
+
+        # Incremental runs read and rebuild only the stale tickers' histories
+        transformed_df = transform_records(conn, stale if plan is not None else None)
+        if transformed_df.empty:
+            print("No new or updated quarters to process.")
+            conn.close()
+            return
+        written = None
+        if plan is not None:
+            quarter_dates = transformed_df[[SOURCES[source][3] for source in SOURCES]].apply(pd.to_datetime).max(axis=1)
+            written = pd.DataFrame({'tic': transformed_df['tic'], 'date': quarter_dates})
+        # Quarters and watermarks in one transaction: a failed write raises and moves no watermark
+        total_records = load_with_watermarks(conn, JOB, load_records, transformed_df,
+                                             plan.loc[stale] if plan is not None else None, written)
+        print(f"Total records inserted/updated: {total_records} for {transformed_df['tic'].nunique()} tickers")
+        conn.close()
+
+    return
+
+
+if __name__ == "__main__":
+    main()
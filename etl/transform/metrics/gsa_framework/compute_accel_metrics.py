@@ -1,83 +1,53 @@
 import pandas as pd
-from etl.utils import calculate_streak, calculate_streak_pos_neg
+from etl.transform.metrics.regime_kernels import group_positions, block, shift, rolling_sum, \
+    positive_flag, streak, accel_regime
 import numpy as np
 
-def calculate_acceleration(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+# Every step handles the yoy, qoq and (with ttm) ttm columns as one block.
+# Pass by='tic' to run a frame holding many tickers (contiguous, in time order) in one call.
+
+
+def _periods(ttm: bool) -> list:
+    return ['yoy', 'qoq', 'ttm'] if ttm else ['yoy', 'qoq']
+
+
+def calculate_acceleration(df: pd.DataFrame, column: str, ttm: bool = True, by: str = None) -> pd.DataFrame:
     """
     Calculate the difference of year-over-year growth percentages to determine acceleration.
     """
-    growth_yoy_name = f"{column}_yoy_growth"
-    accel_yoy_column = f"{column}_yoy_accel"
-    growth_qoq_name = f"{column}_qoq_growth"
-    accel_qoq_column = f"{column}_qoq_accel"
-    growth_ttm_name = f"{column}_ttm_growth"
-    accel_ttm_column = f"{column}_ttm_accel"
-
-    df[accel_yoy_column] = df[growth_yoy_name].astype(float) - df[growth_yoy_name].shift(1).astype(float)
-    df[accel_qoq_column] = df[growth_qoq_name].astype(float) - df[growth_qoq_name].shift(1).astype(float)
-    if ttm:
-        df[accel_ttm_column] = df[growth_ttm_name].astype(float) - df[growth_ttm_name].shift(1).astype(float)
+    periods = _periods(ttm)
+    growth = block(df, [f"{column}_{p}_growth" for p in periods])
+    df[[f"{column}_{p}_accel" for p in periods]] = growth - shift(growth, group_positions(df, by), 1)
 
     return df
 
 
-def calculate_accel_count_4q(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+def calculate_accel_count_4q(df: pd.DataFrame, column: str, ttm: bool = True, by: str = None) -> pd.DataFrame:
     """
     Calculate the count of positive acceleration periods for a specified column over the last 4 quarters.
     """
-    accel_yoy_column = f"{column}_yoy_accel"
-    count_yoy_column = f"{column}_yoy_accel_count_4q"
-    accel_yoy_flag_column = f"{column}_yoy_accel_positive_flag" 
-    accel_qoq_column = f"{column}_qoq_accel"
-    count_qoq_column = f"{column}_qoq_accel_count_4q"
-    accel_qoq_flag_column = f"{column}_qoq_accel_positive_flag"
-    accel_ttm_column = f"{column}_ttm_accel"
-    count_ttm_column = f"{column}_ttm_accel_count_4q"
-    accel_ttm_flag_column = f"{column}_ttm_accel_positive_flag"
+    periods = _periods(ttm)
 
     # Create a flag for positive acceleration
-    df[accel_yoy_flag_column] = (df[accel_yoy_column] > 0).astype(int)
-    df[accel_qoq_flag_column] = (df[accel_qoq_column] > 0).astype(int)
-    
-    df.loc[df[accel_yoy_column].isna(), accel_yoy_flag_column] = np.nan
-    df.loc[df[accel_qoq_column].isna(), accel_qoq_flag_column] = np.nan
-    
-
-    # Calculate count of positive acceleration over the last 4 periods
-    df[count_yoy_column] = df[accel_yoy_flag_column].fillna(0).rolling(window=4, min_periods=1).sum().astype(int)
-    df[count_qoq_column] = df[accel_qoq_flag_column].fillna(0).rolling(window=4, min_periods=1).sum().astype(int)
-    
-    df.loc[df[accel_yoy_flag_column].isna(), count_yoy_column] = np.nan
-    df.loc[df[accel_qoq_flag_column].isna(), count_qoq_column] = np.nan
-    
-    if ttm:
-        df[accel_ttm_flag_column] = (df[accel_ttm_column] > 0).astype(int)
-        df.loc[df[accel_ttm_column].isna(), accel_ttm_flag_column] = np.nan
-        df[count_ttm_column] = df[accel_ttm_flag_column].fillna(0).rolling(window=4, min_periods=1).sum().astype(int)
-        df.loc[df[accel_ttm_flag_column].isna(), count_ttm_column] = np.nan
+    flags = positive_flag(block(df, [f"{column}_{p}_accel" for p in periods]))
+
+    # Calculate count of positive acceleration over the last 4 periods (NaN flags count as 0)
+    counts = rolling_sum(flags, group_positions(df, by), window=4, min_periods=1, skipna=True)
+    counts[np.isnan(flags)] = np.nan
+
+    for i, p in enumerate(periods):
+        df[f"{column}_{p}_accel_positive_flag"] = flags[:, i]
+        df[f"{column}_{p}_accel_count_4q"] = counts[:, i]
 
     return df
 
-def calculate_accel_streak_length(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+def calculate_accel_streak_length(df: pd.DataFrame, column: str, ttm: bool = True, by: str = None) -> pd.DataFrame:
     """
     Calculate the length of the current streak of positive acceleration for a specified column.
     """
-    accel_yoy_column = f"{column}_yoy_accel"
-    streak_yoy_column = f"{column}_yoy_accel_streak_length"
-    accel_yoy_flag_column = f"{column}_yoy_accel_positive_flag"
-    accel_qoq_column = f"{column}_qoq_accel"
-    streak_qoq_column = f"{column}_qoq_accel_streak_length"
-    accel_qoq_flag_column = f"{column}_qoq_accel_positive_flag"
-    accel_ttm_column = f"{column}_ttm_accel"
-    streak_ttm_column = f"{column}_ttm_accel_streak_length"
-    accel_ttm_flag_column = f"{column}_ttm_accel_positive_flag"
-
-
-    # Calculate streak length using the utility function
-    df[streak_yoy_column] = calculate_streak(df[accel_yoy_flag_column])
-    df[streak_qoq_column] = calculate_streak(df[accel_qoq_flag_column])
-    if ttm:
-        df[streak_ttm_column] = calculate_streak(df[accel_ttm_flag_column])
+    periods = _periods(ttm)
+    flags = block(df, [f"{column}_{p}_accel_positive_flag" for p in periods])
+    df[[f"{column}_{p}_accel_streak_length" for p in periods]] = streak(flags, group_positions(df, by))
 
     return df
 
@@ -85,60 +55,26 @@ def compute_accel_regime(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.
     """
     Compute acceleration regime based on acceleration and volatility metrics.
     """
-    accel_yoy_count_column = f"{column}_yoy_accel_count_4q"
-    streak_yoy_length_column = f"{column}_yoy_accel_streak_length"
-    accel_yoy_regime_column = f"{column}_yoy_accel_regime"
-    accel_qoq_count_column = f"{column}_qoq_accel_count_4q"
-    streak_qoq_length_column = f"{column}_qoq_accel_streak_length"
-    accel_qoq_regime_column = f"{column}_qoq_accel_regime"
-    accel_ttm_count_column = f"{column}_ttm_accel_count_4q"
-    streak_ttm_length_column = f"{column}_ttm_accel_streak_length"
-    accel_ttm_regime_column = f"{column}_ttm_accel_regime"
-
-
     # Acceleration Regime Table:
     # 0 if accel_count_4q >= 3 and streak_length >= 2 → Sustained Acceleration
     # 1 if accel_count_4q >= 3 and streak_length < 2 → Choppy Acceleration
     # 2 if accel_count_4q = 2 and streak_length = 2 → Emerging Acceleration
     # 3 if accel_count_4q = 2 and streak_length < 2 → Unstable Momentum
     # 4 if accel_count_4q < 2 → Deceleration
-    def accel_regime_logic(accel_count, streak_length) -> str:
-        if np.isnan(accel_count) or np.isnan(streak_length):
-            return np.nan
-
-        if accel_count >= 3:
-            if streak_length >= 2:
-                return "sustained acceleration"
-            elif streak_length >= 1:
-                return "choppy acceleration"
-            else:
-                return "broken acceleration streak"
-        elif accel_count == 2:
-            if streak_length == 2:
-                return "emerging acceleration"
-            else:
-                return "unstable momentum"
-        elif accel_count == 1 and streak_length == 1:
-            return "broken deceleration streak"
-        else:
-            return "persistent deceleration"
-
-    df[accel_yoy_regime_column] = df.apply(lambda row:
-                                           accel_regime_logic(row[accel_yoy_count_column], row[streak_yoy_length_column]), axis=1)
-    df[accel_qoq_regime_column] = df.apply(lambda row:
-                                           accel_regime_logic(row[accel_qoq_count_column], row[streak_qoq_length_column]), axis=1)
-    if ttm:
-        df[accel_ttm_regime_column] = df.apply(lambda row:
-                                            accel_regime_logic(row[accel_ttm_count_column], row[streak_ttm_length_column]), axis=1)
+    periods = _periods(ttm)
+    regimes = accel_regime(block(df, [f"{column}_{p}_accel_count_4q" for p in periods]),
+                           block(df, [f"{column}_{p}_accel_streak_length" for p in periods]))
+    for i, p in enumerate(periods):
+        df[f"{column}_{p}_accel_regime"] = regimes[:, i]
     return df
 
 
-def compute_accel_metrics(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+def compute_accel_metrics(df: pd.DataFrame, column: str, ttm: bool = True, by: str = None) -> pd.DataFrame:
     """
     Compute all acceleration metrics for a specified column.
     """
-    df = calculate_acceleration(df, column, ttm=ttm)
-    df = calculate_accel_count_4q(df, column, ttm=ttm)
-    df = calculate_accel_streak_length(df, column, ttm=ttm)
+    df = calculate_acceleration(df, column, ttm=ttm, by=by)
+    df = calculate_accel_count_4q(df, column, ttm=ttm, by=by)
+    df = calculate_accel_streak_length(df, column, ttm=ttm, by=by)
     df = compute_accel_regime(df, column, ttm=ttm)
-    return df
\ No newline at end of file
+    return df
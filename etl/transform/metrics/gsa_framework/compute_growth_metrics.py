@@ -1,98 +1,64 @@
 import pandas as pd
-from etl.utils import calculate_streak, calculate_capped_rate
+from etl.transform.metrics.ratio_kernels import capped_rate
+from etl.transform.metrics.regime_kernels import group_positions, block, shift, rolling_sum, \
+    positive_flag, streak, growth_class, growth_regime
 import numpy as np
 
-def calculate_growth(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+# Every step handles the yoy, qoq and (with ttm) ttm columns as one block.
+# Pass by='tic' to run a frame holding many tickers (contiguous, in time order) in one call.
+
+
+def _periods(ttm: bool) -> list:
+    return ['yoy', 'qoq', 'ttm'] if ttm else ['yoy', 'qoq']
+
+
+def calculate_growth(df: pd.DataFrame, column: str, ttm: bool = True, by: str = None) -> pd.DataFrame:
     """
     Calculate year-over-year growth for a specified column. Assumes data is sorted ascendingly by time.
     4 periods ago is used for comparison.
     """
-
-    
-    column_yoy_name = f"{column}_yoy_growth"
-    column_qoq_name = f"{column}_qoq_growth"
-    column_ttm_name = f"{column}_ttm_growth"
-    column_lag_1 = f"{column}_lag_1"
-    column_lag_4 = f"{column}_lag_4"
-    column_ttm = f"{column}_ttm"
-    column_ttm_lag_4 = f"{column}_ttm_lag_4"
-
-    df[column_lag_1] = df[column].shift(1)
-    df[column_lag_4] = df[column].shift(4)
-    
-
+    pos = group_positions(df, by)
+    value = block(df, [column])[:, 0]
 
     # Handle division by zero or NaNs for calculating YoY growth
-    df[column_yoy_name] = df.apply(lambda x: calculate_capped_rate(x[column], x[column_lag_4]), axis=1)
-    df[column_qoq_name] = df.apply(lambda x: calculate_capped_rate(x[column], x[column_lag_1]), axis=1)
-    
-    # Drop intermediate columns
-    df.drop(columns=[column_lag_1, column_lag_4], inplace=True)
-
-
-    # Create flags for positive growth; 1 if positive or zero, 0 if negative, NaN remains NaN
-    def get_positive_flag(value: float) -> int:
-        if pd.isna(value):
-            return np.nan
-        elif value > 0:
-            return 1
-        else:
-            return 0
-
-    flag_yoy_column = f"{column}_yoy_positive_flag"
-    df[flag_yoy_column] = df[column_yoy_name].apply(get_positive_flag)
-
-    flag_qoq_column = f"{column}_qoq_positive_flag"
-    df[flag_qoq_column] = df[column_qoq_name].apply(get_positive_flag)
-
+    df[f"{column}_yoy_growth"] = capped_rate(value, shift(value, pos, 4))
+    df[f"{column}_qoq_growth"] = capped_rate(value, shift(value, pos, 1))
     if ttm:
-        df[column_ttm_lag_4] = df[column_ttm].shift(4)
-        df[column_ttm_name] = df.apply(lambda x: calculate_capped_rate(x[column_ttm], x[column_ttm_lag_4]), axis=1)
-        df.drop(columns=[column_ttm_lag_4], inplace=True)
-        flag_ttm_column = f"{column}_ttm_positive_flag"
-        df[flag_ttm_column] = df[column_ttm_name].apply(get_positive_flag)
+        value_ttm = block(df, [f"{column}_ttm"])[:, 0]
+        df[f"{column}_ttm_growth"] = capped_rate(value_ttm, shift(value_ttm, pos, 4))
+
+    # Create flags for positive growth; 1 if positive, 0 if zero or negative, NaN remains NaN
+    periods = _periods(ttm)
+    flags = positive_flag(block(df, [f"{column}_{p}_growth" for p in periods]))
+    df[[f"{column}_{p}_positive_flag" for p in periods]] = flags
 
     return df
 
 
-def calculate_count_4q(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+def calculate_count_4q(df: pd.DataFrame, column: str, ttm: bool = True, by: str = None) -> pd.DataFrame:
     """
     Calculate the count of positive year-over-year growth periods for a specified column over the last 4 quarters.
     """
-    flag_yoy_column = f"{column}_yoy_positive_flag"
-    count_yoy_column = f"{column}_yoy_count_4q"
-    flag_qoq_column = f"{column}_qoq_positive_flag"
-    count_qoq_column = f"{column}_qoq_count_4q"
-    flag_ttm_column = f"{column}_ttm_positive_flag"
-    count_ttm_column = f"{column}_ttm_count_4q"
-
-    # Calculate count of positive YoY growth over the last 4 periods
-    # output NaN if one of the 4 periods is NaN
-    df[count_yoy_column] = df[flag_yoy_column].rolling(window=4, min_periods=4).apply(lambda x: x.sum() if not x.isnull().any() else np.nan, raw=False)
-    # Calculate count of positive QoQ growth over the last 4 periods
-    df[count_qoq_column] = df[flag_qoq_column].rolling(window=4, min_periods=1).apply(lambda x: x.sum() if not x.isnull().any() else np.nan, raw=False)
-    if ttm:
-        # Calculate count of positive TTM growth over the last 4 periods
-        df[count_ttm_column] = df[flag_ttm_column].rolling(window=4, min_periods=1).apply(lambda x: x.sum() if not x.isnull().any() else np.nan, raw=False)
+    pos = group_positions(df, by)
+
+    # Count of positive growth over the last 4 periods; NaN if one of the periods in the window is NaN.
+    # YoY needs the full 4 periods, QoQ and TTM count whatever history is available.
+    flags_yoy = block(df, [f"{column}_yoy_positive_flag"])
+    df[f"{column}_yoy_count_4q"] = rolling_sum(flags_yoy, pos, window=4, min_periods=4)[:, 0]
+    periods = _periods(ttm)[1:]
+    flags = block(df, [f"{column}_{p}_positive_flag" for p in periods])
+    df[[f"{column}_{p}_count_4q" for p in periods]] = rolling_sum(flags, pos, window=4, min_periods=1)
 
     return df
 
 
-def calculate_streak_length(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+def calculate_streak_length(df: pd.DataFrame, column: str, ttm: bool = True, by: str = None) -> pd.DataFrame:
     """
     Calculate the length of the current streak of positive values for a specified column.
     """
-    flag_yoy_column = f"{column}_yoy_positive_flag"
-    streak_yoy_column = f"{column}_yoy_streak_length"
-    flag_qoq_column = f"{column}_qoq_positive_flag"
-    streak_qoq_column = f"{column}_qoq_streak_length"
-    flag_ttm_column = f"{column}_ttm_positive_flag"
-    streak_ttm_column = f"{column}_ttm_streak_length"
-
-    df[streak_yoy_column] = calculate_streak(df[flag_yoy_column], on_value=1)
-    df[streak_qoq_column] = calculate_streak(df[flag_qoq_column], on_value=1)
-    if ttm:
-        df[streak_ttm_column] = calculate_streak(df[flag_ttm_column], on_value=1)
+    periods = _periods(ttm)
+    flags = block(df, [f"{column}_{p}_positive_flag" for p in periods])
+    df[[f"{column}_{p}_streak_length" for p in periods]] = streak(flags, group_positions(df, by), on_value=1)
 
     return df
 
@@ -101,35 +67,15 @@ def calculate_yoy_growth_flag(df: pd.DataFrame, column: str, score_regime: list[
     """
     Calculate a boolean flag indicating whether year-over-year growth is positive for a specified column.
     """
-    column_yoy_name = f"{column}_yoy_growth"
-    class_yoy_column = f"{column}_yoy_growth_class"
-    column_qoq_name = f"{column}_qoq_growth"
-    class_qoq_column = f"{column}_qoq_growth_class"
-    column_ttm_name = f"{column}_ttm_growth"
-    class_ttm_column = f"{column}_ttm_growth_class"
-
     # 0 if YoY growth < score_regime[0], (Deep contraction)
     # 1 if between score_regime[0] and score_regime[1], (Mild contraction)
     # 2 if between score_regime[1] and score_regime[2], (Moderate growth)
     # 3 if between score_regime[2] and score_regime[3], (Strong growth)
     # 4 if greater than or equal to score_regime[3], (Very strong growth)
-    def get_growth_class(value: float) -> str:
-        if pd.isna(value):
-            return None
-        elif value < score_regime[0]:
-            return "deep contraction"
-        elif value < score_regime[1]:
-            return "mild contraction"
-        elif value < score_regime[2]:
-            return "moderate growth"
-        elif value < score_regime[3]:
-            return "strong growth"
-        else:
-            return "very strong growth"
-    df[class_yoy_column] = df[column_yoy_name].apply(get_growth_class)
-    df[class_qoq_column] = df[column_qoq_name].apply(get_growth_class)
-    if ttm:
-        df[class_ttm_column] = df[column_ttm_name].apply(get_growth_class)
+    periods = _periods(ttm)
+    classes = growth_class(block(df, [f"{column}_{p}_growth" for p in periods]), score_regime)
+    for i, p in enumerate(periods):
+        df[f"{column}_{p}_growth_class"] = classes[:, i]
 
     return df
 
@@ -138,54 +84,28 @@ def compute_growth_regime(df: pd.DataFrame, column: str, ttm: bool = True) -> pd
     """
     Compute growth regimes for a specified column.
     """
-    count_yoy_column = f"{column}_yoy_count_4q"
-    streak_yoy_column = f"{column}_yoy_streak_length"
-    regime_yoy_column = f"{column}_yoy_growth_regime"
-    count_qoq_column = f"{column}_qoq_count_4q"
-    streak_qoq_column = f"{column}_qoq_streak_length"
-    regime_qoq_column = f"{column}_qoq_growth_regime"
-    count_ttm_column = f"{column}_ttm_count_4q"
-    streak_ttm_column = f"{column}_ttm_streak_length"
-    regime_ttm_column = f"{column}_ttm_growth_regime"
-
     # 0 if growth_count_4q >= 3 and growth_streak_len >= 3 -> "Sustained Expansion"
     # 1 if growth_count_4q >= 3 and growth_streak_len < 3 -> "Developing Expansion"
     # 2 if growth_count_4q == 2 -> "Volatile Transition"
     # 3 if growth_count_4q <= 1 and growth_streak_len <= 1 -> "Tentative Turnaround"
     # 4 if growth_count_4q == 0 and growth_streak_len == 0 -> "Persistent Contraction"
-    def get_growth_regime(value_count: int, value_streak: int) -> str:
-        if pd.isna(value_count) or pd.isna(value_streak):
-            return None
-        elif value_count >= 3 and value_streak >= 3:
-            return "sustained expansion"
-        elif value_count >= 3 and 1 <= value_streak < 3:
-            return "developing expansion"
-        elif value_count >= 3 and value_streak == 0:
-            return "broken growth streak"
-        elif value_count == 2 and value_streak == 2:
-            return "emerging growth"
-        elif value_count == 2:
-            return "volatile growth"
-        elif value_count == 1 and value_streak == 1:
-            return "tentative turnaround"
-        elif value_count <= 1 and value_streak == 0:
-            return "persistent contraction"
-
-    df[regime_yoy_column] = df.apply(lambda x: get_growth_regime(x[count_yoy_column], x[streak_yoy_column]), axis=1)
-    df[regime_qoq_column] = df.apply(lambda x: get_growth_regime(x[count_qoq_column], x[streak_qoq_column]), axis=1)
-    if ttm:
-        df[regime_ttm_column] = df.apply(lambda x: get_growth_regime(x[count_ttm_column], x[streak_ttm_column]), axis=1)
+    periods = _periods(ttm)
+    regimes = growth_regime(block(df, [f"{column}_{p}_count_4q" for p in periods]),
+                            block(df, [f"{column}_{p}_streak_length" for p in periods]))
+    for i, p in enumerate(periods):
+        df[f"{column}_{p}_growth_regime"] = regimes[:, i]
 
-    return df  
+    return df
 
 
-def compute_growth_metrics(df: pd.DataFrame, column: str, score_regime: list[float], ttm: bool = True) -> pd.DataFrame:
+def compute_growth_metrics(df: pd.DataFrame, column: str, score_regime: list[float], ttm: bool = True,
+                           by: str = None) -> pd.DataFrame:
     """
     Compute all growth metrics for a specified column.
     """
-    df = calculate_growth(df, column, ttm=ttm)
-    df = calculate_count_4q(df, column, ttm=ttm)
-    df = calculate_streak_length(df, column, ttm=ttm)
+    df = calculate_growth(df, column, ttm=ttm, by=by)
+    df = calculate_count_4q(df, column, ttm=ttm, by=by)
+    df = calculate_streak_length(df, column, ttm=ttm, by=by)
     df = calculate_yoy_growth_flag(df, column, score_regime, ttm=ttm)
     df = compute_growth_regime(df, column, ttm=ttm)
-    return df
\ No newline at end of file
+    return df
@@ -1,134 +1,77 @@
 import pandas as pd
-from etl.utils import calculate_streak
+from etl.transform.metrics.regime_kernels import group_positions, block, shift, rolling_mean_std, stability_regime
 import numpy as np
 
-def calculate_volatility(df: pd.DataFrame, column: str, threshold: float, ttm: bool = True) -> pd.DataFrame:
+# Every step handles the yoy, qoq and (with ttm) ttm columns as one block.
+# Pass by='tic' to run a frame holding many tickers (contiguous, in time order) in one call.
+
+
+def _periods(ttm: bool) -> list:
+    return ['yoy', 'qoq', 'ttm'] if ttm else ['yoy', 'qoq']
+
+
+def calculate_volatility(df: pd.DataFrame, column: str, threshold: float, ttm: bool = True,
+                         by: str = None) -> pd.DataFrame:
     """
     Calculate the volatility of year-over-year growth for a specified column over a rolling window.
     """
-    growth_yoy_column = f"{column}_yoy_growth"
-    volatility_yoy_column = f"{column}_yoy_volatility_4q"
-    volatility_yoy_flag_column = f"{column}_yoy_volatility_flag"
-    growth_qoq_column = f"{column}_qoq_growth"
-    volatility_qoq_column = f"{column}_qoq_volatility_4q"
-    volatility_qoq_flag_column = f"{column}_qoq_volatility_flag"
-    growth_ttm_column = f"{column}_ttm_growth"
-    volatility_ttm_column = f"{column}_ttm_volatility_4q"
-    volatility_ttm_flag_column = f"{column}_ttm_volatility_flag"
-
-    # Calculate rolling standard deviation of YoY growth over a 4-period window excluding the current period
-    # Note: if it has NaN in the window, the result will be NaN
-    df[volatility_yoy_column] = df[growth_yoy_column].shift(1).rolling(window=4).std()
-    df.loc[df[growth_yoy_column].isna(), volatility_yoy_column] = np.nan
-    # Assign volatility flag based on threshold; NaNs remain NaN
-    df[volatility_yoy_flag_column] = df[volatility_yoy_column].apply(lambda x: 0 if x < threshold else 1)
-    df.loc[df[growth_yoy_column].isna(), volatility_yoy_flag_column] = np.nan
-
+    periods = _periods(ttm)
+    growth = block(df, [f"{column}_{p}_growth" for p in periods])
+    pos = group_positions(df, by)
 
-    # Calculate rolling standard deviation of QoQ growth over a 4-period window excluding the current period
-    df[volatility_qoq_column] = df[growth_qoq_column].shift(1).rolling(window=4).std()
-    df.loc[df[growth_qoq_column].isna(), volatility_qoq_column] = np.nan
-    # Assign volatility flag based on threshold
-    df[volatility_qoq_flag_column] = df[volatility_qoq_column].apply(lambda x: 0 if x < threshold else 1)
-    df.loc[df[growth_qoq_column].isna(), volatility_qoq_flag_column] = np.nan
-
-    if ttm:
-        # Calculate rolling standard deviation of TTM growth over a 4-period window excluding the current period
-        df[volatility_ttm_column] = df[growth_ttm_column].shift(1).rolling(window=4).std()
-        df.loc[df[growth_ttm_column].isna(), volatility_ttm_column] = np.nan
-        # Assign volatility flag based on threshold
-        df[volatility_ttm_flag_column] = df[volatility_ttm_column].apply(lambda x: 0 if x < threshold/2 else 1)
-        df.loc[df[growth_ttm_column].isna(), volatility_ttm_flag_column] = np.nan
+    # Calculate rolling standard deviation of growth over a 4-period window excluding the current period
+    # Note: if it has NaN in the window, the result will be NaN
+    _, volatility = rolling_mean_std(shift(growth, pos, 1), pos, window=4)
+    volatility[np.isnan(growth)] = np.nan
+    # Assign volatility flag based on threshold (half of it for TTM); a NaN volatility is flagged volatile
+    thresholds = np.array([threshold / 2 if p == 'ttm' else threshold for p in periods])
+    volatility_flag = np.where(volatility < thresholds, 0.0, 1.0)
+    volatility_flag[np.isnan(growth)] = np.nan
 
+    df[[f"{column}_{p}_volatility_4q" for p in periods]] = volatility
+    df[[f"{column}_{p}_volatility_flag" for p in periods]] = volatility_flag
 
     return df
 
 
 
-def compute_volatility_regime(df: pd.DataFrame, column: str, ttm: bool = True) -> pd.DataFrame:
+def compute_volatility_regime(df: pd.DataFrame, column: str, ttm: bool = True, by: str = None) -> pd.DataFrame:
     """
     Calculate the count of volatile periods for a specified column over the last 4 quarters.
     """
-    growth_yoy_column = f"{column}_yoy_growth"
-    volatility_yoy_column = f"{column}_yoy_volatility_4q"
-    volatility_yoy_flag_column = f"{column}_yoy_volatility_flag"
-    drift_yoy_column = f"{column}_yoy_growth_drift"
-    outlier_yoy_flag_column = f"{column}_yoy_outlier_flag"
-    regime_yoy_column = f"{column}_yoy_stability_regime"
-
-    growth_qoq_column = f"{column}_qoq_growth"
-    volatility_qoq_column = f"{column}_qoq_volatility_4q"
-    volatility_qoq_flag_column = f"{column}_qoq_volatility_flag"
-    drift_qoq_column = f"{column}_qoq_growth_drift"
-    outlier_qoq_flag_column = f"{column}_qoq_outlier_flag"
-    regime_qoq_column = f"{column}_qoq_stability_regime"
-
-    growth_ttm_column = f"{column}_ttm_growth"
-    volatility_ttm_column = f"{column}_ttm_volatility_4q"
-    volatility_ttm_flag_column = f"{column}_ttm_volatility_flag"
-    drift_ttm_column = f"{column}_ttm_growth_drift"
-    outlier_ttm_flag_column = f"{column}_ttm_outlier_flag"
-    regime_ttm_column = f"{column}_ttm_stability_regime"
-
-   # Calculate drift as the mean of YoY growth over the past 4 periods excluding the current period
-    df[drift_yoy_column] = df[growth_yoy_column].shift(1).rolling(window=4).mean()
-    df.loc[df[growth_yoy_column].isna(), drift_yoy_column] = np.nan
-    df[drift_qoq_column] = df[growth_qoq_column].shift(1).rolling(window=4).mean()
-    df.loc[df[growth_qoq_column].isna(), drift_qoq_column] = np.nan
+    periods = _periods(ttm)
+    growth = block(df, [f"{column}_{p}_growth" for p in periods])
+    volatility = block(df, [f"{column}_{p}_volatility_4q" for p in periods])
+    volatility_flag = block(df, [f"{column}_{p}_volatility_flag" for p in periods])
+    pos = group_positions(df, by)
 
+    # Calculate drift as the mean of growth over the past 4 periods excluding the current period
+    drift, _ = rolling_mean_std(shift(growth, pos, 1), pos, window=4)
+    drift[np.isnan(growth)] = np.nan
 
     # Identify outliers where the absolute drift exceeds the 1.5 * volatility
-    df[outlier_yoy_flag_column] = df.apply(lambda x: 1 if abs(x[drift_yoy_column]) > 1.5 * x[volatility_yoy_column] else 0, axis=1)
-    df[outlier_qoq_flag_column] = df.apply(lambda x: 1 if abs(x[drift_qoq_column]) > 1.5 * x[volatility_qoq_column] else 0, axis=1)
-
-    df.loc[df[growth_yoy_column].isna(), outlier_yoy_flag_column] = np.nan
-    df.loc[df[growth_qoq_column].isna(), outlier_qoq_flag_column] = np.nan
-
+    outlier_flag = np.where(np.abs(drift) > 1.5 * volatility, 1.0, 0.0)
+    outlier_flag[np.isnan(growth)] = np.nan
 
     # Determine stability regime based on volatility and outlier flags
     # if volatility is low and no outlier → Stable
     # if volatility is low and outlier → Stable but Disturbed
     # if volatility is high → Volatile
     # if volatility is low and drift < -0.02 → Structurally Deteriorating
+    regimes = stability_regime(volatility_flag, outlier_flag, drift)
 
-    def get_stability_regime(volatility_flag, outlier_flag, drift) -> str:
-        if np.isnan(volatility_flag) or np.isnan(outlier_flag) or np.isnan(drift):
-            return np.nan
-        if volatility_flag == 0:
-            if outlier_flag == 0:
-                if drift < -0.02:
-                    return "structurally deteriorating"
-                else:
-                    return "stable"
-            else:
-                return "stable but disturbed"
-        else:
-            return "volatile"
-    df[regime_yoy_column] = df.apply(lambda row: 
-                                     get_stability_regime(row[volatility_yoy_flag_column], 
-                                                          row[outlier_yoy_flag_column], 
-                                                          row[drift_yoy_column]), axis=1)
-    df[regime_qoq_column] = df.apply(lambda row: 
-                                     get_stability_regime(row[volatility_qoq_flag_column], 
-                                                          row[outlier_qoq_flag_column], 
-                                                          row[drift_qoq_column]), axis=1)
-    
-    if ttm:
-        df[drift_ttm_column] = df[growth_ttm_column].shift(1).rolling(window=4).mean()
-        df.loc[df[growth_ttm_column].isna(), drift_ttm_column] = np.nan
-        df[outlier_ttm_flag_column] = df.apply(lambda x: 1 if abs(x[drift_ttm_column]) > 1.5 * x[volatility_ttm_column] else 0, axis=1)
-        df.loc[df[growth_ttm_column].isna(), outlier_ttm_flag_column] = np.nan
-        df[regime_ttm_column] = df.apply(lambda row: 
-                                        get_stability_regime(row[volatility_ttm_flag_column], 
-                                                            row[outlier_ttm_flag_column], 
-                                                            row[drift_ttm_column]), axis=1)
+    for i, p in enumerate(periods):
+        df[f"{column}_{p}_growth_drift"] = drift[:, i]
+        df[f"{column}_{p}_outlier_flag"] = outlier_flag[:, i]
+        df[f"{column}_{p}_stability_regime"] = regimes[:, i]
 
     return df
 
-def compute_stability_metrics(df: pd.DataFrame, column: str, volatility_threshold: float, ttm: bool = True) -> pd.DataFrame:
+def compute_stability_metrics(df: pd.DataFrame, column: str, volatility_threshold: float, ttm: bool = True,
+                              by: str = None) -> pd.DataFrame:
     """
     Compute stability metrics for a specified column in the DataFrame.
     """
-    df = calculate_volatility(df, column, volatility_threshold, ttm=ttm)
-    df = compute_volatility_regime(df, column, ttm=ttm)
-    return df
\ No newline at end of file
+    df = calculate_volatility(df, column, volatility_threshold, ttm=ttm, by=by)
+    df = compute_volatility_regime(df, column, ttm=ttm, by=by)
+    return df
@@ -0,0 +1,120 @@
+import os
+from database.utils import insert_records, read_sql_query
+import pandas as pd
+
+# Watermarks for the date-incremental mode of the daily metric jobs.
+# Each job (keyed by its target table) stores, per ticker, the last date it wrote
+# and a fingerprint of the upstream quarterly rows it read. A ticker whose
+# fingerprint is unchanged only recomputes the days after its watermark; a new
+# or restated quarter (or a missing watermark) triggers a full-history recompute.
+
+WATERMARK_TABLE = 'core.metric_watermarks'
+# METRICS_INCREMENTAL=0 forces the full-history batch run
+INCREMENTAL = os.getenv("METRICS_INCREMENTAL", "1") != "0"
+# Days re-emitted before the watermark so a revised latest close is picked up
+OVERLAP_DAYS = 3
+# Quarterly tables fingerprinted by their period and raw payload hash
+QUARTERLY_FINGERPRINT = "earnings_date::text || ':' || COALESCE(raw_json_sha256, '')"
+QUARTERLY_SOURCES = {
+    'core.balance_sheets_quarterly': QUARTERLY_FINGERPRINT,
+    'core.income_statements_quarterly': QUARTERLY_FINGERPRINT,
+    'core.cash_flow_statements_quarterly': QUARTERLY_FINGERPRINT,
+    'core.earnings': QUARTERLY_FINGERPRINT,
+}
+
+
+def read_source_fingerprints(conn, sources: dict) -> pd.DataFrame:
+    """
+    md5 per ticker over every upstream row the job depends on.
+    `sources` maps a table to the text expression identifying one of its rows.
+    """
+    parts = "\n            UNION ALL\n".join(
+        f"            SELECT tic, '{table}' AS source, {expression} AS part FROM {table}"
+        for table, expression in sources.items()
+    )
+    query = f"""
+        SELECT tic, md5(string_agg(source || '|' || COALESCE(part, ''), ',' ORDER BY source, part)) AS source_fingerprint
+        FROM (
+{parts}
+        ) AS parts
+        GROUP BY tic;
+    """
+    return read_sql_query(query, conn)
+
+
+def plan_incremental(conn, job: str, sources: dict = QUARTERLY_SOURCES) -> pd.DataFrame:
+    """
+    Decide, per ticker in the universe, where the job has to start.
+    Returns a tic-indexed frame with `start_date`, `full` (full-history recompute),
+    the previous `last_date` and the current `source_fingerprint`.
+    """
+    query = f"""
+        WITH first_dates AS (
+            SELECT tic, MIN(earnings_date)::date AS first_date
+            FROM core.balance_sheets_quarterly
+            GROUP BY tic
+        )
+        SELECT sp.tic, f.first_date, w.last_date, w.source_fingerprint AS last_fingerprint
+        FROM core.stock_profiles AS sp
+        JOIN first_dates AS f ON sp.tic = f.tic
+        LEFT JOIN {WATERMARK_TABLE} AS w ON w.job = '{job}' AND w.tic = sp.tic;
+    """
+    plan = read_sql_query(query, conn)
+    plan = plan.drop_duplicates('tic').set_index('tic')
+    fingerprints = read_source_fingerprints(conn, sources).set_index('tic')['source_fingerprint']
+    plan['source_fingerprint'] = plan.index.map(fingerprints)
+
+    plan['first_date'] = pd.to_datetime(plan['first_date'])
+    plan['last_date'] = pd.to_datetime(plan['last_date'])
+    plan['full'] = plan['last_date'].isna() | (plan['last_fingerprint'] != plan['source_fingerprint'])
+    resume_date = (plan['last_date'] - pd.Timedelta(days=OVERLAP_DAYS)).where(~plan['full'])
+    plan['start_date'] = resume_date.where(resume_date > plan['first_date'], plan['first_date'])
+    return plan.drop(columns=['last_fingerprint'])
+
+
+def describe_plan(plan: pd.DataFrame) -> str:
+    """One-line summary of an incremental plan for the job logs."""
+    n_full = int(plan['full'].sum())
+    return f"{len(plan) - n_full} tickers incremental, {n_full} full-history recompute"
+
+
+def save_watermarks(conn, job: str, plan: pd.DataFrame, transformed_df: pd.DataFrame,
+                    commit: bool = True) -> int:
+    """
+    Advance the watermarks after the job's rows are loaded: last_date becomes the
+    latest date written for each ticker and the fingerprint the one the run read.
+    """
+    written = transformed_df.groupby('tic')['date'].max()
+    watermarks = pd.DataFrame({
+        'job': job,
+        'tic': plan.index,
+        'last_date': plan.index.map(written),
+        'source_fingerprint': plan['source_fingerprint'].values,
+    })
+    watermarks['last_date'] = watermarks['last_date'].fillna(pd.Series(plan['last_date'].values))
+    watermarks = watermarks.dropna(subset=['last_date', 'source_fingerprint'])
+    watermarks['last_date'] = pd.to_datetime(watermarks['last_date']).dt.date
+    return insert_records(conn, watermarks, WATERMARK_TABLE, ['job', 'tic'], commit=commit)
+
+
+def load_with_watermarks(conn, job: str, load_records, transformed_df: pd.DataFrame, plan: pd.DataFrame = None,
+                         written: pd.DataFrame = None, commit: bool = True) -> int:
+    """
+    Write a job's rows with `load_records(df, conn, commit=False)` and, with a
+    plan, advance its watermarks (from `written`, transformed_df by default) in
+    the same transaction, so the watermarks never pass days that were not stored.
+    insert_records reports a failed batch as a rolled-back short count: that
+    raises here after rolling back. Returns the rows written.
+    """
+    try:
+        total_records = load_records(transformed_df, conn, commit=False)
+        if total_records != len(transformed_df):
+            raise RuntimeError(f"Loading {job} wrote {total_records} of {len(transformed_df)} rows")
+        if plan is not None:
+            save_watermarks(conn, job, plan, transformed_df if written is None else written, commit=False)
+        if commit:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return total_records
@@ -0,0 +1,53 @@
+"""Golden comparison: stored SQL percentiles vs pandas rank(pct=True) within each date cohort."""
+import sys
+import os
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
+
+import pandas as pd
+from database.utils import connect_to_db, read_sql_query
+from etl.transform.metrics.percentiles.compute_percentiles import TABLES, COHORTS, COHORT, read_metric_columns
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_DATES = 20  # most recent dates checked per table
+ATOL = 0.0005  # percentiles are stored as NUMERIC(6, 3)
+# ──────────────────────────────────────────────────────────────────
+
+
+conn = connect_to_db()
+if conn is None:
+    sys.exit(1)
+
+cohort_columns = [col.split('.')[1] for col in COHORTS[COHORT]]
+failures = 0
+for source_table, target_table in TABLES:
+    metric_columns = read_metric_columns(conn, source_table, target_table)
+    df = read_sql_query(f"""
+        WITH recent AS (
+            SELECT DISTINCT date FROM {source_table} ORDER BY date DESC LIMIT {N_DATES}
+        )
+        SELECT m.*{''.join(f', sp.{c}' for c in cohort_columns)},
+               {', '.join(f'p.{c}_percentile' for c in metric_columns)}
+        FROM {source_table} AS m
+        JOIN recent USING (date)
+        JOIN {target_table} AS p ON p.inference_id = m.inference_id
+        LEFT JOIN core.stock_profiles AS sp ON sp.tic = m.tic;
+    """, conn)
+    df = df.apply(lambda s: pd.to_numeric(s) if s.name.endswith('percentile') or s.name in metric_columns else s)
+
+    worst = 0.0
+    for col in metric_columns:
+        expected = df.groupby(['date'] + cohort_columns, dropna=False)[col].rank(pct=True) * 100
+        diff = (expected - df[f"{col}_percentile"]).abs()
+        if (expected.isna() != df[f"{col}_percentile"].isna()).any():
+            worst = float('inf')
+        worst = max(worst, diff.max(skipna=True) if diff.notna().any() else 0.0)
+    if worst <= ATOL:
+        print(f"✅ {target_table}: {len(df)} rows x {len(metric_columns)} metrics match (max abs diff {worst:.4f})")
+    else:
+        failures += 1
+        print(f"❌ {target_table}: max abs diff {worst}")
+
+conn.close()
+sys.exit(1 if failures else 0)
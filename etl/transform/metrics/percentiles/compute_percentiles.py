@@ -1,55 +1,137 @@
-from database.utils import connect_to_db, execute_query, insert_records, read_sql_query
+from database.utils import connect_to_db, read_sql_query
+import os
 import pandas as pd
-import yfinance as yf
-import numpy as np
+from etl.transform.metrics.incremental import INCREMENTAL
 
+# Cross-sectional percentiles ranked inside Postgres.
+# Each metric is ranked within its cohort on a single date (all tickers by
+# default), using pandas' rank(pct=True) convention: ties share their average
+# rank, NULL metrics are excluded from the cohort and stay NULL. Only dates with
+# a new or updated metrics row are rewritten, in chunks of DATE_CHUNK dates.
 
+TABLES = [['core.valuation_metrics', 'core.valuation_percentiles'],
+          ['core.profitability_metrics', 'core.profitability_percentiles'],
+          ['core.growth_metrics', 'core.growth_percentiles'],
+          ['core.efficiency_metrics', 'core.efficiency_percentiles'],
+          ['core.financial_health_metrics', 'core.financial_health_percentiles'],
+        ]
 
-def transform_records(df: pd.DataFrame) -> pd.DataFrame:
-    
-    transformed_df = df[['inference_id', 'tic', 'date']].copy()
-    columns = df.columns.tolist()
-    metric_columns = [col for col in columns if col not in ['inference_id', 'tic', 'date', 'updated_at']]
+# Cohort name -> core.stock_profiles (sp) columns added to the per-date partition
+COHORTS = {
+    'global': [],
+    'sector': ['sp.sector'],
+    'industry': ['sp.industry'],
+}
+COHORT = os.getenv("PERCENTILE_COHORT", "global")
+DATE_CHUNK = 250  # about one trading year per statement
+IDENTITY_COLUMNS = ['inference_id', 'tic', 'date', 'updated_at']
 
-    # Calculate percentiles for each metric column
-    for col in metric_columns:
-        percentile_col = f"{col}_percentile"
-        transformed_df[percentile_col] = df[col].rank(pct=True) * 100
-        # None or NaN values => np.nan
-        transformed_df.loc[df[col].isnull(), percentile_col] = np.nan
-    return transformed_df
 
+def read_metric_columns(conn, source_table: str, target_table: str) -> list:
+    """Metric columns of `source_table` that have a `<metric>_percentile` column in `target_table`."""
+    def _columns(table):
+        schema, name = table.split('.')
+        df = read_sql_query(f"""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_schema = '{schema}' AND table_name = '{name}'
+            ORDER BY ordinal_position;
+        """, conn)
+        return df['column_name'].tolist()
 
-def load_records(transformed_df, table, conn):
-    # Insert records into core.valuation_percentiles
-    total_records = insert_records(conn, transformed_df, table, ['inference_id'])
-    return total_records
+    target_columns = set(_columns(target_table))
+    return [col for col in _columns(source_table)
+            if col not in IDENTITY_COLUMNS and f"{col}_percentile" in target_columns]
+
+
+def read_dirty_dates(conn, source_table: str, target_table: str, full_refresh: bool = False) -> list:
+    """Dates with a metrics row that has no percentile row yet or changed after it was ranked."""
+    stale = "TRUE" if full_refresh else "p.inference_id IS NULL OR m.updated_at > p.updated_at"
+    df = read_sql_query(f"""
+        SELECT DISTINCT m.date::date AS date
+        FROM {source_table} AS m
+        LEFT JOIN {target_table} AS p ON p.inference_id = m.inference_id
+        WHERE {stale}
+        ORDER BY 1;
+    """, conn)
+    return df['date'].tolist()
+
+
+def build_upsert_query(source_table: str, target_table: str, metric_columns: list,
+                       cohort: str = COHORT) -> str:
+    """
+    INSERT ... SELECT ranking every metric within (date, cohort columns) for the
+    dates passed as the single %s array parameter.
+    """
+    partition = ", ".join(['m.date'] + COHORTS[cohort])
+    cohort_join = "LEFT JOIN core.stock_profiles AS sp ON sp.tic = m.tic" if COHORTS[cohort] else ""
 
+    # Average rank = (first rank of the tie + last rank of the tie) / 2, over the non-NULL count
+    percentiles = ",\n".join(
+        f"""                CASE WHEN m.{col} IS NULL THEN NULL
+                     ELSE 100.0 * (RANK() OVER w_{col} + COUNT(*) OVER w_{col})
+                          / (2 * COUNT(m.{col}) OVER cohort)
+                END AS {col}_percentile"""
+        for col in metric_columns
+    )
+    windows = ",\n".join(
+        [f"                cohort AS (PARTITION BY {partition})"] +
+        [f"                w_{col} AS (PARTITION BY {partition}, m.{col} IS NULL ORDER BY m.{col})"
+         for col in metric_columns]
+    )
+    target_columns = ['inference_id', 'tic', 'date'] + [f"{col}_percentile" for col in metric_columns]
+    # (tic, date) is unique in both the plain and the date-partitioned layout
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in target_columns if col not in ('tic', 'date'))
+
+    return f"""
+        WITH ranked AS (
+            SELECT m.inference_id, m.tic, m.date,
+{percentiles}
+            FROM {source_table} AS m
+            {cohort_join}
+            WHERE m.date = ANY(%s::date[])
+            WINDOW
+{windows}
+        )
+        INSERT INTO {target_table} ({', '.join(target_columns)})
+        SELECT * FROM ranked
+        ON CONFLICT (tic, date)
+        DO UPDATE SET {updates}, updated_at = NOW();
+    """
+
+
+def update_percentiles(conn, source_table: str, target_table: str,
+                       cohort: str = COHORT, full_refresh: bool = False) -> int:
+    """Re-rank the changed dates of one metrics table; returns the number of rows written."""
+    metric_columns = read_metric_columns(conn, source_table, target_table)
+    dates = read_dirty_dates(conn, source_table, target_table, full_refresh)
+    if not dates:
+        print(f"No new or updated dates for {target_table}.")
+        return 0
+
+    print(f"Ranking {len(metric_columns)} metrics over {len(dates)} dates ({cohort} cohort) into {target_table}")
+    query = build_upsert_query(source_table, target_table, metric_columns, cohort)
+    total_records = 0
+    with conn.cursor() as cursor:
+        for i in range(0, len(dates), DATE_CHUNK):
+            chunk = [pd.Timestamp(d).date() for d in dates[i : i + DATE_CHUNK]]
+            cursor.execute(query, (chunk,))
+            conn.commit()
+            total_records += cursor.rowcount
+            print(f"  {chunk[0]} → {chunk[-1]}: {cursor.rowcount} rows")
+    return total_records
 
 
-def main():
-    # Connect to the database
-    tables = [['core.valuation_metrics', 'core.valuation_percentiles'],
-              ['core.profitability_metrics', 'core.profitability_percentiles'],
-              ['core.growth_metrics', 'core.growth_percentiles'],
-              ['core.efficiency_metrics', 'core.efficiency_percentiles'],
-              ['core.financial_health_metrics', 'core.financial_health_percentiles'],          
-            ]
+def main(full_refresh: bool = not INCREMENTAL):
     conn = connect_to_db()
     if conn is not None:
-        # Extract records
-        cursor = conn.cursor()
-        for table_pair in tables:
-            source_table = table_pair[0]
-            target_table = table_pair[1]
-            query = f"""
-                SELECT *
-                FROM {source_table};
-            """
-            df = read_sql_query(query, conn)
-            transformed_df = transform_records(df)
-            total_records = load_records(transformed_df, target_table, conn)
+        if COHORT not in COHORTS:
+            print(f"❌ Unknown PERCENTILE_COHORT '{COHORT}', expected one of {list(COHORTS)}")
+            return
+        for source_table, target_table in TABLES:
+            total_records = update_percentiles(conn, source_table, target_table, COHORT, full_refresh)
             print(f"Total records inserted/updated into {target_table}: {total_records}")
+        conn.close()
 
     return
 
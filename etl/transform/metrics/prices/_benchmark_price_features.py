@@ -0,0 +1,115 @@
+"""Benchmark and golden checks for compute_price_features on a synthetic universe (no database needed)."""
+import sys
+import os
+import time
+import resource
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
+
+import numpy as np
+import pandas as pd
+from etl.transform.metrics.prices.compute_price_features import WINDOWS, OVERLAP_ROWS, CHUNK_SIZE, build_features
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+N_TICKERS = 5000
+YEARS = 20
+NEW_DAYS = 1  # trading days appended before the incremental run
+N_REFERENCE = 20  # tickers checked against the original analyst price_block
+RTOL = 1e-12  # pandas rolling sums and variances accumulate in a different order than the reference
+# ──────────────────────────────────────────────────────────────────
+
+
+def synthetic_prices(tickers: list, seed: int) -> pd.DataFrame:
+    """Geometric random walks on weekdays, with listings starting at random and a 2:1 split in some tickers."""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp.today().normalize()
+    days = pd.bdate_range(end - pd.DateOffset(years=YEARS), end)
+    frames = []
+    for tic in tickers:
+        dates = days[rng.integers(0, len(days) // 2):]
+        returns = rng.normal(0.0003, 0.02, len(dates))
+        close = 50 * np.exp(np.cumsum(returns))
+        if rng.random() < 0.05:
+            close[rng.integers(1, len(close)):] /= 2
+        frames.append(pd.DataFrame({'tic': tic, 'date': dates.date, 'close': np.round(close, 4)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def incremental_inputs(prices: pd.DataFrame, stored: pd.DataFrame) -> tuple:
+    """What read_prices and plan_price_features return after NEW_DAYS new closes: context closes and state."""
+    anchors = stored.groupby('tic').nth(-(OVERLAP_ROWS + 1)).set_index('tic')
+    state = pd.DataFrame({'anchor_date': pd.to_datetime(anchors['date']), 'peak_close': anchors['peak_close']})
+    since = state['anchor_date'] - pd.DateOffset(months=max(WINDOWS.values())) - pd.Timedelta(days=7)
+    since = prices['tic'].map(since)
+    return prices[pd.to_datetime(prices['date']) > since], state
+
+
+# ─── Reference: original etl/analysis/analysts/rolling_engine.py price_block ──
+
+def reference_price_stats(prices: pd.DataFrame, months: int) -> pd.DataFrame:
+    """Dense (windows x closes) price stats of every (date - months, date] window of one ticker."""
+    from etl.analysis.analysts.rolling_engine import window_bounds, summary_stats
+    dates = pd.to_datetime(prices['date']).to_numpy(dtype='datetime64[D]')
+    closes = prices['close'].to_numpy(dtype=float)
+    starts = (pd.DatetimeIndex(dates) - pd.DateOffset(months=months)).to_numpy(dtype='datetime64[D]')
+    lo, hi = window_bounds(dates, starts, dates)
+    i = np.arange(len(dates))
+    stats = summary_stats(np.where((i >= lo[:, None]) & (i < hi[:, None]), closes, np.nan))
+    return pd.DataFrame({'price_start': closes[lo], 'price_high': stats['high'], 'price_low': stats['low'],
+                         'price_p25': stats['p25'], 'price_median': stats['median'], 'price_p75': stats['p75'],
+                         'price_mean': stats['mean'], 'price_stddev': stats['stddev']})
+
+
+if __name__ == "__main__":
+    tickers = [f"T{i:05d}" for i in range(N_TICKERS)]
+    chunk_size = CHUNK_SIZE or N_TICKERS
+    failures = 0
+    n_rows = n_new = 0
+    full_time = incremental_time = 0.0
+
+    for c in range(0, N_TICKERS, chunk_size):
+        prices = synthetic_prices(tickers[c:c + chunk_size], seed=c)
+        old_prices = prices[prices.groupby('tic').cumcount(ascending=False) >= NEW_DAYS]
+        n_rows += len(prices)
+
+        start = time.perf_counter()
+        full = build_features(prices)
+        full_time += time.perf_counter() - start
+
+        # Incremental run after NEW_DAYS closes on top of a store built without them
+        stored = build_features(old_prices)
+        context, state = incremental_inputs(prices, stored)
+        start = time.perf_counter()
+        incremental = build_features(context, state=state)
+        incremental_time += time.perf_counter() - start
+        n_new += len(incremental)
+
+        expected = full.merge(incremental[['tic', 'date']], on=['tic', 'date'])
+        try:
+            pd.testing.assert_frame_equal(expected, incremental, check_exact=False, rtol=RTOL)
+        except AssertionError as e:
+            print(f"❌ Chunk {c // chunk_size + 1}: incremental rows differ from the full build: {e}")
+            failures += 1
+
+        if c == 0:
+            for tic in tickers[:N_REFERENCE]:
+                tic_full = full[full['tic'] == tic].reset_index(drop=True)
+                for window, months in WINDOWS.items():
+                    reference = reference_price_stats(prices[prices['tic'] == tic], months)
+                    actual = tic_full[[f"{col}_{window}" for col in reference.columns]]
+                    actual.columns = reference.columns
+                    try:
+                        pd.testing.assert_frame_equal(reference, actual, check_exact=False, rtol=RTOL)
+                    except AssertionError as e:
+                        print(f"❌ {tic} {window}: window stats differ from price_block: {e}")
+                        failures += 1
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Universe: {N_TICKERS} tickers x {YEARS} years = {n_rows:,} ticker-days, chunks of {chunk_size}")
+    print(f"Full build: {full_time:.1f}s ({n_rows / full_time:,.0f} rows/s)")
+    print(f"Incremental (+{NEW_DAYS} day): {incremental_time:.1f}s for {n_new:,} rows "
+          f"({NEW_DAYS + OVERLAP_ROWS} per ticker incl. overlap)")
+    print(f"Peak RSS: {peak_mb:,.0f} MB")
+    print("✅ Incremental and reference checks identical" if not failures else f"❌ {failures} failed checks")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,252 @@
+import os
+from database.utils import connect_to_db, insert_records, read_sql_query
+import numpy as np
+import pandas as pd
+from pandas.api.indexers import BaseIndexer
+from etl.utils import convert_decimals_to_float
+from etl.transform.metrics.batch_engine import ticker_filter, start_dates_cte, read_universe_tickers
+from etl.transform.metrics.incremental import INCREMENTAL
+
+# Price-derived features shared by the jobs that read daily closes, materialized
+# in core.price_features with one row per (tic, date): daily returns, price stats
+# and volatility over trailing calendar-month windows, drawdown from the running
+# peak, and jump/split flags.
+# Windows are (date - N months, date] over the ticker's own trading days, the
+# windows of the analyst rating summaries, which read their price stats from here.
+# Incremental runs resume each ticker from an anchor, the stored row
+# OVERLAP_ROWS rows back from the latest. Its peak_close carries the all-time
+# peak forward, and only the longest window of closes before it (12 months plus
+# a week) is reloaded as context. The run is therefore O(longest window + new
+# days) per ticker rather than O(new days): the window quantiles and std devs
+# need every close of the window, so the peak is the only rolling state carried
+# over, and what an incremental run saves is the rest of the ticker's history.
+# A ticker whose close at the anchor no longer matches
+# raw.stock_ohlcv_daily had its history re-adjusted (a split re-fetch by the
+# extractor) and is recomputed in full.
+
+JOB = 'core.price_features'
+
+# Trailing windows: column suffix -> length in calendar months
+WINDOWS = {'1m': 1, '3m': 3, '12m': 12}
+WINDOW_STATS = ['price_start', 'price_high', 'price_low', 'price_p25', 'price_median',
+                'price_p75', 'price_mean', 'price_stddev', 'volatility']
+FEATURES = ['close', 'return_1d', 'log_return_1d', 'peak_close', 'drawdown'] + \
+           [f"{stat}_{window}" for window in WINDOWS for stat in WINDOW_STATS] + \
+           ['is_price_jump', 'is_split_candidate']
+KEY_COLUMNS = ['tic', 'date']
+
+TRADING_DAYS = 252  # annualizes the daily log-return volatility
+# Daily moves flagged as jumps; the extractor re-fetches a ticker's history past the same threshold
+PRICE_JUMP_THRESHOLD = 0.1
+# Close / previous close ratios of common forward and reverse splits
+SPLIT_RATIOS = np.array([2, 3, 4, 5, 10, 1 / 2, 1 / 3, 1 / 4, 1 / 5, 1 / 10])
+SPLIT_TOLERANCE = 0.02
+# Stored rows re-emitted on every incremental run, so a revised latest close is picked up
+OVERLAP_ROWS = 3
+# Tickers per transform/load round; 0 = whole universe at once
+CHUNK_SIZE = int(os.getenv("PRICE_FEATURES_CHUNK_SIZE", "500"))
+
+# (tic, date) sort key: ticker code * _KEY_SPAN + days since _KEY_EPOCH
+_KEY_EPOCH = np.datetime64('1900-01-01', 'D')
+_KEY_SPAN = 1 << 20
+
+
+class _Windows(BaseIndexer):
+    """Precomputed [start, end) row bounds for pandas rolling aggregations."""
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        return self.start, self.end
+
+
+def window_starts(tics: np.ndarray, dates: np.ndarray, months: int) -> np.ndarray:
+    """
+    First row of each row's (date - months, date] window, for rows sorted by
+    tic and date. Windows never reach into the previous ticker.
+    """
+    codes = pd.factorize(tics)[0].astype(np.int64)
+    keys = codes * _KEY_SPAN + (dates.astype('datetime64[D]') - _KEY_EPOCH).astype(np.int64)
+    starts = (pd.DatetimeIndex(dates) - pd.DateOffset(months=months)).to_numpy(dtype='datetime64[D]')
+    return np.searchsorted(keys, codes * _KEY_SPAN + (starts - _KEY_EPOCH).astype(np.int64), side='right')
+
+
+def build_features(prices: pd.DataFrame, state: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    core.price_features rows from daily closes (tic, date, close).
+    `state` (tic-indexed anchor_date and peak_close) resumes tickers after their
+    anchor: their rows up to the anchor are only window context, and the running
+    peak starts from the stored one. Other tickers are computed from their first close.
+    """
+    df = prices.sort_values(['tic', 'date'], kind='mergesort').reset_index(drop=True)
+    df['date'] = pd.to_datetime(df['date'])
+    df['close'] = df['close'].astype(float)
+    tics = df['tic'].to_numpy()
+    dates = df['date'].to_numpy()
+    close = df['close'].to_numpy()
+
+    first = np.ones(len(df), dtype=bool)
+    first[1:] = tics[1:] != tics[:-1]
+    previous = np.where(first, np.nan, np.roll(close, 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = close / previous
+        df['return_1d'] = ratio - 1
+        df['log_return_1d'] = np.log(ratio)
+
+    peak = df.groupby('tic', sort=False)['close'].cummax().to_numpy()
+    if state is not None:
+        peak = np.fmax(peak, df['tic'].map(state['peak_close']).to_numpy(dtype=float))
+    df['peak_close'] = peak
+    df['drawdown'] = close / peak - 1
+
+    end = np.arange(1, len(df) + 1, dtype=np.int64)
+    log_returns = df['log_return_1d']
+    for window, months in WINDOWS.items():
+        start = window_starts(tics, dates, months)
+        rolling = df['close'].rolling(_Windows(start=start, end=end), min_periods=1)
+        df[f"price_start_{window}"] = close[start]
+        df[f"price_high_{window}"] = rolling.max().to_numpy()
+        df[f"price_low_{window}"] = rolling.min().to_numpy()
+        df[f"price_p25_{window}"] = rolling.quantile(0.25).to_numpy()
+        df[f"price_median_{window}"] = rolling.median().to_numpy()
+        df[f"price_p75_{window}"] = rolling.quantile(0.75).to_numpy()
+        df[f"price_mean_{window}"] = rolling.mean().to_numpy()
+        df[f"price_stddev_{window}"] = rolling.std().to_numpy()
+        volatility = log_returns.rolling(_Windows(start=start, end=end), min_periods=2).std()
+        df[f"volatility_{window}"] = volatility.to_numpy() * np.sqrt(TRADING_DAYS)
+
+    move = np.abs(df['return_1d'].to_numpy())
+    df['is_price_jump'] = move > PRICE_JUMP_THRESHOLD
+    near_split = np.abs(ratio[:, None] / SPLIT_RATIOS - 1) <= SPLIT_TOLERANCE
+    df['is_split_candidate'] = df['is_price_jump'] & near_split.any(axis=1)
+
+    if state is not None:
+        anchor = df['tic'].map(state['anchor_date'])
+        df = df[anchor.isna() | (df['date'] > anchor)]
+    df['date'] = df['date'].dt.date
+    return df[KEY_COLUMNS + FEATURES].reset_index(drop=True)
+
+
+def plan_price_features(conn, tickers: list = None) -> pd.DataFrame:
+    """
+    Per ticker of the universe: the anchor row incremental runs resume after
+    (anchor_date, peak_close; NaN without one) and `full` when the ticker has to
+    be recomputed from its first close: no anchor yet, or raw closes restated.
+    """
+    query = f"""
+        SELECT sp.tic, a.date AS anchor_date, a.close AS anchor_close, a.peak_close,
+               p.close AS raw_close
+        FROM core.stock_profiles AS sp
+        LEFT JOIN LATERAL (
+            SELECT f.date, f.close, f.peak_close
+            FROM {JOB} AS f
+            WHERE f.tic = sp.tic
+            ORDER BY f.date DESC
+            OFFSET {OVERLAP_ROWS} LIMIT 1
+        ) AS a ON TRUE
+        LEFT JOIN raw.stock_ohlcv_daily AS p ON p.tic = sp.tic AND p.date = a.date
+        WHERE {ticker_filter(tickers, 'sp.tic')};
+    """
+    plan = convert_decimals_to_float(read_sql_query(query, conn))
+    plan = plan.drop_duplicates('tic').set_index('tic')
+    plan['anchor_date'] = pd.to_datetime(plan['anchor_date'])
+    restated = ~np.isclose(plan['raw_close'].astype(float), plan['anchor_close'].astype(float), rtol=1e-9, atol=0)
+    plan['full'] = plan['anchor_date'].isna() | restated
+    plan.loc[plan['full'], ['anchor_date', 'peak_close']] = np.nan
+    return plan[['anchor_date', 'peak_close', 'full']]
+
+
+def describe_plan(plan: pd.DataFrame) -> str:
+    """One-line summary of a price feature plan for the job logs."""
+    n_full = int(plan['full'].sum())
+    return f"{len(plan) - n_full} tickers incremental, {n_full} full-history recompute"
+
+
+def read_prices(conn, tickers: list = None, anchor_dates: pd.Series = None) -> pd.DataFrame:
+    """
+    Daily closes of `tickers` (the universe when None), sorted by tic and date.
+    With `anchor_dates` (tic -> anchor date) only the longest window plus a week
+    before each anchor is read, plus every later close.
+    """
+    params = None
+    if anchor_dates is not None:
+        cte, params = start_dates_cte(anchor_dates)
+        # The constant lower bound lets a date-partitioned table skip the older years
+        context = f"INTERVAL '{max(WINDOWS.values())} months 7 days'"
+        params = params + (min(params[1], default=None),)
+        query = f"""
+            WITH {cte}
+            SELECT p.tic, p.date::date, p.close
+            FROM raw.stock_ohlcv_daily AS p
+            JOIN start_dates AS s ON p.tic = s.tic
+            WHERE p.date > s.start_date - {context} AND p.date > %s::date - {context}
+            ORDER BY p.tic, p.date;
+        """
+    else:
+        query = f"""
+            SELECT tic, date::date, close
+            FROM raw.stock_ohlcv_daily
+            WHERE {ticker_filter(tickers)}
+            ORDER BY tic, date;
+        """
+    df = read_sql_query(query, conn, params)
+    return convert_decimals_to_float(df)
+
+
+def transform_records(conn, tickers: list = None, plan: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Feature rows of `tickers` (the universe when None). With a plan, tickers it
+    marks incremental only get the rows after their anchor.
+    """
+    if plan is None:
+        return build_features(read_prices(conn, tickers))
+    if tickers is not None:
+        plan = plan[plan.index.isin(tickers)]
+    frames = []
+    full = plan.index[plan['full']].tolist()
+    if full:
+        frames.append(build_features(read_prices(conn, full)))
+    resumed = plan[~plan['full']]
+    if not resumed.empty:
+        frames.append(build_features(read_prices(conn, anchor_dates=resumed['anchor_date']), state=resumed))
+    frames = [frame for frame in frames if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=KEY_COLUMNS + FEATURES)
+
+
+def load_records(transformed_df: pd.DataFrame, conn, replace: list = None, commit: bool = True) -> int:
+    """
+    Upsert feature rows. Tickers in `replace` (full recomputes) lose their stored
+    rows first, so dates that disappeared upstream do not linger.
+    """
+    if replace:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {JOB} WHERE tic = ANY(%s::text[]);", (list(replace),))
+    total_records = insert_records(conn, transformed_df, JOB, KEY_COLUMNS, commit=False, batch_size=1000)
+    if commit:
+        conn.commit()
+    return total_records
+
+
+def main(incremental: bool = INCREMENTAL, chunk_size: int = CHUNK_SIZE):
+    conn = connect_to_db()
+    if conn is not None:
+        tickers = read_universe_tickers(conn)
+        plan = None
+        if incremental:
+            plan = plan_price_features(conn)
+            print(f"Refreshing price features: {describe_plan(plan)}")
+        else:
+            print("Refreshing price features for all tickers")
+
+        chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)] if chunk_size > 0 else [tickers]
+        for i, chunk in enumerate(chunks, start=1):
+            transformed_df = transform_records(conn, chunk, plan)
+            replace = chunk if plan is None else plan.index[plan['full'] & plan.index.isin(chunk)].tolist()
+            total_records = load_records(transformed_df, conn, replace) if not transformed_df.empty else 0
+            print(f"Chunk {i}/{len(chunks)}: {total_records} records inserted/updated "
+                  f"for {transformed_df['tic'].nunique()} tickers")
+        conn.close()
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -3,104 +3,60 @@ import pandas as pd
 import yfinance as yf
 import numpy as np
 from etl.utils import convert_decimals_to_float
+from etl.transform.metrics.batch_engine import read_close_prices, read_quarterly, \
+    rolling_sum, shift, merge_quarterly
+from etl.transform.metrics.incremental import INCREMENTAL, QUARTERLY_FINGERPRINT, plan_incremental, describe_plan, load_with_watermarks
 
+JOB = 'core.profitability_metrics'
+# Upstream rows that force a full recompute when they change
+SOURCES = {
+    'core.balance_sheets_quarterly': QUARTERLY_FINGERPRINT,
+    'core.income_statements_quarterly': QUARTERLY_FINGERPRINT,
+    'core.cash_flow_statements_quarterly': QUARTERLY_FINGERPRINT,
+}
 
-def transform_records(conn, tic: str, date: str) -> pd.DataFrame:
-    close_price_query = f"""
-        SELECT tic, date::date, close AS close_price
-        FROM raw.stock_ohlcv_daily
-        WHERE tic = '{tic}' AND date::date >= '{date}'::date
-        ORDER BY date;
-    """
-    df = read_sql_query(close_price_query, conn)
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date')
-    df = convert_decimals_to_float(df)
-
-
-    balance_sheet_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date, total_assets,
-            total_debt, total_equity, cash_and_short_term_investments, invested_capital
-        FROM core.balance_sheets_quarterly
-        WHERE tic = '{tic}'
-        ORDER BY earnings_date;
+
+def transform_records(conn, tic: str = None, date: str = None,
+                      start_dates: pd.Series = None) -> pd.DataFrame:
     """
-    df_balance_sheet = read_sql_query(balance_sheet_query, conn)
-    df_balance_sheet['earnings_date'] = pd.to_datetime(df_balance_sheet['earnings_date'])
-    df_balance_sheet = df_balance_sheet.sort_values('earnings_date')
-    df_balance_sheet = convert_decimals_to_float(df_balance_sheet)
-
-    df_balance_sheet['total_assets_avg'] = (df_balance_sheet['total_assets'] + df_balance_sheet['total_assets'].shift(4)) / 2
-    df_balance_sheet['total_equity_avg'] = (df_balance_sheet['total_equity'] + df_balance_sheet['total_equity'].shift(4)) / 2
-    df_balance_sheet['ic_avg'] = (df_balance_sheet['invested_capital'] + df_balance_sheet['invested_capital'].shift(4)) / 2
-
-    income_statement_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date,
-               eps_diluted, revenue, ebit, ebitda, gross_profit, net_income,
-               income_tax_expense, income_before_tax, effective_tax_rate
-        FROM core.income_statements_quarterly
-        WHERE tic = '{tic}'
-        ORDER BY earnings_date;
+    Compute profitability metrics for one ticker starting at `date`, or for
+    every ticker in a single batch when tic is None.
+    `start_dates` (tic -> first date) limits an incremental run to the new days.
     """
-    df_income = read_sql_query(income_statement_query, conn)
-    df_income['earnings_date'] = pd.to_datetime(df_income['earnings_date'])
-    df_income = df_income.sort_values('earnings_date')
-    df_income = convert_decimals_to_float(df_income)
-
-    df_income['revenue_ttm'] = df_income['revenue'].rolling(window=4).sum()
-    df_income['ebitda_ttm'] = df_income['ebitda'].rolling(window=4).sum()
-    df_income['ebit_ttm'] = df_income['ebit'].rolling(window=4).sum()
-    df_income['gross_profit_ttm'] = df_income['gross_profit'].rolling(window=4).sum()
-    df_income['net_income_ttm'] = df_income['net_income'].rolling(window=4).sum()
+    df = read_close_prices(conn, tic, date, start_dates)
+
+    df_balance_sheet = read_quarterly(conn, 'core.balance_sheets_quarterly', """
+            total_assets, total_debt, total_equity, cash_and_short_term_investments, invested_capital
+    """, tic, start_dates=start_dates)
+
+    df_balance_sheet['total_assets_avg'] = (df_balance_sheet['total_assets'] + shift(df_balance_sheet, 'total_assets', 4)) / 2
+    df_balance_sheet['total_equity_avg'] = (df_balance_sheet['total_equity'] + shift(df_balance_sheet, 'total_equity', 4)) / 2
+    df_balance_sheet['ic_avg'] = (df_balance_sheet['invested_capital'] + shift(df_balance_sheet, 'invested_capital', 4)) / 2
+
+    df_income = read_quarterly(conn, 'core.income_statements_quarterly', """
+            eps_diluted, revenue, ebit, ebitda, gross_profit, net_income,
+            income_tax_expense, income_before_tax, effective_tax_rate
+    """, tic, start_dates=start_dates)
+
+    df_income['revenue_ttm'] = rolling_sum(df_income, 'revenue')
+    df_income['ebitda_ttm'] = rolling_sum(df_income, 'ebitda')
+    df_income['ebit_ttm'] = rolling_sum(df_income, 'ebit')
+    df_income['gross_profit_ttm'] = rolling_sum(df_income, 'gross_profit')
+    df_income['net_income_ttm'] = rolling_sum(df_income, 'net_income')
     df_income['nopat'] = df_income.apply(
         lambda row: row['ebit_ttm'] * (1 - row['effective_tax_rate'])
         if pd.notna(row['ebit_ttm']) and pd.notna(row['effective_tax_rate']) else np.nan, axis=1
     )
 
 
-    cash_flow_statement_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date,
-               free_cash_flow as fcf, operating_cash_flow as ocf
-        FROM core.cash_flow_statements_quarterly
-        WHERE tic = '{tic}'
-        ORDER BY earnings_date;
-    """
-    df_cash_flow = read_sql_query(cash_flow_statement_query, conn)
-    df_cash_flow['earnings_date'] = pd.to_datetime(df_cash_flow['earnings_date'])
-    df_cash_flow = df_cash_flow.sort_values('earnings_date')
-    df_cash_flow = convert_decimals_to_float(df_cash_flow)
-
-    df_cash_flow['fcf_ttm'] = df_cash_flow['fcf'].rolling(window=4).sum()
-    df_cash_flow['ocf_ttm'] = df_cash_flow['ocf'].rolling(window=4).sum()
-
-
-    df = pd.merge_asof(
-            df, df_balance_sheet,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
-    df = pd.merge_asof(
-            df, df_income,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
-    df = pd.merge_asof(
-            df, df_cash_flow,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
+    df_cash_flow = read_quarterly(conn, 'core.cash_flow_statements_quarterly', """
+            free_cash_flow as fcf, operating_cash_flow as ocf
+    """, tic, start_dates=start_dates)
+
+    df_cash_flow['fcf_ttm'] = rolling_sum(df_cash_flow, 'fcf')
+    df_cash_flow['ocf_ttm'] = rolling_sum(df_cash_flow, 'ocf')
+
+    df = merge_quarterly(df, [df_balance_sheet, df_income, df_cash_flow])
 
     # Compute metrics
     df['gross_margin'] = df.apply(
@@ -147,17 +103,35 @@ def transform_records(conn, tic: str, date: str) -> pd.DataFrame:
 
 
 
-def load_records(transformed_df, conn):
+def load_records(transformed_df, conn, commit: bool = True):
 
     # Insert records into core.profitability_metrics
-    total_records = insert_records(conn, transformed_df, 'core.profitability_metrics', ['tic', 'date'])
+    total_records = insert_records(conn, transformed_df, JOB, ['tic', 'date'], commit=commit)
     return total_records
 
 
-def main():
+def main(batch: bool = True, incremental: bool = INCREMENTAL):
     # Connect to the database
     conn = connect_to_db()
     if conn is not None:
+        if batch:
+            # Load each source table once and compute every ticker together
+            plan = None
+            if incremental:
+                # Only the days after each ticker's watermark, unless a quarter changed
+                plan = plan_incremental(conn, JOB, SOURCES)
+                print(f"Processing all tickers incrementally: {describe_plan(plan)}")
+            else:
+                print("Processing all tickers in a single batch")
+            transformed_df = transform_records(conn, start_dates=None if plan is None else plan['start_date'])
+            if transformed_df.empty:
+                print("No new or updated records to process.")
+                return
+            # Rows and watermarks in one transaction: a failed write raises and moves no watermark
+            total_records = load_with_watermarks(conn, JOB, load_records, transformed_df, plan)
+            print(f"Total records inserted/updated: {total_records}")
+            return
+
         # Extract records
         cursor = conn.cursor()
         query = """
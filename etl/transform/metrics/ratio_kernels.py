@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# Array versions of the ratio rules used across the metric modules.
+# Inputs may be Series, arrays or scalars (Decimal and None are accepted);
+# outputs are float64 arrays with NaN wherever the original row-wise lambda
+# returned np.nan/None.
+
+
+def as_float(values) -> np.ndarray:
+    """Coerce a Series/array/scalar (Decimals, None, NaN) to a float64 array."""
+    if isinstance(values, pd.Series):
+        return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    return np.asarray(pd.to_numeric(pd.Series(np.atleast_1d(values)), errors='coerce'), dtype=float)
+
+
+def mask(values, condition) -> np.ndarray:
+    """Keep `values` where `condition` holds, NaN elsewhere."""
+    return np.where(condition, as_float(values), np.nan)
+
+
+def safe_divide(numerator, denominator) -> np.ndarray:
+    """numerator / denominator, NaN when either is NaN or the denominator is 0."""
+    num = as_float(numerator)
+    den = as_float(denominator)
+    valid = ~np.isnan(num) & ~np.isnan(den) & (den != 0)
+    out = np.full(np.broadcast(num, den).shape, np.nan)
+    np.divide(num, den, out=out, where=valid)
+    return out
+
+
+def positive_divide(numerator, denominator) -> np.ndarray:
+    """numerator / denominator, NaN unless the denominator is strictly positive."""
+    den = as_float(denominator)
+    return safe_divide(numerator, np.where(den > 0, den, np.nan))
+
+
+def growth_rate(current, previous) -> np.ndarray:
+    """(current - previous) / |previous|, NaN when previous is 0 or either is NaN."""
+    cur = as_float(current)
+    prev = as_float(previous)
+    return safe_divide(cur - prev, np.abs(prev))
+
+
+def cagr(current, base, years: float) -> np.ndarray:
+    """
+    (current / base) ** (1 / years) - 1 for a positive base.
+    A negative ratio has no real root and yields NaN (the lambdas produced a
+    complex number there, which was later replaced with NaN).
+    """
+    ratio = positive_divide(current, base)
+    out = np.full(ratio.shape, np.nan)
+    valid = ~np.isnan(ratio) & (ratio >= 0)
+    out[valid] = ratio[valid] ** (1 / years) - 1
+    return out
+
+
+def capped_rate(current, previous, cap: float = 10.0, floor: float = 1e-6) -> np.ndarray:
+    """
+    Array form of etl.utils.calculate_capped_rate:
+    (current - previous) / max(|previous|, floor), clipped to [-cap, cap].
+    """
+    cur = as_float(current)
+    prev = as_float(previous)
+    rate = (cur - prev) / np.maximum(np.abs(prev), floor)
+    return np.clip(rate, -cap, cap)
@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+
+# Array versions of the flag / count / streak / regime rules of the
+# growth-stability-acceleration framework and the earnings surprise metrics.
+# Values are 2-D float blocks (rows x metric columns) so one call covers every
+# yoy/qoq/ttm column; `pos` is each row's position within its ticker (see
+# group_positions), so one call also covers every ticker. Rows of a ticker must
+# be contiguous and in time order, as the readers return them.
+
+
+def group_positions(df: pd.DataFrame, by: str = None) -> np.ndarray:
+    """0-based position of each row within its run of equal `by` values (one group when by is None)."""
+    idx = np.arange(len(df))
+    if by is None:
+        return idx
+    keys = df[by].to_numpy()
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = keys[1:] != keys[:-1]
+    return idx - np.maximum.accumulate(np.where(starts, idx, 0))
+
+
+def block(df: pd.DataFrame, columns: list) -> np.ndarray:
+    """Columns of df as a float (rows x columns) block."""
+    return df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+
+def shift(values: np.ndarray, pos: np.ndarray, periods: int = 1) -> np.ndarray:
+    """Per-group lag by `periods` rows (periods > 0), NaN before the group has that much history."""
+    out = np.full(values.shape, np.nan)
+    out[periods:] = values[:-periods]
+    out[pos < periods] = np.nan
+    return out
+
+
+def _lags(values: np.ndarray, pos: np.ndarray, window: int) -> list:
+    return [values] + [shift(values, pos, k) for k in range(1, window)]
+
+
+def rolling_sum(values: np.ndarray, pos: np.ndarray, window: int = 4,
+                min_periods: int = None, skipna: bool = False) -> np.ndarray:
+    """
+    Per-group trailing sum over `window` rows, NaN while the group has fewer
+    than `min_periods` rows (default: window). NaN inside the window makes the
+    sum NaN unless skipna, which counts it as 0.
+    """
+    lags = _lags(values, pos, window)
+    available = np.minimum(pos + 1, window)
+    if values.ndim == 2:
+        available = available[:, None]
+    total = sum(np.where(available > k, np.nan_to_num(lag), 0.0) for k, lag in enumerate(lags))
+    ok = available >= (window if min_periods is None else min_periods)
+    if not skipna:
+        ok = ok & ~np.logical_or.reduce([np.isnan(lag) & (available > k) for k, lag in enumerate(lags)])
+    return np.where(ok, total, np.nan)
+
+
+def rolling_mean_std(values: np.ndarray, pos: np.ndarray, window: int = 4) -> tuple:
+    """Per-group trailing mean and sample std over a full window, NaN if any value is NaN."""
+    lags = _lags(values, pos, window)
+    mean = sum(lags) / window
+    std = np.sqrt(sum((lag - mean) ** 2 for lag in lags) / (window - 1))
+    return mean, std
+
+
+def positive_flag(values: np.ndarray) -> np.ndarray:
+    """1.0 where value > 0, 0.0 where value <= 0, NaN where value is NaN."""
+    return np.where(np.isnan(values), np.nan, (values > 0).astype(float))
+
+
+def streak(flags: np.ndarray, pos: np.ndarray, on_value=1) -> np.ndarray:
+    """
+    Per-group run length of consecutive `on_value` up to each row, as
+    etl.utils.calculate_streak: [1,1,0,1,1,NaN] -> [1,2,0,1,2,NaN].
+    """
+    on = flags == on_value
+    idx = np.arange(len(flags))
+    if flags.ndim == 2:
+        idx = idx[:, None]
+        pos = pos[:, None]
+    # Index of the last row that breaks the run: an off row, or the row before the group starts
+    breaks = np.where(~on, idx, np.where(pos == 0, idx - 1, -1))
+    out = (idx - np.maximum.accumulate(breaks, axis=0)).astype(float)
+    out[np.isnan(flags)] = np.nan
+    return out
+
+
+def select(conditions: list, choices: list, default=None) -> np.ndarray:
+    """np.select over label choices into an object array; conditions are checked in order."""
+    shape = np.shape(conditions[0])
+    labels = [np.full(shape, choice, dtype=object) for choice in choices]
+    return np.select(conditions, labels, default=np.full(shape, default, dtype=object))
+
+
+# ─── Regime tables ────────────────────────────────────────────────
+
+def growth_class(growth: np.ndarray, score_regime: list) -> np.ndarray:
+    """Growth rate -> class by the four score_regime thresholds; None when NaN."""
+    out = select(
+        [growth < score_regime[0], growth < score_regime[1], growth < score_regime[2], growth < score_regime[3]],
+        ["deep contraction", "mild contraction", "moderate growth", "strong growth"],
+        default="very strong growth",
+    )
+    return np.where(np.isnan(growth), None, out)
+
+
+def growth_regime(count: np.ndarray, streak_length: np.ndarray) -> np.ndarray:
+    """Positive-growth count_4q and streak -> growth regime; None when either is NaN or no rule matches."""
+    out = select(
+        [(count >= 3) & (streak_length >= 3),
+         (count >= 3) & (streak_length >= 1) & (streak_length < 3),
+         (count >= 3) & (streak_length == 0),
+         (count == 2) & (streak_length == 2),
+         count == 2,
+         (count == 1) & (streak_length == 1),
+         (count <= 1) & (streak_length == 0)],
+        ["sustained expansion", "developing expansion", "broken growth streak",
+         "emerging growth", "volatile growth", "tentative turnaround", "persistent contraction"],
+    )
+    return np.where(np.isnan(count) | np.isnan(streak_length), None, out)
+
+
+def stability_regime(volatility_flag: np.ndarray, outlier_flag: np.ndarray, drift: np.ndarray) -> np.ndarray:
+    """Volatility flag, outlier flag and drift -> stability regime; NaN when any is NaN."""
+    low = volatility_flag == 0
+    out = select(
+        [low & (outlier_flag == 0) & (drift < -0.02), low & (outlier_flag == 0), low],
+        ["structurally deteriorating", "stable", "stable but disturbed"],
+        default="volatile",
+    )
+    return np.where(np.isnan(volatility_flag) | np.isnan(outlier_flag) | np.isnan(drift), np.nan, out)
+
+
+def accel_regime(count: np.ndarray, streak_length: np.ndarray) -> np.ndarray:
+    """Positive-acceleration count_4q and streak -> acceleration regime; NaN when either is NaN."""
+    out = select(
+        [(count >= 3) & (streak_length >= 2),
+         (count >= 3) & (streak_length >= 1),
+         count >= 3,
+         (count == 2) & (streak_length == 2),
+         count == 2,
+         (count == 1) & (streak_length == 1)],
+        ["sustained acceleration", "choppy acceleration", "broken acceleration streak",
+         "emerging acceleration", "unstable momentum", "broken deceleration streak"],
+        default="persistent deceleration",
+    )
+    return np.where(np.isnan(count) | np.isnan(streak_length), np.nan, out)
+
+
+def eps_regime(eps: np.ndarray, eps_prev: np.ndarray) -> np.ndarray:
+    """EPS and previous-quarter EPS -> sign/direction regime; 'unknown' when either is NaN."""
+    both_neg = (eps < 0) & (eps_prev < 0)
+    both_pos = (eps > 0) & (eps_prev > 0)
+    with np.errstate(invalid='ignore'):
+        change = np.abs(eps - eps_prev) / np.maximum(np.maximum(np.abs(eps), np.abs(eps_prev)), 1e-6)
+    out = select(
+        [(eps_prev < 0) & (eps > 0),
+         (eps_prev > 0) & (eps < 0),
+         both_neg & (eps > eps_prev),
+         both_neg & (eps < eps_prev),
+         both_pos & (eps > eps_prev),
+         both_pos & (eps < eps_prev),
+         change <= 0.05],
+        ["turnaround", "profit to loss", "loss narrowing", "loss widening",
+         "positive growth", "profit decline", "flat"],
+        default="unknown",
+    )
+    return np.where(np.isnan(eps) | np.isnan(eps_prev), "unknown", out)
+
+
+def surprise_class(surprise: np.ndarray) -> np.ndarray:
+    """Surprise rate -> beat/miss class; 'unknown' when NaN."""
+    return select(
+        [surprise >= 0.10, surprise >= 0.03, surprise >= 0.01, surprise >= 0.0,
+         surprise >= -0.01, surprise >= -0.05, surprise < -0.05],
+        ["major beat", "moderate beat", "slight beat", "in-line (positive)",
+         "in-line (negative)", "slight miss", "major miss"],
+        default="unknown",
+    )
+
+
+def surprise_regime(count: np.ndarray, streak_length: np.ndarray) -> np.ndarray:
+    """Beat count_4q and beat streak -> surprise regime; 'unknown' when either is NaN."""
+    out = select(
+        [(count >= 3) & (streak_length >= 3),
+         (count >= 3) & (streak_length >= 1) & (streak_length <= 2),
+         (count == 3) & (streak_length == 0),
+         (count == 2) & (streak_length == 2),
+         (count == 2) & (streak_length < 2),
+         (count <= 1) & (streak_length <= 1)],
+        ["consistent outperform", "frequent beat", "broken beat streak",
+         "emerging beat", "mixed performance", "consistent miss"],
+        default="unknown",
+    )
+    return np.where(np.isnan(count) | np.isnan(streak_length), "unknown", out)
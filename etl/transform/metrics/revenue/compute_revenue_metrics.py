@@ -3,8 +3,10 @@ from etl.transform.metrics.gsa_framework.compute_growth_metrics import compute_g
 from etl.transform.metrics.gsa_framework.compute_stability_metrics import compute_stability_metrics
 from etl.transform.metrics.gsa_framework.compute_accel_metrics import compute_accel_metrics 
 import pandas as pd
+from etl.transform.metrics.batch_engine import ticker_filter, rolling_sum
 
-def read_records(conn, tic: str) -> pd.DataFrame:
+def read_records(conn, tic: str = None) -> pd.DataFrame:
+    """Quarterly rows of one ticker, or of every ticker in core.stock_profiles when tic is None."""
     # query = f"""
     #     SELECT e.event_id, e.tic, e.calendar_year, e.calendar_quarter, e.revenue, e.raw_json_sha256
     #     FROM core.earnings as e
@@ -23,7 +25,8 @@ def read_records(conn, tic: str) -> pd.DataFrame:
         ON e.tic = r.tic
             AND e.calendar_year = r.calendar_year
             AND e.calendar_quarter = r.calendar_quarter
-        WHERE e.tic = '{tic}'
+        JOIN core.stock_profiles AS sp ON e.tic = sp.tic
+        WHERE {ticker_filter(tic, 'e.tic')}
         ORDER BY e.tic, e.calendar_year, e.calendar_quarter;
     """
     df = read_sql_query(query, conn)
@@ -32,37 +35,35 @@ def read_records(conn, tic: str) -> pd.DataFrame:
 
 
 def transform_records(df: pd.DataFrame) -> pd.DataFrame:
+    """Growth, stability and acceleration metrics for every ticker in df in one grouped pass."""
     transformed_df = df.copy()
-    transformed_df['revenue_ttm'] = transformed_df['revenue'].rolling(window=4).sum()
-    transformed_df = compute_growth_metrics(transformed_df, column="revenue", score_regime=[-0.1, 0, 0.1, 0.3])
-    transformed_df = compute_stability_metrics(transformed_df, column="revenue", volatility_threshold=0.05)
-    transformed_df = compute_accel_metrics(transformed_df, column="revenue")
+    transformed_df['revenue_ttm'] = rolling_sum(transformed_df, 'revenue')
+    transformed_df = compute_growth_metrics(transformed_df, column="revenue", score_regime=[-0.1, 0, 0.1, 0.3], by='tic')
+    transformed_df = compute_stability_metrics(transformed_df, column="revenue", volatility_threshold=0.05, by='tic')
+    transformed_df = compute_accel_metrics(transformed_df, column="revenue", by='tic')
     return transformed_df
 
 
-def load_records(transformed_df, conn):
+def load_records(transformed_df, conn, commit: bool = True):
 
     # Insert records into core.revenue_metrics
-    total_records = insert_records(conn, transformed_df, 'core.revenue_metrics', ['tic', 'calendar_year', 'calendar_quarter'])
+    total_records = insert_records(conn, transformed_df, 'core.revenue_metrics', ['tic', 'calendar_year', 'calendar_quarter'], commit=commit)
     return total_records
 
 def main():
     # Connect to the database
     conn = connect_to_db()
     if conn is not None:
-        # Extract records
-        cursor = conn.cursor()
-        cursor.execute("SELECT tic FROM core.stock_profiles;")
-        records = cursor.fetchall()
-        for record in records:
-            df = read_records(conn, record[0])
-            if df.empty:
-                print("No new or updated records to process.")
-                return
-            transformed_df = transform_records(df)
-            # Load records
-            total_records = load_records(transformed_df, conn)
-            print(f"Total records inserted/updated for {record[0]}: {total_records}")
+        # Extract records for every ticker at once
+        df = read_records(conn)
+        if df.empty:
+            print("No new or updated records to process.")
+            return
+        transformed_df = transform_records(df)
+        # Load records
+        total_records = load_records(transformed_df, conn)
+        print(f"Total records inserted/updated for {transformed_df['tic'].nunique()} tickers: {total_records}")
+        conn.close()
 
     return
 
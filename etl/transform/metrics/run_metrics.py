@@ -0,0 +1,121 @@
+import os
+import resource
+from database.utils import connect_to_db
+import pandas as pd
+from etl.transform.metrics.batch_engine import bundle_cache, bundle_memory, read_universe_tickers
+from etl.transform.metrics.incremental import INCREMENTAL, QUARTERLY_SOURCES, plan_incremental, describe_plan, \
+    load_with_watermarks
+from etl.transform.metrics.profitability import compute_eps_diluted_metrics, compute_profitability_metrics
+from etl.transform.metrics.revenue import compute_revenue_metrics
+from etl.transform.metrics.valuation import compute_valuation_metrics
+from etl.transform.metrics.growth import compute_growth_metrics
+from etl.transform.metrics.efficiency import compute_efficiency_metrics
+from etl.transform.metrics.financial_health import compute_financial_health_metrics
+
+# Single-pass runner for the Phase 2 metric jobs.
+# Each chunk of tickers is processed inside one bundle_cache(): the close prices,
+# quarterly statements and fundamentals are read once and shared by every job,
+# and all outputs (plus the incremental watermarks) are written in one
+# transaction, so a failed chunk leaves no partial results behind.
+# The memory report printed per chunk is what METRICS_CHUNK_SIZE is tuned with.
+
+# Tickers per chunk; 0 loads the whole universe as one bundle
+CHUNK_SIZE = int(os.getenv("METRICS_CHUNK_SIZE", "0"))
+
+# Jobs transforming earnings quarters: read_records(conn, tic) -> transform_records(df)
+QUARTERLY_JOBS = {
+    'core.eps_diluted_metrics': compute_eps_diluted_metrics,
+    'core.revenue_metrics': compute_revenue_metrics,
+}
+# Daily jobs: transform_records(conn, tic, start_dates=...), watermarked under their JOB
+# against their SOURCES (QUARTERLY_SOURCES when the module defines none)
+DAILY_JOBS = {
+    module.JOB: module for module in [
+        compute_valuation_metrics,
+        compute_profitability_metrics,
+        compute_growth_metrics,
+        compute_efficiency_metrics,
+        compute_financial_health_metrics,
+    ]
+}
+
+
+def _mb(n_bytes: float) -> str:
+    return f"{n_bytes / 2**20:,.1f} MB"
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def transform_chunk(conn, tickers: list = None, plans: dict = None) -> tuple:
+    """
+    Run every Phase 2 job over one chunk (tickers=None for the universe) from a
+    shared bundle. Returns job -> (module, transformed_df, plan or None) and the
+    bundle size in bytes.
+    `plans` (job -> plan_incremental frame) switches the daily jobs to incremental.
+    """
+    outputs = {}
+    with bundle_cache():
+        for job, module in QUARTERLY_JOBS.items():
+            df = module.read_records(conn, tickers)
+            outputs[job] = (module, df if df.empty else module.transform_records(df), None)
+
+        for job, module in DAILY_JOBS.items():
+            plan = None
+            if plans is not None:
+                plan = plans[job] if tickers is None else plans[job][plans[job].index.isin(tickers)]
+                df = module.transform_records(conn, start_dates=plan['start_date']) if not plan.empty else pd.DataFrame()
+            else:
+                df = module.transform_records(conn, tickers)
+            outputs[job] = (module, df, plan)
+        memory = bundle_memory()
+    return outputs, memory
+
+
+def load_chunk(conn, outputs: dict) -> dict:
+    """Write every job's rows and watermarks in one transaction; job -> rows written."""
+    totals = {}
+    try:
+        for job, (module, df, plan) in outputs.items():
+            totals[job] = load_with_watermarks(conn, job, module.load_records, df, plan, commit=False) \
+                if not df.empty else 0
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return totals
+
+
+def main(incremental: bool = INCREMENTAL, chunk_size: int = CHUNK_SIZE):
+    conn = connect_to_db()
+    if conn is not None:
+        plans = None
+        if incremental:
+            plans = {job: plan_incremental(conn, job, getattr(module, 'SOURCES', QUARTERLY_SOURCES))
+                     for job, module in DAILY_JOBS.items()}
+            for job, plan in plans.items():
+                print(f"{job}: {describe_plan(plan)}")
+
+        chunks = [None]
+        if chunk_size > 0:
+            tickers = read_universe_tickers(conn)
+            chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+
+        for i, tickers in enumerate(chunks, start=1):
+            label = "all tickers" if tickers is None else f"{len(tickers)} tickers"
+            print(f"Chunk {i}/{len(chunks)}: {label}")
+            outputs, memory = transform_chunk(conn, tickers, plans)
+            totals = load_chunk(conn, outputs)
+            for job, total in totals.items():
+                print(f"  {job}: {total} records inserted/updated")
+            output_memory = sum(df.memory_usage(deep=True).sum() for _, df, _ in outputs.values())
+            print(f"  Memory: bundle {_mb(memory)}, outputs {_mb(output_memory)}, peak RSS {_mb(peak_rss())}")
+        conn.close()
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Golden comparison: vectorized score_frame vs the row-wise df.apply scoring it replaced, plus a what-if timing."""
+import sys
+import os
+import time
+
+# Ensure project root is on PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
+
+import numpy as np
+import pandas as pd
+from database.utils import connect_to_db
+from etl.transform.metrics.stock_scores.score_config import WEIGHTS
+from etl.transform.metrics.stock_scores.score_engine import load_percentiles, score_frame
+
+# ─── PARAMETERS ───────────────────────────────────────────────────
+WHAT_IF_WEIGHTS = {**WEIGHTS, "growth": 1.5, "efficiency": 0.0}
+# ──────────────────────────────────────────────────────────────────
+
+
+# Reference row-wise rules, copied from the original compute_stock_scores.py
+def _to_float_or_nan(value) -> float:
+    if value is None:
+        return float("nan")
+    if pd.isna(value):
+        return float("nan")
+    try:
+        return float(value)
+    except Exception:
+        return float("nan")
+
+
+def _nanmin(values) -> float:
+    arr = np.array([_to_float_or_nan(v) for v in values], dtype=float)
+    if arr.size == 0 or np.isnan(arr).all():
+        return float("nan")
+    return float(np.nanmin(arr))
+
+
+def _nanmax(values) -> float:
+    arr = np.array([_to_float_or_nan(v) for v in values], dtype=float)
+    if arr.size == 0 or np.isnan(arr).all():
+        return float("nan")
+    return float(np.nanmax(arr))
+
+def _nanmean(values) -> float:
+    arr = np.array([_to_float_or_nan(v) for v in values], dtype=float)
+    if arr.size == 0 or np.isnan(arr).all():
+        return float("nan")
+    return float(np.nanmean(arr))
+
+
+def compute_valuation_score(row):
+    cols = []
+    cols.append(100 - _to_float_or_nan(row['pe_ttm_percentile']))
+    cols.append(100 - _to_float_or_nan(row['pe_forward_percentile']))
+    cols.append(100 - _to_float_or_nan(row['peg_ratio_forward_percentile']))
+    cols.append(100 - _to_float_or_nan(row['p_to_fcf_ttm_percentile']))
+
+    max_score = _nanmax(cols)
+    min_score = _nanmin(cols)
+    return 0.75 * max_score + 0.25 * min_score
+
+def compute_profitability_score(row):
+    cols = [
+        row['net_margin_percentile'],
+        row['roe_percentile'],
+        row['fcf_margin_percentile'],
+        row['roic_percentile'],
+    ]
+    max_score = _nanmax(cols)
+    min_score = _nanmin(cols)
+    return 0.75 * max_score + 0.25 * min_score
+
+def compute_growth_score(row):
+    cols = [
+        row['forward_revenue_growth_percentile'],
+        row['revenue_growth_yoy_percentile'],
+        row['revenue_cagr_3y_percentile'],
+    ]
+    if pd.notna(row.get('ebitda_growth_yoy_percentile')):
+        cols.append(row['ebitda_growth_yoy_percentile'])
+    if pd.notna(row.get('forward_eps_growth_percentile')):
+        cols.append(row['forward_eps_growth_percentile'])
+    elif pd.notna(row.get('eps_growth_yoy_percentile')):
+        cols.append(row['eps_growth_yoy_percentile'])
+
+    max_score = _nanmax(cols)
+    min_score = _nanmin(cols)
+    return 0.75 * max_score + 0.25 * min_score
+
+def compute_efficiency_score(row):
+    cols = [
+        row['asset_turnover_percentile'],
+        row['fixed_asset_turnover_percentile']
+    ]
+    cols_inventory = []
+    cols_inventory.append(100 - _to_float_or_nan(row['dio_percentile']))
+    cols_inventory.append(100 - _to_float_or_nan(row['dpo_percentile']))
+    cols_inventory.append(100 - _to_float_or_nan(row['dso_percentile']))
+    cols_inventory.append(100 - _to_float_or_nan(row['cash_conversion_cycle_percentile']))
+
+    cols_non_inventory = []
+    cols_non_inventory.append(row['revenue_per_employee_percentile'])
+    cols_non_inventory.append(100 - _to_float_or_nan(row['opex_ratio_percentile']))
+
+    if _nanmean(cols_inventory) != float("nan") and _nanmean(cols_inventory) > _nanmean(cols_non_inventory):
+        cols += cols_inventory
+    elif _nanmean(cols_non_inventory) != float("nan"):
+        cols += cols_non_inventory
+
+    max_score = _nanmax(cols)
+    min_score = _nanmin(cols)
+    return 0.75 * max_score + 0.25 * min_score
+
+def compute_financial_health_score(row):
+    cols = [row['interest_coverage_ttm_percentile']]
+    cols.append(
+        _nanmax(
+            [
+                100 - _to_float_or_nan(row['net_debt_to_ebitda_ttm_percentile']),
+                100 - _to_float_or_nan(row['debt_to_assets_percentile']),
+                100 - _to_float_or_nan(row['debt_to_equity_percentile']),
+                row['altman_z_score_percentile']
+
+            ]
+        )
+    )
+    cols.append(_nanmax([row['current_ratio_percentile'], row['cash_ratio_percentile']]))
+
+    max_score = _nanmax(cols)
+    min_score = _nanmin(cols)
+    return 0.75 * max_score + 0.25 * min_score
+
+
+def _reference_scores(df: pd.DataFrame) -> pd.DataFrame:
+    out = []
+    for _, group in df.groupby('tic', sort=False):
+        group = group.copy()
+        group['valuation_score'] = group.apply(compute_valuation_score, axis=1)
+        group['profitability_score'] = group.apply(compute_profitability_score, axis=1)
+        group['growth_score'] = group.apply(compute_growth_score, axis=1)
+        group['efficiency_score'] = group.apply(compute_efficiency_score, axis=1)
+        group['financial_health_score'] = group.apply(compute_financial_health_score, axis=1)
+        group['total_score'] = (group['valuation_score'] + group['profitability_score'] +
+                                0.8 * group['growth_score'] + 0.25 * group['efficiency_score'] +
+                                0.25 * group['financial_health_score']) / 3.3
+        out.append(group)
+    scores = pd.concat(out)
+    columns = ['valuation_score', 'profitability_score', 'growth_score',
+               'efficiency_score', 'financial_health_score', 'total_score']
+    scores[columns] = scores.groupby('tic', sort=False)[columns].ffill()
+    return scores[['tic', 'date'] + columns].reset_index(drop=True)
+
+
+conn = connect_to_db()
+if conn is None:
+    sys.exit(1)
+
+df = load_percentiles(conn)
+conn.close()
+print(f"Loaded {len(df)} rows for {df['tic'].nunique()} tickers")
+
+start = time.perf_counter()
+reference = _reference_scores(df)
+print(f"Row-wise apply: {time.perf_counter() - start:.2f}s")
+
+start = time.perf_counter()
+scores = score_frame(df)
+print(f"score_frame:    {time.perf_counter() - start:.3f}s")
+
+failures = 0
+try:
+    pd.testing.assert_frame_equal(reference, scores[reference.columns], check_exact=False, rtol=1e-12, atol=0)
+    print(f"✅ Identical: {len(scores)} rows x {scores.shape[1]} columns")
+except AssertionError as e:
+    failures += 1
+    print(f"❌ Mismatch: {e}")
+
+start = time.perf_counter()
+what_if = score_frame(df, weights=WHAT_IF_WEIGHTS)
+print(f"What-if re-score {WHAT_IF_WEIGHTS}: {time.perf_counter() - start:.3f}s, "
+      f"mean total {np.nanmean(scores['total_score']):.2f} -> {np.nanmean(what_if['total_score']):.2f}")
+
+sys.exit(1 if failures else 0)
@@ -0,0 +1,51 @@
+# Pillar compositions and weights for core.stock_scores.
+#
+# Each pillar lists its terms; a term is a percentile column (without the
+# `_percentile` suffix) or a nested rule:
+#   "roe"                      -> roe_percentile (higher is better)
+#   "-pe_ttm"                  -> 100 - pe_ttm_percentile (lower is better)
+#   ("max", [terms])           -> best of the terms on each row
+#   ("first", [terms])         -> first non-null term on each row
+#   ("best_mean", [[a], [b]])  -> all terms of group a if its mean beats group b's, else group b
+# A pillar score blends its best and worst term: BLEND["max"] * max + BLEND["min"] * min.
+# The total score is the weighted mean of the pillar scores.
+
+BLEND = {"max": 0.75, "min": 0.25}
+
+PILLARS = {
+    "valuation": {
+        "table": "core.valuation_percentiles",
+        "terms": ["-pe_ttm", "-pe_forward", "-peg_ratio_forward", "-p_to_fcf_ttm"],
+    },
+    "profitability": {
+        "table": "core.profitability_percentiles",
+        "terms": ["net_margin", "roe", "fcf_margin", "roic"],
+    },
+    "growth": {
+        "table": "core.growth_percentiles",
+        "terms": ["forward_revenue_growth", "revenue_growth_yoy", "revenue_cagr_3y",
+                  "ebitda_growth_yoy",
+                  ("first", ["forward_eps_growth", "eps_growth_yoy"])],
+    },
+    "efficiency": {
+        "table": "core.efficiency_percentiles",
+        "terms": ["asset_turnover", "fixed_asset_turnover",
+                  # Inventory-heavy businesses are judged on working capital, the rest on opex and headcount
+                  ("best_mean", [["-dio", "-dpo", "-dso", "-cash_conversion_cycle"],
+                                 ["revenue_per_employee", "-opex_ratio"]])],
+    },
+    "financial_health": {
+        "table": "core.financial_health_percentiles",
+        "terms": ["interest_coverage_ttm",
+                  ("max", ["-net_debt_to_ebitda_ttm", "-debt_to_assets", "-debt_to_equity", "altman_z_score"]),
+                  ("max", ["current_ratio", "cash_ratio"])],
+    },
+}
+
+WEIGHTS = {
+    "valuation": 1.0,
+    "profitability": 1.0,
+    "growth": 0.8,
+    "efficiency": 0.25,
+    "financial_health": 0.25,
+}
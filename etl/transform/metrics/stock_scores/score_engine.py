@@ -0,0 +1,134 @@
+from functools import reduce
+from database.utils import read_sql_query
+import numpy as np
+import pandas as pd
+from etl.utils import convert_decimals_to_float
+from etl.transform.metrics.stock_scores.score_config import BLEND, PILLARS, WEIGHTS
+
+# Vectorized stock scores.
+# load_percentiles() joins the five percentile tables for every ticker once;
+# score_frame() evaluates the pillar rules in score_config.py as masked NumPy
+# reductions over column blocks. score_frame() never touches the database, so
+# research code can re-score the full history under other weights, e.g.
+#
+#     df = load_percentiles(conn)
+#     scores = score_frame(df, weights={**WEIGHTS, "growth": 1.5})
+
+
+def _term_columns(term) -> list:
+    """Percentile columns a term reads."""
+    if isinstance(term, str):
+        return [f"{term.lstrip('-')}_percentile"]
+    # A rule is a (name, terms) tuple; best_mean groups are plain lists of terms
+    terms = term if isinstance(term, list) else term[1]
+    return [col for sub in terms for col in _term_columns(sub)]
+
+
+def pillar_columns(pillars: dict = PILLARS) -> dict:
+    """pillar -> percentile columns its terms read, in first-use order."""
+    return {name: list(dict.fromkeys(col for term in pillar['terms'] for col in _term_columns(term)))
+            for name, pillar in pillars.items()}
+
+
+def load_percentiles(conn, tic: str = None, pillars: dict = PILLARS) -> pd.DataFrame:
+    """
+    Percentile columns used by the pillars for every (tic, date) present in all
+    percentile tables, sorted by tic and date. Also returns the latest percentile
+    updated_at of the row and the updated_at of its stored score (NULL if none).
+    """
+    aliases = {name: f"p{i}" for i, name in enumerate(pillars)}
+    base = aliases[next(iter(pillars))]
+    select = ",\n               ".join(
+        f"{aliases[name]}.{col}" for name, cols in pillar_columns(pillars).items() for col in cols
+    )
+    joins = "\n        ".join(
+        f"JOIN {pillars[name]['table']} {alias} ON {base}.tic = {alias}.tic AND {base}.date = {alias}.date"
+        for name, alias in aliases.items() if alias != base
+    )
+    query = f"""
+        SELECT {base}.tic, {base}.date::date,
+               {select},
+               GREATEST({', '.join(f'{alias}.updated_at' for alias in aliases.values())}) AS percentiles_updated_at,
+               ss.updated_at AS scores_updated_at
+        FROM {pillars[next(iter(pillars))]['table']} {base}
+        {joins}
+        LEFT JOIN core.stock_scores ss ON {base}.tic = ss.tic AND {base}.date = ss.date
+        {f"WHERE {base}.tic = '{tic}'" if tic else ''}
+        ORDER BY {base}.tic, {base}.date;
+    """
+    df = read_sql_query(query, conn)
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.sort_values(['tic', 'date'], kind='mergesort').reset_index(drop=True)
+    return convert_decimals_to_float(df)
+
+
+# Blocks are lists of 1-D columns: pairwise ufuncs over contiguous columns are
+# much faster than reducing along axis=1 of a narrow (n_rows, k) matrix.
+
+def _row_max(block: list) -> np.ndarray:
+    # fmax ignores NaN and yields NaN only when the whole row is NaN
+    return reduce(np.fmax, block)
+
+
+def _row_min(block: list) -> np.ndarray:
+    return reduce(np.fmin, block)
+
+
+def _row_mean(block: list) -> np.ndarray:
+    total = reduce(np.add, [np.where(np.isnan(col), 0.0, col) for col in block])
+    count = reduce(np.add, [(~np.isnan(col)).astype(float) for col in block])
+    out = np.full(total.shape, np.nan)
+    np.divide(total, count, out=out, where=count > 0)
+    return out
+
+
+def _evaluate(term, values: dict) -> list:
+    """Evaluate a term into a block (list of 0-100 columns)."""
+    if isinstance(term, str):
+        column = values[f"{term.lstrip('-')}_percentile"]
+        return [100 - column if term.startswith('-') else column]
+
+    rule, terms = term
+    if rule == "best_mean":
+        first, second = ([col for t in group for col in _evaluate(t, values)] for group in terms)
+        # NaN means compare False, so an all-NaN first group falls back to the second
+        use_first = _row_mean(first) > _row_mean(second)
+        missing = np.full(use_first.shape, np.nan)
+        width = max(len(first), len(second))
+        first += [missing] * (width - len(first))
+        second += [missing] * (width - len(second))
+        return [np.where(use_first, a, b) for a, b in zip(first, second)]
+
+    block = [col for t in terms for col in _evaluate(t, values)]
+    if rule == "max":
+        return [_row_max(block)]
+    if rule == "first":
+        return [reduce(lambda picked, col: np.where(np.isnan(picked), col, picked), block)]
+    raise ValueError(f"Unknown score rule: {rule}")
+
+
+def score_frame(df: pd.DataFrame, weights: dict = WEIGHTS, blend: dict = BLEND,
+                pillars: dict = PILLARS, ffill: bool = True) -> pd.DataFrame:
+    """
+    Pillar and total scores for a frame from load_percentiles().
+    The total is the weighted mean of the pillars with a non-zero weight and is
+    NULL when any of them is. With ffill, missing scores carry forward per ticker.
+    """
+    needed = [col for cols in pillar_columns(pillars).values() for col in cols]
+    values = {col: df[col].to_numpy(dtype=float) for col in dict.fromkeys(needed)}
+
+    scores = df[['tic', 'date']].copy()
+    for name, pillar in pillars.items():
+        block = [col for term in pillar['terms'] for col in _evaluate(term, values)]
+        scores[f"{name}_score"] = blend["max"] * _row_max(block) + blend["min"] * _row_min(block)
+
+    weighted = [(name, w) for name, w in weights.items() if w]
+    total = 0.0
+    for name, w in weighted:
+        total = total + w * scores[f"{name}_score"].to_numpy()
+    scores['total_score'] = total / sum(w for _, w in weighted)
+
+    score_columns = [f"{name}_score" for name in pillars] + ['total_score']
+    if ffill:
+        scores[score_columns] = scores.groupby('tic', sort=False)[score_columns].ffill()
+    return scores
@@ -3,246 +3,63 @@ import pandas as pd
 import yfinance as yf
 import numpy as np
 from etl.utils import convert_decimals_to_float
+from etl.transform.metrics.batch_engine import read_close_prices, ffill, merge_quarterly
+from etl.transform.metrics.fundamentals.compute_fundamentals_ttm import read_fundamentals
+from etl.transform.metrics.ratio_kernels import mask, safe_divide, positive_divide, growth_rate
+from etl.transform.metrics.incremental import INCREMENTAL, QUARTERLY_SOURCES, plan_incremental, describe_plan, load_with_watermarks
 
-def transform_records(conn, tic: str, date: str) -> pd.DataFrame:
-    close_price_query = f"""
-        SELECT tic, date::date, close AS close_price
-        FROM raw.stock_ohlcv_daily
-        WHERE tic = '{tic}' AND date::date >= '{date}'::date
-        ORDER BY date;
-    """
-    df = read_sql_query(close_price_query, conn)
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date')
-    df = convert_decimals_to_float(df)
-
+JOB = 'core.valuation_metrics'
 
-    balance_sheet_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date,
-            total_assets, total_debt, total_equity, 
-            cash_and_short_term_investments, cash_and_cash_equivalents
-        FROM core.balance_sheets_quarterly
-        WHERE tic = '{tic}'
-        ORDER BY earnings_date;
+def transform_records(conn, tic: str = None, date: str = None,
+                      start_dates: pd.Series = None) -> pd.DataFrame:
     """
-    df_balance_sheet = read_sql_query(balance_sheet_query, conn)
-    df_balance_sheet['earnings_date'] = pd.to_datetime(df_balance_sheet['earnings_date'])
-    df_balance_sheet = df_balance_sheet.sort_values('earnings_date')
-    df_balance_sheet = convert_decimals_to_float(df_balance_sheet)
-
-    income_statement_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date,
-               eps_diluted AS eps_gaap, ebitda, revenue AS revenue_gaap,
-               weighted_average_shares_diluted AS shares_outstanding
-        FROM core.income_statements_quarterly
-        WHERE tic = '{tic}'
-        ORDER BY earnings_date;
+    Compute valuation metrics for one ticker starting at `date`, or for every
+    ticker in a single batch when tic is None.
+    `start_dates` (tic -> first date) limits an incremental run to the new days.
     """
-    df_income = read_sql_query(income_statement_query, conn)
-    df_income['earnings_date'] = pd.to_datetime(df_income['earnings_date'])
-    df_income = df_income.sort_values('earnings_date')
-    df_income = convert_decimals_to_float(df_income)
-    df_income['ebitda_ttm'] = df_income['ebitda'].rolling(window=4).sum()
-    df_income['eps_gaap_ttm'] = df_income['eps_gaap'].rolling(window=4).sum()
-    df_income['eps_gaap_ttm_prev'] = df_income['eps_gaap_ttm'].shift(4) 
-    df_income['revenue_gaap_ttm'] = df_income['revenue_gaap'].rolling(window=4).sum()
-
-
-    cash_flow_statement_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date, 
-        free_cash_flow as fcf, dividends_paid, common_stock_repurchased
-        FROM core.cash_flow_statements_quarterly
-        WHERE tic = '{tic}'
-        ORDER BY earnings_date;
-    """
-    df_cash_flow = read_sql_query(cash_flow_statement_query, conn)
-    df_cash_flow['earnings_date'] = pd.to_datetime(df_cash_flow['earnings_date'])
-    df_cash_flow = df_cash_flow.sort_values('earnings_date')
-    df_cash_flow = convert_decimals_to_float(df_cash_flow)
-    df_cash_flow['fcf_ttm'] = df_cash_flow['fcf'].rolling(window=4).sum()
-    df_cash_flow['dividends_paid'] = df_cash_flow['dividends_paid'].astype(float).fillna(0)
-    df_cash_flow['dividends_paid_ttm'] = df_cash_flow['dividends_paid'].abs().rolling(window=4).sum()
-
-    df_cash_flow['common_stock_repurchased'] = df_cash_flow['common_stock_repurchased'].astype(float).fillna(0)
-    df_cash_flow['share_repurchased_ttm'] = df_cash_flow['common_stock_repurchased'].abs().rolling(window=4).sum()
-
-    earnings_query = f"""
-        SELECT tic, calendar_year, calendar_quarter, earnings_date::date, 
-               eps, eps_estimated, revenue
-        FROM core.earnings
-        WHERE tic = '{tic}' AND eps_estimated IS NOT NULL 
-        ORDER BY earnings_date;
-    """
-    df_earnings = read_sql_query(earnings_query, conn)
-    df_earnings['earnings_date'] = pd.to_datetime(df_earnings['earnings_date'])
-    df_earnings = df_earnings.sort_values('earnings_date').reset_index(drop=True)
-    df_earnings = convert_decimals_to_float(df_earnings)
-
-    df_earnings['revenue_ttm'] = df_earnings['revenue'].rolling(window=4).sum()
-    df_earnings['revenue_ttm'] = df_earnings['revenue_ttm'].ffill()
-
-    df_earnings['eps_est_ttm'] = df_earnings['eps_estimated'].rolling(window=4).sum()
-    df_earnings['eps_forward'] = df_earnings['eps_est_ttm'].shift(-4)
-    df_earnings['eps_ttm'] = df_earnings['eps'].rolling(window=4).sum()
-    df_earnings['eps_ttm_prev'] = df_earnings['eps_ttm'].shift(4) 
-    df_earnings['eps_forward_growth_rate'] = df_earnings.apply(
-        lambda r: (r['eps_forward'] - r['eps_ttm']) / abs(r['eps_ttm'])
-        if pd.notna(r['eps_forward']) and pd.notna(r['eps_ttm']) and r['eps_ttm'] != 0
-        else np.nan,
-        axis=1
-    )
-    df_earnings['eps_forward_growth_rate'] = df_earnings['eps_forward_growth_rate'].ffill()
-    df_earnings.loc[df_earnings['eps_forward'].isna(), 'eps_forward'] = df_earnings.loc[df_earnings['eps_forward'].isna(), :].apply(
-        lambda r: float(r['eps_ttm']) * (1 + r['eps_forward_growth_rate'])
-        if pd.notna(r['eps_forward_growth_rate']) and pd.notna(r['eps_ttm']) else np.nan, axis=1
-    )
-
-    # eps_forward_growth_rate = df_earnings.loc[df_earnings.index[-5], 'eps_forward_growth_rate']
-    # for i in [4, 3, 2]:
-    #     _eps_forward = df_earnings.iloc[-i+1:]['eps_estimated'].sum()
-    #     _eps_prev = df_earnings.iloc[-8+(5-i):-4]['eps'].sum()
-    #     _eps_forward_growth_rate = (float(_eps_forward) - float(_eps_prev)) / abs(float(_eps_prev)) if _eps_prev > 0 else np.nan
-    #     eps_forward_growth_rate = _eps_forward_growth_rate * (i - 1)/4 + eps_forward_growth_rate * (4 - (i - 1))/4 \
-    #                                     if _eps_forward_growth_rate and eps_forward_growth_rate \
-    #                                     else eps_forward_growth_rate or _eps_forward_growth_rate
-    #     eps_forward = float(df_earnings['eps_ttm'].iloc[-i]) * (1 + eps_forward_growth_rate) \
-    #                         if eps_forward_growth_rate else np.nan
-    #     df_earnings.loc[df_earnings.index[-i], 'eps_forward'] = eps_forward
-    #     df_earnings.loc[df_earnings.index[-i], 'eps_forward_growth_rate'] = eps_forward_growth_rate
-    # df_earnings['eps_forward'] = df_earnings['eps_forward'].ffill()
-    # df_earnings['eps_forward_growth_rate'] = df_earnings['eps_forward_growth_rate'].ffill()
-
-    # ticker = yf.Ticker(tic)
-    # pe_forward = ticker.info.get("forwardPE")
-    # current_price = ticker.info.get("currentPrice")
-    # eps_forward = current_price / pe_forward if pe_forward and pe_forward > 0 and current_price else np.nan    
-    # df_earnings.loc[df_earnings.index[-1], 'eps_forward'] = eps_forward
-    # eps_forward_growth_rate = (eps_forward - float(df_earnings['eps_ttm'].iloc[-1])) / abs(float(df_earnings['eps_ttm'].iloc[-1])) \
-    #                             if eps_forward and float(df_earnings['eps_ttm'].iloc[-1]) != 0 else np.nan
-    # df_earnings.loc[df_earnings.index[-1], 'eps_forward'] = eps_forward
-    # df_earnings.loc[df_earnings.index[-1], 'eps_forward_growth_rate'] = eps_forward_growth_rate
-    
-    df = pd.merge_asof(
-            df, df_balance_sheet,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
-    df = pd.merge_asof(
-            df, df_income,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
-    df = pd.merge_asof(
-            df, df_cash_flow,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
-    df = pd.merge_asof(
-            df, df_earnings,
-            left_on="date",
-            right_on="earnings_date",
-            by="tic",
-            direction="backward",
-            allow_exact_matches=True
-        )
-    df = df.drop(columns=['earnings_date', 'calendar_year', 'calendar_quarter'])
+    df = read_close_prices(conn, tic, date, start_dates)
+    quarters = read_fundamentals(conn, {
+        'balance_sheet': ['total_debt', 'total_equity', 'cash_and_short_term_investments'],
+        'income': ['shares_outstanding', 'ebitda_ttm', 'eps_gaap_ttm', 'eps_gaap_ttm_prev', 'revenue_gaap_ttm'],
+        'cash_flow': ['fcf_ttm', 'dividends_paid_ttm', 'share_repurchased_ttm'],
+        'earnings': ['revenue_ttm', 'eps_forward', 'eps_ttm', 'eps_ttm_prev', 'eps_forward_growth_rate'],
+    }, tic, start_dates)
+    quarters['earnings']['revenue_ttm'] = ffill(quarters['earnings'], 'revenue_ttm')
+
+    df = merge_quarterly(df, list(quarters.values()))
     df = df.sort_values('date')
 
     # Compute metrics
-    df['eps_gaap_forward'] = df.apply(
-        lambda row: float(row['eps_gaap_ttm']) * (1 + row['eps_forward_growth_rate'])
-        if pd.notna(row['eps_forward_growth_rate']) and pd.notna(row['eps_gaap_ttm']) else np.nan, axis=1
-    )
-    df['pe_forward'] = df.apply(
-        lambda row: float(row['close_price']) / float(row['eps_gaap_forward'])
-        if row['eps_gaap_forward'] and row['eps_gaap_forward'] > 0 else np.nan, axis=1
-    )
+    df['eps_gaap_forward'] = df['eps_gaap_ttm'] * (1 + df['eps_forward_growth_rate'])
+    df['pe_forward'] = positive_divide(df['close_price'], df['eps_gaap_forward'])
     df['market_cap'] = df['close_price'] * df['shares_outstanding']
     df['book_value_per_share'] = df['total_equity'] / df['shares_outstanding']
     df['ev'] = df['market_cap'] + df['total_debt'] - df['cash_and_short_term_investments']
 
-    df['pe_ttm'] = df.apply(
-        lambda row: float(row['close_price']) / float(row['eps_gaap_ttm'])
-        if row['eps_gaap_ttm'] and row['eps_gaap_ttm'] > 0 else np.nan, axis=1
-    )
+    df['pe_ttm'] = positive_divide(df['close_price'], df['eps_gaap_ttm'])
 
-    df['ev_to_ebitda_ttm'] = df.apply(
-        lambda row: float(row['ev']) / float(row['ebitda_ttm'])
-        if row['ev'] and row['ebitda_ttm'] > 0 else np.nan, axis=1
-    )
-    df['ps_ttm'] = df.apply(
-        lambda row: (float(row['close_price']) * float(row['shares_outstanding'])) / float(row['revenue_gaap_ttm'])
-        if row['revenue_gaap_ttm'] > 0 else np.nan, axis=1
-    )
-    df['p_to_fcf_ttm'] = df.apply(
-        lambda row: (float(row['close_price']) * float(row['shares_outstanding'])) / float(row['fcf_ttm'])
-        if row['fcf_ttm'] > 0 else np.nan, axis=1
-    )
-    df['fcf_yield_ttm'] = df.apply(
-        lambda row: float(row['fcf_ttm']) / float(row['market_cap'])
-        if pd.notna(row['fcf_ttm']) else np.nan, axis=1
-    )
-    df['ev_to_revenue_ttm'] = df.apply(
-        lambda row: float(row['ev']) / float(row['revenue_ttm'])
-        if row['ev'] and row['revenue_ttm'] > 0 else np.nan, axis=1
-    )
-    df['eps_growth_rate'] = df.apply(
-        lambda r: (r['eps_ttm'] - r['eps_ttm_prev']) / abs(r['eps_ttm_prev'])
-        if pd.notna(r['eps_ttm']) and pd.notna(r['eps_ttm_prev']) and r['eps_ttm_prev'] != 0
-        else np.nan,
-        axis=1
-    )
+    # EV-based ratios are undefined when EV is exactly zero
+    df['ev_to_ebitda_ttm'] = mask(positive_divide(df['ev'], df['ebitda_ttm']), df['ev'] != 0)
+    df['ps_ttm'] = positive_divide(df['close_price'] * df['shares_outstanding'], df['revenue_gaap_ttm'])
+    df['p_to_fcf_ttm'] = positive_divide(df['close_price'] * df['shares_outstanding'], df['fcf_ttm'])
+    df['fcf_yield_ttm'] = safe_divide(df['fcf_ttm'], df['market_cap'])
+    df['ev_to_revenue_ttm'] = mask(positive_divide(df['ev'], df['revenue_ttm']), df['ev'] != 0)
+    df['eps_growth_rate'] = growth_rate(df['eps_ttm'], df['eps_ttm_prev'])
 
-    df['peg_ratio'] = df.apply(
-        lambda row: float(row['pe_ttm']) / float(row['eps_growth_rate']) / 100
-        if row['eps_growth_rate'] and row['eps_growth_rate'] > 0 and row['pe_ttm'] else np.nan, axis=1
-    )
+    df['peg_ratio'] = mask(positive_divide(df['pe_ttm'], df['eps_growth_rate']) / 100, df['pe_ttm'] != 0)
 
-    df['eps_growth_rate_forward'] = df.apply(
-        lambda r: (r['eps_forward'] - r['eps_ttm']) / abs(r['eps_ttm'])
-        if pd.notna(r['eps_forward']) and pd.notna(r['eps_ttm']) and r['eps_ttm'] != 0
-        else np.nan,
-        axis=1
-    )
+    df['eps_growth_rate_forward'] = growth_rate(df['eps_forward'], df['eps_ttm'])
 
-    df['peg_ratio_forward'] = df.apply(
-        lambda row: float(row['pe_forward']) / float(row['eps_growth_rate_forward']) / 100
-        if row['eps_growth_rate_forward'] and row['eps_growth_rate_forward'] > 0 and row['pe_forward'] else np.nan, axis=1
-    )
+    df['peg_ratio_forward'] = mask(positive_divide(df['pe_forward'], df['eps_growth_rate_forward']) / 100,
+                                   df['pe_forward'] != 0)
 
-    df['price_to_book'] = df.apply(
-        lambda row: float(row['close_price']) / float(row['book_value_per_share'])
-        if row['book_value_per_share'] and row['book_value_per_share'] > 0 else np.nan, axis=1
-    )
-    df['ev_to_fcf_ttm'] = df.apply(
-        lambda row: float(row['ev']) / float(row['fcf_ttm'])
-        if row['ev'] and row['fcf_ttm'] > 0 else np.nan, axis=1
-    )
-    df['earnings_yield_ttm'] = df.apply(
-        lambda row: float(row['eps_gaap_ttm']) / float(row['close_price'])
-        if row['close_price'] and row['close_price'] > 0 and pd.notna(row['eps_gaap_ttm']) else np.nan, axis=1
-    )
-    df['revenue_yield_ttm'] = df.apply(
-        lambda row: float(row['revenue_gaap_ttm']) / float(row['market_cap'])
-        if row['revenue_gaap_ttm'] > 0 else np.nan, axis=1
-    )
-    df['total_shareholder_yield_ttm'] = df.apply(
-        lambda row: (float(row['dividends_paid_ttm']) + float(row['share_repurchased_ttm'])) / float(row['market_cap'])
-        if pd.notna(row['market_cap']) and row['market_cap'] > 0 \
-            and (float(row['dividends_paid_ttm']) + float(row['share_repurchased_ttm'])) > 0 else np.nan, axis=1
-    )
+    df['price_to_book'] = positive_divide(df['close_price'], df['book_value_per_share'])
+    df['ev_to_fcf_ttm'] = mask(positive_divide(df['ev'], df['fcf_ttm']), df['ev'] != 0)
+    df['earnings_yield_ttm'] = positive_divide(df['eps_gaap_ttm'], df['close_price'])
+    df['revenue_yield_ttm'] = mask(safe_divide(df['revenue_gaap_ttm'], df['market_cap']), df['revenue_gaap_ttm'] > 0)
+    shareholder_payout_ttm = df['dividends_paid_ttm'] + df['share_repurchased_ttm']
+    df['total_shareholder_yield_ttm'] = mask(positive_divide(shareholder_payout_ttm, df['market_cap']),
+                                             shareholder_payout_ttm > 0)
 
     transformed_df = df[[
         'tic', 'date', 'market_cap', 'pe_ttm', 'pe_forward', 'ev_to_ebitda_ttm',
@@ -255,18 +72,36 @@ def transform_records(conn, tic: str, date: str) -> pd.DataFrame:
 
 
 
-def load_records(transformed_df, conn):
+def load_records(transformed_df, conn, commit: bool = True):
 
     # Insert records into core.valuation_metrics
-    total_records = insert_records(conn, transformed_df, 'core.valuation_metrics', ['tic', 'date'])
+    total_records = insert_records(conn, transformed_df, JOB, ['tic', 'date'], commit=commit)
     return total_records
 
 
 
-def main():
+def main(batch: bool = True, incremental: bool = INCREMENTAL):
     # Connect to the database
     conn = connect_to_db()
     if conn is not None:
+        if batch:
+            # Load each source table once and compute every ticker together
+            plan = None
+            if incremental:
+                # Only the days after each ticker's watermark, unless a quarter changed
+                plan = plan_incremental(conn, JOB, QUARTERLY_SOURCES)
+                print(f"Processing all tickers incrementally: {describe_plan(plan)}")
+            else:
+                print("Processing all tickers in a single batch")
+            transformed_df = transform_records(conn, start_dates=None if plan is None else plan['start_date'])
+            if transformed_df.empty:
+                print("No new or updated records to process.")
+                return
+            # Rows and watermarks in one transaction: a failed write raises and moves no watermark
+            total_records = load_with_watermarks(conn, JOB, load_records, transformed_df, plan)
+            print(f"Total records inserted/updated: {total_records}")
+            return
+
         # Extract records
         cursor = conn.cursor()
         query = """
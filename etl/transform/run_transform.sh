@@ -48,17 +48,27 @@ log "🚀 Starting Metrics Transformation..."
 # 1. Base Transformation
 log "--- Phase 1: Base Data Preparation ---"
 run_task "earnings/main.py"
+# Shared TTM features read by the valuation, growth, efficiency and financial health metrics
+run_task "metrics/fundamentals/compute_fundamentals_ttm.py"
+# Daily returns, window price stats, volatility and drawdown read by the analyst summaries
+run_task "metrics/prices/compute_price_features.py"
 
 # 2. Domain-Specific Metrics
 # These are likely independent of each other, but must complete before Phase 3
 log "--- Phase 2: Computing Domain Metrics ---"
-run_task "metrics/profitability/compute_eps_diluted_metrics.py"
-run_task "metrics/revenue/compute_revenue_metrics.py"
-run_task "metrics/valuation/compute_valuation_metrics.py"
-run_task "metrics/profitability/compute_profitability_metrics.py"
-run_task "metrics/growth/compute_growth_metrics.py"
-run_task "metrics/efficiency/compute_efficiency_metrics.py"
-run_task "metrics/financial_health/compute_financial_health_metrics.py"
+# METRICS_SINGLE_PASS=1 runs all seven jobs in one process from a shared input
+# bundle (METRICS_CHUNK_SIZE tickers at a time, 0 = whole universe)
+if [ "${METRICS_SINGLE_PASS:-0}" = "1" ]; then
+    run_task "metrics/run_metrics.py"
+else
+    run_task "metrics/profitability/compute_eps_diluted_metrics.py"
+    run_task "metrics/revenue/compute_revenue_metrics.py"
+    run_task "metrics/valuation/compute_valuation_metrics.py"
+    run_task "metrics/profitability/compute_profitability_metrics.py"
+    run_task "metrics/growth/compute_growth_metrics.py"
+    run_task "metrics/efficiency/compute_efficiency_metrics.py"
+    run_task "metrics/financial_health/compute_financial_health_metrics.py"
+fi
 
 # 3. Aggregation & Scoring (Dependent on Phase 2)
 # If Phase 2 failed, these would calculate based on incomplete data, so strict error handling is vital.
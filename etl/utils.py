@@ -1,44 +1,289 @@
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 
 import json
+import time
 import hashlib
+import asyncio
+import weakref
+import httpx
 import pandas as pd
 import os
 import numpy as np
 import re
 import math
 from decimal import Decimal
+from tqdm import tqdm
 import ast
 import database.config
+from etl.trading_calendar import to_trading_date
+from etl.rate_limiter import estimate_tokens, COMPLETION_TOKENS
+from etl.llm_cache import read_cached_response, write_cached_response
+from etl.llm_router import LLM_PROVIDERS, route_models, rate_limiter, by_budget, attempts, is_failover_error, \
+    route_stats
+from etl.checkpointing import RESUME, astart_input, thread_config
 
 llm_chatgpt = ChatOpenAI(model=os.getenv("OPENAI_LLM_MODEL"), 
                          api_key=os.getenv("OPENAI_API_KEY"),
                          timeout=120,
-                         max_retries=2
+                         max_retries=0,
+                         include_response_headers=True
                          )
 llm_gemini = ChatGoogleGenerativeAI(model=os.getenv("GEMINI_LLM_MODEL"),
                                     google_api_key=os.getenv("GEMINI_API_KEY"),
                                     timeout=120,
-                                    max_retries=2
+                                    max_retries=0
                                     )
 
-def run_llm(messages: list[BaseMessage], model = os.getenv("LLM_MODEL", "chatgpt")) -> dict:
-    """Interact with the LLM using a system message and a human prompt."""
-    try:
-        if model == "chatgpt":
-            response = llm_chatgpt.invoke(messages)
-        elif model == "gemini":
-            response = llm_gemini.invoke(messages)
+# Clients of the other model names of the tiers (etl/llm_router.py): (provider, model name) -> client
+_llm_clients = {}
+
+
+def _llm_client(provider: str, model_name: str):
+    """Sync client of a model; the provider's default model is llm_chatgpt / llm_gemini."""
+    if model_name == LLM_PROVIDERS[provider][1]:
+        return llm_chatgpt if provider == "chatgpt" else llm_gemini
+    if (provider, model_name) not in _llm_clients:
+        if provider == "chatgpt":
+            _llm_clients[(provider, model_name)] = ChatOpenAI(model=model_name,
+                                                             api_key=os.getenv("OPENAI_API_KEY"),
+                                                             timeout=120,
+                                                             max_retries=0,
+                                                             include_response_headers=True
+                                                             )
         else:
-            raise ValueError(f"Unsupported model: {model}")
-        return response
+            _llm_clients[(provider, model_name)] = ChatGoogleGenerativeAI(model=model_name,
+                                                                         google_api_key=os.getenv("GEMINI_API_KEY"),
+                                                                         timeout=120,
+                                                                         max_retries=0
+                                                                         )
+    return _llm_clients[(provider, model_name)]
+
+
+def llm_cache_key(messages: list[BaseMessage], model: str, model_name: str = None) -> str:
+    """Response cache key: hash of the provider, model, temperature and canonical messages."""
+    provider, default_name = LLM_PROVIDERS[model]
+    model_name = model_name or default_name
+    llm = _llm_client(model, model_name)
+    return hash_dict({
+        "provider": provider,
+        "model": model_name,
+        "temperature": getattr(llm, "temperature", None),
+        "messages": [{"type": m.type, "content": m.content} for m in messages],
+    })
+
+
+def _is_cacheable(response) -> bool:
+    """Every prompt of the pipeline asks for JSON: an answer without parseable JSON is left for a retry."""
+    content = response.content
+    if not isinstance(content, str):
+        return False
+    for text in (content, _strip_plus_outside_strings(content)):
+        match = re.search(r'(\{.*\}|\[.*\])', text, re.DOTALL)
+        try:
+            if match and json.loads(match.group(0)):
+                return True
+        except json.JSONDecodeError:
+            continue
+    return False
+
+
+def _accepts(validate, response) -> bool:
+    """Whether `validate`, the caller's parser of the reply content (raising on an unusable answer), accepts `response`."""
+    if validate is None:
+        return True
+    try:
+        validate(response.content)
+        return True
+    except Exception:
+        return False
+
+
+def run_llm(messages: list[BaseMessage], model: str = None, cache: bool = True, route: str = None,
+            validate=None) -> dict:
+    """
+    Interact with the LLM using a system message and a human prompt.
+    The call goes to `model` if given, else to the models of `route`'s tier
+    (etl/llm_router.py): the first one with rate-limit budget, failing over
+    to the next on a 429, a timeout or a 5xx, and retrying the tier after a
+    backoff once every model has failed that way (the clients do not retry).
+    Responses are replayed from ref.llm_response_cache (etl/llm_cache.py);
+    cache=False skips the lookup and overwrites the entry with a fresh answer.
+    With `validate`, only answers it accepts are stored, and a cached answer
+    it rejects is asked again (and its entry overwritten), so a node's retry
+    never replays a schema-invalid answer.
+    """
+    try:
+        candidates = route_models(route, model)
+        keys = {candidate: llm_cache_key(messages, *candidate) for candidate in candidates}
+        if cache:
+            for candidate in candidates:
+                if (response := read_cached_response(keys[candidate])) is not None and _accepts(validate, response):
+                    route_stats.record_hit(route, candidate)
+                    return response
+        tokens = estimate_tokens(messages) + COMPLETION_TOKENS
+        tries = attempts(by_budget(candidates, tokens))
+        for i, (candidate, backoff) in enumerate(tries):
+            time.sleep(backoff)
+            # Wait for the shared RPM/TPM budget instead of sleeping a fixed time between calls
+            limiter = rate_limiter(candidate)
+            start = time.perf_counter()
+            limiter.acquire(tokens)
+            sent = time.perf_counter()
+            try:
+                response = _llm_client(*candidate).invoke(messages)
+            except Exception as e:
+                limiter.record_error(e)
+                failover = i + 1 < len(tries) and is_failover_error(e)
+                route_stats.record_call(route, candidate, sent - start, time.perf_counter() - sent,
+                                        error=e, failover=failover)
+                if failover:
+                    print(f"LLM {candidate[0]} {candidate[1]} failed ({e}); trying {tries[i + 1][0][0]} next.")
+                    continue
+                raise
+            route_stats.record_call(route, candidate, sent - start, time.perf_counter() - sent, response)
+            limiter.record(tokens, response)
+            if _is_cacheable(response) and _accepts(validate, response):
+                write_cached_response(keys[candidate], LLM_PROVIDERS[candidate[0]][0], candidate[1], response)
+            return response
     except Exception as e:
         # Raise an exception to be handled by the graph or caller
         raise RuntimeError(f"LLM invocation failed: {e}")
 
 
+# Concurrent mode of the analysis drivers: graph runs in flight at once (1 = sequential invoke loop)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "1"))
+# In-flight LLM requests per provider, shared by every graph run of the process
+LLM_MODEL_CONCURRENCY = {
+    "chatgpt": int(os.getenv("OPENAI_LLM_CONCURRENCY", "32")),
+    "gemini": int(os.getenv("GEMINI_LLM_CONCURRENCY", "32")),
+}
+
+# Per event loop: provider -> semaphore, and model name -> ChatOpenAI whose
+# pooled httpx client keeps connections alive between requests. Both are bound
+# to the loop they were created on, so each asyncio.run() gets its own.
+_llm_semaphores = weakref.WeakKeyDictionary()
+_async_llm_chatgpt = weakref.WeakKeyDictionary()
+
+
+def _llm_semaphore(model: str) -> asyncio.Semaphore:
+    semaphores = _llm_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if model not in semaphores:
+        semaphores[model] = asyncio.Semaphore(LLM_MODEL_CONCURRENCY[model])
+    return semaphores[model]
+
+
+def _async_chatgpt(model_name: str = None) -> ChatOpenAI:
+    clients = _async_llm_chatgpt.setdefault(asyncio.get_running_loop(), {})
+    model_name = model_name or os.getenv("OPENAI_LLM_MODEL")
+    if model_name not in clients:
+        pool = LLM_MODEL_CONCURRENCY["chatgpt"]
+        http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool),
+                                        timeout=120)
+        clients[model_name] = ChatOpenAI(model=model_name,
+                                         api_key=os.getenv("OPENAI_API_KEY"),
+                                         timeout=120,
+                                         max_retries=0,
+                                         include_response_headers=True,
+                                         http_async_client=http_client
+                                         )
+    return clients[model_name]
+
+
+def _async_llm_client(provider: str, model_name: str):
+    if provider == "chatgpt":
+        return _async_chatgpt() if model_name == LLM_PROVIDERS["chatgpt"][1] else _async_chatgpt(model_name)
+    return _llm_client(provider, model_name)
+
+
+async def arun_llm(messages: list[BaseMessage], model: str = None, cache: bool = True, route: str = None,
+                   validate=None) -> dict:
+    """
+    Async run_llm: waits for a slot of the provider's semaphore and the rate
+    limiter, then awaits the request; routing and failover as in run_llm.
+    """
+    try:
+        candidates = route_models(route, model)
+        keys = {candidate: llm_cache_key(messages, *candidate) for candidate in candidates}
+    except Exception as e:
+        raise RuntimeError(f"LLM invocation failed: {e}")
+    if cache:
+        for candidate in candidates:
+            response = await asyncio.to_thread(read_cached_response, keys[candidate])
+            if response is not None and _accepts(validate, response):
+                route_stats.record_hit(route, candidate)
+                return response
+    tokens = estimate_tokens(messages) + COMPLETION_TOKENS
+    tries = attempts(await asyncio.to_thread(by_budget, candidates, tokens))
+    for i, (candidate, backoff) in enumerate(tries):
+        await asyncio.sleep(backoff)
+        limiter = rate_limiter(candidate)
+        start = time.perf_counter()
+        async with _llm_semaphore(candidate[0]):
+            await limiter.aacquire(tokens)
+            sent = time.perf_counter()
+            try:
+                response = await _async_llm_client(*candidate).ainvoke(messages)
+            except Exception as e:
+                await asyncio.to_thread(limiter.record_error, e)
+                failover = i + 1 < len(tries) and is_failover_error(e)
+                route_stats.record_call(route, candidate, sent - start, time.perf_counter() - sent,
+                                        error=e, failover=failover)
+                if failover:
+                    print(f"LLM {candidate[0]} {candidate[1]} failed ({e}); trying {tries[i + 1][0][0]} next.")
+                    continue
+                raise RuntimeError(f"LLM invocation failed: {e}")
+        route_stats.record_call(route, candidate, sent - start, time.perf_counter() - sent, response)
+        await asyncio.to_thread(limiter.record, tokens, response)
+        if _is_cacheable(response) and _accepts(validate, response):
+            await asyncio.to_thread(write_cached_response, keys[candidate], LLM_PROVIDERS[candidate[0]][0],
+                                    candidate[1], response)
+        return response
+
+
+def llm_node(func, afunc, name: str = None) -> RunnableLambda:
+    """Graph node running `func` under invoke and the coroutine `afunc` under ainvoke/abatch."""
+    return RunnableLambda(func, afunc=afunc, name=name)
+
+
+async def abatch_as_completed(app, inputs: list, concurrency: int = LLM_CONCURRENCY,
+                              retries: int = 3, desc: str = None, thread_ids: list = None):
+    """
+    Run a compiled graph over `inputs` with up to `concurrency` runs in flight,
+    yielding (index, final_state) in completion order. Failed runs are retried
+    in later rounds, up to `retries` attempts; after the last one the exception
+    is yielded in place of the state.
+    With `thread_ids`, each run is the thread of its id: when the app was
+    compiled with etl.checkpointing's checkpointer, the first attempt starts it
+    through astart_input (continuing it under RESUME) and retries continue it
+    from its last checkpoint.
+    """
+    pending = list(range(len(inputs)))
+    with tqdm(total=len(inputs), desc=desc) as progress:
+        for attempt in range(1, retries + 1):
+            failed = []
+            if thread_ids is None:
+                run_inputs = [inputs[i] for i in pending]
+                configs = {"max_concurrency": concurrency}
+            else:
+                run_inputs = [await astart_input(app, inputs[i], thread_ids[i], resume=RESUME or attempt > 1)
+                              for i in pending]
+                configs = [{**thread_config(thread_ids[i]), "max_concurrency": concurrency} for i in pending]
+            async for j, output in app.abatch_as_completed(run_inputs, config=configs,
+                                                           return_exceptions=True):
+                if isinstance(output, Exception) and attempt < retries:
+                    failed.append(pending[j])
+                    print(f"Error processing input {pending[j]}: {output}. Retrying...")
+                    continue
+                progress.update(1)
+                yield pending[j], output
+            if not failed:
+                break
+            pending = failed
+
+
 
 
 def hash_dict(obj: dict) -> str:
@@ -114,23 +359,20 @@ def timestamp_to_trading_date(timestamp):
     effectively inform.
 
     Args:
-        timestamp (str | pd.Timestamp | datetime): Datetime-like object. Assumed to
-            already represent America/New_York local time (or a naive time treated
-            as such).
+        timestamp (str | pd.Timestamp | datetime): Datetime-like object. A time
+            zone-aware timestamp is converted to America/New_York first; a naive
+            one is taken as New York local time.
 
     Returns:
         datetime.date: The trading date to attribute the event to.
 
     Notes:
         - This is a simple cutoff rule; it does not skip market holidays/weekends.
-          If you need true exchange-trading-day logic, apply a trading calendar
-          mapping after this step.
+          For whole columns or exchange sessions use etl.trading_calendar
+          (to_trading_date / get_calendar().to_trading_date) instead of .apply.
         - Cutoff is 09:30 (inclusive of 09:30 → same-day; earlier → previous day).
     """
-    timestamp = pd.to_datetime(timestamp)
-    if timestamp.hour < 9 or (timestamp.hour == 9 and timestamp.minute < 30):
-        timestamp -= pd.Timedelta(days=1)
-    return timestamp.date()
+    return pd.Timestamp(to_trading_date(timestamp)[0]).date()
 
 
 def convert_numpy_types(record):